@@ -1,8 +1,19 @@
+"""
+Aplicação principal (application factory)
+
+Importar este módulo não acessa o banco: create_app() apenas monta a
+aplicação. Criação de tabelas e dados iniciais ficam no comando explícito
+de inicialização:
+
+    flask --app app init-db        (ou: python app.py init-db)
+"""
 import os
+import click
 from flask import Flask, session, request, redirect, url_for
 from config import get_config
-from flask_login import LoginManager
+from flask_login import LoginManager, login_required, current_user
 from database import db, seed_unidades, User, Chamado, Unidade, ProblemaReportado, ItemInternet, HistoricoTicket, Configuracao
+from database import RECURSOS_VERSIONADOS, COLUNAS_NAO_VERSIONADAS
 from setores.ti.routes import ti_bp
 from auth.routes import auth_bp
 from principal.routes import main_bp
@@ -13,9 +24,8 @@ from setores.marketing.routes import marketing
 from setores.produtos.routes import produtos
 from setores.comercial.routes import comercial
 from setores.outros.routes import outros_bp
-from flask_login import LoginManager, login_required
 from datetime import timedelta, datetime
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 import json
 
 # IMPORTAÇÕES DE SEGURANÇA
@@ -23,43 +33,117 @@ from security.middleware import SecurityMiddleware
 from security.session_security import SessionSecurity
 from security.security_config import SecurityConfig
 
-app = Flask(
-    __name__,
-    template_folder='principal/templates',
-    static_folder='static',
-    instance_relative_config=True
-)
-
-# Carrega as configurações baseadas no ambiente
-from config import get_config
-app.config.from_object(get_config())
-
-# APLICAR CONFIGURAÇÕES DE SEGURANÇA
-app.config.from_object(SecurityConfig)
-
-# Configuração do Socket.IO
-socketio = SocketIO(
-    app,
-    cors_allowed_origins="*",
-    logger=False,
-    engineio_logger=False,
-    async_mode='threading',
-    ping_timeout=60,
-    ping_interval=25,
-    transports=['polling', 'websocket']
-)
-
-# INICIALIZAR MIDDLEWARE DE SEGURANÇA
-security_middleware = SecurityMiddleware(app)
+# IMPORTAÇÕES DE DESEMPENHO
+from performance import CompressionMiddleware, MetricsMiddleware, QueryProfiler, init_versionamento
+from setores.ti.utils.serializacao import JSONProviderRapido
+from setores.ti.email_outbox import email_outbox
+from setores.ti.email_massa_jobs import email_massa_jobs
+from setores.ti.notificacoes_email import notificacoes_email
+from setores.ti.blob_store import armazem_anexos
+from setores.ti.uploads import RequestAnexos
+from setores.ti.miniaturas import miniaturas
+from setores.ti.salas_socketio import SALA_ADMINS, pode_acompanhar, sala_chamado, salas_do_usuario
+
+# Extensões sem app associado; ligadas em create_app()
+socketio = SocketIO()
 session_security = SessionSecurity()
-
-# Configura o LoginManager
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 
-# Inicializa o SQLAlchemy com o app
-db.init_app(app)
+
+def create_app(config_object=None):
+    """Monta a aplicação sem nenhuma operação de banco de dados"""
+    app = Flask(
+        __name__,
+        template_folder='principal/templates',
+        static_folder='static',
+        instance_relative_config=True
+    )
+
+    # Carrega as configurações baseadas no ambiente
+    app.config.from_object(config_object or get_config())
+
+    # APLICAR CONFIGURAÇÕES DE SEGURANÇA
+    app.config.from_object(SecurityConfig)
+
+    # Serialização JSON (orjson quando disponível) para jsonify e json_response
+    app.json = JSONProviderRapido(app)
+    # Anexos do multipart vão direto para o armazenamento por hash (uma passagem)
+    app.request_class = RequestAnexos
+
+    # Configuração do Socket.IO
+    socketio.init_app(
+        app,
+        cors_allowed_origins="*",
+        logger=False,
+        engineio_logger=False,
+        async_mode='threading',
+        ping_timeout=60,
+        ping_interval=25,
+        transports=['polling', 'websocket']
+    )
+
+    # MÉTRICAS POR ENDPOINT (registrado primeiro para medir a requisição inteira)
+    app.metrics_middleware = MetricsMiddleware(app)
+
+    # LOG DE CONSULTAS LENTAS E DETECTOR DE N+1 (warn em debug, strict em testes)
+    app.query_profiler = QueryProfiler(app)
+
+    # INICIALIZAR MIDDLEWARE DE SEGURANÇA
+    app.security_middleware = SecurityMiddleware(app)
+
+    # COMPRESSÃO DE RESPOSTAS E VERSIONAMENTO PARA ETAG
+    app.compression_middleware = CompressionMiddleware(app)
+
+    # Configura o LoginManager
+    login_manager.init_app(app)
+
+    # Inicializa o SQLAlchemy com o app (a conexão só é aberta na primeira consulta)
+    db.init_app(app)
+    init_versionamento(RECURSOS_VERSIONADOS, COLUNAS_NAO_VERSIONADAS)
+
+    # Outbox de e-mails: workers sobem no primeiro request, não no import
+    email_outbox.init_app(app)
+    email_massa_jobs.init_app(app)
+    notificacoes_email.init_app(app)
+    armazem_anexos.init_app(app)
+    miniaturas.init_app(app)
+
+    # MIDDLEWARE DE SEGURANÇA DE SESSÃO
+    app.before_request(security_before_request)
+
+    # Adicionar socketio ao contexto da aplicação
+    app.socketio = socketio
+
+    # Favicon
+    app.add_url_rule('/favicon.ico', 'favicon', favicon)
+
+    # Registra blueprints
+    app.register_blueprint(main_bp)
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(ti_bp, url_prefix='/ti')
+    app.register_blueprint(compras_bp, url_prefix='/compras')
+    app.register_blueprint(financeiro_bp, url_prefix='/financeiro')
+    app.register_blueprint(manutencao)
+    app.register_blueprint(marketing)
+    app.register_blueprint(produtos)
+    app.register_blueprint(comercial)
+    app.register_blueprint(outros_bp, url_prefix='/outros')
+
+    # Endpoints administrativos de manutenção do banco
+    app.add_url_rule('/verificar-banco', 'verificar_banco', verificar_banco)
+    app.add_url_rule('/debug-sla', 'debug_sla', debug_sla)
+    app.add_url_rule('/corrigir-datas-conclusao', 'corrigir_datas_conclusao', corrigir_datas_conclusao)
+    app.add_url_rule('/criar-estrutura', 'criar_estrutura', criar_estrutura)
+
+    # Comando de inicialização do banco
+    app.cli.add_command(init_db_command)
+
+    # CRIAR DIRETÓRIO DE LOGS SE NÃO EXISTIR
+    os.makedirs('logs', exist_ok=True)
+
+    return app
+
 
 def add_missing_structures():
     """
@@ -79,8 +163,138 @@ def add_missing_structures():
 
     return True
 
-# MIDDLEWARE DE SEGURANÇA DE SESSÃO
-@app.before_request
+
+def inicializar_banco(resetar_senha_admin=False):
+    """
+    Cria as tabelas e os dados iniciais (unidades, admin e agente padrão).
+    Deve ser executado uma vez por deploy, não a cada worker iniciado.
+    """
+    try:
+        # Adiciona estruturas faltantes
+        if not add_missing_structures():
+            print("⚠️  Algumas estruturas podem não ter sido criadas corretamente.")
+            return False
+
+        print("✅ Estruturas adicionais verificadas/criadas com sucesso!")
+
+        # Verificar e inserir dados iniciais
+        try:
+            unidades_count = Unidade.query.count()
+            if unidades_count == 0:
+                print("🔄 Inserindo dados iniciais (unidades, problemas, itens)...")
+                seed_unidades()
+                print("✅ Dados iniciais inseridos com sucesso!")
+            else:
+                print(f"✅ Dados iniciais já existem ({unidades_count} unidades)")
+        except Exception as e:
+            print(f"⚠️ Erro ao verificar/inserir dados iniciais: {str(e)}")
+
+        # Criar usuário admin padrão se não existir
+        try:
+            admin_user = User.query.filter_by(usuario='admin').first()
+            if not admin_user:
+                print("🔄 Criando usuário admin padrão...")
+                admin_user = User(
+                    nome='Administrador',
+                    sobrenome='Sistema',
+                    usuario='admin',
+                    email='admin@evoquefitness.com',
+                    nivel_acesso='Administrador',
+                    setor='TI',
+                    bloqueado=False
+                )
+                admin_user.set_password('admin123')
+                admin_user.setores = ['TI']
+                db.session.add(admin_user)
+                db.session.commit()
+                print("✅ Usuário admin criado: admin/admin123")
+            else:
+                print(f"✅ Usuário admin já existe: {admin_user.email}")
+                # Garantir que o admin tem as permissões corretas
+                admin_user.nivel_acesso = 'Administrador'
+                admin_user.setores = ['TI']
+                admin_user.bloqueado = False
+                if resetar_senha_admin:
+                    admin_user.set_password('admin123')
+                    print("🔑 Senha do admin redefinida para o padrão")
+                db.session.commit()
+                print("✅ Configurações do admin atualizadas")
+
+            # Criar usuário agente de suporte padrão se não existir
+            from database import AgenteSuporte
+            agente_user = User.query.filter_by(usuario='agente').first()
+            if not agente_user:
+                print("🔄 Criando usuário agente de suporte padrão...")
+                agente_user = User(
+                    nome='Agente',
+                    sobrenome='Suporte',
+                    usuario='agente',
+                    email='agente@evoquefitness.com',
+                    nivel_acesso='Gestor',
+                    setor='TI',
+                    bloqueado=False
+                )
+                agente_user.set_password('agente123')
+                agente_user.setores = ['TI']
+                db.session.add(agente_user)
+                db.session.commit()
+
+                # Criar registro de agente de suporte
+                agente_suporte = AgenteSuporte(
+                    usuario_id=agente_user.id,
+                    ativo=True,
+                    nivel_experiencia='pleno',
+                    max_chamados_simultaneos=10
+                )
+                db.session.add(agente_suporte)
+                db.session.commit()
+                print("✅ Usuário agente criado: agente/agente123")
+            else:
+                print(f"✅ Usuário agente já existe: {agente_user.email}")
+                # Garantir que é um agente de suporte ativo
+                agente_suporte = AgenteSuporte.query.filter_by(usuario_id=agente_user.id).first()
+                if not agente_suporte:
+                    agente_suporte = AgenteSuporte(
+                        usuario_id=agente_user.id,
+                        ativo=True,
+                        nivel_experiencia='pleno',
+                        max_chamados_simultaneos=10
+                    )
+                    db.session.add(agente_suporte)
+                    db.session.commit()
+                    print("✅ Registro de agente de suporte criado")
+        except Exception as e:
+            print(f"⚠️ Erro ao criar/atualizar usuários padrão: {str(e)}")
+            db.session.rollback()
+
+    except Exception as e:
+        print(f"❌ Erro durante a inicialização do banco: {str(e)}")
+        print("⚠️  Verifique se:")
+        print("   - O servidor MySQL está acessível")
+        print("   - As credenciais estão corretas")
+        return False
+
+    return True
+
+
+@click.command('init-db')
+@click.option('--resetar-senha-admin', is_flag=True, help='Redefine a senha do admin para o padrão')
+def init_db_command(resetar_senha_admin):
+    """Cria tabelas e dados iniciais do banco"""
+    if not inicializar_banco(resetar_senha_admin):
+        raise SystemExit(1)
+
+
+def exibir_status_seguranca():
+    print("🔒 Inicializando sistema de segurança...")
+    print("✅ Middleware de segurança ativo")
+    print("✅ Rate limiting configurado")
+    print("✅ Validação de entrada ativa")
+    print("✅ Headers de segurança configurados")
+    print("✅ Sistema de auditoria ativo")
+    print("✅ Proteção de sessão ativa")
+
+
 def security_before_request():
     """Verificações de segurança antes de cada requisição"""
     if '_session_id' not in session and request.endpoint not in ['static', None]:
@@ -98,148 +312,20 @@ def load_user(user_id):
         return None
     return user
 
-# Adicionar socketio ao contexto da aplicação
-app.socketio = socketio
-
-# Favicon route
-@app.route('/favicon.ico')
 def favicon():
-    from flask import send_from_directory
-    return send_from_directory(os.path.join(app.root_path, 'static'), 'favicon.ico', mimetype='image/vnd.microsoft.icon')
-
-# Registra blueprints
-app.register_blueprint(main_bp)
-app.register_blueprint(auth_bp)
-app.register_blueprint(ti_bp, url_prefix='/ti')
-app.register_blueprint(compras_bp, url_prefix='/compras')
-app.register_blueprint(financeiro_bp, url_prefix='/financeiro')
-app.register_blueprint(manutencao)
-app.register_blueprint(marketing)
-app.register_blueprint(produtos)
-app.register_blueprint(comercial)
-app.register_blueprint(outros_bp, url_prefix='/outros')
-
-# CRIAR DIRETÓRIO DE LOGS SE NÃO EXISTIR
-os.makedirs('logs', exist_ok=True)
-
-# Cria as tabelas e popula dados iniciais dentro do contexto da aplicação
-with app.app_context():
-    try:
-        # Adiciona estruturas faltantes
-        if add_missing_structures():
-            print("✅ Estruturas adicionais verificadas/criadas com sucesso!")
-
-            # Verificar e inserir dados iniciais
-            try:
-                from database import Unidade, ProblemaReportado, ItemInternet
-                unidades_count = Unidade.query.count()
-                if unidades_count == 0:
-                    print("🔄 Inserindo dados iniciais (unidades, problemas, itens)...")
-                    seed_unidades()
-                    print("✅ Dados iniciais inseridos com sucesso!")
-                else:
-                    print(f"✅ Dados iniciais já existem ({unidades_count} unidades)")
-            except Exception as e:
-                print(f"⚠️ Erro ao verificar/inserir dados iniciais: {str(e)}")
-
-            # Criar usuário admin padrão se não existir
-            try:
-                admin_user = User.query.filter_by(usuario='admin').first()
-                if not admin_user:
-                    print("🔄 Criando usuário admin padrão...")
-                    admin_user = User(
-                        nome='Administrador',
-                        sobrenome='Sistema',
-                        usuario='admin',
-                        email='admin@evoquefitness.com',
-                        nivel_acesso='Administrador',
-                        setor='TI',
-                        bloqueado=False
-                    )
-                    admin_user.set_password('admin123')
-                    admin_user.setores = ['TI']
-                    db.session.add(admin_user)
-                    db.session.commit()
-                    print("✅ Usuário admin criado: admin/admin123")
-                else:
-                    print(f"✅ Usuário admin já existe: {admin_user.email}")
-                    # Garantir que o admin tem as permissões corretas
-                    admin_user.nivel_acesso = 'Administrador'
-                    admin_user.setores = ['TI']
-                    admin_user.bloqueado = False
-                    admin_user.set_password('admin123')  # Resetar senha para garantir
-                    db.session.commit()
-                    print("✅ Configurações do admin atualizadas")
-
-                # Criar usuário agente de suporte padrão se não existir
-                agente_user = User.query.filter_by(usuario='agente').first()
-                if not agente_user:
-                    print("🔄 Criando usuário agente de suporte padrão...")
-                    agente_user = User(
-                        nome='Agente',
-                        sobrenome='Suporte',
-                        usuario='agente',
-                        email='agente@evoquefitness.com',
-                        nivel_acesso='Gestor',
-                        setor='TI',
-                        bloqueado=False
-                    )
-                    agente_user.set_password('agente123')
-                    agente_user.setores = ['TI']
-                    db.session.add(agente_user)
-                    db.session.commit()
-
-                    # Criar registro de agente de suporte
-                    from database import AgenteSuporte
-                    agente_suporte = AgenteSuporte(
-                        usuario_id=agente_user.id,
-                        ativo=True,
-                        nivel_experiencia='pleno',
-                        max_chamados_simultaneos=10
-                    )
-                    db.session.add(agente_suporte)
-                    db.session.commit()
-                    print("✅ Usuário agente criado: agente/agente123")
-                else:
-                    print(f"✅ Usuário agente já existe: {agente_user.email}")
-                    # Garantir que é um agente de suporte ativo
-                    from database import AgenteSuporte
-                    agente_suporte = AgenteSuporte.query.filter_by(usuario_id=agente_user.id).first()
-                    if not agente_suporte:
-                        agente_suporte = AgenteSuporte(
-                            usuario_id=agente_user.id,
-                            ativo=True,
-                            nivel_experiencia='pleno',
-                            max_chamados_simultaneos=10
-                        )
-                        db.session.add(agente_suporte)
-                        db.session.commit()
-                        print("✅ Registro de agente de suporte criado")
-            except Exception as e:
-                print(f"⚠️ Erro ao criar/atualizar usuários padrão: {str(e)}")
-                db.session.rollback()
-        else:
-            print("⚠️  Algumas estruturas podem não ter sido criadas corretamente.")
-        
-        # INICIALIZAR SISTEMA DE SEGURANÇA
-        print("🔒 Inicializando sistema de segurança...")
-        print("✅ Middleware de segurança ativo")
-        print("✅ Rate limiting configurado")
-        print("✅ Validação de entrada ativa")
-        print("✅ Headers de segurança configurados")
-        print("✅ Sistema de auditoria ativo")
-        print("✅ Proteção de sess��o ativa")
-            
-    except Exception as e:
-        print(f"❌ Erro durante a inicialização do banco: {str(e)}")
-        print("⚠️  Verifique se:")
-        print("   - O servidor MySQL está acessível")
-        print("   - As credenciais estão corretas")
+    from flask import current_app, send_from_directory
+    return send_from_directory(os.path.join(current_app.root_path, 'static'), 'favicon.ico', mimetype='image/vnd.microsoft.icon')
 
 # Eventos Socket.IO
 @socketio.on('connect')
 def handle_connect():
-    print(f'Cliente conectado: {request.sid}')
+    # Sem login não há sala a entrar; os eventos são todos do painel
+    if not current_user.is_authenticated:
+        return False
+    salas = salas_do_usuario(current_user)
+    for sala in salas:
+        join_room(sala)
+    print(f'Cliente conectado: {request.sid} ({len(salas)} sala(s))')
     emit('connected', {
         'message': 'Conectado ao servidor Socket.IO',
         'status': 'success',
@@ -251,14 +337,34 @@ def handle_disconnect():
     print(f'Cliente desconectado: {request.sid}')
 
 @socketio.on('join_admin')
-def handle_join_admin(data):
-    print(f'Admin {data.get("user_id")} entrou na sala de administradores')
+def handle_join_admin(data=None):
+    # Mantido para clientes antigos: o connect já coloca administradores na sala
+    if not current_user.is_authenticated or not current_user.tem_permissao('Administrador'):
+        emit('admin_joined', {'message': 'Acesso negado', 'status': 'error'})
+        return
+    join_room(SALA_ADMINS)
+    print(f'Admin {current_user.id} entrou na sala de administradores')
     emit('admin_joined', {
         'message': 'Você está recebendo notificações administrativas',
         'status': 'success',
         'timestamp': datetime.now().isoformat()
     })
 
+@socketio.on('acompanhar_chamado')
+def handle_acompanhar_chamado(data):
+    chamado = Chamado.query.get((data or {}).get('chamado_id') or 0)
+    if chamado is None or not current_user.is_authenticated or not pode_acompanhar(current_user, chamado):
+        emit('acompanhamento', {'chamado_id': (data or {}).get('chamado_id'), 'status': 'error'})
+        return
+    join_room(sala_chamado(chamado.id))
+    emit('acompanhamento', {'chamado_id': chamado.id, 'status': 'success'})
+
+@socketio.on('deixar_chamado')
+def handle_deixar_chamado(data):
+    chamado_id = (data or {}).get('chamado_id')
+    if chamado_id:
+        leave_room(sala_chamado(chamado_id))
+
 @socketio.on('test_notification')
 def handle_test_notification():
     emit('notification_test', {
@@ -272,7 +378,6 @@ def handle_ping():
     emit('pong', {'timestamp': datetime.now().isoformat()})
 
 # Endpoint para verificar estrutura do banco (apenas em desenvolvimento)
-@app.route('/verificar-banco')
 @login_required
 def verificar_banco():
     """Endpoint para verificar e corrigir estrutura do banco"""
@@ -332,7 +437,6 @@ def verificar_banco():
     except Exception as e:
         return f"❌ Erro: {str(e)}"
 
-@app.route('/debug-sla')
 @login_required
 def debug_sla():
     """Endpoint para debugar SLA dos chamados"""
@@ -394,7 +498,6 @@ def debug_sla():
     except Exception as e:
         return f"❌ Erro no debug: {str(e)}"
 
-@app.route('/corrigir-datas-conclusao')
 @login_required
 def corrigir_datas_conclusao():
     """Corrige datas de conclusão faltantes"""
@@ -446,7 +549,6 @@ def corrigir_datas_conclusao():
         db.session.rollback()
         return f"❌ Erro: {str(e)}"
 
-@app.route('/criar-estrutura')
 @login_required
 def criar_estrutura():
     """Endpoint para criar estrutura faltante do banco"""
@@ -520,7 +622,21 @@ def criar_estrutura():
         <p><a href="/verificar-banco">← Voltar</a></p>
         """
 
+# Instância usada por `from app import app`, pelo servidor WSGI e pelos scripts
+app = create_app()
+
 if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'init-db':
+        with app.app_context():
+            sys.exit(0 if inicializar_banco('--resetar-senha-admin' in sys.argv) else 1)
+
+    # Servidor de desenvolvimento: garante o banco antes de subir
+    with app.app_context():
+        inicializar_banco()
+    exibir_status_seguranca()
+
     print("🚀 Iniciando aplicação com proteções de segurança ativas...")
     print("🔌 Socket.IO configurado e ativo")
     socketio.run(app, host='0.0.0.0', port=5001, debug=True, allow_unsafe_werkzeug=True)
@@ -85,6 +85,44 @@ class Config:
     # Configurações de cache
     CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')
     CACHE_DEFAULT_TIMEOUT = int(os.environ.get('CACHE_DEFAULT_TIMEOUT', 300))
+
+    # Configurações de desempenho
+    COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 500))
+    QUERY_PROFILER_MODE = os.environ.get('QUERY_PROFILER_MODE')  # off, warn, strict
+
+    # Outbox de e-mails (entrega em segundo plano)
+    EMAIL_OUTBOX_ENABLED = os.environ.get('EMAIL_OUTBOX_ENABLED', 'True').lower() == 'true'
+    EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS', 4))
+    EMAIL_OUTBOX_MAX_TENTATIVAS = int(os.environ.get('EMAIL_OUTBOX_MAX_TENTATIVAS', 6))
+
+    # Envios em massa (segundo plano, em blocos com commit)
+    EMAIL_MASSA_WORKERS = int(os.environ.get('EMAIL_MASSA_WORKERS', 2))
+    EMAIL_MASSA_LOTE = int(os.environ.get('EMAIL_MASSA_LOTE', 100))
+    EMAIL_MASSA_LEASE = int(os.environ.get('EMAIL_MASSA_LEASE', 300))
+
+    # Agrupamento de notificações (imediato, agrupado) e resumo horário
+    NOTIFICACOES_MODO = os.environ.get('NOTIFICACOES_MODO', 'imediato')
+    NOTIFICACOES_JANELA = int(os.environ.get('NOTIFICACOES_JANELA', 120))
+    NOTIFICACOES_RESUMO_DESTINATARIOS = os.environ.get('NOTIFICACOES_RESUMO_DESTINATARIOS', '')
+    NOTIFICACOES_MAX_POR_HORA = int(os.environ.get('NOTIFICACOES_MAX_POR_HORA', 10))
+
+    # Anexos por hash: carência (s) antes de apagar blobs sem referência
+    ANEXOS_BLOBS_CARENCIA = int(os.environ.get('ANEXOS_BLOBS_CARENCIA', 24 * 3600))
+    # Órfãos encontrados na conciliação ficam na quarentena por N dias antes de apagar
+    ANEXOS_QUARENTENA_DIAS = int(os.environ.get('ANEXOS_QUARENTENA_DIAS', 7))
+    # Entrega dos anexos: python (send_file com Range), x-accel (nginx) ou x-sendfile
+    ANEXOS_ENTREGA = os.environ.get('ANEXOS_ENTREGA', 'python')
+    ANEXOS_X_ACCEL_PREFIXO = os.environ.get('ANEXOS_X_ACCEL_PREFIXO', '/_anexos/')
+    # Máximo de anexos num download ZIP de vários chamados
+    ANEXOS_ZIP_MAX_ARQUIVOS = int(os.environ.get('ANEXOS_ZIP_MAX_ARQUIVOS', 2000))
+    # Upload retomável: maior bloco por PUT e inatividade até a sessão ser apagada (s)
+    ANEXOS_UPLOAD_BLOCO_MAX = int(os.environ.get('ANEXOS_UPLOAD_BLOCO_MAX', 8 * 1024 * 1024))
+    ANEXOS_UPLOAD_SESSAO_EXPIRA = int(os.environ.get('ANEXOS_UPLOAD_SESSAO_EXPIRA', 24 * 3600))
+    # Miniaturas de imagens/PDFs: cache em disco ao lado dos blobs (LRU)
+    ANEXOS_MINIATURAS_MAX_MB = int(os.environ.get('ANEXOS_MINIATURAS_MAX_MB', 512))
     
     # Configurações específicas do Flask
     WTF_CSRF_ENABLED = True
@@ -257,6 +295,7 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
     SQLALCHEMY_ENGINE_OPTIONS = {}  # Remove MySQL-specific options for SQLite
+    QUERY_PROFILER_MODE = 'strict'
 
     def __init__(self):
         # Override database validation for testing
@@ -402,7 +402,7 @@ class ChamadoAnexo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     chamado_id = db.Column(db.Integer, db.ForeignKey('chamado.id'), nullable=False)
     nome_original = db.Column(db.String(255), nullable=False)
-    nome_arquivo = db.Column(db.String(255), nullable=False)  # Nome único no sistema
+    nome_arquivo = db.Column(db.String(255), nullable=False)  # Nome no sistema (hash do blob)
     caminho_arquivo = db.Column(db.String(500), nullable=False)
     tamanho_bytes = db.Column(db.BigInteger, nullable=False)
     tipo_mime = db.Column(db.String(100), nullable=False)
@@ -496,24 +496,72 @@ class ChamadoAnexo(db.Model):
 
     def to_dict(self):
         """Converte o anexo para dicionário"""
-        return {
-            'id': self.id,
-            'chamado_id': self.chamado_id,
-            'nome_original': self.nome_original,
-            'nome_arquivo': self.nome_arquivo,
-            'tamanho_bytes': self.tamanho_bytes,
-            'tamanho_formatado': self.get_tamanho_formatado(),
-            'tipo_mime': self.tipo_mime,
-            'extensao': self.extensao,
-            'data_upload': self.get_data_upload_brazil().strftime('%d/%m/%Y %H:%M:%S') if self.data_upload else None,
-            'usuario_upload': f"{self.usuario_upload.nome} {self.usuario_upload.sobrenome}",
-            'descricao': self.descricao,
-            'tipo_arquivo': self.get_tipo_arquivo(),
-            'icone': self.get_icone_arquivo(),
-            'is_image': self.is_image(),
-            'is_video': self.is_video(),
-            'is_document': self.is_document()
-        }
+        from setores.ti.utils.serializacao import ANEXO
+        return ANEXO(self)
+
+class BlobAnexo(db.Model):
+    """Conteúdo de anexo armazenado uma única vez, endereçado pelo SHA-256"""
+    __tablename__ = 'blobs_anexos'
+
+    id = db.Column(db.Integer, primary_key=True)
+    hash_arquivo = db.Column(db.String(64), unique=True, nullable=False)
+    caminho_arquivo = db.Column(db.String(500), nullable=False)
+    tamanho_bytes = db.Column(db.BigInteger, nullable=False)
+    referencias = db.Column(db.Integer, nullable=False, default=0)  # ChamadoAnexo ativos com este hash
+    data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_sem_referencia = db.Column(db.DateTime, nullable=True, index=True)  # Início da carência da coleta
+
+    def __repr__(self):
+        return f'<BlobAnexo {self.hash_arquivo[:12]} refs={self.referencias}>'
+
+class IndiceArquivoAnexo(db.Model):
+    """Último estado do arquivo visto pelo reindexador (arquivos inalterados não são re-hasheados)"""
+    __tablename__ = 'indice_arquivos_anexos'
+
+    anexo_id = db.Column(db.Integer, db.ForeignKey('chamado_anexos.id', ondelete='CASCADE'), primary_key=True)
+    caminho_arquivo = db.Column(db.String(500), nullable=False)
+    tamanho_bytes = db.Column(db.BigInteger, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    data_verificacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+
+    def __repr__(self):
+        return f'<IndiceArquivoAnexo {self.anexo_id} {self.tamanho_bytes}B>'
+
+class SessaoUploadAnexo(db.Model):
+    """Upload retomável em andamento (o arquivo parcial fica em blobs/tmp/sessoes)"""
+    __tablename__ = 'sessoes_upload_anexos'
+
+    id = db.Column(db.String(32), primary_key=True)
+    chamado_id = db.Column(db.Integer, db.ForeignKey('chamado.id', ondelete='CASCADE'), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    nome_original = db.Column(db.String(255), nullable=False)
+    tipo_mime = db.Column(db.String(100), nullable=False)
+    tamanho_bytes = db.Column(db.BigInteger, nullable=False)
+    hash_esperado = db.Column(db.String(64), nullable=True)
+    descricao = db.Column(db.Text, nullable=True)
+    data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_atualizacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None), index=True)
+
+    def __repr__(self):
+        return f'<SessaoUploadAnexo {self.id} {self.nome_original}>'
+
+class EstatisticaAnexos(db.Model):
+    """Totais de anexos ativos por categoria, unidade e mês do upload (mantidos no upload/remoção)"""
+    __tablename__ = 'estatisticas_anexos'
+    __table_args__ = (
+        db.UniqueConstraint('categoria', 'unidade', 'ano', 'mes', name='uq_estatisticas_anexos_chave'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    categoria = db.Column(db.String(20), nullable=False)  # image, video, document, other
+    unidade = db.Column(db.String(100), nullable=False)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    tamanho_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<EstatisticaAnexos {self.categoria} {self.unidade} {self.ano}-{self.mes:02d}>'
 
 class Unidade(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -1150,6 +1198,17 @@ class EmailMassaDestinatario(db.Model):
     def __repr__(self):
         return f'<EmailMassaDestinatario {self.email_destinatario} - {self.status_envio}>'
 
+class ExecucaoEmailMassa(db.Model):
+    """Lease do processo que está enviando um EmailMassa: um único dono por vez"""
+    __tablename__ = 'execucoes_email_massa'
+
+    email_massa_id = db.Column(db.Integer, db.ForeignKey('emails_massa.id'), primary_key=True)
+    dono = db.Column(db.String(32), nullable=True)  # processo que detém o lease (NULL = livre)
+    bloqueado_ate = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<ExecucaoEmailMassa {self.email_massa_id} {self.dono} até {self.bloqueado_ate}>'
+
 class SessaoAtiva(db.Model):
     """Tabela para sessões ativas dos usuários"""
     __tablename__ = 'sessoes_ativas'
@@ -1472,6 +1531,103 @@ class TransferenciaHistorico(db.Model):
     def __repr__(self):
         return f'<TransferenciaHistorico {self.id} - Chamado:{self.chamado_id} - {self.tipo_transferencia}>'
 
+class EmailOutbox(db.Model):
+    """Fila persistente de e-mails; os handlers só enfileiram e os workers entregam"""
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    chave_idempotencia = db.Column(db.String(64), unique=True, nullable=False)
+    assunto = db.Column(db.String(500), nullable=False)
+    corpo = db.Column(db.Text(length=2**32 - 1), nullable=False)
+    corpo_html = db.Column(db.Text(length=2**32 - 1), nullable=True)  # versão HTML (corpo fica como texto)
+    destinatarios = db.Column(db.Text, nullable=False)  # JSON: lista de endereços
+    anexos = db.Column(db.Text(length=2**32 - 1), nullable=True)  # JSON: nome, content_type, tamanho, dados (base64) ou caminho (+ hash do blob)
+    referencia = db.Column(db.String(100), nullable=True, index=True)  # ex.: chamado:123
+    status = db.Column(db.String(20), nullable=False, default='pendente', index=True)  # pendente, enviando, enviado, morto
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    max_tentativas = db.Column(db.Integer, nullable=False, default=6)
+    proxima_tentativa = db.Column(db.DateTime, nullable=False, default=lambda: get_brazil_time().replace(tzinfo=None), index=True)
+    bloqueado_ate = db.Column(db.DateTime, nullable=True)  # lease do worker que está entregando
+    dono = db.Column(db.String(32), nullable=True)  # processo que detém o lease
+    ultimo_erro = db.Column(db.Text, nullable=True)
+    data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_envio = db.Column(db.DateTime, nullable=True)
+
+    def get_destinatarios(self):
+        return json.loads(self.destinatarios) if self.destinatarios else []
+
+    def get_anexos(self):
+        if not self.anexos:
+            return None
+        import base64
+        anexos = []
+        for a in json.loads(self.anexos):
+            anexo = {'nome': a['nome'], 'content_type': a.get('content_type'), 'tamanho': a.get('tamanho')}
+            if a.get('caminho'):
+                anexo['caminho'] = a['caminho']
+            else:
+                anexo['dados'] = base64.b64decode(a['dados'])
+            anexos.append(anexo)
+        return anexos
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.status} ({self.tentativas} tentativas)>'
+
+class NotificacaoEmail(db.Model):
+    """Notificação aguardando agrupamento (janela por destinatário/chamado ou resumo horário)"""
+    __tablename__ = 'notificacoes_email'
+    __table_args__ = (
+        db.Index('ix_notificacoes_email_pendentes', 'status', 'enviar_apos'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    destinatario = db.Column(db.String(120), nullable=False, index=True)
+    referencia = db.Column(db.String(100), nullable=True)  # ex.: chamado:EVQ-0001
+    assunto = db.Column(db.String(500), nullable=False)
+    corpo = db.Column(db.Text, nullable=False)
+    corpo_html = db.Column(db.Text, nullable=True)  # versão HTML, quando a notificação tem template
+    modo = db.Column(db.String(20), nullable=False, default='agrupado')  # agrupado, resumo
+    status = db.Column(db.String(20), nullable=False, default='pendente')  # pendente, enviada
+    enviar_apos = db.Column(db.DateTime, nullable=False)
+    lote = db.Column(db.String(64), nullable=True, index=True)  # chave_idempotencia do e-mail gerado na outbox
+    data_criacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+    data_envio = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<NotificacaoEmail {self.id} {self.destinatario} {self.referencia} {self.status}>'
+
+class VersaoRecurso(db.Model):
+    """Contador de versão por recurso, usado para ETag/Last-Modified das APIs"""
+    __tablename__ = 'versoes_recursos'
+
+    recurso = db.Column(db.String(50), primary_key=True)
+    versao = db.Column(db.BigInteger, nullable=False, default=0)
+    data_atualizacao = db.Column(db.DateTime, default=lambda: get_brazil_time().replace(tzinfo=None))
+
+    def __repr__(self):
+        return f'<VersaoRecurso {self.recurso} v{self.versao}>'
+
+# Tabelas cujas alterações incrementam a versão de cada recurso
+RECURSOS_VERSIONADOS = {
+    'chamado': ['chamados'],
+    'chamado_agente': ['chamados'],
+    'chamado_anexos': ['chamados'],
+    'historicos_tickets': ['chamados'],
+    'historico_sla': ['chamados'],
+    'agentes_suporte': ['chamados', 'transferencias'],
+    'user': ['chamados', 'transferencias', 'logs_acoes', 'logs_acesso'],
+    'transferencia_historico': ['transferencias'],
+    'configuracoes': ['configuracoes'],
+    'feriados': ['configuracoes'],
+    'logs_acoes': ['logs_acoes'],
+    'logs_acesso': ['logs_acesso'],
+}
+
+# Colunas atualizadas a cada requisição que não alteram o conteúdo das listagens
+COLUNAS_NAO_VERSIONADAS = {
+    'user': {'ultimo_acesso', 'tentativas_login', 'bloqueado_ate'},
+}
+
 def init_app(app):
     db.init_app(app)
     
@@ -0,0 +1,21 @@
+"""
+Módulo de desempenho: compressão, respostas condicionais, métricas, perfil de SQL e imports sob demanda
+"""
+from .compression import CompressionMiddleware
+from .conditional import conditional_response, init_versionamento
+from .metrics import MetricsMiddleware, registro
+from .query_profiler import QueryProfiler, NPlusOneError, monitorar, ignorar_n_mais_1
+from .lazy import modulo_preguicoso
+
+__all__ = [
+    'CompressionMiddleware',
+    'conditional_response',
+    'init_versionamento',
+    'MetricsMiddleware',
+    'registro',
+    'QueryProfiler',
+    'NPlusOneError',
+    'monitorar',
+    'ignorar_n_mais_1',
+    'modulo_preguicoso'
+]
@@ -0,0 +1,99 @@
+"""
+Compressão de respostas HTTP (gzip e, se disponível, brotli)
+"""
+import gzip
+import logging
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele usamos apenas gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+MIMETYPES_COMPRESSIVEIS = [
+    'application/json',
+    'application/javascript',
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+    'text/javascript',
+]
+
+
+class CompressionMiddleware:
+    def __init__(self, app=None):
+        self.app = app
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.after_request(self.after_request)
+
+        # Configurações padrão
+        app.config.setdefault('COMPRESSION_ENABLED', True)
+        app.config.setdefault('COMPRESSION_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESSION_GZIP_LEVEL', 6)
+        app.config.setdefault('COMPRESSION_BROTLI_QUALITY', 4)
+        app.config.setdefault('COMPRESSION_MIMETYPES', MIMETYPES_COMPRESSIVEIS)
+
+        logger.info(f"CompressionMiddleware inicializado (brotli {'disponível' if brotli else 'indisponível'})")
+
+    def escolher_codificacao(self):
+        """Escolhe a melhor codificação aceita pelo cliente"""
+        aceitas = request.accept_encodings
+        if brotli is not None and aceitas['br']:
+            return 'br'
+        if aceitas['gzip']:
+            return 'gzip'
+        return None
+
+    def deve_comprimir(self, response):
+        config = self.app.config
+        if not config.get('COMPRESSION_ENABLED'):
+            return False
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype not in config.get('COMPRESSION_MIMETYPES', []):
+            return False
+        tamanho = response.calculate_content_length()
+        return tamanho is not None and tamanho >= config.get('COMPRESSION_MIN_SIZE', 1024)
+
+    def comprimir(self, dados, codificacao):
+        if codificacao == 'br':
+            return brotli.compress(dados, quality=self.app.config['COMPRESSION_BROTLI_QUALITY'])
+        return gzip.compress(dados, compresslevel=self.app.config['COMPRESSION_GZIP_LEVEL'])
+
+    def after_request(self, response):
+        if not self.deve_comprimir(response):
+            return response
+
+        # A resposta depende do Accept-Encoding mesmo quando não comprimida
+        response.vary.add('Accept-Encoding')
+
+        codificacao = self.escolher_codificacao()
+        if not codificacao:
+            return response
+
+        try:
+            dados = self.comprimir(response.get_data(), codificacao)
+        except Exception as e:
+            logger.warning(f"Falha ao comprimir resposta ({codificacao}): {str(e)}")
+            return response
+
+        response.set_data(dados)
+        response.headers['Content-Encoding'] = codificacao
+
+        # O corpo muda de bytes, então um ETag forte deixaria de ser válido
+        etag, fraco = response.get_etag()
+        if etag and not fraco:
+            response.set_etag(etag, weak=True)
+
+        return response
@@ -0,0 +1,194 @@
+"""
+Respostas condicionais (ETag / Last-Modified) para as APIs de listagem
+
+Cada recurso (chamados, logs, ...) possui um contador em versoes_recursos que
+é incrementado logo depois do commit da transação que alterou as tabelas
+associadas, em uma transação curta própria: a linha do contador não fica
+bloqueada durante a transação do usuário, e um erro no versionamento não a
+afeta. Entre o commit e o incremento, um cliente pode receber um 304 antigo
+por alguns milissegundos. O token da resposta é calculado a partir desses contadores com uma única
+consulta por chave primária, antes de executar a view, permitindo responder
+304 sem montar nem serializar a listagem.
+"""
+import hashlib
+import logging
+import time
+from functools import wraps
+
+from flask import request, make_response
+from flask_login import current_user
+from sqlalchemy import event, insert, inspect, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_versionamento_ativo = False
+
+
+def _alterou_colunas_relevantes(obj, ignorar):
+    estado = inspect(obj)
+    for atributo in estado.mapper.column_attrs:
+        if atributo.key in ignorar:
+            continue
+        if estado.attrs[atributo.key].history.has_changes():
+            return True
+    return False
+
+
+def _recursos_alterados(session, mapa, ignorar):
+    recursos = set()
+    for obj in list(session.new) + list(session.deleted):
+        tabela = getattr(obj, '__tablename__', None)
+        if tabela in mapa:
+            recursos.update(mapa[tabela])
+    for obj in session.dirty:
+        tabela = getattr(obj, '__tablename__', None)
+        if tabela in mapa and _alterou_colunas_relevantes(obj, ignorar.get(tabela, ())):
+            recursos.update(mapa[tabela])
+    return recursos
+
+
+def incrementar_versoes(engine, recursos):
+    """Incrementa os contadores dos recursos informados, cada um em uma transação curta"""
+    from database import VersaoRecurso, get_brazil_time
+
+    tabela = VersaoRecurso.__table__
+    agora = get_brazil_time().replace(tzinfo=None)
+    for recurso in sorted(recursos):
+        incremento = (update(tabela)
+                      .where(tabela.c.recurso == recurso)
+                      .values(versao=tabela.c.versao + 1, data_atualizacao=agora))
+        try:
+            try:
+                with engine.begin() as connection:
+                    if connection.execute(incremento).rowcount == 0:
+                        connection.execute(insert(tabela).values(recurso=recurso, versao=1, data_atualizacao=agora))
+            except IntegrityError:
+                # Outro processo criou o contador ao mesmo tempo
+                with engine.begin() as connection:
+                    connection.execute(incremento)
+        except Exception as e:
+            logger.warning(f"Não foi possível incrementar versão do recurso {recurso}: {str(e)}")
+
+
+def init_versionamento(mapa, ignorar=None):
+    """
+    Registra os eventos do SQLAlchemy que mantêm versoes_recursos atualizado.
+    mapa: {tabela: [recursos]}; ignorar: {tabela: {colunas que não geram nova versão}}
+    """
+    global _versionamento_ativo
+    if _versionamento_ativo:
+        return
+    _versionamento_ativo = True
+    ignorar = ignorar or {}
+
+    def _registrar(session, recursos):
+        session.info.setdefault('_recursos_alterados', set()).update(recursos)
+
+    @event.listens_for(Session, 'before_flush')
+    def _coletar_recursos(session, flush_context, instances):
+        recursos = _recursos_alterados(session, mapa, ignorar)
+        if recursos:
+            _registrar(session, recursos)
+
+    def _coletar_em_massa(contexto):
+        tabela = getattr(contexto.mapper.local_table, 'name', None)
+        if tabela in mapa:
+            _registrar(contexto.session, mapa[tabela])
+
+    event.listen(Session, 'after_bulk_update', _coletar_em_massa)
+    event.listen(Session, 'after_bulk_delete', _coletar_em_massa)
+
+    # after_commit também dispara ao liberar um savepoint (begin_nested): só marca
+    # o commit e deixa o incremento para quando a transação externa terminar
+    @event.listens_for(Session, 'after_commit')
+    def _marcar_commit(session):
+        session.info['_commit_confirmado'] = True
+
+    @event.listens_for(Session, 'after_rollback')
+    def _desmarcar_commit(session):
+        session.info.pop('_commit_confirmado', None)
+
+    @event.listens_for(Session, 'after_transaction_end')
+    def _versionar(session, transaction):
+        if transaction.parent is not None:
+            return
+        confirmado = session.info.pop('_commit_confirmado', False)
+        recursos = session.info.pop('_recursos_alterados', None)
+        # Transação externa desfeita: as alterações não valeram
+        if confirmado and recursos:
+            incrementar_versoes(session.get_bind(), recursos)
+
+
+def obter_versoes(recursos):
+    """Retorna ({recurso: versao}, data da última alteração) com uma única consulta"""
+    from database import VersaoRecurso
+
+    linhas = VersaoRecurso.query.filter(VersaoRecurso.recurso.in_(list(recursos))).all()
+    versoes = {linha.recurso: linha.versao for linha in linhas}
+    datas = [linha.data_atualizacao for linha in linhas if linha.data_atualizacao]
+    return versoes, (max(datas) if datas else None)
+
+
+def calcular_etag(recursos, janela=None):
+    """Calcula o ETag da requisição atual e a data de última modificação"""
+    versoes, ultima_alteracao = obter_versoes(recursos)
+
+    partes = [f"{r}={versoes.get(r, 0)}" for r in sorted(recursos)]
+    partes.append(request.full_path)
+    if current_user and current_user.is_authenticated:
+        partes.append(f"u={current_user.id}")
+    if janela:
+        # Respostas que dependem do relógio (ex.: SLA) expiram a cada janela
+        partes.append(f"t={int(time.time() // janela)}")
+        ultima_alteracao = None
+
+    etag = hashlib.sha1('|'.join(partes).encode('utf-8')).hexdigest()
+    return etag, ultima_alteracao
+
+
+def conditional_response(*recursos, janela=None):
+    """
+    Decorador para endpoints GET que retornam JSON derivado dos recursos informados.
+    Deve ficar abaixo dos decoradores de autenticação para que eles rodem antes.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+
+            try:
+                etag, ultima_alteracao = calcular_etag(recursos, janela)
+            except Exception as e:
+                logger.warning(f"Falha ao calcular ETag para {request.path}: {str(e)}")
+                return f(*args, **kwargs)
+
+            last_modified = None
+            if ultima_alteracao:
+                from database import brazil_to_utc
+                last_modified = brazil_to_utc(ultima_alteracao).replace(microsecond=0)
+
+            if request.if_none_match:
+                nao_modificado = request.if_none_match.contains_weak(etag)
+            else:
+                nao_modificado = bool(
+                    last_modified and request.if_modified_since
+                    and last_modified <= request.if_modified_since
+                )
+
+            if nao_modificado:
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,89 @@
+"""
+Carregamento sob demanda de dependências pesadas ou opcionais
+
+modulo_preguicoso('msal') devolve um objeto que se comporta como o módulo,
+mas só o importa no primeiro acesso a um atributo. Assim integrações usadas
+por poucas rotas (Microsoft Graph, psutil, geradores de relatório) não pesam
+no import de cada worker e de cada script de manutenção.
+"""
+import importlib
+import logging
+import threading
+import time
+import types
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_registrados = {}
+
+
+class ModuloPreguicoso(types.ModuleType):
+    """Proxy que importa o módulo real no primeiro acesso"""
+
+    def __init__(self, nome, opcional=False):
+        super().__init__(nome)
+        self._lazy_nome = nome
+        self._lazy_opcional = opcional
+        self._lazy_modulo = None
+        self._lazy_erro = None
+
+    def _carregar(self):
+        if self._lazy_modulo is not None:
+            return self._lazy_modulo
+        if self._lazy_erro is not None:
+            raise ImportError(f"Dependência opcional '{self._lazy_nome}' não instalada") from self._lazy_erro
+
+        with _lock:
+            if self._lazy_modulo is None and self._lazy_erro is None:
+                inicio = time.perf_counter()
+                try:
+                    self._lazy_modulo = importlib.import_module(self._lazy_nome)
+                except ImportError as e:
+                    if not self._lazy_opcional:
+                        raise
+                    self._lazy_erro = e
+                    logger.warning(f"⚠️ Dependência opcional '{self._lazy_nome}' indisponível: {str(e)}")
+                    raise ImportError(f"Dependência opcional '{self._lazy_nome}' não instalada") from e
+                logger.debug(f"📦 {self._lazy_nome} carregado sob demanda em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        return self._carregar()
+
+    def __getattr__(self, atributo):
+        if atributo.startswith('_lazy_'):
+            raise AttributeError(atributo)
+        return getattr(self._carregar(), atributo)
+
+    def __dir__(self):
+        return dir(self._carregar())
+
+    def __repr__(self):
+        estado = 'carregado' if self._lazy_modulo is not None else 'pendente'
+        return f"<módulo preguiçoso '{self._lazy_nome}' ({estado})>"
+
+    @property
+    def disponivel(self):
+        """True se o módulo pode ser importado (importa na primeira verificação)"""
+        try:
+            self._carregar()
+            return True
+        except ImportError:
+            return False
+
+    @property
+    def carregado(self):
+        return self._lazy_modulo is not None
+
+
+def modulo_preguicoso(nome, opcional=False):
+    """Retorna o proxy compartilhado do módulo (um por nome)"""
+    with _lock:
+        proxy = _registrados.get(nome)
+        if proxy is None:
+            proxy = _registrados[nome] = ModuloPreguicoso(nome, opcional)
+        return proxy
+
+
+def modulos_preguicosos():
+    """Situação de cada módulo registrado: {nome: carregado}"""
+    with _lock:
+        return {nome: proxy.carregado for nome, proxy in _registrados.items()}
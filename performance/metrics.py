@@ -0,0 +1,225 @@
+"""
+Instrumentação de requisições com exposição no formato texto do Prometheus
+
+Por endpoint registra: histograma de latência, quantidade e tempo de SQL
+(via eventos do SQLAlchemy), tamanho da resposta e status HTTP. Os valores
+ficam em memória no processo; com vários workers, cada um expõe os seus.
+"""
+import hmac
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from flask import Blueprint, Response, abort, g, has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_TAMANHO = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+BUCKETS_SQL = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_labels(labels, extra=None):
+    itens = list(labels)
+    if extra:
+        itens.append(extra)
+    if not itens:
+        return ''
+    return '{' + ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in itens) + '}'
+
+
+class Histograma:
+    __slots__ = ('buckets', 'contagens', 'soma', 'total')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.contagens = [0] * len(buckets)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.soma += valor
+        self.total += 1
+        for i, limite in enumerate(self.buckets):
+            if valor <= limite:
+                self.contagens[i] += 1
+                break
+
+
+class RegistroMetricas:
+    """Armazena contadores, gauges e histogramas rotulados"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ajuda = {}
+        self._tipos = {}
+        self._contadores = defaultdict(float)
+        self._gauges = {}
+        self._histogramas = {}
+
+    def _registrar(self, nome, tipo, ajuda):
+        if nome not in self._tipos:
+            self._tipos[nome] = tipo
+            self._ajuda[nome] = ajuda or nome
+
+    def incrementar(self, nome, valor=1, ajuda=None, **labels):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._registrar(nome, 'counter', ajuda)
+            self._contadores[chave] += valor
+
+    def definir(self, nome, valor, ajuda=None, **labels):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._registrar(nome, 'gauge', ajuda)
+            self._gauges[chave] = valor
+
+    def observar(self, nome, valor, buckets=BUCKETS_LATENCIA, ajuda=None, **labels):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._registrar(nome, 'histogram', ajuda)
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma(buckets)
+            histograma.observar(valor)
+
+    def valor(self, nome, **labels):
+        """Valor atual de um contador ou gauge (útil em testes e diagnósticos)"""
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            if chave in self._gauges:
+                return self._gauges[chave]
+            return self._contadores.get(chave, 0)
+
+    def limpar(self):
+        with self._lock:
+            self._contadores.clear()
+            self._gauges.clear()
+            self._histogramas.clear()
+
+    def exportar(self):
+        """Gera o texto no formato de exposição do Prometheus"""
+        with self._lock:
+            series = defaultdict(list)
+            for (nome, labels), valor in self._contadores.items():
+                series[nome].append(f"{nome}{_formatar_labels(labels)} {valor:g}")
+            for (nome, labels), valor in self._gauges.items():
+                series[nome].append(f"{nome}{_formatar_labels(labels)} {valor:g}")
+            for (nome, labels), h in self._histogramas.items():
+                acumulado = 0
+                for limite, contagem in zip(h.buckets, h.contagens):
+                    acumulado += contagem
+                    series[nome].append(f"{nome}_bucket{_formatar_labels(labels, ('le', f'{limite:g}'))} {acumulado}")
+                series[nome].append(f"{nome}_bucket{_formatar_labels(labels, ('le', '+Inf'))} {h.total}")
+                series[nome].append(f"{nome}_sum{_formatar_labels(labels)} {h.soma:g}")
+                series[nome].append(f"{nome}_count{_formatar_labels(labels)} {h.total}")
+
+            linhas = []
+            for nome in sorted(series):
+                linhas.append(f"# HELP {nome} {self._ajuda[nome]}")
+                linhas.append(f"# TYPE {nome} {self._tipos[nome]}")
+                linhas.extend(series[nome])
+            return '\n'.join(linhas) + '\n'
+
+
+# Instância global usada pelos demais módulos (ex.: contadores de e-mail)
+registro = RegistroMetricas()
+
+
+def _antes_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_metricas_inicio', []).append(time.perf_counter())
+
+
+def _depois_cursor(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get('_metricas_inicio')
+    if not inicios:
+        return
+    duracao = time.perf_counter() - inicios.pop()
+    if has_request_context() and hasattr(g, '_metricas_sql_qtd'):
+        g._metricas_sql_qtd += 1
+        g._metricas_sql_tempo += duracao
+
+
+class MetricsMiddleware:
+    def __init__(self, app=None, registro_metricas=None):
+        self.app = app
+        self.registro = registro_metricas or registro
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        # Configurações padrão
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_ENDPOINT', '/metrics')
+        app.config.setdefault('METRICS_TOKEN', None)
+
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+
+        if not event.contains(Engine, 'before_cursor_execute', _antes_cursor):
+            event.listen(Engine, 'before_cursor_execute', _antes_cursor)
+            event.listen(Engine, 'after_cursor_execute', _depois_cursor)
+
+        bp = Blueprint('metricas', __name__)
+        bp.add_url_rule(app.config['METRICS_ENDPOINT'], 'exportar', self.exportar)
+        app.register_blueprint(bp)
+
+        logger.info("MetricsMiddleware inicializado")
+
+    def before_request(self):
+        g._metricas_inicio = time.perf_counter()
+        g._metricas_sql_qtd = 0
+        g._metricas_sql_tempo = 0.0
+
+    def after_request(self, response):
+        inicio = g.pop('_metricas_inicio', None)
+        if inicio is None or request.endpoint == 'metricas.exportar':
+            return response
+
+        try:
+            duracao = time.perf_counter() - inicio
+            endpoint = request.endpoint or 'nao_encontrado'
+            metodo = request.method
+            # calculate_content_length() converteria respostas em streaming numa lista
+            tamanho = (response.content_length if response.is_streamed else response.calculate_content_length()) or 0
+
+            self.registro.observar('http_request_duration_seconds', duracao, BUCKETS_LATENCIA,
+                                   'Latência das requisições por endpoint', endpoint=endpoint, method=metodo)
+            self.registro.incrementar('http_requests_total', 1, 'Requisições por endpoint e status',
+                                      endpoint=endpoint, method=metodo, status=response.status_code)
+            self.registro.observar('http_response_size_bytes', tamanho, BUCKETS_TAMANHO,
+                                   'Tamanho do corpo da resposta', endpoint=endpoint, method=metodo)
+            self.registro.observar('http_request_sql_statements', g._metricas_sql_qtd, BUCKETS_SQL,
+                                   'Comandos SQL executados por requisição', endpoint=endpoint, method=metodo)
+            self.registro.incrementar('http_request_sql_seconds_total', g._metricas_sql_tempo,
+                                      'Tempo total gasto em SQL', endpoint=endpoint, method=metodo)
+        except Exception as e:
+            logger.warning(f"Erro ao registrar métricas: {str(e)}")
+
+        return response
+
+    def autorizado(self):
+        token = self.app.config.get('METRICS_TOKEN')
+        cabecalho = request.headers.get('Authorization', '')
+        if token and cabecalho.startswith('Bearer '):
+            return hmac.compare_digest(cabecalho[7:].strip(), token)
+        return current_user.is_authenticated and current_user.tem_permissao('Administrador')
+
+    def exportar(self):
+        if not self.autorizado():
+            abort(403)
+        return Response(self.registro.exportar(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,231 @@
+"""
+Log de consultas lentas e detector de N+1
+
+- Consultas acima de SLOW_QUERY_THRESHOLD_MS são registradas com a rota e o
+  trecho do código que as disparou (sempre ativo, custo de uma comparação)
+- Com QUERY_PROFILER_MODE 'warn' ou 'strict', o formato de cada SELECT é
+  normalizado e contado por requisição; formatos repetidos a partir de
+  QUERY_PROFILER_N1_THRESHOLD vezes são candidatos a N+1. 'warn' apenas
+  registra no log; 'strict' (padrão em TESTING) registra como erro e marca a
+  resposta com o cabeçalho X-Query-N-Plus-One. Só em TESTING (e em
+  monitorar()) levanta NPlusOneError: fora dos testes a view já rodou e fez
+  commit, e um 500 nessa hora só esconderia do cliente o que foi gravado.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+MODOS = ('off', 'warn', 'strict')
+
+_RAIZ_PROJETO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_DIR_PROFILER = os.path.dirname(os.path.abspath(__file__))
+
+_RE_LISTA_PARAMETROS = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+_RE_NUMEROS = re.compile(r'\b\d+\b')
+_RE_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_RE_ESPACOS = re.compile(r'\s+')
+
+_local = threading.local()
+_config = {'modo': 'off', 'limite_lento': 0.5, 'limite_n1': 5}
+
+
+class NPlusOneError(RuntimeError):
+    """Levantada no modo strict quando uma requisição repete o mesmo SELECT"""
+
+
+def normalizar_consulta(statement):
+    """Reduz o SQL a um formato comparável (listas IN, números e textos viram ?)"""
+    forma = _RE_TEXTO.sub('?', statement)
+    forma = _RE_LISTA_PARAMETROS.sub('(?)', forma)
+    forma = _RE_NUMEROS.sub('?', forma)
+    return _RE_ESPACOS.sub(' ', forma).strip()
+
+
+def _eh_biblioteca(arquivo):
+    return (arquivo.startswith('<') or 'site-packages' in arquivo
+            or arquivo.startswith(_DIR_PROFILER) or arquivo.startswith(sys.prefix))
+
+
+def local_chamada():
+    """Frame mais interno do projeto (fora de bibliotecas e deste módulo) na pilha atual"""
+    externo = None
+    for frame in reversed(traceback.extract_stack()):
+        if _eh_biblioteca(frame.filename):
+            continue
+        arquivo = os.path.abspath(frame.filename)
+        if arquivo.startswith(_RAIZ_PROJETO):
+            return f"{os.path.relpath(arquivo, _RAIZ_PROJETO)}:{frame.lineno} em {frame.name}"
+        externo = externo or f"{arquivo}:{frame.lineno} em {frame.name}"
+    return externo or 'desconhecido'
+
+
+class _EstadoPerfil:
+    __slots__ = ('nome', 'formas', 'locais', 'ignorar_n1')
+
+    def __init__(self, nome):
+        self.nome = nome
+        self.formas = Counter()
+        self.locais = {}
+        self.ignorar_n1 = False
+
+    def candidatos(self, limite):
+        return [(forma, qtd, self.locais.get(forma)) for forma, qtd in self.formas.items() if qtd >= limite]
+
+
+def _estado_atual():
+    return getattr(_local, 'estado', None)
+
+
+def _antes_cursor(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_perfil_inicio', []).append(time.perf_counter())
+
+
+def _depois_cursor(conn, cursor, statement, parameters, context, executemany):
+    inicios = conn.info.get('_perfil_inicio')
+    if not inicios:
+        return
+    duracao = time.perf_counter() - inicios.pop()
+    estado = _estado_atual()
+
+    if duracao >= _config['limite_lento']:
+        origem = estado.nome if estado else (request.endpoint if has_request_context() else 'fora de requisição')
+        logger.warning(
+            f"🐢 Consulta lenta ({duracao * 1000:.0f} ms) em {origem} [{local_chamada()}]: {statement[:500]}"
+        )
+        _registrar_metrica('sql_slow_queries_total', 'Consultas acima do limite de lentidão', origem)
+
+    if estado is None or _config['modo'] == 'off':
+        return
+    if not statement.lstrip()[:6].upper() == 'SELECT':
+        return
+
+    forma = normalizar_consulta(statement)
+    estado.formas[forma] += 1
+    if estado.formas[forma] == _config['limite_n1']:
+        # A pilha no momento em que o limite é atingido aponta para o laço
+        estado.locais[forma] = local_chamada()
+
+
+def _registrar_metrica(nome, ajuda, origem):
+    try:
+        from performance.metrics import registro
+        registro.incrementar(nome, 1, ajuda, endpoint=origem)
+    except Exception:
+        pass
+
+
+def _iniciar(nome):
+    _local.estado = _EstadoPerfil(nome)
+
+
+def _finalizar():
+    """Encerra o perfil atual, registra os candidatos a N+1 e os devolve (nome, candidatos)"""
+    estado = _estado_atual()
+    _local.estado = None
+    if estado is None or estado.ignorar_n1 or _config['modo'] == 'off':
+        return None, []
+
+    candidatos = estado.candidatos(_config['limite_n1'])
+    nivel = logging.ERROR if _config['modo'] == 'strict' else logging.WARNING
+    for forma, quantidade, local in candidatos:
+        logger.log(nivel, f"🔁 Possível N+1 em {estado.nome}: {quantidade}x [{local}] {forma[:300]}")
+        _registrar_metrica('sql_n_plus_one_total', 'Formatos de SELECT repetidos na mesma requisição', estado.nome)
+    return estado.nome, candidatos
+
+
+def _erro_n_mais_1(nome, candidatos):
+    forma, quantidade, local = candidatos[0]
+    return NPlusOneError(
+        f"{nome}: SELECT repetido {quantidade}x em {local} "
+        f"({len(candidatos)} formato(s) suspeito(s)): {forma[:300]}"
+    )
+
+
+@contextmanager
+def monitorar(nome):
+    """Perfil de consultas fora de requisições (scripts, CLI, workers)"""
+    anterior = _estado_atual()
+    _iniciar(nome)
+    try:
+        yield
+        nome, candidatos = _finalizar()
+        if candidatos and _config['modo'] == 'strict':
+            raise _erro_n_mais_1(nome, candidatos)
+    finally:
+        _local.estado = anterior
+
+
+def ignorar_n_mais_1(f):
+    """Marca uma view cujo padrão de consultas repetidas é conhecido e aceito"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        estado = _estado_atual()
+        if estado is not None:
+            estado.ignorar_n1 = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+class QueryProfiler:
+    def __init__(self, app=None):
+        self.app = app
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        # Configurações padrão
+        modo_padrao = 'strict' if app.testing else ('warn' if app.debug else 'off')
+        if not app.config.get('QUERY_PROFILER_MODE'):
+            app.config['QUERY_PROFILER_MODE'] = os.environ.get('QUERY_PROFILER_MODE') or modo_padrao
+        app.config.setdefault('SLOW_QUERY_THRESHOLD_MS', 500)
+        app.config.setdefault('QUERY_PROFILER_N1_THRESHOLD', 5)
+
+        modo = app.config['QUERY_PROFILER_MODE']
+        if modo not in MODOS:
+            logger.warning(f"QUERY_PROFILER_MODE inválido: {modo}; usando 'off'")
+            modo = 'off'
+        _config['modo'] = modo
+        _config['limite_lento'] = app.config['SLOW_QUERY_THRESHOLD_MS'] / 1000.0
+        _config['limite_n1'] = app.config['QUERY_PROFILER_N1_THRESHOLD']
+
+        if not event.contains(Engine, 'before_cursor_execute', _antes_cursor):
+            event.listen(Engine, 'before_cursor_execute', _antes_cursor)
+            event.listen(Engine, 'after_cursor_execute', _depois_cursor)
+
+        if modo != 'off':
+            app.before_request(self.before_request)
+            app.after_request(self.after_request)
+            app.teardown_request(self.teardown_request)
+
+        logger.info(f"QueryProfiler inicializado (modo {modo})")
+
+    def before_request(self):
+        _iniciar(request.endpoint or request.path)
+
+    def after_request(self, response):
+        nome, candidatos = _finalizar()
+        if candidatos and _config['modo'] == 'strict':
+            response.headers['X-Query-N-Plus-One'] = str(len(candidatos))
+            if self.app.testing:
+                raise _erro_n_mais_1(nome, candidatos)
+        return response
+
+    def teardown_request(self, exc):
+        # Garante que o estado não vaze para a próxima requisição da thread
+        _local.estado = None
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Pico de memória ao enviar e-mails com anexos grandes (tracemalloc).
+
+Sobe o stand-in do Graph/SMTP (tests/servidor_email_falso.py) em outro
+processo e envia a mesma mensagem com N arquivos de M MB:
+
+- graph legado: arquivos lidos inteiros, base64 e JSON único no sendMail
+- graph streaming: rascunho + upload session em fatias lidas do disco
+- smtp legado: MIMEBase.set_payload + send_message (mensagem inteira em memória)
+- smtp streaming: MIME gerado em blocos direto no socket (EmailService)
+
+Uso: python scripts/benchmark_anexos_email.py [--arquivos 3] [--mb 10]
+Falha (código 1) se o pico do streaming passar de --limite-mb.
+"""
+import argparse
+import base64
+import json
+import os
+import smtplib
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import requests
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(RAIZ)
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def aguardar_porta(porta, timeout=10):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            socket.create_connection(('127.0.0.1', porta), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Porta {porta} não respondeu")
+
+
+def medir(nome, funcao):
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    funcao()
+    duracao = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{nome:<18} pico {pico / 1024 / 1024:8.1f} MB   {duracao * 1000:8.0f} ms")
+    return pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pico de memória no envio de anexos')
+    parser.add_argument('--arquivos', type=int, default=3)
+    parser.add_argument('--mb', type=int, default=10)
+    parser.add_argument('--limite-mb', type=float, default=8.0)
+    args = parser.parse_args()
+
+    porta_graph, porta_smtp = porta_livre(), porta_livre()
+    servidor = subprocess.Popen([sys.executable, os.path.join(RAIZ, 'tests', 'servidor_email_falso.py'),
+                                 '--porta-graph', str(porta_graph), '--porta-smtp', str(porta_smtp)],
+                                stdout=subprocess.DEVNULL)
+    pasta = tempfile.mkdtemp(prefix='anexos-')
+    try:
+        aguardar_porta(porta_graph)
+        aguardar_porta(porta_smtp)
+        os.environ.update(
+            MICROSOFT_GRAPH_SMTP_SERVER='127.0.0.1', MICROSOFT_GRAPH_SMTP_PORT=str(porta_smtp),
+            MICROSOFT_GRAPH_SMTP_STARTTLS='false', MICROSOFT_GRAPH_USERNAME='ti@teste.local',
+            MICROSOFT_GRAPH_PASSWORD='x'
+        )
+        from setores.ti.anexos_email import normalizar_anexos
+        from setores.ti.email_service import EmailService
+        from setores.ti.graph_auth import ProvedorTokenGraph
+        from setores.ti.graph_client import ClienteGraph
+
+        anexos = []
+        for i in range(args.arquivos):
+            caminho = os.path.join(pasta, f"video{i}.mp4")
+            with open(caminho, 'wb') as arquivo:
+                for _ in range(args.mb):
+                    arquivo.write(os.urandom(1024 * 1024))
+            anexos.append({'nome': f"video{i}.mp4", 'content_type': 'video/mp4', 'caminho': caminho})
+
+        url_base = f"http://127.0.0.1:{porta_graph}"
+
+        def token_falso(provedor):
+            # O MSAL só fala https: o token vem direto do servidor falso
+            return requests.post(f"{url_base}/{provedor.tenant_id}/oauth2/v2.0/token", data={
+                'grant_type': 'client_credentials', 'client_id': provedor.client_id,
+                'client_secret': provedor.client_secret, 'scope': ' '.join(provedor.scopes)
+            }, timeout=10).json()
+
+        cliente = ClienteGraph(f"{url_base}/v1.0", ProvedorTokenGraph(
+            'cliente', 'segredo', 'tenant', ['https://graph.microsoft.com/.default'], buscar_token=token_falso
+        ))
+        servico = EmailService()
+        mensagem = {
+            'message': {
+                'subject': 'Benchmark de anexos',
+                'body': {'contentType': 'Text', 'content': 'Segue em anexo.'},
+                'toRecipients': [{'emailAddress': {'address': 'destino@teste.local'}}]
+            },
+            'saveToSentItems': False
+        }
+        # Aquece token, sessão HTTP e pool SMTP fora da medição
+        cliente.enviar_email('ti@teste.local', mensagem)
+        servico.enviar_email('destino@teste.local', 'aquecimento', '<p>oi</p>')
+
+        def graph_legado():
+            anexos_json = []
+            for anexo in anexos:
+                with open(anexo['caminho'], 'rb') as fh:
+                    dados = fh.read()
+                anexos_json.append({
+                    "@odata.type": "#microsoft.graph.fileAttachment",
+                    "name": anexo['nome'], "contentType": anexo['content_type'],
+                    "contentBytes": base64.b64encode(dados).decode('utf-8')
+                })
+            corpo = dict(mensagem, message=dict(mensagem['message'], attachments=anexos_json))
+            cliente.sessao.post(f"{url_base}/v1.0/users/ti@teste.local/sendMail", data=json.dumps(corpo),
+                                headers={'Authorization': f"Bearer {cliente.provedor_token.obter_token()}",
+                                         'Content-Type': 'application/json'}).raise_for_status()
+
+        def graph_streaming():
+            cliente.enviar_email_com_anexos('ti@teste.local', mensagem, normalizar_anexos(anexos))
+
+        def smtp_legado():
+            msg = MIMEMultipart()
+            msg['From'], msg['To'], msg['Subject'] = 'ti@teste.local', 'destino@teste.local', 'Benchmark'
+            msg.attach(MIMEText('<p>Segue em anexo.</p>', 'html', 'utf-8'))
+            for anexo in anexos:
+                with open(anexo['caminho'], 'rb') as fh:
+                    parte = MIMEBase('video', 'mp4')
+                    parte.set_payload(fh.read())
+                encoders.encode_base64(parte)
+                parte.add_header('Content-Disposition', 'attachment', filename=anexo['nome'])
+                msg.attach(parte)
+            with smtplib.SMTP('127.0.0.1', porta_smtp) as smtp:
+                smtp.login('ti@teste.local', 'x')
+                smtp.send_message(msg)
+
+        def smtp_streaming():
+            if not servico.enviar_email('destino@teste.local', 'Benchmark', '<p>Segue em anexo.</p>', anexos=anexos):
+                raise RuntimeError('Envio SMTP falhou')
+
+        total_mb = args.arquivos * args.mb
+        print(f"📎 {args.arquivos} arquivo(s) de {args.mb} MB ({total_mb} MB no total)\n")
+        medir('graph legado', graph_legado)
+        pico_graph = medir('graph streaming', graph_streaming)
+        medir('smtp legado', smtp_legado)
+        pico_smtp = medir('smtp streaming', smtp_streaming)
+
+        recebidas = json.loads(cliente.sessao.get(f"{url_base}/_mensagens").text)
+        tamanhos = [sorted(m['anexos']) for m in recebidas if m['anexos']]
+        print(f"\n📨 Mensagens com anexos recebidas pelo stand-in: {len(tamanhos)}")
+
+        limite = args.limite_mb * 1024 * 1024
+        if max(pico_graph, pico_smtp) > limite:
+            print(f"❌ Pico do streaming acima de {args.limite_mb} MB")
+            return 1
+        print(f"✅ Pico do streaming abaixo de {args.limite_mb} MB")
+        return 0
+    finally:
+        servidor.terminate()
+        servidor.wait()
+        for nome in os.listdir(pasta):
+            os.remove(os.path.join(pasta, nome))
+        os.rmdir(pasta)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark do tempo de inicialização a frio de um worker.
+
+Cada medição roda em um processo novo (como um worker do gunicorn ou um
+script que faz `from app import app`) e compara:
+
+- atual: apenas importar app.py (create_app, sem acesso ao banco)
+- legado: importar e executar a inicialização que antes rodava no import
+  (create_all, verificação de seeds e reset do hash da senha do admin)
+
+O banco de desenvolvimento é inicializado uma vez antes das medições.
+
+Uso: python scripts/benchmark_inicializacao.py [--repeticoes 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CODIGO_ATUAL = """
+import time
+inicio = time.perf_counter()
+import app
+print(time.perf_counter() - inicio)
+"""
+
+CODIGO_LEGADO = """
+import time
+inicio = time.perf_counter()
+import app
+with app.app.app_context():
+    app.inicializar_banco(resetar_senha_admin=True)
+print(time.perf_counter() - inicio)
+"""
+
+
+def medir(codigo):
+    resultado = subprocess.run(
+        [sys.executable, '-c', codigo],
+        cwd=RAIZ, capture_output=True, text=True, check=True
+    )
+    return float(resultado.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de inicialização da aplicação')
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    print("🔄 Inicializando o banco de desenvolvimento...")
+    subprocess.run([sys.executable, 'app.py', 'init-db'], cwd=RAIZ, capture_output=True, check=True)
+
+    # Primeira execução aquece o cache de bytecode e do sistema de arquivos
+    medir(CODIGO_ATUAL)
+
+    tempos_atual = [medir(CODIGO_ATUAL) for _ in range(args.repeticoes)]
+    tempos_legado = [medir(CODIGO_LEGADO) for _ in range(args.repeticoes)]
+
+    atual = min(tempos_atual)
+    legado = min(tempos_legado)
+    print(f"📊 Melhor de {args.repeticoes} processos")
+    print(f"{'legado (import + init)':<26} {legado * 1000:8.1f} ms")
+    print(f"{'atual (só import)':<26} {atual * 1000:8.1f} ms")
+    print(f"⚡ Ganho por worker: {(legado - atual) * 1000:.1f} ms ({legado / atual:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
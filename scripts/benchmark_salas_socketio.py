@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Fan-out dos eventos Socket.IO: broadcast x salas.
+
+Conecta N clientes simulados no gerenciador de salas do python-socketio
+(mesmo caminho do emit real, só o envio ao socket é contado) com um perfil
+parecido com o de produção: poucos administradores, algumas dezenas de
+agentes, membros de grupos responsáveis por unidades e o restante
+solicitantes. Cada sessão entra nas mesmas salas que o connect do app.py
+coloca (salas_do_usuario) e agentes acompanham alguns chamados.
+
+Depois dispara uma sequência de eventos de chamado duas vezes: sem sala
+(como era) e com salas_do_chamado (como as rotas emitem agora), e compara
+entregas, bytes e tempo.
+
+Uso: python scripts/benchmark_salas_socketio.py [--clientes 500] [--eventos 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import socketio
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from setores.ti.salas_socketio import (  # noqa: E402
+    SALA_ADMINS, SALA_AGENTES, sala_agente, sala_chamado, sala_unidade, sala_usuario, salas_do_chamado
+)
+
+UNIDADES = [f"Evoque {i:02d}" for i in range(80)]
+
+# Proporção dos eventos emitidos pelas rotas em um dia típico
+EVENTOS = [
+    ('status_atualizado', 40),
+    ('novo_chamado', 20),
+    ('chamado_atribuido', 15),
+    ('chamado_atualizado', 10),
+    ('chamado_transferido', 10),
+    ('chamado_reaberto', 5),
+]
+
+
+class Contador:
+    """Substitui o envio ao socket: conta pacotes e bytes por evento"""
+
+    def __init__(self):
+        self.evento = None
+        self.entregas = Counter()
+        self.bytes = Counter()
+
+    def __call__(self, eio_sid, pkt):
+        self.entregas[self.evento] += 1
+        self.bytes[self.evento] += len(pkt.data)
+
+
+def montar_clientes(servidor, quantidade, rng):
+    """Conecta as sessões simuladas; devolve (usuários, agentes, chamados)"""
+    admins = max(1, quantidade // 100)
+    agentes = max(1, quantidade // 20)
+    gestores = quantidade // 4
+    usuarios, ids_agentes = [], []
+    for i in range(quantidade):
+        salas = [sala_usuario(i + 1)]
+        if i < admins:
+            salas.append(SALA_ADMINS)
+        elif i < admins + agentes:
+            ids_agentes.append(i + 1)
+            salas += [SALA_AGENTES, sala_agente(i + 1)]
+        elif i < admins + agentes + gestores:
+            salas += [sala_unidade(u) for u in rng.sample(UNIDADES, rng.randint(1, 3))]
+        usuarios.append((i + 1, salas))
+
+    # Chamados abertos por solicitantes (podem repetir)
+    solicitantes = [uid for uid, _ in usuarios[admins + agentes:]]
+    chamados = [
+        SimpleNamespace(id=n + 1, usuario_id=rng.choice(solicitantes), unidade=rng.choice(UNIDADES),
+                        agente_id=rng.choice(ids_agentes))
+        for n in range(quantidade * 2)
+    ]
+
+    for uid, salas in usuarios:
+        sid = servidor.manager.connect(f"eio-{uid}", '/')
+        for sala in salas:
+            servidor.manager.enter_room(sid, '/', sala)
+        if uid in ids_agentes:
+            # Tela de detalhe aberta em alguns chamados do próprio agente
+            for chamado in rng.sample(chamados, 2):
+                servidor.manager.enter_room(sid, '/', sala_chamado(chamado.id))
+    return usuarios, ids_agentes, chamados
+
+
+def salas_do_evento(evento, chamado, ids_agentes, rng):
+    """Mesmo público que as rotas usam para cada evento"""
+    if evento in ('novo_chamado', 'chamado_reaberto'):
+        return salas_do_chamado(chamado, fila=True)
+    if evento == 'chamado_atribuido':
+        return salas_do_chamado(chamado, agentes=(chamado.agente_id,)) + [SALA_AGENTES]
+    if evento == 'chamado_transferido':
+        return salas_do_chamado(chamado, agentes=(chamado.agente_id, rng.choice(ids_agentes)))
+    return salas_do_chamado(chamado, agentes=(chamado.agente_id,))
+
+
+def executar(servidor, contador, sequencia, com_salas, ids_agentes, seed):
+    rng = random.Random(seed)
+    contador.entregas.clear()
+    contador.bytes.clear()
+    inicio = time.perf_counter()
+    for evento, chamado in sequencia:
+        contador.evento = evento
+        dados = {'chamado_id': chamado.id, 'codigo': f"TI-{chamado.id:06d}", 'unidade': chamado.unidade}
+        salas = salas_do_evento(evento, chamado, ids_agentes, rng) if com_salas else None
+        servidor.emit(evento, dados, to=list(dict.fromkeys(salas)) if salas else None)
+    return time.perf_counter() - inicio, Counter(contador.entregas), Counter(contador.bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--clientes', type=int, default=500)
+    parser.add_argument('--eventos', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    servidor = socketio.Server()
+    contador = Contador()
+    servidor._send_eio_packet = contador
+
+    usuarios, ids_agentes, chamados = montar_clientes(servidor, args.clientes, rng)
+    nomes, pesos = zip(*EVENTOS)
+    sequencia = [(rng.choices(nomes, pesos)[0], rng.choice(chamados)) for _ in range(args.eventos)]
+    por_evento = Counter(evento for evento, _ in sequencia)
+
+    tempo_b, entregas_b, bytes_b = executar(servidor, contador, sequencia, False, ids_agentes, args.seed)
+    tempo_s, entregas_s, bytes_s = executar(servidor, contador, sequencia, True, ids_agentes, args.seed)
+
+    print(f"{len(usuarios)} clientes ({len(ids_agentes)} agentes), {args.eventos} eventos\n")
+    print(f"{'evento':<22}{'emitidos':>9}{'broadcast/ev':>14}{'salas/ev':>10}{'redução':>9}")
+    for evento in nomes:
+        n = por_evento[evento]
+        if not n:
+            continue
+        b, s = entregas_b[evento] / n, entregas_s[evento] / n
+        print(f"{evento:<22}{n:>9}{b:>14.1f}{s:>10.1f}{1 - s / b:>9.1%}")
+
+    total_b, total_s = sum(entregas_b.values()), sum(entregas_s.values())
+    print(f"\n{'entregas':<22}{total_b:>12,} -> {total_s:,} ({1 - total_s / total_b:.1%} a menos)")
+    print(f"{'bytes':<22}{sum(bytes_b.values()):>12,} -> {sum(bytes_s.values()):,}")
+    print(f"{'tempo de emit':<22}{tempo_b * 1000:>10.1f}ms -> {tempo_s * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
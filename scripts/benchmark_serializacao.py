@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark da serialização JSON das listagens de chamados.
+
+Compara o caminho antigo (dict montado campo a campo com strftime + json da
+biblioteca padrão, como o jsonify fazia) com o serializador declarativo
+CHAMADO + dumps() (orjson quando instalado) em um payload de 10k chamados.
+
+Uso: python scripts/benchmark_serializacao.py [--chamados 10000] [--repeticoes 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from setores.ti.utils import serializacao  # noqa: E402
+from setores.ti.utils.serializacao import CHAMADO, dumps  # noqa: E402
+
+
+def gerar_chamados(quantidade):
+    base = datetime(2024, 1, 1, 8, 0, 0)
+    chamados = []
+    for i in range(quantidade):
+        chamados.append(SimpleNamespace(
+            id=i + 1,
+            codigo=f"TI-{i + 1:06d}",
+            protocolo=f"2024{i + 1:08d}",
+            solicitante=f"Solicitante {i}",
+            email=f"usuario{i}@academiaevoque.com.br",
+            cargo='Recepcionista',
+            telefone='(11) 99999-0000',
+            unidade=f"Unidade {i % 80}",
+            problema='Internet',
+            descricao='Sem acesso à internet na recepção desde a abertura da unidade. ' * 3,
+            internet_item='Roteador',
+            data_visita=date(2024, 2, 1) if i % 3 == 0 else None,
+            data_abertura=base + timedelta(minutes=i),
+            status='Aberto',
+            prioridade='Normal',
+        ))
+    return chamados
+
+
+def serializar_legado(chamados):
+    lista = []
+    for c in chamados:
+        lista.append({
+            'id': c.id,
+            'codigo': c.codigo if hasattr(c, 'codigo') else None,
+            'protocolo': c.protocolo if hasattr(c, 'protocolo') else None,
+            'solicitante': c.solicitante if hasattr(c, 'solicitante') else None,
+            'email': c.email if hasattr(c, 'email') else None,
+            'cargo': c.cargo if hasattr(c, 'cargo') else None,
+            'telefone': c.telefone if hasattr(c, 'telefone') else None,
+            'unidade': c.unidade if hasattr(c, 'unidade') else None,
+            'problema': c.problema if hasattr(c, 'problema') else None,
+            'descricao': c.descricao if hasattr(c, 'descricao') else None,
+            'internet_item': c.internet_item if hasattr(c, 'internet_item') else None,
+            'data_visita': c.data_visita.strftime('%d/%m/%Y') if c.data_visita else None,
+            'data_abertura': c.data_abertura.strftime('%d/%m/%Y %H:%M:%S') if c.data_abertura else None,
+            'status': c.status if hasattr(c, 'status') else 'Aberto',
+            'prioridade': c.prioridade if hasattr(c, 'prioridade') else 'Normal',
+            'visita_tecnica': c.visita_tecnica if hasattr(c, 'visita_tecnica') else False,
+        })
+    # Mesmas opções do DefaultJSONProvider do Flask
+    return json.dumps(lista, ensure_ascii=True, sort_keys=True).encode('utf-8')
+
+
+def serializar_novo(chamados):
+    return dumps(CHAMADO.muitos(chamados))
+
+
+def serializar_novo_stdlib(chamados):
+    orjson = serializacao.orjson
+    serializacao.orjson = None
+    try:
+        return dumps(CHAMADO.muitos(chamados))
+    finally:
+        serializacao.orjson = orjson
+
+
+def medir(nome, funcao, chamados, repeticoes):
+    tempos = []
+    tamanho = 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        tamanho = len(funcao(chamados))
+        tempos.append(time.perf_counter() - inicio)
+    melhor = min(tempos)
+    print(f"{nome:<28} {melhor * 1000:8.1f} ms  {tamanho / 1024:8.0f} KB")
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de serialização JSON')
+    parser.add_argument('--chamados', type=int, default=10000)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    chamados = gerar_chamados(args.chamados)
+    print(f"📊 {args.chamados} chamados, melhor de {args.repeticoes} execuções "
+          f"(orjson {'disponível' if serializacao.orjson else 'indisponível'})")
+
+    legado = medir('legado (stdlib + strftime)', serializar_legado, chamados, args.repeticoes)
+    medir('novo (stdlib)', serializar_novo_stdlib, chamados, args.repeticoes)
+    novo = medir('novo (padrão)', serializar_novo, chamados, args.repeticoes)
+    print(f"⚡ Ganho total: {legado / novo:.1f}x")
+
+    # Apenas a etapa de codificação, com a mesma lista de dicts
+    lista = CHAMADO.muitos(chamados)
+    codificar_legado = medir('só json.dumps (jsonify)', lambda _: json.dumps(lista, ensure_ascii=True, sort_keys=True), chamados, args.repeticoes)
+    codificar_novo = medir('só dumps()', lambda _: dumps(lista), chamados, args.repeticoes)
+    print(f"⚡ Ganho na codificação: {codificar_legado / codificar_novo:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark da renderização do e-mail de grupo (enviar_email_grupo).
+
+Compara, para um grupo de N membros:
+
+- legado: jinja2.Template() criado a partir da string inline a cada
+  requisição e render() completo por membro
+- registro: template pré-compilado do registro, render() completo por membro
+- preparado: templates_email.preparar() com fragmentos estáticos; por
+  membro só o nome é escapado e concatenado
+
+Uso: python scripts/benchmark_templates_email.py [--membros 5000] [--repeticoes 3]
+"""
+import argparse
+import os
+import sys
+import time
+
+from jinja2 import Template
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from setores.ti.utils.templates_email import templates_email  # noqa: E402
+
+TEMPLATE_LEGADO = """
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <style>
+                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
+                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
+                .header { background-color: #007bff; color: white; padding: 20px; text-align: center; }
+                .content { background-color: #f8f9fa; padding: 20px; }
+                .message { background-color: white; padding: 20px; margin: 15px 0; }
+                .footer { text-align: center; margin-top: 20px; font-size: 12px; color: #666; }
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>{{ assunto }}</h1>
+                </div>
+                <div class="content">
+                    <p>Olá <strong>{{ nome_destinatario }}</strong>,</p>
+                    <div class="message">
+                        {{ mensagem|safe }}
+                    </div>
+                    <p><em>Esta mensagem foi enviada para o grupo: <strong>{{ nome_grupo }}</strong></em></p>
+                </div>
+                <div class="footer">
+                    <p>Enviado por: {{ remetente }} em {{ data_envio }}</p>
+                    <p>Sistema ERP Evoque Fitness</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """
+
+CONTEXTO = {
+    'assunto': 'Manutenção programada da rede',
+    'mensagem': '<p>A rede das unidades ficará indisponível no domingo das 6h às 8h.</p>' * 5,
+    'nome_grupo': 'Gerentes de Unidade',
+    'remetente': 'Equipe TI',
+    'data_envio': '01/02/2024 às 10:00',
+}
+
+
+def legado(nomes):
+    template = Template(TEMPLATE_LEGADO)
+    return [template.render(nome_destinatario=nome, **CONTEXTO) for nome in nomes]
+
+
+def registro(nomes):
+    template = templates_email.obter('grupo.html')
+    return [template.render(nome_destinatario=nome, **CONTEXTO) for nome in nomes]
+
+
+def preparado(nomes):
+    template = templates_email.preparar('grupo.html', ('nome_destinatario',), **CONTEXTO)
+    return [template.render(nome_destinatario=nome) for nome in nomes]
+
+
+def medir(nome, funcao, nomes, repeticoes):
+    melhor = min(_cronometrar(funcao, nomes) for _ in range(repeticoes))
+    print(f"{nome:<12} {melhor * 1000:8.1f} ms  {len(nomes) / melhor:10.0f} renders/s")
+    return melhor
+
+
+def _cronometrar(funcao, nomes):
+    inicio = time.perf_counter()
+    funcao(nomes)
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dos templates de e-mail')
+    parser.add_argument('--membros', type=int, default=5000)
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    nomes = [f"Membro {i} <{i}@academiaevoque.com.br>" for i in range(args.membros)]
+
+    inicio = time.perf_counter()
+    templates_email.ambiente
+    print(f"📧 Registro carregado em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    print(f"📊 Grupo de {args.membros} membros, melhor de {args.repeticoes} execuções")
+
+    tempo_legado = medir('legado', legado, nomes, args.repeticoes)
+    medir('registro', registro, nomes, args.repeticoes)
+    tempo_preparado = medir('preparado', preparado, nomes, args.repeticoes)
+    print(f"⚡ Ganho: {tempo_legado / tempo_preparado:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
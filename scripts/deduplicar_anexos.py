@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Migra os anexos antigos (um arquivo por upload em uploads/chamados) para o
+armazenamento por hash (uploads/chamados/blobs/aa/bb/<sha256>).
+
+- Cada arquivo é hasheado e movido para o blob; cópias de um conteúdo que já
+  virou blob são apagadas
+- ChamadoAnexo passa a apontar para o blob (caminho, nome e hash conferido)
+- Ao final os contadores de referência são recalculados pelos anexos ativos
+- Arquivos ausentes ficam como estão (ver scripts/reindex_attachments.py)
+
+Uso: python scripts/deduplicar_anexos.py [--dry-run] [--lote 200]
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import app  # noqa: E402
+from database import db, BlobAnexo, ChamadoAnexo  # noqa: E402
+from setores.ti.anexos_utils import calculate_file_hash  # noqa: E402
+from setores.ti.blob_store import (  # noqa: E402
+    caminho_blob, eh_caminho_blob, importar_arquivo, recontar_referencias
+)
+
+
+def deduplicar(dry_run=False, lote=200):
+    resumo = {'avaliados': 0, 'migrados': 0, 'duplicados': 0, 'ja_migrados': 0,
+              'ausentes': 0, 'bytes_economizados': 0}
+    # caminho antigo -> hash, para registros que compartilham o mesmo arquivo
+    migrados = {}
+    # hashes com BlobAnexo (no dry-run, também os que seriam criados)
+    blobs = {h for (h,) in db.session.query(BlobAnexo.hash_arquivo).all()}
+
+    for anexo in ChamadoAnexo.query.order_by(ChamadoAnexo.id).all():
+        resumo['avaliados'] += 1
+        origem = anexo.caminho_arquivo
+        if origem and eh_caminho_blob(origem):
+            resumo['ja_migrados'] += 1
+            continue
+
+        if origem in migrados:
+            hash_arquivo = migrados[origem]
+        elif origem and os.path.exists(origem):
+            tamanho = os.path.getsize(origem)
+            if dry_run:
+                hash_arquivo = calculate_file_hash(origem)
+                novo = hash_arquivo not in blobs and not os.path.exists(caminho_blob(hash_arquivo))
+            else:
+                hash_arquivo, _, tamanho, novo = importar_arquivo(origem)
+            migrados[origem] = hash_arquivo
+            if novo:
+                resumo['migrados'] += 1
+            else:
+                resumo['duplicados'] += 1
+                resumo['bytes_economizados'] += tamanho
+        elif anexo.hash_arquivo and os.path.exists(caminho_blob(anexo.hash_arquivo)):
+            # Arquivo movido por uma execução interrompida antes do commit
+            hash_arquivo = anexo.hash_arquivo
+        else:
+            resumo['ausentes'] += 1
+            continue
+
+        if hash_arquivo not in blobs:
+            blobs.add(hash_arquivo)
+            if not dry_run:
+                db.session.add(BlobAnexo(
+                    hash_arquivo=hash_arquivo,
+                    caminho_arquivo=caminho_blob(hash_arquivo),
+                    tamanho_bytes=os.path.getsize(caminho_blob(hash_arquivo)),
+                    referencias=0
+                ))
+
+        if not dry_run:
+            anexo.caminho_arquivo = caminho_blob(hash_arquivo)
+            anexo.nome_arquivo = hash_arquivo
+            anexo.hash_arquivo = hash_arquivo
+            if resumo['avaliados'] % lote == 0:
+                db.session.commit()
+
+    if dry_run:
+        db.session.rollback()
+        resumo['contadores_ajustados'] = 0
+    else:
+        db.session.commit()
+        resumo['contadores_ajustados'] = recontar_referencias()
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deduplica os anexos em um armazenamento por hash')
+    parser.add_argument('--dry-run', action='store_true', help='Só calcula o que seria feito')
+    parser.add_argument('--lote', type=int, default=200, help='Registros por commit')
+    args = parser.parse_args()
+
+    with app.app_context():
+        resumo = deduplicar(dry_run=args.dry_run, lote=args.lote)
+
+    prefixo = '🔎 Simulação' if args.dry_run else '✅ Migração concluída'
+    print(f"{prefixo}: {resumo['avaliados']} anexo(s) avaliado(s)")
+    print(f"   {resumo['migrados']} blob(s) novo(s), {resumo['duplicados']} cópia(s) duplicada(s), "
+          f"{resumo['ja_migrados']} já migrado(s), {resumo['ausentes']} arquivo(s) ausente(s)")
+    print(f"   {resumo['bytes_economizados'] / (1024 * 1024):.1f} MB economizados, "
+          f"{resumo['contadores_ajustados']} contador(es) de referência ajustado(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
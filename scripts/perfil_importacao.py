@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Perfil do tempo de import da aplicação com verificação de orçamento.
+
+Roda `python -X importtime -c "import app"` em um processo novo, lista os
+módulos mais caros (tempo acumulado) e falha (código 1) quando:
+
+- o tempo total de import passa do orçamento (--orcamento-ms), ou
+- algum módulo que deve ser carregado sob demanda (Graph, psutil...) já
+  aparece carregado logo após o import.
+
+Uso: python scripts/perfil_importacao.py [--orcamento-ms 1500] [--top 25] [--alvo app]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Dependências que só podem ser importadas na primeira utilização.
+# requests fica de fora: o cliente do python-engineio (via flask_socketio)
+# já o importa no carregamento.
+PROIBIDOS_NO_IMPORT = ('msal', 'psutil')
+
+
+def perfil(alvo):
+    """Executa o import com -X importtime e devolve [(modulo, proprio_us, acumulado_us)]"""
+    codigo = (
+        f"import sys, json; import {alvo}; "
+        f"print(json.dumps(sorted(m for m in {PROIBIDOS_NO_IMPORT!r} if m in sys.modules)))"
+    )
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', codigo],
+        cwd=RAIZ, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        print(resultado.stderr[-2000:])
+        raise SystemExit(f"❌ Falha ao importar {alvo}")
+
+    linhas = []
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith('import time:') or 'self [us]' in linha:
+            continue
+        proprio, acumulado, modulo = linha[len('import time:'):].split('|')
+        linhas.append((modulo.strip(), int(proprio), int(acumulado)))
+
+    carregados = resultado.stdout.strip().splitlines()[-1]
+    return linhas, [m.strip('"') for m in carregados.strip('[]').split(', ') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perfil de import da aplicação')
+    parser.add_argument('--alvo', default='app', help='Módulo a importar')
+    parser.add_argument('--orcamento-ms', type=float, default=1500, help='Tempo máximo de import')
+    parser.add_argument('--top', type=int, default=25)
+    args = parser.parse_args()
+
+    linhas, carregados = perfil(args.alvo)
+    total = next((acumulado for modulo, _, acumulado in linhas if modulo == args.alvo), 0) / 1000
+
+    print(f"📊 Import de '{args.alvo}': {total:.1f} ms ({len(linhas)} módulos)")
+    print(f"{'acumulado':>12} {'próprio':>10}  módulo")
+    for modulo, proprio, acumulado in sorted(linhas, key=lambda l: l[2], reverse=True)[:args.top]:
+        print(f"{acumulado / 1000:10.1f}ms {proprio / 1000:8.1f}ms  {modulo}")
+
+    falhou = False
+    if total > args.orcamento_ms:
+        print(f"❌ Orçamento excedido: {total:.1f} ms > {args.orcamento_ms:.0f} ms")
+        falhou = True
+    else:
+        print(f"✅ Dentro do orçamento ({args.orcamento_ms:.0f} ms)")
+
+    if carregados:
+        print(f"❌ Carregados no import (deveriam ser sob demanda): {', '.join(carregados)}")
+        falhou = True
+    else:
+        print(f"✅ Nenhum de {', '.join(PROIBIDOS_NO_IMPORT)} carregado no import")
+
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == '__main__':
+    main()
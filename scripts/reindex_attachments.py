@@ -1,14 +1,18 @@
+import argparse
 import os
 import sys
 import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from flask import Flask
-
 # Importa a aplicação e modelos
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from app import app  # noqa: E402
-from database import db, Chamado, ChamadoAnexo, User  # noqa: E402
+from database import db, Chamado, ChamadoAnexo, IndiceArquivoAnexo, User, get_brazil_time  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+from setores.ti.blob_store import caminho_blob, eh_caminho_blob, liberar  # noqa: E402
+from setores.ti.estatisticas_anexos import recalcular  # noqa: E402
 
 UPLOAD_DIR = 'uploads/chamados'
 
@@ -17,7 +21,7 @@ def sha256_file(path: str) -> str | None:
     try:
         h = hashlib.sha256()
         with open(path, 'rb') as f:
-            for chunk in iter(lambda: f.read(8192), b''):
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
                 h.update(chunk)
         return h.hexdigest()
     except Exception:
@@ -28,112 +32,199 @@ def ensure_upload_dir():
     os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 
-def reindex_attachments():
-    """
-    Valida e corrige registros de anexos para garantir:
-    - Caminho existente -> atualiza tamanho e hash
-    - Caminho inexistente -> marca como inativo (ativo=False)
-    - usuario_upload_id nulo -> atribui usuário admin se existir
-    - data_upload nula -> preenche com agora (mantendo timezone naive)
-    - tipo_mime/extensao vazios -> tenta inferir pela extensão
-    Retorna um resumo com contagens e problemas corrigidos.
-    """
-    ensure_upload_dir()
+def resolver_caminho(anexo):
+    path = anexo.caminho_arquivo
+    if anexo.hash_arquivo and anexo.nome_arquivo == anexo.hash_arquivo:
+        # Anexo no armazenamento por hash (ver scripts/deduplicar_anexos.py)
+        return caminho_blob(anexo.hash_arquivo)
+    if not path or not os.path.isabs(path):
+        # Normaliza para caminho absoluto relativo ao projeto
+        return os.path.join(UPLOAD_DIR, os.path.basename(anexo.nome_arquivo or ''))
+    return path
+
 
-    total = 0
-    fixed_size = 0
-    fixed_hash = 0
-    marked_inactive = 0
-    fixed_meta = 0
-    fixed_user = 0
-    fixed_date = 0
+def _desativar(anexo, resumo):
+    if anexo.ativo:
+        liberar(anexo.hash_arquivo)
+        anexo.ativo = False
+        resumo['marcados_inativos'] += 1
 
-    # Usuário admin (fallback para registros sem usuário)
-    admin_user = User.query.filter_by(usuario='admin').first()
 
-    for anexo in ChamadoAnexo.query.all():
-        total += 1
+def _processar_lote(anexos, chamados_vivos, admin_id, pool, completo, resumo):
+    indices = {
+        i.anexo_id: i for i in IndiceArquivoAnexo.query.filter(
+            IndiceArquivoAnexo.anexo_id.in_([a.id for a in anexos])
+        )
+    }
+    agora = get_brazil_time().replace(tzinfo=None)
+    para_hashear = []
 
+    for anexo in anexos:
         # Se chamado foi removido, desativar anexo
-        if anexo.chamado_id and not Chamado.query.get(anexo.chamado_id):
-            if anexo.ativo:
-                anexo.ativo = False
-                marked_inactive += 1
+        if anexo.chamado_id not in chamados_vivos:
+            _desativar(anexo, resumo)
+            continue
+
+        path = resolver_caminho(anexo)
+        try:
+            info = os.stat(path)
+        except OSError:
+            _desativar(anexo, resumo)
             continue
 
-        path = anexo.caminho_arquivo
-        if not path or not os.path.isabs(path):
-            # Normaliza para caminho absoluto relativo ao projeto
-            path = os.path.join(UPLOAD_DIR, os.path.basename(anexo.nome_arquivo or ''))
-
-        if not os.path.exists(path):
-            if anexo.ativo:
-                anexo.ativo = False
-                marked_inactive += 1
-        else:
-            # Atualiza tamanho se divergente
-            real_size = os.path.getsize(path)
-            if anexo.tamanho_bytes != real_size:
-                anexo.tamanho_bytes = real_size
-                fixed_size += 1
-
-            # Atualiza hash se ausente
-            if not anexo.hash_arquivo:
-                file_hash = sha256_file(path)
-                if file_hash:
-                    anexo.hash_arquivo = file_hash
-                    fixed_hash += 1
-
-            # Garante caminho salvo normalizado
-            if anexo.caminho_arquivo != path:
-                anexo.caminho_arquivo = path
-                fixed_meta += 1
-
-            # Preenche tipo_mime/extensao se ausente
-            if not anexo.extensao and anexo.nome_original and '.' in anexo.nome_original:
-                anexo.extensao = anexo.nome_original.rsplit('.', 1)[1].lower()
-                fixed_meta += 1
+        # Atualiza tamanho se divergente
+        if anexo.tamanho_bytes != info.st_size:
+            anexo.tamanho_bytes = info.st_size
+            resumo['corrigidos_tamanho'] += 1
+
+        # Garante caminho salvo normalizado
+        if anexo.caminho_arquivo != path:
+            anexo.caminho_arquivo = path
+            resumo['corrigidos_metadados'] += 1
+
+        # Preenche tipo_mime/extensao se ausente
+        if not anexo.extensao and anexo.nome_original and '.' in anexo.nome_original:
+            anexo.extensao = anexo.nome_original.rsplit('.', 1)[1].lower()
+            resumo['corrigidos_metadados'] += 1
 
         # Usuário do upload
-        if not anexo.usuario_upload_id and admin_user:
-            anexo.usuario_upload_id = admin_user.id
-            fixed_user += 1
+        if not anexo.usuario_upload_id and admin_id:
+            anexo.usuario_upload_id = admin_id
+            resumo['corrigidos_usuario_upload'] += 1
 
         # Data do upload
         if not anexo.data_upload:
             anexo.data_upload = datetime.now()
-            fixed_date += 1
+            resumo['corrigidos_data_upload'] += 1
+
+        # Arquivo igual ao da última passada (caminho, tamanho e mtime): não relê
+        indice = indices.get(anexo.id)
+        inalterado = (indice is not None and indice.caminho_arquivo == path and
+                      indice.tamanho_bytes == info.st_size and indice.mtime_ns == info.st_mtime_ns)
+        if inalterado and anexo.hash_arquivo and not completo:
+            resumo['pulados_inalterados'] += 1
+            continue
+        para_hashear.append((anexo, path, info, indice))
 
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return {
-            'status': 'error',
-            'message': f'Erro ao salvar alterações: {str(e)}'
-        }
+    # Leitura dos arquivos em paralelo (I/O); o banco só é tocado nesta thread
+    hashes = pool.map(sha256_file, [path for _, path, _, _ in para_hashear])
+    for (anexo, path, info, indice), file_hash in zip(para_hashear, hashes):
+        resumo['hasheados'] += 1
+        if not file_hash:
+            continue
+        if anexo.hash_arquivo != file_hash:
+            if eh_caminho_blob(path):
+                # O nome do blob é o hash: conteúdo diferente é arquivo corrompido
+                resumo['hash_divergente'] += 1
+                print(f"⚠️  Blob corrompido: anexo {anexo.id} ({path})")
+                continue
+            if anexo.hash_arquivo:
+                resumo['hash_divergente'] += 1
+            else:
+                resumo['corrigidos_hash'] += 1
+            anexo.hash_arquivo = file_hash
+
+        if indice is None:
+            indice = IndiceArquivoAnexo(anexo_id=anexo.id)
+            db.session.add(indice)
+        indice.caminho_arquivo = path
+        indice.tamanho_bytes = info.st_size
+        indice.mtime_ns = info.st_mtime_ns
+        indice.data_verificacao = agora
+
+
+def reindex_attachments(lote=500, workers=None, dry_run=False, completo=False, progresso=True):
+    """
+    Valida e corrige registros de anexos para garantir:
+    - Caminho existente -> atualiza tamanho e hash
+    - Caminho inexistente -> marca como inativo (ativo=False)
+    - usuario_upload_id nulo -> atribui usuário admin se existir
+    - data_upload nula -> preenche com agora (mantendo timezone naive)
+    - tipo_mime/extensao vazios -> tenta inferir pela extensão
+    Processa em lotes (commit por lote) e só re-hasheia arquivos cujo
+    tamanho/mtime mudou desde a última passada (ou todos, com completo=True).
+    Retorna um resumo com contagens e problemas corrigidos.
+    """
+    ensure_upload_dir()
+
+    resumo = dict.fromkeys((
+        'total_anexos_avaliados', 'corrigidos_tamanho', 'corrigidos_hash', 'marcados_inativos',
+        'corrigidos_metadados', 'corrigidos_usuario_upload', 'corrigidos_data_upload',
+        'hasheados', 'pulados_inalterados', 'hash_divergente'
+    ), 0)
+
+    # Uma consulta para os chamados existentes e uma para o admin, não uma por anexo
+    chamados_vivos = {i for (i,) in db.session.query(Chamado.id)}
+    admin_id = db.session.query(User.id).filter_by(usuario='admin').scalar()
+    total = db.session.query(func.count(ChamadoAnexo.id)).scalar() or 0
+
+    inicio = time.monotonic()
+    ultimo_id = 0
+    with ThreadPoolExecutor(max_workers=workers or min(8, (os.cpu_count() or 2) * 2)) as pool:
+        while True:
+            anexos = (ChamadoAnexo.query
+                      .filter(ChamadoAnexo.id > ultimo_id)
+                      .order_by(ChamadoAnexo.id)
+                      .limit(lote)
+                      .all())
+            if not anexos:
+                break
+            ultimo_id = anexos[-1].id
+            resumo['total_anexos_avaliados'] += len(anexos)
+
+            try:
+                _processar_lote(anexos, chamados_vivos, admin_id, pool, completo, resumo)
+                if dry_run:
+                    db.session.rollback()
+                else:
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                return {
+                    'status': 'error',
+                    'message': f'Erro ao salvar alterações (anexos até id {ultimo_id}): {str(e)}'
+                }
+            # Sessão não acumula objetos entre lotes
+            db.session.expunge_all()
+
+            if progresso:
+                decorrido = time.monotonic() - inicio
+                feitos = resumo['total_anexos_avaliados']
+                print(f"⏳ {feitos}/{total} ({feitos * 100 / max(total, 1):.0f}%) "
+                      f"- {resumo['hasheados']} hasheados, {resumo['pulados_inalterados']} inalterados "
+                      f"- {feitos / max(decorrido, 0.001):.0f} anexos/s", flush=True)
+
+    # Tamanhos e anexos desativados acima mudam os agregados de estatísticas
+    if not dry_run:
+        recalcular()
 
     # Estatísticas por chamado (para conferência)
-    por_chamado = {}
-    for anexo in ChamadoAnexo.query.filter_by(ativo=True).all():
-        por_chamado.setdefault(anexo.chamado_id, 0)
-        por_chamado[anexo.chamado_id] += 1
+    por_chamado = dict(
+        db.session.query(ChamadoAnexo.chamado_id, func.count(ChamadoAnexo.id))
+        .filter(ChamadoAnexo.ativo.is_(True))
+        .group_by(ChamadoAnexo.chamado_id)
+        .all()
+    )
 
     return {
         'status': 'success',
-        'total_anexos_avaliados': total,
-        'corrigidos_tamanho': fixed_size,
-        'corrigidos_hash': fixed_hash,
-        'marcados_inativos': marked_inactive,
-        'corrigidos_metadados': fixed_meta,
-        'corrigidos_usuario_upload': fixed_user,
-        'corrigidos_data_upload': fixed_date,
+        'dry_run': dry_run,
+        **resumo,
         'chamados_com_anexos': len(por_chamado),
         'amostra_contagem_por_chamado': dict(list(por_chamado.items())[:10])
     }
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Valida e corrige os registros de anexos')
+    parser.add_argument('--dry-run', action='store_true', help='Só relata o que seria corrigido')
+    parser.add_argument('--lote', type=int, default=500, help='Anexos por lote (commit por lote)')
+    parser.add_argument('--workers', type=int, default=None, help='Threads de leitura/hash')
+    parser.add_argument('--completo', action='store_true', help='Re-hasheia também arquivos inalterados')
+    parser.add_argument('--silencioso', action='store_true', help='Sem linhas de progresso')
+    args = parser.parse_args()
+
     with app.app_context():
-        result = reindex_attachments()
+        result = reindex_attachments(lote=args.lote, workers=args.workers, dry_run=args.dry_run,
+                                     completo=args.completo, progresso=not args.silencioso)
         print(result)
@@ -4,7 +4,7 @@ from auth.auth_helpers import setor_required
 from datetime import datetime, date
 from database import db, SolicitacaoCompra, User
 from setores.ti.email_service import email_service
-from jinja2 import Template
+from setores.ti.utils.templates_email import templates_email
 import os
 
 compras_bp = Blueprint(
@@ -136,85 +136,12 @@ def criar_solicitacao():
 def enviar_email_nova_solicitacao(solicitacao):
     """Envia email de notificação para nova solicitação de compra"""
     try:
-        template_html = Template("""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <style>
-                body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                .header { background-color: #FF6200; color: white; padding: 20px; text-align: center; border-radius: 8px 8px 0 0; }
-                .content { background-color: #f8f9fa; padding: 20px; border-radius: 0 0 8px 8px; }
-                .info-box { background-color: white; padding: 15px; margin: 10px 0; border-left: 4px solid #FF6200; border-radius: 4px; }
-                .priority-high { border-left-color: #dc3545; }
-                .priority-urgent { border-left-color: #ff0000; background-color: #fff5f5; }
-                .footer { text-align: center; margin-top: 20px; font-size: 12px; color: #666; }
-                .btn { background-color: #FF6200; color: white; padding: 10px 20px; text-decoration: none; border-radius: 4px; display: inline-block; }
-                .status-badge { background-color: #28a745; color: white; padding: 4px 8px; border-radius: 12px; font-size: 12px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>📋 Nova Solicitação de Compra</h1>
-                </div>
-
-                <div class="content">
-                    <p>Uma nova solicitação de compra foi criada no sistema:</p>
-
-                    <div class="info-box {% if solicitacao.prioridade == 'Alta' %}priority-high{% elif solicitacao.prioridade == 'Urgente' %}priority-urgent{% endif %}">
-                        <h3>📄 Detalhes da Solicitação</h3>
-                        <p><strong>Protocolo:</strong> {{ solicitacao.protocolo }}</p>
-                        <p><strong>Solicitante:</strong> {{ solicitacao.solicitante.nome }} {{ solicitacao.solicitante.sobrenome }}</p>
-                        <p><strong>Email:</strong> {{ solicitacao.solicitante.email }}</p>
-                        <p><strong>Setor:</strong> {{ solicitacao.solicitante.setor }}</p>
-                        <p><strong>Data:</strong> {{ data_atual }}</p>
-                        <p><strong>Status:</strong> <span class="status-badge">{{ solicitacao.status }}</span></p>
-                    </div>
-
-                    <div class="info-box">
-                        <h3>🛍�� Produto/Serviço</h3>
-                        <p><strong>Item:</strong> {{ solicitacao.produto }}</p>
-                        <p><strong>Quantidade:</strong> {{ solicitacao.quantidade }}</p>
-                        {% if solicitacao.categoria %}<p><strong>Categoria:</strong> {{ solicitacao.categoria|title }}</p>{% endif %}
-                        {% if solicitacao.valor_estimado %}<p><strong>Valor Estimado:</strong> R$ {{ "%.2f"|format(solicitacao.valor_estimado) }}</p>{% endif %}
-                        {% if solicitacao.data_entrega_desejada %}<p><strong>Data Desejada:</strong> {{ solicitacao.data_entrega_desejada.strftime('%d/%m/%Y') }}</p>{% endif %}
-                    </div>
-
-                    <div class="info-box">
-                        <h3>📝 Justificativa</h3>
-                        <p>{{ solicitacao.justificativa }}</p>
-                        {% if solicitacao.observacoes %}
-                        <h4>💬 Observações Adicionais</h4>
-                        <p>{{ solicitacao.observacoes }}</p>
-                        {% endif %}
-                    </div>
-
-                    <div class="info-box">
-                        <h3>⚡ Prioridade</h3>
-                        <p><strong>{{ solicitacao.prioridade }}</strong> {% if solicitacao.urgente %} - <span style="color: red;">URGENTE</span>{% endif %}</p>
-                    </div>
-
-                    <p style="text-align: center; margin: 30px 0;">
-                        <a href="#" class="btn">Acessar Sistema de Compras</a>
-                    </p>
-                </div>
-
-                <div class="footer">
-                    <p>Este é um email automático do sistema de compras da Evoque Fitness.</p>
-                    <p>{{ data_atual }}</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """)
-
         # Preparar dados para o template
         from database import get_brazil_time
         data_atual = get_brazil_time().strftime('%d/%m/%Y às %H:%M')
 
-        corpo_html = template_html.render(
+        corpo_html = templates_email.renderizar(
+            'nova_solicitacao_compra.html',
             solicitacao=solicitacao,
             data_atual=data_atual
         )
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from database import db, Chamado, AgenteSuporte, ChamadoAgente, User, get_brazil_time, NotificacaoAgente, HistoricoAtendimento
+from setores.ti.utils.serializacao import json_response, error_response
+from setores.ti.salas_socketio import SALA_AGENTES, emitir, salas_do_chamado
 from sqlalchemy import func
 import logging
 import traceback
@@ -25,17 +27,6 @@ def api_login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def json_response(data, status=200):
-    """Retorna resposta JSON padronizada"""
-    response = jsonify(data)
-    response.status_code = status
-    response.headers['Content-Type'] = 'application/json'
-    return response
-
-def error_response(message, status=400):
-    """Retorna erro JSON padronizado"""
-    return json_response({'error': message}, status)
-
 def criar_notificacao_agente(agente_id, titulo, mensagem, tipo, chamado_id=None, metadados=None, prioridade='normal'):
     """Cria uma nova notificação para o agente"""
     try:
@@ -188,7 +179,7 @@ def atualizar_chamado_agente(chamado_id):
 
         # Enviar e-mail de notificação
         try:
-            from setores.ti.routes import enviar_email
+            from setores.ti.notificacoes_email import notificar_email
             assunto = f"Atualização do Chamado {chamado.codigo}"
             corpo = f"""
 Olá {chamado.solicitante},
@@ -210,7 +201,8 @@ Para acompanhar seu chamado, acesse o sistema ou entre em contato conosco.
 Atenciosamente,
 Equipe de Suporte TI - Evoque Fitness
 """
-            enviar_email(assunto, corpo, [chamado.email])
+            notificar_email([chamado.email], assunto, corpo, referencia=f"chamado:{chamado.codigo}")
+            db.session.commit()
         except Exception as email_error:
             logger.warning(f"Erro ao enviar e-mail de atualização: {str(email_error)}")
 
@@ -289,7 +281,7 @@ def transferir_chamado(chamado_id):
 
         # Enviar e-mails de notificação
         try:
-            from setores.ti.routes import enviar_email
+            from setores.ti.notificacoes_email import notificar_email
             logger.info(f"🔄 Iniciando envio de e-mails para transferência do chamado {chamado.codigo}")
             logger.info(f"📧 Email do solicitante: {chamado.email}")
             logger.info(f"📧 Email do agente destino: {agente_destino.usuario.email}")
@@ -319,7 +311,7 @@ Atenciosamente,
 Equipe de Suporte TI - Evoque Fitness
 """
             logger.info(f"📤 Enviando e-mail para solicitante: {chamado.email}")
-            resultado_cliente = enviar_email(assunto_cliente, corpo_cliente, [chamado.email])
+            resultado_cliente = notificar_email([chamado.email], assunto_cliente, corpo_cliente, referencia=f"chamado:{chamado.codigo}")
             logger.info(f"📥 Resultado do envio para solicitante: {'✅ Sucesso' if resultado_cliente else '❌ Falha'}")
 
             # E-mail para o agente destino
@@ -357,7 +349,8 @@ Atenciosamente,
 Sistema de Suporte TI - Evoque Fitness
 """
             logger.info(f"📤 Enviando e-mail para agente destino: {agente_destino.usuario.email}")
-            resultado_agente = enviar_email(assunto_agente, corpo_agente, [agente_destino.usuario.email])
+            resultado_agente = notificar_email([agente_destino.usuario.email], assunto_agente, corpo_agente, referencia=f"chamado:{chamado.codigo}")
+            db.session.commit()
             logger.info(f"📥 Resultado do envio para agente: {'✅ Sucesso' if resultado_agente else '❌ Falha'}")
 
             if resultado_cliente and resultado_agente:
@@ -781,7 +774,7 @@ def atribuir_chamado_para_mim(chamado_id):
 
         # Enviar e-mails de notificação
         try:
-            from setores.ti.routes import enviar_email
+            from setores.ti.notificacoes_email import notificar_email
             logger.info(f"🔄 Iniciando envio de e-mail de atribuição para chamado {chamado.codigo}")
             logger.info(f"📧 Email do solicitante: {chamado.email}")
 
@@ -812,7 +805,8 @@ Atenciosamente,
 Equipe de Suporte TI - Evoque Fitness
 """
             logger.info(f"📤 Enviando e-mail de atribuição para: {chamado.email}")
-            resultado = enviar_email(assunto_cliente, corpo_cliente, [chamado.email])
+            resultado = notificar_email([chamado.email], assunto_cliente, corpo_cliente, referencia=f"chamado:{chamado.codigo}")
+            db.session.commit()
             logger.info(f"📥 Resultado do envio: {'✅ Sucesso' if resultado else '❌ Falha'}")
 
         except Exception as email_error:
@@ -822,20 +816,18 @@ Equipe de Suporte TI - Evoque Fitness
 
         # Emitir evento Socket.IO para notificação em tempo real
         try:
-            from flask import current_app
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_atribuido', {
-                    'chamado_id': chamado.id,
-                    'codigo': chamado.codigo,
-                    'protocolo': chamado.protocolo,
-                    'solicitante': chamado.solicitante,
-                    'problema': chamado.problema,
-                    'prioridade': chamado.prioridade,
-                    'agente_id': agente.id,
-                    'agente_nome': f"{current_user.nome} {current_user.sobrenome}",
-                    'agente_email': current_user.email,
-                    'timestamp': get_brazil_time().isoformat()
-                })
+            emitir('chamado_atribuido', {
+                'chamado_id': chamado.id,
+                'codigo': chamado.codigo,
+                'protocolo': chamado.protocolo,
+                'solicitante': chamado.solicitante,
+                'problema': chamado.problema,
+                'prioridade': chamado.prioridade,
+                'agente_id': agente.id,
+                'agente_nome': f"{current_user.nome} {current_user.sobrenome}",
+                'agente_email': current_user.email,
+                'timestamp': get_brazil_time().isoformat()
+            }, salas_do_chamado(chamado, agentes=(agente.id,)) + [SALA_AGENTES])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 from flask_login import login_required, current_user
 from database import db, User, AgenteSuporte, ChamadoAgente, Chamado
 from auth.auth_helpers import setor_required
+from setores.ti.utils.serializacao import json_response, error_response
 import json
 import logging
 
@@ -9,14 +10,6 @@ logger = logging.getLogger(__name__)
 
 agentes_bp = Blueprint('agentes', __name__)
 
-def json_response(data, status=200):
-    """Padroniza respostas JSON"""
-    return jsonify(data), status
-
-def error_response(message, status=400):
-    """Padroniza respostas de erro"""
-    return jsonify({'error': message}), status
-
 @agentes_bp.route('/api/agentes', methods=['GET'])
 @login_required
 @setor_required('Administrador')
@@ -0,0 +1,130 @@
+"""
+Anexos de e-mail lidos do disco em blocos
+
+Um anexo pode vir com 'dados' (bytes em memória) ou com 'caminho' (arquivo
+salvo). Arquivos nunca são lidos inteiros: o MIME do SMTP é gerado em blocos
+direto para o socket e o Graph recebe os arquivos grandes por upload session.
+"""
+import base64
+import logging
+import os
+import re
+import uuid
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import compat32
+
+# Mesmo formato que o smtplib.send_message gera (cabeçalhos codificados, CRLF)
+POLITICA_SMTP = compat32.clone(linesep='\r\n')
+
+logger = logging.getLogger(__name__)
+
+# Múltiplo de 57 bytes: cada 57 bytes viram uma linha base64 de 76 caracteres
+TAMANHO_BLOCO = 57 * 1024 * 4
+
+# Acima disso o Graph não aceita o anexo dentro do JSON do sendMail
+LIMITE_INLINE_GRAPH = 3 * 1024 * 1024
+
+
+class AnexoEmail:
+    __slots__ = ('nome', 'content_type', 'caminho', 'dados', 'tamanho')
+
+    def __init__(self, nome, content_type=None, caminho=None, dados=None, tamanho=None):
+        self.nome = nome
+        self.content_type = content_type or 'application/octet-stream'
+        self.caminho = caminho
+        self.dados = dados
+        if tamanho is None:
+            tamanho = len(dados) if dados is not None else os.path.getsize(caminho)
+        self.tamanho = tamanho
+
+    @classmethod
+    def de_dict(cls, anexo):
+        """Converte o dict usado pelas rotas; None se não houver nome ou conteúdo"""
+        if isinstance(anexo, cls):
+            return anexo
+        nome = anexo.get('nome')
+        if not nome or (anexo.get('dados') is None and not anexo.get('caminho')):
+            return None
+        return cls(nome, anexo.get('content_type'), anexo.get('caminho'), anexo.get('dados'), anexo.get('tamanho'))
+
+    def blocos(self, tamanho=TAMANHO_BLOCO):
+        if self.dados is not None:
+            visao = memoryview(self.dados)
+            for inicio in range(0, len(visao), tamanho):
+                yield bytes(visao[inicio:inicio + tamanho])
+            return
+        with open(self.caminho, 'rb') as arquivo:
+            while True:
+                bloco = arquivo.read(tamanho)
+                if not bloco:
+                    return
+                yield bloco
+
+    def base64_em_linhas(self):
+        """Conteúdo em base64 com linhas de 76 caracteres (CRLF), bloco a bloco"""
+        for bloco in self.blocos():
+            codificado = base64.b64encode(bloco)
+            yield b'\r\n'.join(codificado[i:i + 76] for i in range(0, len(codificado), 76)) + b'\r\n'
+
+    def como_graph(self):
+        """fileAttachment com contentBytes (apenas para anexos pequenos)"""
+        dados = self.dados if self.dados is not None else b''.join(self.blocos())
+        return {
+            "@odata.type": "#microsoft.graph.fileAttachment",
+            "name": self.nome,
+            "contentType": self.content_type,
+            "contentBytes": base64.b64encode(dados).decode('ascii')
+        }
+
+    def como_dict(self):
+        return {'nome': self.nome, 'content_type': self.content_type, 'caminho': self.caminho,
+                'dados': self.dados, 'tamanho': self.tamanho}
+
+
+def normalizar_anexos(anexos):
+    """Lista de AnexoEmail; anexos sem conteúdo ou com arquivo inacessível são ignorados"""
+    validos = []
+    for anexo in anexos or []:
+        try:
+            anexo_email = AnexoEmail.de_dict(anexo)
+        except OSError as e:
+            logger.warning(f"Falha ao anexar arquivo '{anexo.get('nome')}': {e}")
+            continue
+        if anexo_email is not None:
+            validos.append(anexo_email)
+    return validos
+
+
+def gerar_mime(remetente, destinatario, assunto, corpo_html, corpo_texto=None, anexos=None):
+    """
+    Mensagem MIME completa como sequência de blocos de bytes (CRLF), pronta
+    para o DATA do SMTP. Só o cabeçalho e os corpos ficam em memória.
+    """
+    fronteira = f"===============anexo{uuid.uuid4().hex}=="
+    msg = MIMEMultipart(boundary=fronteira)
+    msg['From'] = remetente
+    msg['To'] = destinatario
+    msg['Subject'] = assunto
+
+    alt = MIMEMultipart('alternative')
+    if corpo_texto:
+        alt.attach(MIMEText(corpo_texto, 'plain', 'utf-8'))
+    alt.attach(MIMEText(corpo_html, 'html', 'utf-8'))
+    msg.attach(alt)
+
+    # Linhas iniciadas por '.' são duplicadas (RFC 5321); o base64 nunca tem '.'
+    inicio = re.sub(rb'(?m)^\.', b'..', msg.as_bytes(policy=POLITICA_SMTP))
+    fechamento = f"--{fronteira}--\r\n".encode('ascii')
+    yield inicio[:-len(fechamento)]
+
+    for anexo in normalizar_anexos(anexos):
+        maintype, _, subtype = anexo.content_type.partition('/')
+        parte = MIMEBase(maintype, subtype or 'octet-stream')
+        parte['Content-Transfer-Encoding'] = 'base64'
+        parte.add_header('Content-Disposition', 'attachment', filename=anexo.nome)
+        yield f"--{fronteira}\r\n".encode('ascii') + parte.as_bytes(policy=POLITICA_SMTP)
+        yield from anexo.base64_em_linhas()
+
+    yield fechamento
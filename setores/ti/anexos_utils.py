@@ -11,6 +11,7 @@ from werkzeug.utils import secure_filename
 ANEXOS_CONFIG = {
     'UPLOAD_FOLDER': 'uploads/chamados',
     'MAX_FILE_SIZE': 10 * 1024 * 1024,  # 10MB por arquivo
+    'MAX_VIDEO_SIZE': 50 * 1024 * 1024,  # 50MB por vídeo (upload retomável)
     'MAX_TOTAL_SIZE': 50 * 1024 * 1024,  # 50MB total por chamado
     'ALLOWED_EXTENSIONS': {
         'images': ['jpg', 'jpeg', 'png', 'gif', 'webp', 'bmp'],
@@ -36,6 +37,18 @@ ANEXOS_CONFIG = {
     ]
 }
 
+# Tipos contados como documento nas estatísticas e na categoria do arquivo
+DOCUMENT_MIME_TYPES = [
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.ms-powerpoint',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'text/plain'
+]
+
 def is_allowed_file(filename, file_content_type):
     """Verifica se o arquivo é permitido baseado na extensão e tipo MIME"""
     if not filename or '.' not in filename:
@@ -95,11 +108,23 @@ def create_upload_directory(base_path=None):
     except Exception as e:
         return False, f"Erro ao criar diretório: {str(e)}"
 
-def validate_file_size(file_size, chamado_id=None):
+def get_max_file_size(filename=None):
+    """
+    Tamanho máximo de um arquivo (vídeos têm limite próprio). Decidido pela
+    extensão, que validar_conteudo confere com os primeiros bytes; o
+    Content-Type é o que o cliente declarou e não serve para isso.
+    """
+    extension = filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else ''
+    if extension in ANEXOS_CONFIG['ALLOWED_EXTENSIONS']['videos']:
+        return ANEXOS_CONFIG['MAX_VIDEO_SIZE']
+    return ANEXOS_CONFIG['MAX_FILE_SIZE']
+
+def validate_file_size(file_size, chamado_id=None, filename=None):
     """Valida o tamanho do arquivo"""
     # Verificar tamanho individual do arquivo
-    if file_size > ANEXOS_CONFIG['MAX_FILE_SIZE']:
-        max_size_mb = ANEXOS_CONFIG['MAX_FILE_SIZE'] / (1024 * 1024)
+    max_size = get_max_file_size(filename)
+    if file_size > max_size:
+        max_size_mb = max_size / (1024 * 1024)
         return False, f"Arquivo muito grande. Máximo permitido: {max_size_mb:.1f}MB"
     
     # Se um chamado_id for fornecido, verificar tamanho total
@@ -117,22 +142,24 @@ def validate_file_size(file_size, chamado_id=None):
     
     return True, "Tamanho válido"
 
+def get_upload_limit(chamado_id=None, filename=None):
+    """Maior tamanho aceito para o próximo arquivo (limite por arquivo e saldo do chamado)"""
+    limite = get_max_file_size(filename)
+    if chamado_id:
+        from database import Chamado
+        chamado = Chamado.query.get(chamado_id)
+        if chamado:
+            saldo = ANEXOS_CONFIG['MAX_TOTAL_SIZE'] - chamado.get_tamanho_total_anexos()
+            limite = min(limite, max(saldo, 0))
+    return limite
+
 def get_file_type_category(mime_type):
     """Retorna a categoria do tipo de arquivo"""
     if mime_type.startswith('image/'):
         return 'image'
     elif mime_type.startswith('video/'):
         return 'video'
-    elif mime_type in [
-        'application/pdf',
-        'application/msword',
-        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        'application/vnd.ms-excel',
-        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        'application/vnd.ms-powerpoint',
-        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-        'text/plain'
-    ]:
+    elif mime_type in DOCUMENT_MIME_TYPES:
         return 'document'
     else:
         return 'other'
@@ -142,46 +169,56 @@ def save_uploaded_file(file, chamado_id, usuario_id, descricao=None):
     from database import db, ChamadoAnexo
     from flask import current_app
     
+    file_path, blob_novo = None, False
     try:
         # Validar arquivo
         is_valid, message = is_allowed_file(file.filename, file.content_type)
         if not is_valid:
             return False, message, None
         
-        # Validar tamanho
-        file.seek(0, 2)  # Ir para o final do arquivo
-        file_size = file.tell()
-        file.seek(0)  # Voltar ao início
-        
-        is_valid_size, size_message = validate_file_size(file_size, chamado_id)
-        if not is_valid_size:
-            return False, size_message, None
+        # Extrair extensão
+        extension = ''
+        if '.' in file.filename:
+            extension = file.filename.rsplit('.', 1)[1].lower()
         
         # Criar diretório de upload
         success, upload_path = create_upload_directory()
         if not success:
             return False, upload_path, None
         
-        # Gerar nome único para o arquivo
-        unique_filename = generate_unique_filename(file.filename)
-        file_path = os.path.join(upload_path, unique_filename)
-        
-        # Salvar arquivo
-        file.save(file_path)
+        from setores.ti.blob_store import LimiteExcedido, gravar_stream, publicar_recebido, referenciar
+        from setores.ti.uploads import ArquivoRecebido, TAMANHO_CABECALHO, validar_conteudo
         
-        # Calcular hash
-        file_hash = calculate_file_hash(file_path)
-        
-        # Extrair extensão
-        extension = ''
-        if '.' in file.filename:
-            extension = file.filename.rsplit('.', 1)[1].lower()
+        stream = file.stream
+        if isinstance(stream, ArquivoRecebido):
+            # Hash, tamanho e cabeçalho já calculados durante a leitura do multipart
+            file_size = stream.tamanho
+            is_valid_size, size_message = validate_file_size(file_size, chamado_id, file.filename)
+            if not is_valid_size:
+                return False, size_message, None
+            is_valid, message = validar_conteudo(stream.cabecalho, extension)
+            if not is_valid:
+                return False, message, None
+            # Salvar no armazenamento por hash (rename do temporário, sem reler)
+            file_hash, file_path, blob_novo = publicar_recebido(stream)
+        else:
+            is_valid, message = validar_conteudo(stream.read(TAMANHO_CABECALHO), extension)
+            stream.seek(0)
+            if not is_valid:
+                return False, message, None
+            # Uma passagem só: hash e contagem enquanto grava, parando no limite
+            try:
+                file_hash, file_path, file_size, blob_novo = gravar_stream(
+                    stream, limite=get_upload_limit(chamado_id, file.filename)
+                )
+            except LimiteExcedido as e:
+                return False, validate_file_size(e.tamanho, chamado_id, file.filename)[1], None
         
         # Criar registro no banco
         anexo = ChamadoAnexo(
             chamado_id=chamado_id,
             nome_original=secure_filename(file.filename),
-            nome_arquivo=unique_filename,
+            nome_arquivo=file_hash,
             caminho_arquivo=file_path,
             tamanho_bytes=file_size,
             tipo_mime=file.content_type,
@@ -192,13 +229,25 @@ def save_uploaded_file(file, chamado_id, usuario_id, descricao=None):
         )
         
         db.session.add(anexo)
+        referenciar(file_hash, file_path, file_size)
+        from setores.ti.estatisticas_anexos import registrar_anexo
+        registrar_anexo(anexo)
         db.session.commit()
         
+        # Miniatura gerada em segundo plano (imagens e PDFs)
+        miniaturas = current_app.extensions.get('miniaturas')
+        if miniaturas:
+            miniaturas.agendar(anexo)
+        
         current_app.logger.info(f"Anexo salvo com sucesso: {file.filename} para chamado {chamado_id}")
         return True, "Arquivo enviado com sucesso", anexo
         
     except Exception as e:
         db.session.rollback()
+        if blob_novo:
+            # Conteúdo gravado agora e sem nenhum registro: não fica perdido no disco
+            from setores.ti.blob_store import descartar_orfao
+            descartar_orfao(file_path)
         current_app.logger.error(f"Erro ao salvar anexo: {str(e)}")
         return False, f"Erro interno: {str(e)}", None
 
@@ -217,7 +266,12 @@ def delete_attachment(anexo_id, usuario_id):
         if anexo.usuario_upload_id != usuario_id and not current_user.tem_permissao('Administrador'):
             return False, "Sem permissão para remover este anexo"
         
-        # Soft delete
+        # Soft delete (o blob só é apagado pela coleta quando ninguém mais o usa)
+        if anexo.ativo:
+            from setores.ti.blob_store import liberar
+            from setores.ti.estatisticas_anexos import registrar_anexo
+            liberar(anexo.hash_arquivo)
+            registrar_anexo(anexo, sinal=-1)
         anexo.ativo = False
         db.session.commit()
         
@@ -265,86 +319,37 @@ def get_file_icon_class(mime_type):
         return 'fas fa-file text-muted'
 
 def cleanup_orphaned_files():
-    """Remove arquivos órfãos (sem registro no banco ou marcados como removidos)"""
-    from database import ChamadoAnexo
+    """
+    Move para a quarentena os arquivos sem registro no banco, apaga a
+    quarentena vencida e os blobs sem referência
+    """
     from flask import current_app
-    import glob
     
     try:
         upload_path = ANEXOS_CONFIG['UPLOAD_FOLDER']
         if not os.path.exists(upload_path):
             return True, "Diretório de upload não existe"
         
-        # Listar todos os arquivos no diretório
-        all_files = glob.glob(os.path.join(upload_path, '*'))
-        
-        # Obter nomes de arquivos ativos no banco
-        anexos_ativos = ChamadoAnexo.query.filter_by(ativo=True).all()
-        arquivos_ativos = {anexo.nome_arquivo for anexo in anexos_ativos}
+        armazem = current_app.extensions['anexos_blobs']
+        conciliacao = armazem.reconciliar()
+        quarentena = armazem.purgar_quarentena()
+        blobs = armazem.coletar_lixo()
         
-        files_removed = 0
-        for file_path in all_files:
-            filename = os.path.basename(file_path)
-            if filename not in arquivos_ativos:
-                try:
-                    os.remove(file_path)
-                    files_removed += 1
-                    current_app.logger.info(f"Arquivo órfão removido: {filename}")
-                except Exception as e:
-                    current_app.logger.error(f"Erro ao remover arquivo órfão {filename}: {str(e)}")
-        
-        return True, f"{files_removed} arquivos órfãos removidos"
+        return True, (f"{conciliacao['movidos_quarentena']} arquivos órfãos movidos para a quarentena, "
+                      f"{quarentena['arquivos_removidos']} apagados da quarentena, "
+                      f"{blobs['blobs_removidos']} blobs sem referência removidos, "
+                      f"{conciliacao['ausentes']} anexos sem arquivo")
         
     except Exception as e:
         current_app.logger.error(f"Erro na limpeza de arquivos órfãos: {str(e)}")
         return False, f"Erro na limpeza: {str(e)}"
 
 def get_attachment_statistics():
-    """Retorna estatísticas sobre anexos do sistema"""
-    from database import ChamadoAnexo, db
-    
+    """Retorna estatísticas sobre anexos do sistema (por categoria, unidade e mês)"""
     try:
-        # Consultas básicas
-        total_anexos = ChamadoAnexo.query.filter_by(ativo=True).count()
-        
-        # Tamanho total
-        result = db.session.query(db.func.sum(ChamadoAnexo.tamanho_bytes)).filter_by(ativo=True).scalar()
-        tamanho_total = result or 0
-        
-        # Anexos por tipo
-        anexos_imagem = ChamadoAnexo.query.filter(
-            ChamadoAnexo.ativo == True,
-            ChamadoAnexo.tipo_mime.like('image/%')
-        ).count()
-        
-        anexos_video = ChamadoAnexo.query.filter(
-            ChamadoAnexo.ativo == True,
-            ChamadoAnexo.tipo_mime.like('video/%')
-        ).count()
-        
-        anexos_documento = ChamadoAnexo.query.filter(
-            ChamadoAnexo.ativo == True,
-            ChamadoAnexo.tipo_mime.in_([
-                'application/pdf',
-                'application/msword',
-                'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-                'application/vnd.ms-excel',
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                'application/vnd.ms-powerpoint',
-                'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-                'text/plain'
-            ])
-        ).count()
-        
-        return {
-            'total_anexos': total_anexos,
-            'tamanho_total': tamanho_total,
-            'tamanho_total_formatado': format_file_size(tamanho_total),
-            'anexos_imagem': anexos_imagem,
-            'anexos_video': anexos_video,
-            'anexos_documento': anexos_documento,
-            'anexos_outros': total_anexos - anexos_imagem - anexos_video - anexos_documento
-        }
+        # Lidas da tabela de agregados, mantida no upload e na remoção
+        from setores.ti.estatisticas_anexos import obter_estatisticas
+        return obter_estatisticas()
         
     except Exception as e:
         return {
@@ -0,0 +1,386 @@
+"""
+Armazenamento de anexos endereçado por conteúdo
+
+- Cada conteúdo é gravado uma única vez em <UPLOAD_FOLDER>/blobs/aa/bb/<sha256>;
+  o mesmo arquivo anexado a vários chamados ocupa o disco uma vez só
+- BlobAnexo.referencias conta os ChamadoAnexo ativos com aquele hash (o
+  upload incrementa e o soft delete decrementa) e os e-mails da outbox ainda
+  não entregues que o anexam
+- Blobs sem referência são apagados pela coleta (flask anexos-blobs gc) só
+  depois de ANEXOS_BLOBS_CARENCIA segundos, para não apagar um conteúdo que
+  um upload concorrente acabou de voltar a usar
+"""
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import case, delete, func, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db, BlobAnexo, ChamadoAnexo, EmailOutbox, get_brazil_time
+from performance.metrics import registro
+from setores.ti.anexos_utils import ANEXOS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+PASTA_BLOBS = 'blobs'
+PASTA_TEMPORARIOS = 'tmp'
+TAMANHO_BLOCO = 64 * 1024
+
+
+def _agora():
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def raiz_blobs(pasta_upload=None):
+    return os.path.join(pasta_upload or ANEXOS_CONFIG['UPLOAD_FOLDER'], PASTA_BLOBS)
+
+
+def caminho_blob(hash_arquivo, raiz=None):
+    """Caminho do blob, com dois níveis de pastas para não lotar um diretório só"""
+    return os.path.join(raiz or raiz_blobs(), hash_arquivo[:2], hash_arquivo[2:4], hash_arquivo)
+
+
+def pasta_temporarios(raiz=None):
+    """Temporários ficam dentro da raiz dos blobs: a publicação é um rename atômico"""
+    return os.path.join(raiz or raiz_blobs(), PASTA_TEMPORARIOS)
+
+
+def caminho_derivado(hash_arquivo, sufixo, raiz=None):
+    """Arquivos derivados (miniaturas) ficam ao lado do blob: <hash>.<sufixo>"""
+    return f"{caminho_blob(hash_arquivo, raiz)}.{sufixo}"
+
+
+def remover_derivados(hash_arquivo, raiz=None):
+    removidos = 0
+    for caminho in glob.glob(glob.escape(caminho_blob(hash_arquivo, raiz)) + '.*'):
+        try:
+            os.remove(caminho)
+            removidos += 1
+        except OSError:
+            pass
+    return removidos
+
+
+def eh_caminho_blob(caminho, raiz=None):
+    raiz = os.path.abspath(raiz or raiz_blobs())
+    return os.path.abspath(caminho).startswith(raiz + os.sep)
+
+
+def publicar(origem, hash_arquivo, raiz=None):
+    """Move o arquivo para o caminho do hash; devolve (caminho, novo)"""
+    destino = caminho_blob(hash_arquivo, raiz)
+    novo = not os.path.exists(destino)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    # Mesmo quando o blob já existe o replace é feito: o conteúdo é idêntico e
+    # o mtime renovado protege o arquivo de uma coleta em andamento
+    try:
+        os.replace(origem, destino)
+    except OSError:
+        shutil.move(origem, destino)
+    return destino, novo
+
+
+class LimiteExcedido(Exception):
+    def __init__(self, tamanho, limite):
+        super().__init__(f"Arquivo passou de {limite} bytes")
+        self.tamanho = tamanho
+        self.limite = limite
+
+
+def _registrar_upload(novo):
+    registro.incrementar('anexos_blobs_total', 1, 'Uploads de anexos por destino',
+                         resultado='novo' if novo else 'deduplicado')
+
+
+def gravar_stream(origem, raiz=None, limite=None):
+    """
+    Copia o stream para um temporário calculando o SHA-256 no caminho e o
+    publica no lugar definitivo. Retorna (hash, caminho, tamanho, novo).
+    Levanta LimiteExcedido assim que passar de `limite` bytes.
+    """
+    raiz = raiz or raiz_blobs()
+    pasta_tmp = pasta_temporarios(raiz)
+    os.makedirs(pasta_tmp, exist_ok=True)
+
+    sha256 = hashlib.sha256()
+    tamanho = 0
+    fd, temporario = tempfile.mkstemp(dir=pasta_tmp)
+    try:
+        with os.fdopen(fd, 'wb') as destino:
+            while True:
+                bloco = origem.read(TAMANHO_BLOCO)
+                if not bloco:
+                    break
+                tamanho += len(bloco)
+                if limite is not None and tamanho > limite:
+                    raise LimiteExcedido(tamanho, limite)
+                sha256.update(bloco)
+                destino.write(bloco)
+        hash_arquivo = sha256.hexdigest()
+        caminho, novo = publicar(temporario, hash_arquivo, raiz)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+    _registrar_upload(novo)
+    return hash_arquivo, caminho, tamanho, novo
+
+
+def publicar_recebido(arquivo):
+    """Publica um ArquivoRecebido (já hasheado na leitura do multipart); retorna (hash, caminho, novo)"""
+    arquivo.flush()
+    hash_arquivo = arquivo.hash_arquivo
+    caminho, novo = publicar(arquivo.caminho, hash_arquivo)
+    _registrar_upload(novo)
+    return hash_arquivo, caminho, novo
+
+
+def importar_arquivo(caminho, raiz=None):
+    """
+    Move um arquivo já salvo para o armazenamento por hash (ou o apaga, se o
+    conteúdo já existir lá). Retorna (hash, caminho, tamanho, novo).
+    """
+    raiz = raiz or raiz_blobs()
+    sha256 = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b''):
+            sha256.update(bloco)
+    hash_arquivo = sha256.hexdigest()
+    tamanho = os.path.getsize(caminho)
+    destino = caminho_blob(hash_arquivo, raiz)
+    if os.path.exists(destino):
+        os.remove(caminho)
+        return hash_arquivo, destino, tamanho, False
+    destino, novo = publicar(caminho, hash_arquivo, raiz)
+    return hash_arquivo, destino, tamanho, novo
+
+
+def descartar_orfao(caminho):
+    """Apaga um blob recém-gravado que não chegou a ser registrado no banco"""
+    hash_arquivo = os.path.basename(caminho)
+    if BlobAnexo.query.filter_by(hash_arquivo=hash_arquivo).first() is None and os.path.exists(caminho):
+        os.remove(caminho)
+
+
+# ==================== REFERÊNCIAS ====================
+
+def _somar_referencias(hash_arquivo, quantidade):
+    return db.session.execute(
+        update(BlobAnexo)
+        .where(BlobAnexo.hash_arquivo == hash_arquivo)
+        .values(referencias=BlobAnexo.referencias + quantidade, data_sem_referencia=None)
+    ).rowcount
+
+
+def referenciar(hash_arquivo, caminho, tamanho, quantidade=1):
+    """Soma referências ao blob, criando o registro se preciso (sem commit)"""
+    if _somar_referencias(hash_arquivo, quantidade):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(BlobAnexo(
+                hash_arquivo=hash_arquivo,
+                caminho_arquivo=caminho,
+                tamanho_bytes=tamanho,
+                referencias=quantidade,
+                data_sem_referencia=None if quantidade else _agora()
+            ))
+    except IntegrityError:
+        # Outro upload do mesmo conteúdo criou o registro ao mesmo tempo
+        _somar_referencias(hash_arquivo, quantidade)
+
+
+def liberar(hash_arquivo):
+    """Tira uma referência do blob (sem commit); ao chegar a zero começa a carência"""
+    if not hash_arquivo:
+        return
+    db.session.execute(
+        update(BlobAnexo)
+        .where(BlobAnexo.hash_arquivo == hash_arquivo, BlobAnexo.referencias > 0)
+        .values(
+            referencias=BlobAnexo.referencias - 1,
+            data_sem_referencia=case((BlobAnexo.referencias <= 1, _agora()), else_=BlobAnexo.data_sem_referencia)
+        )
+    )
+
+
+def recontar_referencias():
+    """Recalcula os contadores a partir dos ChamadoAnexo ativos e da outbox; devolve quantos mudaram"""
+    contagens = dict(
+        db.session.query(ChamadoAnexo.hash_arquivo, func.count(ChamadoAnexo.id))
+        .filter(ChamadoAnexo.ativo.is_(True), ChamadoAnexo.hash_arquivo.isnot(None))
+        .group_by(ChamadoAnexo.hash_arquivo)
+        .all()
+    )
+    na_fila = db.session.query(EmailOutbox.anexos).filter(
+        EmailOutbox.status.in_(('pendente', 'enviando')), EmailOutbox.anexos.isnot(None)
+    )
+    for (anexos,) in na_fila:
+        for anexo in json.loads(anexos):
+            if anexo.get('hash'):
+                contagens[anexo['hash']] = contagens.get(anexo['hash'], 0) + 1
+    agora = _agora()
+    ajustados = 0
+    for blob in BlobAnexo.query.all():
+        referencias = contagens.get(blob.hash_arquivo, 0)
+        if blob.referencias == referencias:
+            continue
+        blob.referencias = referencias
+        if referencias:
+            blob.data_sem_referencia = None
+        elif blob.data_sem_referencia is None:
+            blob.data_sem_referencia = agora
+        ajustados += 1
+    db.session.commit()
+    return ajustados
+
+
+# ==================== COLETA ====================
+
+def _remover_pastas_vazias(pasta):
+    """Remove as duas pastas do shard se ficaram vazias"""
+    for _ in range(2):
+        try:
+            os.rmdir(pasta)
+        except OSError:
+            return
+        pasta = os.path.dirname(pasta)
+
+
+def coletar_lixo(carencia, simular=False, raiz=None):
+    """Apaga blobs sem referência há mais de `carencia` segundos e temporários abandonados"""
+    raiz = raiz or raiz_blobs()
+    limite = _agora() - timedelta(seconds=carencia)
+    resultado = {'blobs_removidos': 0, 'bytes_liberados': 0, 'temporarios_removidos': 0}
+
+    candidatos = BlobAnexo.query.filter(
+        BlobAnexo.referencias <= 0,
+        BlobAnexo.data_sem_referencia <= limite
+    ).all()
+    for blob in candidatos:
+        # O contador é conferido com os anexos ativos antes de apagar qualquer coisa
+        ativos = ChamadoAnexo.query.filter_by(hash_arquivo=blob.hash_arquivo, ativo=True).count()
+        if ativos:
+            logger.warning(f"Blob {blob.hash_arquivo[:12]} com contador defasado ({ativos} referência(s))")
+            if not simular:
+                blob.referencias = ativos
+                blob.data_sem_referencia = None
+                db.session.commit()
+            continue
+        try:
+            modificado = os.path.getmtime(blob.caminho_arquivo)
+        except OSError:
+            modificado = None
+        if modificado is not None and time.time() - modificado < carencia:
+            continue  # Publicado de novo por um upload recente
+
+        resultado['blobs_removidos'] += 1
+        resultado['bytes_liberados'] += blob.tamanho_bytes or 0
+        if simular:
+            continue
+        apagados = db.session.execute(
+            delete(BlobAnexo).where(BlobAnexo.id == blob.id, BlobAnexo.referencias <= 0)
+        ).rowcount
+        db.session.commit()
+        if apagados and modificado is not None:
+            try:
+                os.remove(blob.caminho_arquivo)
+            except OSError as e:
+                logger.error(f"Erro ao remover blob {blob.caminho_arquivo}: {str(e)}")
+            remover_derivados(blob.hash_arquivo, raiz)
+            _remover_pastas_vazias(os.path.dirname(blob.caminho_arquivo))
+
+    pasta_tmp = pasta_temporarios(raiz)
+    if os.path.isdir(pasta_tmp):
+        for entrada in os.scandir(pasta_tmp):
+            if entrada.is_file() and time.time() - entrada.stat().st_mtime > carencia:
+                resultado['temporarios_removidos'] += 1
+                if not simular:
+                    os.remove(entrada.path)
+
+    if resultado['blobs_removidos'] and not simular:
+        registro.incrementar('anexos_blobs_removidos_total', resultado['blobs_removidos'],
+                             'Blobs de anexos apagados pela coleta')
+        logger.info(f"🧹 {resultado['blobs_removidos']} blob(s) sem referência removido(s) "
+                    f"({resultado['bytes_liberados'] / (1024 * 1024):.1f} MB)")
+    return resultado
+
+
+class ArmazemAnexos:
+    def __init__(self, app=None):
+        self.app = app
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        # Configurações padrão
+        app.config.setdefault('ANEXOS_BLOBS_CARENCIA', 24 * 3600)
+        app.config.setdefault('ANEXOS_ENTREGA', 'python')  # python, x-accel, x-sendfile
+        app.config.setdefault('ANEXOS_X_ACCEL_PREFIXO', '/_anexos/')
+        app.config.setdefault('ANEXOS_QUARENTENA_DIAS', 7)
+        app.config.setdefault('ANEXOS_ZIP_MAX_ARQUIVOS', 2000)
+        app.config.setdefault('ANEXOS_UPLOAD_BLOCO_MAX', 8 * 1024 * 1024)
+        app.config.setdefault('ANEXOS_UPLOAD_SESSAO_EXPIRA', 24 * 3600)
+
+        from setores.ti.entrega_anexos import MODOS_ENTREGA
+        if app.config['ANEXOS_ENTREGA'] not in MODOS_ENTREGA:
+            raise ValueError(f"ANEXOS_ENTREGA inválido: {app.config['ANEXOS_ENTREGA']}")
+
+        app.extensions['anexos_blobs'] = self
+        # Os comandos de conciliação e estatísticas se registram no grupo ao importar os módulos
+        import setores.ti.reconciliacao_anexos  # noqa: F401
+        import setores.ti.estatisticas_anexos  # noqa: F401
+        app.cli.add_command(anexos_blobs_command)
+
+    def coletar_lixo(self, simular=False):
+        from setores.ti.uploads_retomaveis import coletar_sessoes
+        resultado = coletar_lixo(self.app.config['ANEXOS_BLOBS_CARENCIA'], simular=simular)
+        resultado['sessoes_removidas'] = coletar_sessoes(self.app.config['ANEXOS_UPLOAD_SESSAO_EXPIRA'], simular=simular)
+        return resultado
+
+    def reconciliar(self, quarentena=True, simular=False, **kwargs):
+        from setores.ti.reconciliacao_anexos import reconciliar
+        return reconciliar(self.app.config['ANEXOS_BLOBS_CARENCIA'], quarentena=quarentena, simular=simular, **kwargs)
+
+    def purgar_quarentena(self, simular=False):
+        from setores.ti.reconciliacao_anexos import purgar_quarentena
+        return purgar_quarentena(self.app.config['ANEXOS_QUARENTENA_DIAS'], simular=simular)
+
+
+@click.group('anexos-blobs')
+def anexos_blobs_command():
+    """Manutenção do armazenamento de anexos por hash"""
+
+
+@anexos_blobs_command.command('gc')
+@click.option('--simular', is_flag=True, help='Só lista o que seria removido')
+def gc_command(simular):
+    """Remove blobs sem referência após a carência"""
+    resultado = current_app.extensions['anexos_blobs'].coletar_lixo(simular=simular)
+    prefixo = '🔎 Seriam removidos' if simular else '🧹 Removidos'
+    click.echo(f"{prefixo}: {resultado['blobs_removidos']} blob(s), "
+               f"{resultado['bytes_liberados'] / (1024 * 1024):.1f} MB, "
+               f"{resultado['temporarios_removidos']} temporário(s), "
+               f"{resultado['sessoes_removidas']} sessão(ões) de upload abandonada(s)")
+
+
+@anexos_blobs_command.command('recontar')
+def recontar_command():
+    """Recalcula os contadores de referência a partir dos anexos ativos"""
+    click.echo(f"🔢 {recontar_referencias()} contador(es) ajustado(s)")
+
+
+# Instância global, ligada à aplicação em create_app()
+armazem_anexos = ArmazemAnexos()
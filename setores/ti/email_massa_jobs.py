@@ -0,0 +1,397 @@
+"""
+Envio de e-mails em massa em segundo plano
+
+- A requisição grava o EmailMassa e todos os destinatários ('pendente') e
+  retorna na hora; o envio roda em um pool de threads
+- Destinatários são processados em blocos com commit por bloco: uma queda
+  perde no máximo o bloco em andamento
+- Pausar, retomar e cancelar são mudanças de status no banco; o worker
+  confere o status entre blocos
+- Só um processo envia cada trabalho: o worker toma o lease em
+  execucoes_email_massa (livre ou vencido) e o renova a cada bloco
+- Trabalhos em 'na_fila'/'enviando' sem dono vivo (lease livre ou vencido)
+  são retomados pelos requests, verificados a cada EMAIL_MASSA_LEASE segundos
+- Progresso enviado pelo Socket.IO no evento 'email_massa_progresso'
+"""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import func, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db, EmailMassa, EmailMassaDestinatario, ExecucaoEmailMassa, get_brazil_time
+from performance.metrics import registro
+from setores.ti.salas_socketio import SALA_ADMINS, emitir, sala_usuario
+
+logger = logging.getLogger(__name__)
+
+# Trabalhos nesses status devem estar (ou voltar a estar) em execução
+STATUS_ATIVOS = ('na_fila', 'enviando')
+
+
+def _agora():
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def _entregador_padrao(assunto, mensagens):
+    from setores.ti.routes import entregar_emails_em_massa
+    return entregar_emails_em_massa(assunto, mensagens)
+
+
+def preparar_template(email_massa):
+    """Partes comuns do HTML renderizadas uma vez por trabalho"""
+    from setores.ti.utils.templates_email import templates_email
+    criador = email_massa.criador
+    return templates_email.preparar(
+        'grupo.html',
+        ('nome_destinatario',),
+        assunto=email_massa.assunto,
+        mensagem=email_massa.conteudo,
+        nome_grupo=email_massa.grupo.nome if email_massa.grupo else '',
+        remetente=f"{criador.nome} {criador.sobrenome}" if criador else '',
+        data_envio=(email_massa.data_envio or email_massa.data_criacao or _agora()).strftime('%d/%m/%Y às %H:%M')
+    )
+
+
+def progresso(email_massa):
+    """Resumo do trabalho (resposta da API e evento do Socket.IO)"""
+    processados = (email_massa.enviados_count or 0) + (email_massa.falhas_count or 0)
+    total = email_massa.destinatarios_count or 0
+    return {
+        'id': email_massa.id,
+        'status': email_massa.status,
+        'total': total,
+        'enviados': email_massa.enviados_count or 0,
+        'falhas': email_massa.falhas_count or 0,
+        'pendentes': max(total - processados, 0),
+        'percentual': round(processados * 100 / total, 1) if total else 100.0
+    }
+
+
+class ExecutorEmailMassa:
+    def __init__(self, app=None, entregador=None):
+        self.app = app
+        self.entregador = entregador or _entregador_padrao
+        self._pool = None
+        self._em_execucao = set()
+        self._proxima_retomada = 0
+        self._dono = uuid.uuid4().hex
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        # Configurações padrão
+        app.config.setdefault('EMAIL_MASSA_ENABLED', True)
+        app.config.setdefault('EMAIL_MASSA_AUTOSTART', not app.testing)
+        app.config.setdefault('EMAIL_MASSA_WORKERS', 2)
+        app.config.setdefault('EMAIL_MASSA_LOTE', 100)
+        app.config.setdefault('EMAIL_MASSA_INTERVALO_LOTE', 0)
+        app.config.setdefault('EMAIL_MASSA_LEASE', 300)
+
+        app.extensions['email_massa'] = self
+        app.cli.add_command(email_massa_command)
+
+        if app.config['EMAIL_MASSA_ENABLED'] and app.config['EMAIL_MASSA_AUTOSTART']:
+            # Trabalhos sem dono (restart, worker reciclado) voltam pelos requests
+            app.before_request(self._retomar_interrompidos)
+
+        logger.info("ExecutorEmailMassa inicializado")
+
+    def _retomar_interrompidos(self):
+        # Um lease só vence depois de EMAIL_MASSA_LEASE: verificar com essa frequência basta
+        agora = time.monotonic()
+        if agora < self._proxima_retomada:
+            return
+        self._proxima_retomada = agora + self.app.config['EMAIL_MASSA_LEASE']
+
+        ids = [i for (i,) in db.session.query(EmailMassa.id)
+               .outerjoin(ExecucaoEmailMassa, ExecucaoEmailMassa.email_massa_id == EmailMassa.id)
+               .filter(EmailMassa.status.in_(STATUS_ATIVOS))
+               .filter(or_(ExecucaoEmailMassa.dono.is_(None), ExecucaoEmailMassa.bloqueado_ate < _agora()))
+               .all()]
+        retomados = sum(1 for email_massa_id in ids if self._submeter(email_massa_id))
+        if retomados:
+            logger.info(f"📨 {retomados} envio(s) em massa sem dono retomado(s)")
+
+    # ==================== LEASE ====================
+
+    def _novo_lease(self):
+        return (_agora() + timedelta(seconds=self.app.config['EMAIL_MASSA_LEASE'])).replace(microsecond=0)
+
+    def _tomar_lease(self, email_massa_id):
+        """Toma o trabalho para este processo se ninguém o detém (ou o lease venceu)"""
+        resultado = db.session.execute(
+            update(ExecucaoEmailMassa)
+            .where(ExecucaoEmailMassa.email_massa_id == email_massa_id)
+            .where(or_(ExecucaoEmailMassa.dono.is_(None), ExecucaoEmailMassa.bloqueado_ate < _agora()))
+            .values(dono=self._dono, bloqueado_ate=self._novo_lease())
+        )
+        if resultado.rowcount == 0:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(ExecucaoEmailMassa(
+                        email_massa_id=email_massa_id, dono=self._dono, bloqueado_ate=self._novo_lease()
+                    ))
+            except IntegrityError:
+                # A linha existe e o lease é de outro processo
+                db.session.commit()
+                return False
+        db.session.commit()
+        return True
+
+    def _renovar_lease(self, email_massa_id):
+        resultado = db.session.execute(
+            update(ExecucaoEmailMassa)
+            .where(ExecucaoEmailMassa.email_massa_id == email_massa_id)
+            .where(ExecucaoEmailMassa.dono == self._dono)
+            .values(bloqueado_ate=self._novo_lease())
+        )
+        db.session.commit()
+        return resultado.rowcount == 1
+
+    def _liberar_lease(self, email_massa_id):
+        db.session.execute(
+            update(ExecucaoEmailMassa)
+            .where(ExecucaoEmailMassa.email_massa_id == email_massa_id)
+            .where(ExecucaoEmailMassa.dono == self._dono)
+            .values(dono=None, bloqueado_ate=None)
+        )
+        db.session.commit()
+
+    # ==================== CONTROLE ====================
+
+    def _submeter(self, email_massa_id):
+        with self._lock:
+            if email_massa_id in self._em_execucao:
+                return False
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.app.config['EMAIL_MASSA_WORKERS'],
+                    thread_name_prefix='email-massa'
+                )
+            self._em_execucao.add(email_massa_id)
+        self._pool.submit(self._executar_com_contexto, email_massa_id)
+        return True
+
+    def enfileirar(self, email_massa):
+        """Coloca um EmailMassa já gravado (com destinatários) na fila de envio"""
+        email_massa.status = 'na_fila'
+        db.session.commit()
+        if self.app.config['EMAIL_MASSA_ENABLED']:
+            self._submeter(email_massa.id)
+        else:
+            self.executar(email_massa.id)
+
+    def _mudar_status(self, email_massa_id, de, para):
+        resultado = db.session.execute(
+            update(EmailMassa)
+            .where(EmailMassa.id == email_massa_id)
+            .where(EmailMassa.status.in_(de))
+            .values(status=para)
+        )
+        db.session.commit()
+        return resultado.rowcount == 1
+
+    def pausar(self, email_massa_id):
+        """O worker para ao fim do bloco em andamento"""
+        return self._mudar_status(email_massa_id, STATUS_ATIVOS, 'pausado')
+
+    def retomar(self, email_massa_id, reenviar_falhas=False):
+        if not self._mudar_status(email_massa_id, ('pausado', 'erro'), 'na_fila'):
+            return False
+        if reenviar_falhas:
+            reabertos = EmailMassaDestinatario.query.filter_by(
+                email_massa_id=email_massa_id, status_envio='falha'
+            ).update({'status_envio': 'pendente', 'erro_envio': None})
+            db.session.execute(
+                update(EmailMassa)
+                .where(EmailMassa.id == email_massa_id)
+                .values(falhas_count=func.coalesce(EmailMassa.falhas_count, 0) - reabertos,
+                        data_conclusao=None)
+            )
+            db.session.commit()
+        if self.app.config['EMAIL_MASSA_ENABLED']:
+            self._submeter(email_massa_id)
+        else:
+            self.executar(email_massa_id)
+        return True
+
+    def cancelar(self, email_massa_id):
+        if not self._mudar_status(email_massa_id, STATUS_ATIVOS + ('pausado',), 'cancelado'):
+            return False
+        # Um worker ativo termina o bloco em andamento e para no próximo
+        self._encerrar_cancelado(db.session.get(EmailMassa, email_massa_id))
+        return True
+
+    def parar(self, aguardar=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=aguardar)
+
+    # ==================== EXECUÇÃO ====================
+
+    def _executar_com_contexto(self, email_massa_id):
+        resultado = None
+        try:
+            with self.app.app_context():
+                try:
+                    resultado = self.executar(email_massa_id)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Erro no envio em massa {email_massa_id}: {str(e)}")
+                    self._mudar_status(email_massa_id, STATUS_ATIVOS, 'erro')
+                    email_massa = db.session.get(EmailMassa, email_massa_id)
+                    if email_massa:
+                        email_massa.erro_detalhes = str(e)[:2000]
+                        db.session.commit()
+                        self._publicar(email_massa)
+        finally:
+            with self._lock:
+                self._em_execucao.discard(email_massa_id)
+
+        # Pausado e retomado enquanto este worker terminava o bloco: o _submeter
+        # do retomar foi recusado (id ainda em execução), então reenvia daqui
+        if resultado is not None:
+            with self.app.app_context():
+                if self._status_atual(email_massa_id) == 'na_fila':
+                    self._submeter(email_massa_id)
+
+    def _status_atual(self, email_massa_id):
+        return db.session.query(EmailMassa.status).filter(EmailMassa.id == email_massa_id).scalar()
+
+    def executar(self, email_massa_id):
+        """
+        Processa os destinatários pendentes em blocos até acabar, pausar ou
+        cancelar. Retorna None se outro processo detém o trabalho.
+        """
+        if not self._tomar_lease(email_massa_id):
+            logger.info(f"🔒 Envio em massa {email_massa_id} já está com outro processo")
+            return None
+        try:
+            return self._executar(email_massa_id)
+        finally:
+            db.session.rollback()
+            self._liberar_lease(email_massa_id)
+
+    def _executar(self, email_massa_id):
+        if not self._mudar_status(email_massa_id, STATUS_ATIVOS, 'enviando'):
+            return self._status_atual(email_massa_id)
+
+        email_massa = db.session.get(EmailMassa, email_massa_id)
+        if email_massa.data_envio is None:
+            email_massa.data_envio = _agora()
+            db.session.commit()
+        template = preparar_template(email_massa)
+        tamanho_lote = self.app.config['EMAIL_MASSA_LOTE']
+        intervalo = self.app.config['EMAIL_MASSA_INTERVALO_LOTE']
+        self._publicar(email_massa)
+
+        while True:
+            if not self._renovar_lease(email_massa_id):
+                # Ficou parado além do lease e outro processo assumiu: não envia em dobro
+                logger.warning(f"🔒 Lease do envio em massa {email_massa_id} perdido; encerrando este worker")
+                return None
+            status = self._status_atual(email_massa_id)
+            if status != 'enviando':
+                if status == 'cancelado':
+                    self._encerrar_cancelado(email_massa)
+                logger.info(f"⏸️ Envio em massa {email_massa_id} interrompido ({status})")
+                return status
+
+            pendentes = EmailMassaDestinatario.query.filter_by(
+                email_massa_id=email_massa_id, status_envio='pendente'
+            ).order_by(EmailMassaDestinatario.id).limit(tamanho_lote).all()
+            if not pendentes:
+                break
+
+            self._processar_lote(email_massa, template, pendentes)
+            self._publicar(email_massa)
+            if intervalo:
+                time.sleep(intervalo)
+
+        concluido = self._mudar_status(
+            email_massa_id, ('enviando',), 'concluido' if not email_massa.falhas_count else 'erro'
+        )
+        db.session.refresh(email_massa)
+        if concluido:
+            email_massa.data_conclusao = _agora()
+            db.session.commit()
+            logger.info(f"✅ Envio em massa {email_massa_id} finalizado: "
+                        f"{email_massa.enviados_count} enviados, {email_massa.falhas_count} falhas")
+        self._publicar(email_massa)
+        return email_massa.status
+
+    def _processar_lote(self, email_massa, template, pendentes):
+        mensagens = [(d.id, d.email_destinatario, template.render(nome_destinatario=d.nome_destinatario or ''))
+                     for d in pendentes]
+        resultados = self.entregador(email_massa.assunto, mensagens)
+
+        agora = _agora()
+        enviados = falhas = 0
+        for destinatario in pendentes:
+            erro = resultados.get(str(destinatario.id), 'Sem resultado de envio')
+            if erro is None:
+                destinatario.status_envio = 'enviado'
+                destinatario.data_envio = agora
+                enviados += 1
+            else:
+                destinatario.status_envio = 'falha'
+                destinatario.erro_envio = erro[:500]
+                falhas += 1
+
+        # Contadores incrementados no banco: seguros mesmo com pausa/retomada concorrentes
+        db.session.execute(
+            update(EmailMassa)
+            .where(EmailMassa.id == email_massa.id)
+            .values(enviados_count=func.coalesce(EmailMassa.enviados_count, 0) + enviados,
+                    falhas_count=func.coalesce(EmailMassa.falhas_count, 0) + falhas)
+        )
+        db.session.commit()
+        db.session.refresh(email_massa)
+        registro.incrementar('email_massa_total', enviados, 'Destinatários de envios em massa', resultado='enviado')
+        registro.incrementar('email_massa_total', falhas, 'Destinatários de envios em massa', resultado='falha')
+
+    def _encerrar_cancelado(self, email_massa):
+        EmailMassaDestinatario.query.filter_by(
+            email_massa_id=email_massa.id, status_envio='pendente'
+        ).update({'status_envio': 'cancelado'})
+        email_massa.data_conclusao = _agora()
+        db.session.commit()
+        self._publicar(email_massa)
+
+    def _publicar(self, email_massa):
+        # Só para administradores e para quem criou o envio
+        try:
+            emitir('email_massa_progresso', progresso(email_massa),
+                   [SALA_ADMINS, sala_usuario(email_massa.criado_por)])
+        except Exception as e:
+            logger.warning(f"Falha ao publicar progresso do envio em massa: {str(e)}")
+
+
+@click.command('email-massa')
+@click.argument('email_massa_id', type=int, required=False)
+def email_massa_command(email_massa_id):
+    """Processa envios em massa pendentes (ou um específico) neste processo"""
+    executor = current_app.extensions['email_massa']
+    if email_massa_id:
+        ids = [email_massa_id]
+    else:
+        ids = [i for (i,) in db.session.query(EmailMassa.id).filter(EmailMassa.status.in_(STATUS_ATIVOS)).all()]
+    for item_id in ids:
+        status = executor.executar(item_id)
+        click.echo(f"📨 Envio em massa {item_id}: {status or 'não estava na fila'}")
+
+
+# Instância global, ligada à aplicação em create_app()
+email_massa_jobs = ExecutorEmailMassa()
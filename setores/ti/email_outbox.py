@@ -0,0 +1,377 @@
+"""
+Outbox persistente de e-mails com pool de workers em segundo plano
+
+- enfileirar_email() grava a mensagem na tabela email_outbox e retorna na
+  hora; a requisição não espera token, Graph nem SMTP
+- Um despachante busca os itens vencidos, reserva cada um com UPDATE
+  condicional (seguro com vários processos) e entrega no pool de threads;
+  só reserva quantos itens houver workers livres, para nenhum lease vencer
+  parado na fila do pool. O worker confere se o lease ainda é dele antes de
+  enviar
+- Falhas são reagendadas com backoff exponencial com jitter; após
+  max_tentativas o item vai para 'morto' (dead-letter)
+- enfileirar_email() não faz commit: o item entra na transação de quem
+  chamou (savepoint) e só existe se ela for confirmada; os workers deste
+  processo são acordados no commit
+- chave_idempotencia é única: com chave explícita, reenvios da mesma
+  mensagem não duplicam
+- Anexos guardados como blob ganham uma referência no BlobAnexo ao
+  enfileirar, liberada quando o item termina (enviado ou morto): a coleta
+  de blobs não apaga o arquivo de um e-mail ainda na fila
+"""
+import base64
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import and_, event, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import db, EmailOutbox, get_brazil_time
+from setores.ti.anexos_email import normalizar_anexos
+from setores.ti.blob_store import eh_caminho_blob, liberar, referenciar
+from performance.metrics import registro
+
+logger = logging.getLogger(__name__)
+
+def _agora():
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def _metrica(resultado, quantidade=1):
+    registro.incrementar('email_outbox_total', quantidade, 'E-mails processados pela outbox', resultado=resultado)
+
+
+def _serializar_anexos(anexos):
+    """Arquivos salvos em disco são gravados só pelo caminho; bytes em memória, em base64"""
+    validos = normalizar_anexos(anexos)
+    if not validos:
+        return None
+    serializados = []
+    for anexo in validos:
+        item = {'nome': anexo.nome, 'content_type': anexo.content_type, 'tamanho': anexo.tamanho}
+        if anexo.caminho:
+            item['caminho'] = anexo.caminho
+            if eh_caminho_blob(anexo.caminho):
+                item['hash'] = os.path.basename(anexo.caminho)
+        else:
+            item['dados'] = base64.b64encode(anexo.dados).decode('ascii')
+        serializados.append(item)
+    return json.dumps(serializados)
+
+
+def _blobs_do_item(item):
+    """[(hash, caminho, tamanho)] dos anexos do item guardados como blob"""
+    if not item.anexos:
+        return []
+    return [(a['hash'], a['caminho'], a.get('tamanho')) for a in json.loads(item.anexos) if a.get('hash')]
+
+
+def enfileirar_email(assunto, corpo, destinatarios, anexos=None, chave_idempotencia=None, referencia=None,
+                     corpo_html=None):
+    """
+    Grava o e-mail na outbox dentro da transação atual, sem commit: quem
+    chamou confirma junto com o restante do que está fazendo. Só há
+    deduplicação com chave_idempotencia explícita; nesse caso retorna o item
+    já existente com a mesma chave.
+    """
+    if chave_idempotencia:
+        existente = EmailOutbox.query.filter_by(chave_idempotencia=chave_idempotencia).first()
+        if existente:
+            logger.info(f"📭 E-mail já enfileirado (outbox {existente.id}), ignorando duplicata")
+            _metrica('duplicado')
+            return existente
+
+    item = EmailOutbox(
+        chave_idempotencia=chave_idempotencia or uuid.uuid4().hex,
+        assunto=assunto[:500],
+        corpo=corpo,
+        corpo_html=corpo_html,
+        destinatarios=json.dumps(list(destinatarios)),
+        anexos=_serializar_anexos(anexos),
+        referencia=referencia,
+        max_tentativas=current_app.config.get('EMAIL_OUTBOX_MAX_TENTATIVAS', 6)
+    )
+    try:
+        # Só o savepoint é desfeito em caso de conflito; a transação de quem chamou continua
+        with db.session.begin_nested():
+            db.session.add(item)
+            db.session.flush()
+            for hash_arquivo, caminho, tamanho in _blobs_do_item(item):
+                referenciar(hash_arquivo, caminho, tamanho)
+    except IntegrityError:
+        # Outra requisição gravou a mesma chave entre a consulta e o insert
+        _metrica('duplicado')
+        return EmailOutbox.query.filter_by(chave_idempotencia=chave_idempotencia).first()
+
+    _metrica('enfileirado')
+    logger.info(f"📬 E-mail enfileirado na outbox ({item.id}) para {len(destinatarios)} destinatário(s)")
+    # Os workers só enxergam o item depois do commit de quem chamou
+    db.session.info['_outbox_notificar'] = True
+    return item
+
+
+def calcular_backoff(tentativas, base, maximo):
+    """Espera antes da próxima tentativa: base * 2^(n-1), limitada, com jitter de ±20%"""
+    atraso = min(base * (2 ** max(tentativas - 1, 0)), maximo)
+    return atraso * random.uniform(0.8, 1.2)
+
+
+def _entregador_padrao(assunto, corpo, destinatarios, anexos, corpo_html=None):
+    from setores.ti.routes import entregar_email
+    return entregar_email(assunto, corpo, destinatarios, anexos, corpo_html=corpo_html)
+
+
+class OutboxEmail:
+    def __init__(self, app=None, entregador=None):
+        self.app = app
+        self.entregador = entregador or _entregador_padrao
+        self._evento = threading.Event()
+        self._parar = threading.Event()
+        self._despachante = None
+        self._pool = None
+        self._lock = threading.Lock()
+        self._dono = uuid.uuid4().hex
+        self._ocupados = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        # Configurações padrão
+        app.config.setdefault('EMAIL_OUTBOX_ENABLED', True)
+        app.config.setdefault('EMAIL_OUTBOX_AUTOSTART', not app.testing)
+        app.config.setdefault('EMAIL_OUTBOX_WORKERS', 4)
+        app.config.setdefault('EMAIL_OUTBOX_INTERVALO', 5)
+        app.config.setdefault('EMAIL_OUTBOX_LOTE', 20)
+        app.config.setdefault('EMAIL_OUTBOX_MAX_TENTATIVAS', 6)
+        app.config.setdefault('EMAIL_OUTBOX_BACKOFF_BASE', 30)
+        app.config.setdefault('EMAIL_OUTBOX_BACKOFF_MAX', 3600)
+        app.config.setdefault('EMAIL_OUTBOX_LEASE', 300)
+
+        app.extensions['email_outbox'] = self
+        app.cli.add_command(outbox_worker_command)
+        if not event.contains(Session, 'after_commit', self._apos_commit):
+            event.listen(Session, 'after_commit', self._apos_commit)
+
+        if app.config['EMAIL_OUTBOX_ENABLED'] and app.config['EMAIL_OUTBOX_AUTOSTART']:
+            # Os workers sobem no primeiro request do processo, nunca no import
+            app.before_request(self._garantir_iniciado)
+
+        logger.info("OutboxEmail inicializado")
+
+    def _garantir_iniciado(self):
+        if self._despachante is None:
+            self.iniciar()
+
+    # ==================== CICLO DE VIDA ====================
+
+    def iniciar(self):
+        with self._lock:
+            if self._despachante is not None:
+                return
+            self._parar.clear()
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.app.config['EMAIL_OUTBOX_WORKERS'],
+                thread_name_prefix='outbox-email'
+            )
+            self._despachante = threading.Thread(target=self._loop, name='outbox-despachante', daemon=True)
+            self._despachante.start()
+        logger.info(f"📮 Outbox de e-mail iniciada com {self.app.config['EMAIL_OUTBOX_WORKERS']} workers")
+
+    def parar(self, aguardar=True):
+        with self._lock:
+            if self._despachante is None:
+                return
+            self._parar.set()
+            self._evento.set()
+            despachante, pool = self._despachante, self._pool
+            self._despachante = self._pool = None
+        if aguardar:
+            despachante.join(timeout=10)
+        pool.shutdown(wait=aguardar)
+
+    def notificar(self):
+        """Acorda o despachante (novo item enfileirado neste processo)"""
+        self._evento.set()
+
+    def _apos_commit(self, session):
+        if session.info.pop('_outbox_notificar', False):
+            self.notificar()
+
+    def _vagas(self):
+        with self._lock:
+            return self.app.config['EMAIL_OUTBOX_WORKERS'] - self._ocupados
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                vagas = min(self._vagas(), self.app.config['EMAIL_OUTBOX_LOTE'])
+                reservados = []
+                if vagas > 0:
+                    with self.app.app_context():
+                        reservados = self._reservar(vagas)
+                for item_id, lease in reservados:
+                    with self._lock:
+                        self._ocupados += 1
+                    self._pool.submit(self._processar_com_contexto, item_id, lease)
+                if reservados and len(reservados) == vagas:
+                    # Pode haver mais itens vencidos: volta assim que um worker liberar
+                    continue
+            except Exception as e:
+                logger.error(f"Erro no despachante da outbox: {str(e)}")
+            self._evento.wait(self.app.config['EMAIL_OUTBOX_INTERVALO'])
+            self._evento.clear()
+
+    # ==================== RESERVA E ENTREGA ====================
+
+    def _novo_lease(self, agora):
+        # Sem microssegundos: o DATETIME do MySQL os descarta e a comparação no worker falharia
+        return (agora + timedelta(seconds=self.app.config['EMAIL_OUTBOX_LEASE'])).replace(microsecond=0)
+
+    def _reservar(self, limite):
+        """
+        Reserva itens vencidos; o UPDATE condicional garante um único dono.
+        Retorna [(id, lease)].
+        """
+        agora = _agora()
+        candidatos = db.session.query(EmailOutbox.id).filter(or_(
+            and_(EmailOutbox.status == 'pendente', EmailOutbox.proxima_tentativa <= agora),
+            and_(EmailOutbox.status == 'enviando', EmailOutbox.bloqueado_ate < agora)
+        )).order_by(EmailOutbox.proxima_tentativa).limit(limite).all()
+
+        lease = self._novo_lease(agora)
+        reservados = []
+        for (item_id,) in candidatos:
+            resultado = db.session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id == item_id)
+                .where(or_(
+                    EmailOutbox.status == 'pendente',
+                    and_(EmailOutbox.status == 'enviando', EmailOutbox.bloqueado_ate < agora)
+                ))
+                .values(status='enviando', bloqueado_ate=lease, dono=self._dono)
+            )
+            if resultado.rowcount == 1:
+                reservados.append((item_id, lease))
+        db.session.commit()
+        return reservados
+
+    def _processar_com_contexto(self, item_id, lease):
+        try:
+            with self.app.app_context():
+                try:
+                    self.processar(item_id, lease)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Erro ao processar item {item_id} da outbox: {str(e)}")
+        finally:
+            with self._lock:
+                self._ocupados -= 1
+            self._evento.set()
+
+    def processar(self, item_id, lease):
+        """Entrega um item reservado por este processo e registra o resultado"""
+        item = db.session.get(EmailOutbox, item_id)
+        if item is None or item.status != 'enviando':
+            return
+        if item.dono != self._dono or item.bloqueado_ate != lease or lease <= _agora():
+            # Lease vencido e, possivelmente, reservado por outro processo: não envia
+            _metrica('lease_perdido')
+            logger.warning(f"🔒 Lease do e-mail {item_id} não pertence mais a este worker; envio ignorado")
+            db.session.rollback()
+            return
+
+        item.tentativas += 1
+        erro = None
+        try:
+            sucesso = self.entregador(item.assunto, item.corpo, item.get_destinatarios(), item.get_anexos(),
+                                      corpo_html=item.corpo_html)
+        except Exception as e:
+            sucesso, erro = False, str(e)
+
+        if sucesso:
+            item.status = 'enviado'
+            item.data_envio = _agora()
+            item.ultimo_erro = None
+            _metrica('enviado')
+        elif item.tentativas >= item.max_tentativas:
+            item.status = 'morto'
+            item.ultimo_erro = erro or 'Falha no envio (Graph e SMTP)'
+            _metrica('morto')
+            logger.error(f"💀 E-mail {item.id} descartado após {item.tentativas} tentativas: {item.ultimo_erro}")
+        else:
+            espera = calcular_backoff(item.tentativas, self.app.config['EMAIL_OUTBOX_BACKOFF_BASE'],
+                                      self.app.config['EMAIL_OUTBOX_BACKOFF_MAX'])
+            item.status = 'pendente'
+            item.proxima_tentativa = _agora() + timedelta(seconds=espera)
+            item.ultimo_erro = erro or 'Falha no envio (Graph e SMTP)'
+            _metrica('falha')
+            logger.warning(f"⏳ E-mail {item.id} falhou (tentativa {item.tentativas}), nova tentativa em {espera:.0f}s")
+
+        if item.status in ('enviado', 'morto'):
+            for hash_arquivo, _, _ in _blobs_do_item(item):
+                liberar(hash_arquivo)
+        item.bloqueado_ate = None
+        item.dono = None
+        db.session.commit()
+        return item.status
+
+    def processar_pendentes(self, limite=None):
+        """Entrega de forma síncrona tudo o que estiver vencido (testes e CLI)"""
+        processados = 0
+        while limite is None or processados < limite:
+            reservados = self._reservar(self.app.config['EMAIL_OUTBOX_LOTE'])
+            if not reservados:
+                break
+            for item_id, lease in reservados:
+                self.processar(item_id, lease)
+                processados += 1
+        return processados
+
+    def reenfileirar(self, item_id):
+        """Devolve um item 'morto' para a fila"""
+        item = db.session.get(EmailOutbox, item_id)
+        if item is None or item.status != 'morto':
+            return False
+        item.status = 'pendente'
+        item.tentativas = 0
+        item.proxima_tentativa = _agora()
+        # As referências foram liberadas quando o item morreu
+        for hash_arquivo, caminho, tamanho in _blobs_do_item(item):
+            referenciar(hash_arquivo, caminho, tamanho)
+        db.session.commit()
+        self.notificar()
+        return True
+
+
+@click.command('outbox-worker')
+@click.option('--uma-vez', is_flag=True, help='Entrega o que estiver vencido e encerra')
+def outbox_worker_command(uma_vez):
+    """Processa a outbox de e-mails em um processo dedicado"""
+    outbox = current_app.extensions['email_outbox']
+    if uma_vez:
+        click.echo(f"📮 {outbox.processar_pendentes()} e-mail(s) processado(s)")
+        return
+
+    outbox.iniciar()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        outbox.parar()
+
+
+# Instância global, ligada à aplicação em create_app()
+email_outbox = OutboxEmail()
@@ -1,10 +1,12 @@
 import os
-import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from flask import current_app
 import logging
-from jinja2 import Template
+from setores.ti.utils.templates_email import templates_email
+from setores.ti.smtp_pool import PoolSMTP
+from setores.ti.anexos_email import gerar_mime, normalizar_anexos
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,25 @@ class EmailService:
         self.email_username = os.getenv('MICROSOFT_GRAPH_USERNAME')
         self.email_password = os.getenv('MICROSOFT_GRAPH_PASSWORD')
         self.from_email = os.getenv('MICROSOFT_GRAPH_USERNAME')
+        self.usar_starttls = os.getenv('MICROSOFT_GRAPH_SMTP_STARTTLS', 'true').lower() == 'true'
+        self.tamanho_pool = int(os.getenv('MICROSOFT_GRAPH_SMTP_POOL', '3'))
+        self.max_mensagens_conexao = int(os.getenv('SMTP_MAX_MENSAGENS_CONEXAO', '100'))
+        self.timeout = int(os.getenv('SMTP_TIMEOUT', '30'))
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self):
+        """Pool de conexões SMTP autenticadas (criado no primeiro envio)"""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = PoolSMTP(
+                        self.smtp_server, self.smtp_port, self.email_username, self.email_password,
+                        usar_starttls=self.usar_starttls, tamanho=self.tamanho_pool,
+                        max_mensagens=self.max_mensagens_conexao, timeout=self.timeout
+                    )
+        return self._pool
 
     def enviar_email(self, destinatario, assunto, corpo_html, corpo_texto=None, anexos=None):
         """Envia um email via SMTP com suporte a anexos"""
@@ -23,48 +44,28 @@ class EmailService:
                 logger.error("Credenciais de email não configuradas")
                 return False
 
-            # Criar mensagem
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email
-            msg['To'] = destinatario
-            msg['Subject'] = assunto
-
-            # Parte alternativa (texto/HTML)
-            alt = MIMEMultipart('alternative')
-            if corpo_texto:
-                parte_texto = MIMEText(corpo_texto, 'plain', 'utf-8')
-                alt.attach(parte_texto)
-            parte_html = MIMEText(corpo_html, 'html', 'utf-8')
-            alt.attach(parte_html)
-            msg.attach(alt)
-
-            # Anexos
-            if anexos:
-                from email.mime.base import MIMEBase
-                from email import encoders
-                for anexo in anexos:
-                    try:
-                        nome = anexo.get('nome')
-                        dados = anexo.get('dados')
-                        content_type = anexo.get('content_type') or 'application/octet-stream'
-                        if not (nome and dados is not None):
-                            continue
-                        maintype, _, subtype = content_type.partition('/')
-                        part = MIMEBase(maintype, subtype or 'octet-stream')
-                        part.set_payload(dados)
-                        encoders.encode_base64(part)
-                        part.add_header('Content-Disposition', 'attachment', filename=nome)
-                        if content_type:
-                            part.add_header('Content-Type', content_type)
-                        msg.attach(part)
-                    except Exception as attach_err:
-                        logger.warning(f"Falha ao anexar arquivo '{anexo.get('nome')}': {attach_err}")
-
-            # Conectar e enviar
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.email_username, self.email_password)
-                server.send_message(msg)
+            anexos_validos = normalizar_anexos(anexos)
+
+            if anexos_validos:
+                # Anexos vão do disco para o socket em blocos, sem montar a mensagem inteira
+                self.pool.enviar_blocos(self.from_email, [destinatario], lambda: gerar_mime(
+                    self.from_email, destinatario, assunto, corpo_html, corpo_texto, anexos_validos
+                ))
+            else:
+                msg = MIMEMultipart()
+                msg['From'] = self.from_email
+                msg['To'] = destinatario
+                msg['Subject'] = assunto
+
+                # Parte alternativa (texto/HTML)
+                alt = MIMEMultipart('alternative')
+                if corpo_texto:
+                    alt.attach(MIMEText(corpo_texto, 'plain', 'utf-8'))
+                alt.attach(MIMEText(corpo_html, 'html', 'utf-8'))
+                msg.attach(alt)
+
+                # Enviar por uma conexão já autenticada do pool
+                self.pool.enviar(msg)
 
             logger.info(f"Email enviado com sucesso para {destinatario}")
             return True
@@ -76,75 +77,14 @@ class EmailService:
     def notificar_agente_atribuido(self, chamado, agente):
         """Envia notificação quando um agente é atribuído a um chamado"""
         try:
-            template_html = Template("""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="utf-8">
-                <style>
-                    body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-                    .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-                    .header { background-color: #007bff; color: white; padding: 20px; text-align: center; }
-                    .content { background-color: #f8f9fa; padding: 20px; }
-                    .info-box { background-color: white; padding: 15px; margin: 10px 0; border-left: 4px solid #007bff; }
-                    .footer { text-align: center; margin-top: 20px; font-size: 12px; color: #666; }
-                    .btn { background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 4px; }
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>🎯 Agente Atribuído ao Seu Chamado</h1>
-                    </div>
-                    
-                    <div class="content">
-                        <p>Olá <strong>{{ chamado.solicitante }}</strong>,</p>
-                        
-                        <p>Temos uma ótima notícia! Um agente de suporte foi atribuído ao seu chamado:</p>
-                        
-                        <div class="info-box">
-                            <h3>📋 Detalhes do Chamado</h3>
-                            <p><strong>Código:</strong> {{ chamado.codigo }}</p>
-                            <p><strong>Protocolo:</strong> {{ chamado.protocolo }}</p>
-                            <p><strong>Problema:</strong> {{ chamado.problema }}</p>
-                            <p><strong>Prioridade:</strong> {{ chamado.prioridade }}</p>
-                            <p><strong>Status:</strong> {{ chamado.status }}</p>
-                        </div>
-                        
-                        <div class="info-box">
-                            <h3>👨‍💻 Agente Responsável</h3>
-                            <p><strong>Nome:</strong> {{ agente.nome }}</p>
-                            <p><strong>Nível:</strong> {{ agente.nivel_experiencia|title }}</p>
-                            <p><strong>Especialidades:</strong> {{ especialidades_texto }}</p>
-                        </div>
-                        
-                        <div class="info-box">
-                            <h3>📞 Próximos Passos</h3>
-                            <p>{{ agente.nome }} irá analisar seu chamado e entrará em contato em breve. Você pode acompanhar o progresso do chamado através do sistema.</p>
-                            <p>Se tiver alguma dúvida adicional ou informação que possa ajudar na resolução, responda este email.</p>
-                        </div>
-                        
-                        <p style="text-align: center; margin: 30px 0;">
-                            <a href="#" class="btn">Acompanhar Chamado</a>
-                        </p>
-                    </div>
-                    
-                    <div class="footer">
-                        <p>Este é um email automático do sistema de suporte da Evoque Fitness.</p>
-                        <p>Data: {{ data_atual }}</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """)
-            
             # Preparar dados para o template
             especialidades_texto = ', '.join(agente.especialidades_list) if agente.especialidades_list else 'Suporte Geral'
             
             from database import get_brazil_time
             data_atual = get_brazil_time().strftime('%d/%m/%Y às %H:%M')
             
-            corpo_html = template_html.render(
+            corpo_html = templates_email.renderizar(
+                'agente_atribuido.html',
                 chamado=chamado,
                 agente=agente,
                 especialidades_texto=especialidades_texto,
@@ -177,7 +117,11 @@ Sistema de Suporte Evoque Fitness
             
             assunto = f"🎯 Agente Atribuído - Chamado {chamado.codigo}"
             
-            return self.enviar_email(chamado.email, assunto, corpo_html, corpo_texto)
+            # Vai pela outbox (ou pelo agrupamento, conforme NOTIFICACOES_MODO) sem perder o
+            # template; quem chama faz o commit
+            from setores.ti.notificacoes_email import notificar_email
+            return notificar_email([chamado.email], assunto, corpo_texto.strip(),
+                                   referencia=f"chamado:{chamado.codigo}", corpo_html=corpo_html)
             
         except Exception as e:
             logger.error(f"Erro ao gerar notificação de agente atribuído: {str(e)}")
@@ -0,0 +1,131 @@
+"""
+Entrega de anexos (download e pré-visualização)
+
+- ETag forte = hash_arquivo (SHA-256 do conteúdo): If-None-Match responde 304
+  sem abrir o arquivo
+- Modo 'python' (padrão): send_file do Werkzeug com Range (206) e If-Range,
+  para o player de vídeo poder avançar sem baixar tudo
+- Modos 'x-accel' (nginx) e 'x-sendfile' (Apache/lighttpd): a view só confere
+  permissão e cabeçalhos; o proxy transfere o arquivo e trata o Range, sem
+  ocupar o worker
+
+Exemplo nginx para ANEXOS_ENTREGA=x-accel (ANEXOS_X_ACCEL_PREFIXO=/_anexos/):
+
+    location /_anexos/ {
+        internal;
+        alias /srv/portal/uploads/chamados/;
+        etag off;
+        add_header ETag $upstream_http_etag;
+    }
+"""
+import logging
+import os
+import unicodedata
+from urllib.parse import quote
+
+from flask import current_app, jsonify, request
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.utils import send_file
+
+from performance.metrics import registro
+from setores.ti.anexos_utils import ANEXOS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+MODOS_ENTREGA = ('python', 'x-accel', 'x-sendfile')
+
+
+def _metrica(modo, status):
+    registro.incrementar('anexos_entregues_total', 1, 'Anexos entregues', modo=modo, status=str(status))
+
+
+def _definir_disposition(resposta, nome, as_attachment):
+    """Mesmo formato do send_file (filename* em UTF-8 para nomes acentuados)"""
+    try:
+        nome.encode('ascii')
+        nomes = {'filename': nome}
+    except UnicodeEncodeError:
+        simples = unicodedata.normalize('NFKD', nome).encode('ascii', 'ignore').decode('ascii')
+        nomes = {'filename': simples, 'filename*': f"UTF-8''{quote(nome, safe='!#$&+-.^_`|~')}"}
+    resposta.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline', **nomes)
+
+
+def _caminho_interno(caminho):
+    """URI interna do nginx para o arquivo, relativa à pasta de uploads"""
+    relativo = os.path.relpath(os.path.abspath(caminho), os.path.abspath(ANEXOS_CONFIG['UPLOAD_FOLDER']))
+    prefixo = current_app.config['ANEXOS_X_ACCEL_PREFIXO'].rstrip('/')
+    return f"{prefixo}/{quote(relativo.replace(os.sep, '/'))}"
+
+
+def _resposta_proxy(caminho, mimetype, nome, as_attachment, modo):
+    resposta = current_app.response_class(mimetype=mimetype)
+    if modo == 'x-accel':
+        resposta.headers['X-Accel-Redirect'] = _caminho_interno(caminho)
+    else:
+        resposta.headers['X-Sendfile'] = os.path.abspath(caminho)
+    resposta.headers['Accept-Ranges'] = 'bytes'
+    _definir_disposition(resposta, nome, as_attachment)
+    return resposta
+
+
+def servir_arquivo(caminho, etag, mimetype, nome, as_attachment=False, max_age=0):
+    """
+    Entrega um arquivo dos anexos já autorizado. etag precisa identificar o
+    conteúdo (hash); max_age > 0 só para conteúdo que nunca muda na mesma URL.
+    """
+    modo = current_app.config['ANEXOS_ENTREGA']
+
+    # Conteúdo endereçado por hash: a mesma ETag é sempre o mesmo arquivo
+    if etag and request.if_none_match.contains(etag):
+        resposta = current_app.response_class(status=304)
+        resposta.set_etag(etag)
+        _definir_cache(resposta, max_age)
+        _metrica(modo, 304)
+        return resposta
+
+    if modo in ('x-accel', 'x-sendfile'):
+        resposta = _resposta_proxy(caminho, mimetype, nome, as_attachment, modo)
+        if etag:
+            resposta.set_etag(etag)
+    else:
+        try:
+            resposta = send_file(
+                caminho,
+                request.environ,
+                mimetype=mimetype,
+                as_attachment=as_attachment,
+                download_name=nome,
+                conditional=True,
+                etag=etag or True,
+                max_age=max_age,
+                response_class=current_app.response_class,
+                _root_path=current_app.root_path
+            )
+        except RequestedRangeNotSatisfiable as e:
+            _metrica(modo, 416)
+            return e.get_response()
+        except FileNotFoundError:
+            logger.error(f"Arquivo não encontrado: {caminho}")
+            _metrica(modo, 404)
+            return jsonify({'error': 'Arquivo não encontrado no servidor'}), 404
+
+    _definir_cache(resposta, max_age)
+    _metrica(modo, resposta.status_code)
+    return resposta
+
+
+def _definir_cache(resposta, max_age):
+    # Anexos exigem login: nunca em caches compartilhados
+    resposta.cache_control.public = None
+    resposta.cache_control.private = True
+    if max_age:
+        resposta.cache_control.no_cache = None
+        resposta.cache_control.max_age = max_age
+    else:
+        resposta.cache_control.no_cache = True
+
+
+def servir_anexo(anexo, as_attachment=True):
+    """Resposta para um ChamadoAnexo já autorizado"""
+    return servir_arquivo(anexo.caminho_arquivo, anexo.hash_arquivo, anexo.tipo_mime,
+                          anexo.nome_original, as_attachment=as_attachment)
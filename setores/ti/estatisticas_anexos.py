@@ -0,0 +1,160 @@
+"""
+Estatísticas de anexos a partir de uma tabela de agregados
+
+- estatisticas_anexos guarda quantidade e bytes dos anexos ativos por
+  categoria (image, video, document, other), unidade do chamado e mês do
+  upload: é uma tabela pequena, lida inteira a cada consulta
+- save_uploaded_file e delete_attachment somam/subtraem na mesma transação
+  do anexo; recalcular() refaz tudo com uma única consulta agrupada (usado
+  na primeira leitura, pelo reindexador e por flask anexos-blobs estatisticas)
+"""
+import logging
+from collections import defaultdict
+
+import click
+from sqlalchemy import case, delete, extract, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from database import db, BlobAnexo, Chamado, ChamadoAnexo, EstatisticaAnexos, get_brazil_time
+from setores.ti.anexos_utils import DOCUMENT_MIME_TYPES, format_file_size, get_file_type_category
+from setores.ti.blob_store import anexos_blobs_command
+
+logger = logging.getLogger(__name__)
+
+CATEGORIAS = ('image', 'video', 'document', 'other')
+
+
+def expressao_categoria():
+    """Mesma classificação de get_file_type_category, em SQL"""
+    return case(
+        (ChamadoAnexo.tipo_mime.like('image/%'), 'image'),
+        (ChamadoAnexo.tipo_mime.like('video/%'), 'video'),
+        (ChamadoAnexo.tipo_mime.in_(DOCUMENT_MIME_TYPES), 'document'),
+        else_='other'
+    )
+
+
+def _somar(chave, quantidade, tamanho):
+    return db.session.execute(
+        update(EstatisticaAnexos)
+        .where(*(getattr(EstatisticaAnexos, campo) == valor for campo, valor in chave.items()))
+        .values(quantidade=EstatisticaAnexos.quantidade + quantidade,
+                tamanho_bytes=EstatisticaAnexos.tamanho_bytes + tamanho)
+    ).rowcount
+
+
+def registrar_anexo(anexo, sinal=1):
+    """Soma (sinal=1) ou tira (sinal=-1) o anexo dos agregados (sem commit)"""
+    data = anexo.data_upload or get_brazil_time().replace(tzinfo=None)
+    chamado = anexo.chamado or Chamado.query.get(anexo.chamado_id)
+    chave = {
+        'categoria': get_file_type_category(anexo.tipo_mime or ''),
+        'unidade': chamado.unidade if chamado else '',
+        'ano': data.year,
+        'mes': data.month,
+    }
+    quantidade, tamanho = sinal, sinal * (anexo.tamanho_bytes or 0)
+    if _somar(chave, quantidade, tamanho):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(EstatisticaAnexos(**chave, quantidade=quantidade, tamanho_bytes=tamanho))
+    except IntegrityError:
+        # Outro upload criou a linha ao mesmo tempo
+        _somar(chave, quantidade, tamanho)
+
+
+def recalcular():
+    """Refaz a tabela de agregados com uma consulta agrupada; devolve o número de linhas"""
+    categoria = expressao_categoria()
+    ano = extract('year', ChamadoAnexo.data_upload)
+    mes = extract('month', ChamadoAnexo.data_upload)
+    linhas = db.session.execute(
+        select(categoria, Chamado.unidade, ano, mes,
+               func.count(ChamadoAnexo.id), func.coalesce(func.sum(ChamadoAnexo.tamanho_bytes), 0))
+        .join(Chamado, Chamado.id == ChamadoAnexo.chamado_id)
+        .where(ChamadoAnexo.ativo.is_(True), ChamadoAnexo.data_upload.isnot(None))
+        .group_by(categoria, Chamado.unidade, ano, mes)
+    ).all()
+
+    db.session.execute(delete(EstatisticaAnexos))
+    db.session.add_all(
+        EstatisticaAnexos(categoria=cat, unidade=unidade or '', ano=int(a), mes=int(m),
+                          quantidade=quantidade, tamanho_bytes=int(tamanho))
+        for cat, unidade, a, m, quantidade, tamanho in linhas
+    )
+    db.session.commit()
+    return len(linhas)
+
+
+def obter_estatisticas():
+    """Totais por categoria, por unidade e crescimento mês a mês (lidos dos agregados)"""
+    linhas = EstatisticaAnexos.query.all()
+    if not linhas and db.session.query(ChamadoAnexo.id).filter(ChamadoAnexo.ativo.is_(True)).first():
+        # Tabela ainda não preenchida (instalação anterior aos agregados)
+        recalcular()
+        linhas = EstatisticaAnexos.query.all()
+
+    por_categoria = {categoria: [0, 0] for categoria in CATEGORIAS}
+    por_unidade = defaultdict(lambda: [0, 0])
+    por_mes = defaultdict(lambda: [0, 0])
+    for linha in linhas:
+        for grupo, chave in ((por_categoria, linha.categoria), (por_unidade, linha.unidade),
+                             (por_mes, (linha.ano, linha.mes))):
+            grupo.setdefault(chave, [0, 0])
+            grupo[chave][0] += linha.quantidade
+            grupo[chave][1] += linha.tamanho_bytes
+
+    total_anexos = sum(q for q, _ in por_categoria.values())
+    tamanho_total = sum(t for _, t in por_categoria.values())
+    # Espaço real em disco: conteúdo repetido é gravado uma vez só
+    armazenado = db.session.query(func.coalesce(func.sum(BlobAnexo.tamanho_bytes), 0)).scalar() or 0
+
+    meses, acumulado = [], 0
+    for (ano, mes), (quantidade, tamanho) in sorted(por_mes.items()):
+        acumulado += tamanho
+        meses.append({
+            'mes': f"{ano}-{mes:02d}",
+            'anexos': quantidade,
+            'tamanho': tamanho,
+            'tamanho_formatado': format_file_size(max(tamanho, 0)),
+            'acumulado': acumulado,
+            'acumulado_formatado': format_file_size(max(acumulado, 0))
+        })
+
+    unidades = [
+        {'unidade': unidade, 'anexos': quantidade, 'tamanho': tamanho,
+         'tamanho_formatado': format_file_size(max(tamanho, 0))}
+        for unidade, (quantidade, tamanho) in sorted(por_unidade.items(), key=lambda item: -item[1][1])
+        if quantidade
+    ]
+
+    return {
+        'total_anexos': total_anexos,
+        'tamanho_total': tamanho_total,
+        'tamanho_total_formatado': format_file_size(max(tamanho_total, 0)),
+        'tamanho_armazenado': armazenado,
+        'tamanho_armazenado_formatado': format_file_size(armazenado),
+        'anexos_imagem': por_categoria['image'][0],
+        'anexos_video': por_categoria['video'][0],
+        'anexos_documento': por_categoria['document'][0],
+        'anexos_outros': por_categoria['other'][0],
+        'tamanho_por_categoria': {categoria: tamanho for categoria, (_, tamanho) in por_categoria.items()},
+        'por_unidade': unidades,
+        'por_mes': meses
+    }
+
+
+@anexos_blobs_command.command('estatisticas')
+@click.option('--recalcular', 'refazer', is_flag=True, help='Refaz os agregados a partir dos anexos')
+def estatisticas_command(refazer):
+    """Mostra o uso de espaço dos anexos por categoria, unidade e mês"""
+    if refazer:
+        click.echo(f"🔢 {recalcular()} linha(s) de agregados recalculada(s)")
+    dados = obter_estatisticas()
+    click.echo(f"📎 {dados['total_anexos']} anexo(s), {dados['tamanho_total_formatado']} "
+               f"({dados['tamanho_armazenado_formatado']} em disco)")
+    for unidade in dados['por_unidade']:
+        click.echo(f"   {unidade['unidade']}: {unidade['anexos']} anexo(s), {unidade['tamanho_formatado']}")
+    for mes in dados['por_mes']:
+        click.echo(f"   {mes['mes']}: +{mes['tamanho_formatado']} (total {mes['acumulado_formatado']})")
@@ -0,0 +1,131 @@
+"""
+Autenticação do Microsoft Graph compartilhada pelo processo
+
+- Um único ConfidentialClientApplication reaproveitado entre envios
+- Token em cache até pouco antes de expirar; perto do fim da validade a
+  renovação é feita em segundo plano enquanto o token atual segue em uso
+- Apenas uma busca de token por vez (as demais threads aguardam o resultado)
+- Contadores graph_token_total{resultado=cache|obtido|erro} nas métricas
+- Só aceita authorities https; testes e benchmarks injetam buscar_token em
+  vez de apontar o provedor para um servidor local em http
+"""
+import logging
+import threading
+import time
+
+from performance.lazy import modulo_preguicoso
+from performance.metrics import registro
+
+logger = logging.getLogger(__name__)
+
+msal = modulo_preguicoso('msal')
+
+AUTHORITY_HOST_PADRAO = 'https://login.microsoftonline.com'
+
+
+class ErroTokenGraph(RuntimeError):
+    """Falha ao obter token do Azure AD"""
+
+
+class ProvedorTokenGraph:
+    def __init__(self, client_id, client_secret, tenant_id, scopes,
+                 authority_host=AUTHORITY_HOST_PADRAO, margem_expiracao=60, janela_renovacao=300,
+                 buscar_token=None):
+        if not authority_host.lower().startswith('https://'):
+            # O client secret iria em texto aberto para o endereço informado
+            raise ValueError(f"Authority do Graph precisa ser https: {authority_host}")
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.tenant_id = tenant_id
+        self.scopes = list(scopes)
+        self.authority = f"{authority_host.rstrip('/')}/{tenant_id}"
+        self.margem_expiracao = margem_expiracao
+        self.janela_renovacao = janela_renovacao
+        # Substitui o MSAL (testes/benchmarks): recebe o provedor e devolve a resposta do token
+        self._buscar_externo = buscar_token
+
+        self._cliente = None
+        self._token = None
+        self._expira_em = 0.0
+        self._lock = threading.Lock()
+        self._renovando = False
+
+    @property
+    def configurado(self):
+        return all([self.client_id, self.client_secret, self.tenant_id])
+
+    def _obter_cliente(self):
+        if self._cliente is None:
+            self._cliente = msal.ConfidentialClientApplication(
+                client_id=self.client_id,
+                client_credential=self.client_secret,
+                authority=self.authority
+            )
+        return self._cliente
+
+    def _buscar_token(self):
+        """Consulta o Azure AD; devolve (token, segundos de validade)"""
+        if self._buscar_externo is not None:
+            resultado = self._buscar_externo(self)
+        else:
+            resultado = self._obter_cliente().acquire_token_for_client(scopes=self.scopes)
+
+        if 'access_token' not in resultado:
+            raise ErroTokenGraph(
+                f"{resultado.get('error', 'N/A')}: {resultado.get('error_description', 'N/A')} "
+                f"(correlation_id {resultado.get('correlation_id', 'N/A')})"
+            )
+        return resultado['access_token'], int(resultado.get('expires_in', 3599))
+
+    def _renovar(self):
+        """Busca um token novo e atualiza o cache (chamado com o lock ou pela thread de renovação)"""
+        inicio = time.perf_counter()
+        try:
+            token, validade = self._buscar_token()
+        except Exception as e:
+            registro.incrementar('graph_token_total', 1, 'Tokens do Graph servidos', resultado='erro')
+            logger.error(f"❌ Erro ao obter token do Graph: {str(e)}")
+            raise
+        self._token = token
+        self._expira_em = time.time() + validade - self.margem_expiracao
+        registro.incrementar('graph_token_total', 1, 'Tokens do Graph servidos', resultado='obtido')
+        logger.info(f"🔑 Token do Graph obtido em {(time.perf_counter() - inicio) * 1000:.0f} ms (válido por {validade}s)")
+        return token
+
+    def _renovar_em_segundo_plano(self):
+        try:
+            with self._lock:
+                self._renovar()
+        except Exception:
+            pass  # o token atual continua válido; a próxima chamada tenta de novo
+        finally:
+            self._renovando = False
+
+    def obter_token(self):
+        """Token válido do cache ou recém-obtido; None se não configurado ou em caso de erro"""
+        if not self.configurado:
+            return None
+
+        restante = self._expira_em - time.time()
+        if self._token and restante > 0:
+            if restante < self.janela_renovacao and not self._renovando:
+                self._renovando = True
+                threading.Thread(target=self._renovar_em_segundo_plano, name='graph-token', daemon=True).start()
+            registro.incrementar('graph_token_total', 1, 'Tokens do Graph servidos', resultado='cache')
+            return self._token
+
+        with self._lock:
+            # Outra thread pode ter renovado enquanto esperávamos o lock
+            if self._token and self._expira_em > time.time():
+                registro.incrementar('graph_token_total', 1, 'Tokens do Graph servidos', resultado='cache')
+                return self._token
+            try:
+                return self._renovar()
+            except Exception:
+                return None
+
+    def invalidar(self):
+        """Descarta o token em cache (ex.: Graph respondeu 401)"""
+        with self._lock:
+            self._token = None
+            self._expira_em = 0.0
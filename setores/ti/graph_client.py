@@ -0,0 +1,399 @@
+"""
+Cliente HTTP do Microsoft Graph
+
+- Session com pool de conexões keep-alive (uma conexão TLS reaproveitada)
+- Timeouts de conexão e leitura em todas as chamadas
+- Retentativas com backoff exponencial e jitter em erros de conexão, 429 e
+  5xx, respeitando Retry-After (limitado a retry_after_max); timeout de
+  leitura em POST não é repetido, para não duplicar envios
+- Disjuntor: após falhas consecutivas o Graph é considerado fora e as chamadas
+  falham na hora (CircuitoAberto), liberando o fallback SMTP sem esperar timeouts
+- Envio em massa via JSON $batch (20 mensagens por chamada), com lotes em
+  paralelo sob um limite de requisições por segundo
+- Anexos grandes: rascunho + upload session, enviando o arquivo do disco em
+  fatias (nunca o arquivo inteiro em base64 dentro do JSON)
+"""
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+from performance.lazy import modulo_preguicoso
+from performance.metrics import registro
+
+logger = logging.getLogger(__name__)
+
+requests = modulo_preguicoso('requests')
+
+STATUS_RETENTAVEIS = {429, 500, 502, 503, 504}
+
+# Limite do Graph para requisições dentro de um $batch
+TAMANHO_MAXIMO_LOTE = 20
+
+# Fatias do upload session: múltiplos de 320 KiB, no máximo 4 MiB (exigência do Graph)
+TAMANHO_FATIA_UPLOAD = 320 * 1024 * 4
+
+
+class ErroGraph(RuntimeError):
+    def __init__(self, mensagem, status=None, resposta=None, ambiguo=False):
+        super().__init__(mensagem)
+        self.status = status
+        self.resposta = resposta
+        # A requisição pode ter sido processada (timeout de leitura, resposta truncada)
+        self.ambiguo = ambiguo
+
+
+class CircuitoAberto(ErroGraph):
+    """O disjuntor está aberto: o Graph não será chamado até o fim da pausa"""
+
+
+class Disjuntor:
+    """Disjuntor simples: fechado -> aberto (após N falhas) -> meio-aberto (uma tentativa)"""
+
+    def __init__(self, limite_falhas=5, tempo_aberto=60, nome='graph'):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.nome = nome
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._teste_em_andamento = False
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self):
+        if self._falhas < self.limite_falhas:
+            return 'fechado'
+        return 'aberto' if time.monotonic() < self._aberto_ate else 'meio_aberto'
+
+    def permitir(self):
+        with self._lock:
+            estado = self.estado
+            if estado == 'fechado':
+                return True
+            if estado == 'meio_aberto' and not self._teste_em_andamento:
+                # Uma única chamada de teste decide se o circuito fecha
+                self._teste_em_andamento = True
+                return True
+            return False
+
+    def sucesso(self):
+        with self._lock:
+            if self._falhas >= self.limite_falhas:
+                logger.info(f"✅ Circuito {self.nome} fechado")
+            self._falhas = 0
+            self._teste_em_andamento = False
+        self._publicar()
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            self._teste_em_andamento = False
+            if self._falhas >= self.limite_falhas:
+                self._aberto_ate = time.monotonic() + self.tempo_aberto
+                logger.warning(f"⚡ Circuito {self.nome} aberto por {self.tempo_aberto}s após {self._falhas} falhas")
+        self._publicar()
+
+    def _publicar(self):
+        registro.definir('circuit_breaker_open', 1 if self.estado == 'aberto' else 0,
+                         'Disjuntor aberto (1) ou fechado (0)', circuito=self.nome)
+
+
+def interpretar_retry_after(valor):
+    """Segundos indicados pelo cabeçalho Retry-After (número ou data HTTP)"""
+    if not valor:
+        return None
+    try:
+        return max(float(valor), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(valor).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class LimitadorTaxa:
+    """Balde de fichas: no máximo `taxa` chamadas por segundo, com rajada de `rajada`"""
+
+    def __init__(self, taxa, rajada=None):
+        self.taxa = float(taxa)
+        self.rajada = float(rajada or max(taxa, 1))
+        self._fichas = self.rajada
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.rajada, self._fichas + (agora - self._atualizado) * self.taxa)
+                self._atualizado = agora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.taxa
+            time.sleep(espera)
+
+
+class ClienteGraph:
+    def __init__(self, base_url, provedor_token, timeout_conexao=5, timeout_leitura=30,
+                 max_tentativas=3, backoff_base=0.5, backoff_max=8, retry_after_max=30,
+                 tamanho_pool=10, disjuntor=None):
+        self.base_url = base_url.rstrip('/')
+        self.provedor_token = provedor_token
+        self.timeout = (timeout_conexao, timeout_leitura)
+        self.max_tentativas = max_tentativas
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+        self.tamanho_pool = tamanho_pool
+        self.disjuntor = disjuntor or Disjuntor()
+        self._sessao = None
+        self._lock = threading.Lock()
+
+    @property
+    def sessao(self):
+        if self._sessao is None:
+            with self._lock:
+                if self._sessao is None:
+                    sessao = requests.Session()
+                    adaptador = requests.adapters.HTTPAdapter(
+                        pool_connections=2, pool_maxsize=self.tamanho_pool, max_retries=0
+                    )
+                    sessao.mount('https://', adaptador)
+                    sessao.mount('http://', adaptador)
+                    self._sessao = sessao
+        return self._sessao
+
+    def _espera(self, tentativa, retry_after=None):
+        if retry_after is not None:
+            return retry_after
+        return min(self.backoff_base * (2 ** (tentativa - 1)), self.backoff_max) * random.uniform(0.5, 1.5)
+
+    def requisitar(self, metodo, caminho, **kwargs):
+        """Chamada autenticada com retentativas; devolve a resposta com status 2xx"""
+        if not self.disjuntor.permitir():
+            registro.incrementar('graph_requests_total', 1, 'Chamadas ao Microsoft Graph', status='circuito_aberto')
+            raise CircuitoAberto("Circuito do Graph aberto")
+
+        url = caminho if caminho.startswith('http') else f"{self.base_url}/{caminho.lstrip('/')}"
+        try:
+            resposta = self._tentar(metodo, url, kwargs.pop('headers', None) or {}, kwargs)
+        except ErroGraph as e:
+            if e.status is not None and e.status not in STATUS_RETENTAVEIS:
+                # Erro da requisição (4xx): o Graph respondeu, então não conta como indisponibilidade
+                self.disjuntor.sucesso()
+            else:
+                self.disjuntor.falha()
+            raise
+        except BaseException:
+            # Qualquer outra saída (inclusive erro do provedor de token) também libera a
+            # chamada de teste do meio-aberto; senão o circuito nunca mais fecharia
+            self.disjuntor.falha()
+            raise
+        self.disjuntor.sucesso()
+        return resposta
+
+    def _tentar(self, metodo, url, cabecalhos_extra, kwargs):
+        token_renovado = False
+        tentativa = 0
+        while True:
+            tentativa += 1
+            token = self.provedor_token.obter_token()
+            if not token:
+                raise ErroGraph("Token do Graph indisponível")
+
+            cabecalhos = dict(cabecalhos_extra, Authorization=f"Bearer {token}")
+            retry_after = None
+            try:
+                resposta = self.sessao.request(metodo, url, headers=cabecalhos, timeout=self.timeout, **kwargs)
+            except requests.ConnectionError as e:
+                # Inclui timeout de conexão: a requisição não chegou ao Graph
+                registro.incrementar('graph_requests_total', 1, 'Chamadas ao Microsoft Graph', status='erro_rede')
+                ultimo_erro = ErroGraph(f"Erro de rede no Graph: {str(e)}")
+            except requests.Timeout as e:
+                registro.incrementar('graph_requests_total', 1, 'Chamadas ao Microsoft Graph', status='timeout')
+                ultimo_erro = ErroGraph(f"Timeout de leitura no Graph: {str(e)}", ambiguo=True)
+                if metodo.upper() != 'GET':
+                    # O Graph pode ter processado o envio: repetir aqui arriscaria duplicar o e-mail
+                    raise ultimo_erro
+            except requests.RequestException as e:
+                # Falha ao ler a resposta (ChunkedEncodingError, ContentDecodingError...): a requisição chegou
+                registro.incrementar('graph_requests_total', 1, 'Chamadas ao Microsoft Graph', status='erro_resposta')
+                ultimo_erro = ErroGraph(f"Resposta inválida do Graph: {str(e)}", ambiguo=True)
+                if metodo.upper() != 'GET':
+                    raise ultimo_erro
+            else:
+                registro.incrementar('graph_requests_total', 1, 'Chamadas ao Microsoft Graph', status=resposta.status_code)
+                if resposta.status_code < 300:
+                    return resposta
+
+                if resposta.status_code == 401 and not token_renovado:
+                    # Token revogado ou expirado antes do previsto: renova uma vez, sem gastar tentativa
+                    self.provedor_token.invalidar()
+                    token_renovado = True
+                    tentativa -= 1
+                    continue
+
+                ultimo_erro = ErroGraph(
+                    f"Graph respondeu {resposta.status_code}: {resposta.text[:500]}",
+                    status=resposta.status_code, resposta=resposta
+                )
+                if resposta.status_code not in STATUS_RETENTAVEIS:
+                    raise ultimo_erro
+                retry_after = interpretar_retry_after(resposta.headers.get('Retry-After'))
+                if retry_after is not None and retry_after > self.retry_after_max:
+                    # Espera longa demais para uma thread de envio: devolve para a outbox
+                    raise ultimo_erro
+
+            if tentativa >= self.max_tentativas:
+                raise ultimo_erro
+            espera = self._espera(tentativa, retry_after)
+            logger.warning(f"⏳ {ultimo_erro} (tentativa {tentativa}/{self.max_tentativas}), nova tentativa em {espera:.1f}s")
+            time.sleep(espera)
+
+    def enviar_email(self, usuario_id, mensagem):
+        """POST /users/{id}/sendMail (o Graph responde 202)"""
+        return self.requisitar('POST', f"users/{usuario_id}/sendMail", json=mensagem)
+
+    def enviar_email_com_anexos(self, usuario_id, mensagem, anexos, limite_inline=None):
+        """
+        sendMail com anexos (AnexoEmail). Até limite_inline (soma dos tamanhos)
+        os anexos vão no próprio JSON; acima disso a mensagem é criada como
+        rascunho e os anexos grandes sobem por upload session.
+        """
+        from setores.ti.anexos_email import LIMITE_INLINE_GRAPH
+        limite_inline = limite_inline or LIMITE_INLINE_GRAPH
+
+        if sum(a.tamanho for a in anexos) <= limite_inline:
+            corpo = dict(mensagem, message=dict(mensagem['message'], attachments=[a.como_graph() for a in anexos]))
+            return self.enviar_email(usuario_id, corpo)
+
+        rascunho = self.requisitar('POST', f"users/{usuario_id}/messages", json=mensagem['message']).json()
+        caminho_mensagem = f"users/{usuario_id}/messages/{rascunho['id']}"
+        try:
+            for anexo in anexos:
+                if anexo.tamanho <= limite_inline:
+                    self.requisitar('POST', f"{caminho_mensagem}/attachments", json=anexo.como_graph())
+                else:
+                    self._enviar_por_upload_session(caminho_mensagem, anexo)
+            return self.requisitar('POST', f"{caminho_mensagem}/send")
+        except Exception:
+            # Não deixa rascunhos órfãos na caixa do remetente
+            try:
+                self.requisitar('DELETE', caminho_mensagem)
+            except Exception:
+                pass
+            raise
+
+    def _enviar_por_upload_session(self, caminho_mensagem, anexo):
+        sessao_upload = self.requisitar('POST', f"{caminho_mensagem}/attachments/createUploadSession", json={
+            'AttachmentItem': {
+                'attachmentType': 'file',
+                'name': anexo.nome,
+                'size': anexo.tamanho,
+                'contentType': anexo.content_type
+            }
+        }).json()
+        url = sessao_upload['uploadUrl']
+
+        inicio = 0
+        for fatia in anexo.blocos(TAMANHO_FATIA_UPLOAD):
+            fim = inicio + len(fatia) - 1
+            cabecalhos = {
+                'Content-Length': str(len(fatia)),
+                'Content-Range': f"bytes {inicio}-{fim}/{anexo.tamanho}"
+            }
+            for tentativa in range(1, self.max_tentativas + 1):
+                try:
+                    # A URL do upload já é autorizada: não leva o token
+                    resposta = self.sessao.put(url, data=fatia, headers=cabecalhos, timeout=self.timeout)
+                except requests.RequestException as e:
+                    erro = ErroGraph(f"Erro no upload de '{anexo.nome}': {str(e)}")
+                else:
+                    if resposta.status_code < 300:
+                        break
+                    erro = ErroGraph(f"Upload de '{anexo.nome}' respondeu {resposta.status_code}: {resposta.text[:500]}",
+                                     status=resposta.status_code, resposta=resposta)
+                    if resposta.status_code not in STATUS_RETENTAVEIS:
+                        raise erro
+                if tentativa == self.max_tentativas:
+                    raise erro
+                time.sleep(self._espera(tentativa))
+            inicio = fim + 1
+        registro.incrementar('graph_upload_bytes_total', anexo.tamanho, 'Bytes enviados por upload session do Graph')
+
+    def enviar_lote(self, usuario_id, mensagens):
+        """
+        Envia até 20 mensagens em um único POST /$batch.
+        mensagens: lista de (id, mensagem no formato do sendMail).
+        Devolve {id: (status, retry_after, erro)} com o resultado de cada item.
+        """
+        if len(mensagens) > TAMANHO_MAXIMO_LOTE:
+            raise ValueError(f"Um $batch aceita no máximo {TAMANHO_MAXIMO_LOTE} requisições")
+
+        corpo = {'requests': [{
+            'id': str(item_id),
+            'method': 'POST',
+            'url': f"/users/{usuario_id}/sendMail",
+            'headers': {'Content-Type': 'application/json'},
+            'body': mensagem
+        } for item_id, mensagem in mensagens]}
+        resposta = self.requisitar('POST', '$batch', json=corpo)
+
+        resultados = {}
+        for item in resposta.json().get('responses', []):
+            status = int(item.get('status', 0))
+            erro = None
+            if status >= 300:
+                erro = ((item.get('body') or {}).get('error') or {}).get('message') or f"Graph respondeu {status}"
+            retry_after = interpretar_retry_after((item.get('headers') or {}).get('Retry-After'))
+            resultados[item.get('id')] = (status, retry_after, erro)
+            registro.incrementar('graph_batch_items_total', 1, 'Itens enviados via $batch do Graph', status=status)
+        return resultados
+
+    def enviar_emails_em_massa(self, usuario_id, mensagens, concorrencia=4, limitador=None, max_rodadas=3):
+        """
+        Envia muitas mensagens em lotes de 20, com até `concorrencia` lotes em
+        paralelo e o ritmo controlado por `limitador` (LimitadorTaxa).
+        Itens recusados com 429/5xx voltam para a rodada seguinte.
+        mensagens: lista de (id, mensagem). Devolve {id: erro ou None}; quando
+        o lote inteiro falha, o erro é o próprio ErroGraph (ver .ambiguo).
+        """
+        pendentes = list(mensagens)
+        resultados = {}
+
+        def enviar(lote):
+            if limitador:
+                limitador.aguardar()
+            try:
+                return lote, self.enviar_lote(usuario_id, lote), None
+            except ErroGraph as e:
+                return lote, None, e
+
+        with ThreadPoolExecutor(max_workers=max(concorrencia, 1), thread_name_prefix='graph-lote') as pool:
+            for rodada in range(1, max_rodadas + 1):
+                lotes = [pendentes[i:i + TAMANHO_MAXIMO_LOTE] for i in range(0, len(pendentes), TAMANHO_MAXIMO_LOTE)]
+                pendentes, espera = [], 0.0
+                for lote, respostas, erro_lote in pool.map(enviar, lotes):
+                    if erro_lote is not None:
+                        # O lote inteiro falhou (rede, circuito aberto...): não adianta repetir aqui
+                        for item_id, _ in lote:
+                            resultados[str(item_id)] = erro_lote
+                        continue
+                    for item_id, mensagem in lote:
+                        status, retry_after, erro = respostas.get(str(item_id), (0, None, 'Sem resposta no $batch'))
+                        if status in STATUS_RETENTAVEIS and rodada < max_rodadas:
+                            pendentes.append((item_id, mensagem))
+                            espera = max(espera, retry_after if retry_after is not None else self._espera(rodada))
+                        else:
+                            resultados[str(item_id)] = erro
+                if not pendentes:
+                    break
+                espera = min(espera, self.retry_after_max)
+                logger.warning(f"⏳ {len(pendentes)} mensagem(ns) limitada(s) pelo Graph, nova rodada em {espera:.1f}s")
+                time.sleep(espera)
+
+        return resultados
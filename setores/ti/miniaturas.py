@@ -0,0 +1,216 @@
+"""
+Miniaturas de anexos (imagens e primeira página de PDFs)
+
+- Geradas em segundo plano logo após o upload ou no primeiro pedido, e
+  gravadas ao lado do blob como <hash>.mini-<largura>.jpg: o mesmo conteúdo
+  em vários chamados compartilha as miniaturas
+- Pillow é opcional (sem ele a rota devolve o preview original); PDFs usam o
+  pdftoppm (poppler-utils) quando instalado
+- O conjunto de miniaturas é um cache em disco: cada acesso renova o mtime e,
+  acima de ANEXOS_MINIATURAS_MAX_MB, as menos usadas são apagadas (LRU)
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from performance.lazy import modulo_preguicoso
+from performance.metrics import registro
+from setores.ti.blob_store import caminho_derivado, pasta_temporarios, raiz_blobs
+
+Image = modulo_preguicoso('PIL.Image', opcional=True)
+ImageOps = modulo_preguicoso('PIL.ImageOps', opcional=True)
+
+logger = logging.getLogger(__name__)
+
+# Lado maior, em pixels
+LARGURAS = {'p': 160, 'm': 480, 'g': 1024}
+TAMANHO_PADRAO = 'm'
+PREFIXO_SUFIXO = 'mini-'
+QUALIDADE_JPEG = 82
+
+
+def caminho_miniatura(hash_arquivo, largura):
+    return caminho_derivado(hash_arquivo, f"{PREFIXO_SUFIXO}{largura}.jpg")
+
+
+def suporta(tipo_mime):
+    tipo_mime = (tipo_mime or '').lower()
+    if tipo_mime.startswith('image/'):
+        return Image.disponivel
+    if tipo_mime == 'application/pdf':
+        return shutil.which('pdftoppm') is not None
+    return False
+
+
+def _gerar_de_imagem(origem, destino, largura):
+    with Image.open(origem) as imagem:
+        # Em JPEG o decodificador já entrega a imagem reduzida (bem mais rápido)
+        imagem.draft('RGB', (largura, largura))
+        imagem = ImageOps.exif_transpose(imagem)
+        imagem.thumbnail((largura, largura))
+        if imagem.mode in ('RGBA', 'LA', 'P'):
+            imagem = imagem.convert('RGBA')
+            fundo = Image.new('RGB', imagem.size, (255, 255, 255))
+            fundo.paste(imagem, mask=imagem.getchannel('A'))
+            imagem = fundo
+        elif imagem.mode != 'RGB':
+            imagem = imagem.convert('RGB')
+        imagem.save(destino, 'JPEG', quality=QUALIDADE_JPEG, optimize=True)
+
+
+def _gerar_de_pdf(origem, destino, largura):
+    # pdftoppm acrescenta a extensão ao prefixo informado
+    prefixo = destino[:-len('.jpg')]
+    subprocess.run(
+        ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-scale-to', str(largura), '-jpeg', origem, prefixo],
+        check=True, timeout=30, capture_output=True
+    )
+
+
+class GeradorMiniaturas:
+    def __init__(self, app=None):
+        self.app = app
+        self._pool = None
+        self._lock = threading.Lock()
+        self._em_andamento = {}
+        self._bytes_cache = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        # Configurações padrão
+        app.config.setdefault('ANEXOS_MINIATURAS_NO_UPLOAD', not app.testing)
+        app.config.setdefault('ANEXOS_MINIATURAS_MAX_MB', 512)
+        app.config.setdefault('ANEXOS_MINIATURAS_MAX_AGE', 30 * 24 * 3600)
+
+        app.extensions['miniaturas'] = self
+        logger.info("GeradorMiniaturas inicializado")
+
+    # ==================== GERAÇÃO ====================
+
+    def obter(self, hash_arquivo, caminho_origem, tipo_mime, largura):
+        """Caminho da miniatura (gerada agora se preciso) ou None se não houver como gerar"""
+        destino = caminho_miniatura(hash_arquivo, largura)
+        try:
+            # Renova o mtime: é por ele que o cache decide o que apagar
+            os.utime(destino)
+            registro.incrementar('anexos_miniaturas_total', 1, 'Miniaturas de anexos', resultado='cache')
+            return destino
+        except FileNotFoundError:
+            pass
+        if not suporta(tipo_mime):
+            return None
+
+        # Pedidos simultâneos da mesma miniatura esperam uma única geração
+        with self._lock:
+            evento = self._em_andamento.get(destino)
+            gerar = evento is None
+            if gerar:
+                evento = self._em_andamento[destino] = threading.Event()
+        if not gerar:
+            evento.wait(60)
+            return destino if os.path.exists(destino) else None
+
+        try:
+            return self._gerar(caminho_origem, tipo_mime, destino, largura)
+        finally:
+            with self._lock:
+                self._em_andamento.pop(destino, None)
+            evento.set()
+
+    def _gerar(self, origem, tipo_mime, destino, largura):
+        pasta_tmp = pasta_temporarios()
+        os.makedirs(pasta_tmp, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=pasta_tmp, prefix='mini-', suffix='.jpg')
+        os.close(fd)
+        try:
+            if tipo_mime.lower() == 'application/pdf':
+                _gerar_de_pdf(origem, temporario, largura)
+            else:
+                _gerar_de_imagem(origem, temporario, largura)
+            tamanho = os.path.getsize(temporario)
+            os.replace(temporario, destino)
+        except Exception as e:
+            logger.warning(f"Falha ao gerar miniatura de {origem}: {str(e)}")
+            registro.incrementar('anexos_miniaturas_total', 1, 'Miniaturas de anexos', resultado='erro')
+            return None
+        finally:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+        registro.incrementar('anexos_miniaturas_total', 1, 'Miniaturas de anexos', resultado='gerada')
+        self._registrar_bytes(tamanho)
+        return destino
+
+    def agendar(self, anexo, tamanho=TAMANHO_PADRAO):
+        """Gera a miniatura padrão em segundo plano (chamado após o upload)"""
+        if not self.app.config['ANEXOS_MINIATURAS_NO_UPLOAD'] or not suporta(anexo.tipo_mime):
+            return
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='miniaturas')
+        self._pool.submit(self.obter, anexo.hash_arquivo, anexo.caminho_arquivo, anexo.tipo_mime, LARGURAS[tamanho])
+
+    def parar(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=True)
+
+    # ==================== CACHE (LRU) ====================
+
+    def _listar(self):
+        marcador = f".{PREFIXO_SUFIXO}"
+        for pasta, _, arquivos in os.walk(raiz_blobs()):
+            for nome in arquivos:
+                if marcador in nome:
+                    caminho = os.path.join(pasta, nome)
+                    try:
+                        info = os.stat(caminho)
+                    except FileNotFoundError:
+                        continue
+                    yield caminho, info.st_size, info.st_mtime
+
+    def _registrar_bytes(self, tamanho):
+        with self._lock:
+            if self._bytes_cache is not None:
+                self._bytes_cache += tamanho
+                excedeu = self._bytes_cache > self.app.config['ANEXOS_MINIATURAS_MAX_MB'] * 1024 * 1024
+            else:
+                excedeu = True  # Primeira geração do processo: mede o cache
+        if excedeu:
+            self.despejar()
+
+    def despejar(self):
+        """Apaga as miniaturas menos usadas até o cache ficar em 90% do limite"""
+        limite = self.app.config['ANEXOS_MINIATURAS_MAX_MB'] * 1024 * 1024
+        itens = sorted(self._listar(), key=lambda item: item[2])
+        total = sum(tamanho for _, tamanho, _ in itens)
+        removidas = 0
+        if total > limite:
+            alvo = limite * 0.9
+            for caminho, tamanho, _ in itens:
+                if total <= alvo:
+                    break
+                try:
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    pass
+                total -= tamanho
+                removidas += 1
+            registro.incrementar('anexos_miniaturas_removidas_total', removidas, 'Miniaturas apagadas pelo LRU')
+            logger.info(f"🧹 {removidas} miniatura(s) removida(s) do cache")
+        with self._lock:
+            self._bytes_cache = total
+        return removidas
+
+
+# Instância global, ligada à aplicação em create_app()
+miniaturas = GeradorMiniaturas()
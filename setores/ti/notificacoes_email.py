@@ -0,0 +1,297 @@
+"""
+Agrupamento de notificações por e-mail
+
+- notificar_email() grava a notificação em vez de enviar na hora
+- Notificações do mesmo destinatário e chamado dentro da janela
+  (NOTIFICACOES_JANELA) viram um único e-mail
+- Destinatários em NOTIFICACOES_RESUMO_DESTINATARIOS recebem um resumo por
+  hora com tudo o que aconteceu no período
+- Limite por destinatário (NOTIFICACOES_MAX_POR_HORA): acima dele, as
+  notificações são adiadas para o próximo resumo em vez de descartadas
+- A entrega é feita pela outbox (retentativas e idempotência)
+- O padrão é o modo 'imediato'; envios pedidos explicitamente pelo usuário
+  (ticket, aviso de status) vão direto para a outbox em qualquer modo
+"""
+import hashlib
+import html
+import logging
+import re
+import threading
+from datetime import timedelta
+from itertools import groupby
+
+import click
+from flask import current_app
+from sqlalchemy import func
+
+from database import db, NotificacaoEmail, get_brazil_time
+from performance.metrics import registro
+
+logger = logging.getLogger(__name__)
+
+SEPARADOR = '\n' + '─' * 48 + '\n'
+SEPARADOR_HTML = '<hr style="border:none;border-top:1px solid #ddd;margin:24px 0">'
+
+CORPO_HTML = re.compile(r'<body[^>]*>(.*)</body>', re.IGNORECASE | re.DOTALL)
+
+
+def _agora():
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def _metrica(resultado, quantidade=1):
+    registro.incrementar('notificacoes_email_total', quantidade, 'Notificações por e-mail', resultado=resultado)
+
+
+def _proximo_resumo(agora, intervalo):
+    """Próximo horário cheio do ciclo de resumo (ex.: início da próxima hora)"""
+    inicio_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    decorrido = int((agora - inicio_dia).total_seconds())
+    return inicio_dia + timedelta(seconds=(decorrido // intervalo + 1) * intervalo)
+
+
+def _descricao_referencia(referencia):
+    if referencia and ':' in referencia:
+        tipo, valor = referencia.split(':', 1)
+        return f"{tipo.title()} {valor}"
+    return referencia or ''
+
+
+def notificar_email(destinatarios, assunto, corpo, referencia=None, corpo_html=None):
+    """
+    Registra uma notificação para cada destinatário. No modo 'imediato' envia
+    direto pela outbox. Não faz commit: a notificação é confirmada junto com
+    a transação de quem chamou. Retorna True se a notificação foi aceita.
+    """
+    config = current_app.config
+    if config.get('NOTIFICACOES_MODO', 'imediato') == 'imediato':
+        from setores.ti.routes import enviar_email
+        return enviar_email(assunto, corpo, destinatarios, referencia=referencia, corpo_html=corpo_html)
+
+    agora = _agora()
+    resumo = {e.strip().lower() for e in (config.get('NOTIFICACOES_RESUMO_DESTINATARIOS') or '').split(',') if e.strip()}
+    try:
+        # Em caso de erro só o savepoint é desfeito; a transação de quem chamou continua
+        with db.session.begin_nested():
+            for destinatario in dict.fromkeys(d for d in destinatarios if d):
+                if destinatario.lower() in resumo:
+                    modo = 'resumo'
+                    enviar_apos = _proximo_resumo(agora, config['NOTIFICACOES_INTERVALO_RESUMO'])
+                else:
+                    modo = 'agrupado'
+                    # Entra na janela já aberta para o mesmo destinatário e chamado
+                    enviar_apos = db.session.query(func.min(NotificacaoEmail.enviar_apos)).filter(
+                        NotificacaoEmail.destinatario == destinatario,
+                        NotificacaoEmail.referencia == referencia,
+                        NotificacaoEmail.modo == 'agrupado',
+                        NotificacaoEmail.status == 'pendente'
+                    ).scalar() or agora + timedelta(seconds=config['NOTIFICACOES_JANELA'])
+
+                db.session.add(NotificacaoEmail(
+                    destinatario=destinatario,
+                    referencia=referencia,
+                    assunto=assunto[:500],
+                    corpo=corpo,
+                    corpo_html=corpo_html,
+                    modo=modo,
+                    enviar_apos=enviar_apos
+                ))
+                _metrica('registrada')
+    except Exception as e:
+        logger.error(f"Erro ao registrar notificação: {str(e)}")
+        return False
+    return True
+
+
+def _html_da_notificacao(notificacao):
+    """Conteúdo HTML de uma notificação: o do template (sem <html>/<body>) ou o texto escapado"""
+    if notificacao.corpo_html:
+        encontrado = CORPO_HTML.search(notificacao.corpo_html)
+        return encontrado.group(1) if encontrado else notificacao.corpo_html
+    return f'<div style="white-space:pre-wrap">{html.escape(notificacao.corpo.strip())}</div>'
+
+
+def montar_mensagem(notificacoes, modo):
+    """
+    Assunto, corpo em texto e corpo HTML (None se nenhuma notificação tiver
+    template) do e-mail que junta as notificações (em ordem de criação)
+    """
+    if len(notificacoes) == 1:
+        return notificacoes[0].assunto, notificacoes[0].corpo, notificacoes[0].corpo_html
+
+    if modo == 'resumo':
+        assunto = f"Resumo de notificações ({len(notificacoes)})"
+        introducao = f"Você tem {len(notificacoes)} notificações do período:\n"
+    else:
+        assunto = f"[{len(notificacoes)} atualizações] {notificacoes[-1].assunto}"
+        introducao = f"{_descricao_referencia(notificacoes[0].referencia)}: {len(notificacoes)} atualizações\n"
+
+    partes = [introducao]
+    partes_html = [f'<p><strong>{html.escape(introducao.strip())}</strong></p>']
+    for notificacao in notificacoes:
+        cabecalho = notificacao.data_criacao.strftime('%d/%m %H:%M') if notificacao.data_criacao else ''
+        if modo == 'resumo' and notificacao.referencia:
+            cabecalho += f" · {_descricao_referencia(notificacao.referencia)}"
+        partes.append(f"{cabecalho} · {notificacao.assunto}\n\n{notificacao.corpo.strip()}\n")
+        partes_html.append(f'<p style="color:#666">{html.escape(f"{cabecalho} · {notificacao.assunto}")}</p>'
+                           f'{_html_da_notificacao(notificacao)}')
+
+    corpo_html = None
+    if any(n.corpo_html for n in notificacoes):
+        corpo_html = f'<html><body>{SEPARADOR_HTML.join(partes_html)}</body></html>'
+    return assunto[:500], SEPARADOR.join(partes), corpo_html
+
+
+class AgregadorNotificacoes:
+    def __init__(self, app=None):
+        self.app = app
+        self._evento = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+
+        # Configurações padrão
+        app.config.setdefault('NOTIFICACOES_MODO', 'imediato')  # imediato, agrupado
+        app.config.setdefault('NOTIFICACOES_AUTOSTART', not app.testing)
+        app.config.setdefault('NOTIFICACOES_JANELA', 120)
+        app.config.setdefault('NOTIFICACOES_RESUMO_DESTINATARIOS', '')
+        app.config.setdefault('NOTIFICACOES_INTERVALO_RESUMO', 3600)
+        app.config.setdefault('NOTIFICACOES_MAX_POR_HORA', 10)
+        app.config.setdefault('NOTIFICACOES_VERIFICACAO', 15)
+
+        app.extensions['notificacoes_email'] = self
+        app.cli.add_command(descarregar_notificacoes_command)
+
+        if app.config['NOTIFICACOES_MODO'] != 'imediato' and app.config['NOTIFICACOES_AUTOSTART']:
+            app.before_request(self._garantir_iniciado)
+
+        logger.info("AgregadorNotificacoes inicializado")
+
+    def _garantir_iniciado(self):
+        if self._thread is None:
+            self.iniciar()
+
+    def iniciar(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name='notificacoes-email', daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread:
+            self._parar.set()
+            self._evento.set()
+            thread.join(timeout=10)
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                with self.app.app_context():
+                    self.descarregar()
+            except Exception as e:
+                logger.error(f"Erro ao descarregar notificações: {str(e)}")
+            # Notificações novas só vencem depois da janela: basta verificar periodicamente
+            self._evento.wait(self.app.config['NOTIFICACOES_VERIFICACAO'])
+            self._evento.clear()
+
+    # ==================== AGRUPAMENTO ====================
+
+    def _enviados_na_ultima_hora(self, destinatario, agora):
+        return db.session.query(func.count(func.distinct(NotificacaoEmail.lote))).filter(
+            NotificacaoEmail.destinatario == destinatario,
+            NotificacaoEmail.status == 'enviada',
+            NotificacaoEmail.data_envio >= agora - timedelta(hours=1)
+        ).scalar() or 0
+
+    def _aplicar_limite(self, destinatario, grupos, agora):
+        """
+        Respeita NOTIFICACOES_MAX_POR_HORA: com vagas, o excedente vai junto
+        em um único resumo; sem vagas, tudo fica para o próximo resumo.
+        """
+        limite = self.app.config['NOTIFICACOES_MAX_POR_HORA']
+        disponiveis = max(limite - self._enviados_na_ultima_hora(destinatario, agora), 0)
+        if len(grupos) <= disponiveis:
+            return grupos
+
+        ordenados = sorted(grupos.items(), key=lambda g: (g[1][0].data_criacao or agora, g[1][0].id))
+        if not disponiveis:
+            proximo = _proximo_resumo(agora, self.app.config['NOTIFICACOES_INTERVALO_RESUMO'])
+            for _, notificacoes in ordenados:
+                for notificacao in notificacoes:
+                    notificacao.modo = 'resumo'
+                    notificacao.enviar_apos = proximo
+            quantidade = sum(len(n) for _, n in ordenados)
+            _metrica('adiada', quantidade)
+            logger.info(f"🚦 Limite de {limite} e-mails/h atingido para {destinatario}: "
+                        f"{quantidade} notificação(ões) adiada(s) para o próximo resumo")
+            return {}
+
+        mantidos = dict(ordenados[:disponiveis - 1])
+        excedentes = [n for _, notificacoes in ordenados[disponiveis - 1:] for n in notificacoes]
+        resumo = mantidos.setdefault(('resumo', None), [])
+        resumo.extend(excedentes)
+        resumo.sort(key=lambda n: (n.data_criacao or agora, n.id))
+        _metrica('resumida', len(excedentes))
+        return mantidos
+
+    def descarregar(self, todas=False):
+        """Junta e enfileira as notificações vencidas (ou todas); devolve quantos e-mails gerou"""
+        from setores.ti.routes import enviar_email
+
+        agora = _agora()
+        consulta = NotificacaoEmail.query.filter(NotificacaoEmail.status == 'pendente')
+        if not todas:
+            consulta = consulta.filter(NotificacaoEmail.enviar_apos <= agora)
+        vencidas = consulta.order_by(
+            NotificacaoEmail.destinatario, NotificacaoEmail.data_criacao, NotificacaoEmail.id
+        ).all()
+
+        emails = 0
+        for destinatario, itens in groupby(vencidas, key=lambda n: n.destinatario):
+            grupos = {}
+            for notificacao in itens:
+                chave = ('resumo', None) if notificacao.modo == 'resumo' else ('agrupado', notificacao.referencia)
+                grupos.setdefault(chave, []).append(notificacao)
+
+            for (modo, referencia), notificacoes in self._aplicar_limite(destinatario, grupos, agora).items():
+                assunto, corpo, corpo_html = montar_mensagem(notificacoes, modo)
+                lote = hashlib.sha256(
+                    ('notificacoes:' + ','.join(str(n.id) for n in notificacoes)).encode('utf-8')
+                ).hexdigest()
+                # A chave de idempotência da outbox é o próprio lote: reprocessar não duplica
+                if not enviar_email(assunto, corpo, [destinatario], chave_idempotencia=lote, referencia=referencia,
+                                    corpo_html=corpo_html):
+                    continue
+                for notificacao in notificacoes:
+                    notificacao.status = 'enviada'
+                    notificacao.data_envio = agora
+                    notificacao.lote = lote
+                emails += 1
+                _metrica('agrupada', len(notificacoes))
+            db.session.commit()
+
+        if emails:
+            logger.info(f"📬 {len(vencidas)} notificação(ões) agrupada(s) em {emails} e-mail(s)")
+        return emails
+
+
+@click.command('notificacoes-descarregar')
+@click.option('--todas', is_flag=True, help='Envia também as que ainda estão dentro da janela')
+def descarregar_notificacoes_command(todas):
+    """Agrupa e enfileira as notificações pendentes"""
+    agregador = current_app.extensions['notificacoes_email']
+    click.echo(f"📬 {agregador.descarregar(todas=todas)} e-mail(s) gerado(s)")
+
+
+# Instância global, ligada à aplicação em create_app()
+notificacoes_email = AgregadorNotificacoes()
@@ -9,6 +9,7 @@ from flask_login import LoginManager, login_required, current_user, logout_user
 from auth.auth_helpers import setor_required
 import os
 from setores.ti.routes import enviar_email
+from setores.ti.notificacoes_email import notificar_email
 from setores.ti.rotas import get_client_info
 from datetime import datetime, timedelta
 from flask import current_app
@@ -17,6 +18,9 @@ import json
 import pytz
 import traceback
 from database import LogAcesso, LogAcao, SessaoAtiva, registrar_log_acao
+from performance.conditional import conditional_response
+from setores.ti.utils.serializacao import json_response, error_response, CHAMADO, USUARIO
+from setores.ti.salas_socketio import SALA_AGENTES, agente_do_chamado, emitir, salas_do_chamado
 
 # Importar utilitários SLA
 from setores.ti.sla_utils import (
@@ -49,13 +53,6 @@ def api_login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
-def json_response(data, status_code=200):
-    """Retorna resposta JSON padronizada"""
-    response = jsonify(data)
-    response.status_code = status_code
-    response.headers['Content-Type'] = 'application/json'
-    return response
-
 def verificar_ou_criar_agente(usuario):
     """Verifica se o usuário é um agente ou cria um se necessário"""
     agente = AgenteSuporte.query.filter_by(usuario_id=usuario.id, ativo=True).first()
@@ -74,9 +71,6 @@ def verificar_ou_criar_agente(usuario):
             logger.info(f"Agente criado automaticamente para usuário {usuario.id}")
     return agente
 
-def error_response(message, status=400):
-    """Retorna erro JSON padronizado"""
-    return json_response({'error': message}, status)
 
 def gerenciamento_usuarios_required(f):
     """Decorador que permite acesso a administradores e agentes de suporte ativos"""
@@ -935,6 +929,7 @@ Data de Abertura: {chamado.get_data_abertura_brazil().strftime('%d/%m/%Y %H:%M:%
         try:
             from setores.ti.routes import enviar_email
             enviar_email(assunto, corpo_email, [destino])
+            db.session.commit()
 
             # Registrar log da ação
             registrar_log_acao(
@@ -1036,7 +1031,6 @@ def atribuir_chamado_para_mim(chamado_id):
 
         # Enviar e-mail de notificação
         try:
-            from setores.ti.routes import enviar_email
             assunto = f"Chamado {chamado.codigo} - Agente Atribuído"
             corpo = f"""
 Olá {chamado.solicitante},
@@ -1054,25 +1048,25 @@ Em breve você receberá um contato para resolução do seu problema.
 Atenciosamente,
 Equipe de Suporte TI - Evoque Fitness
 """
-            enviar_email(assunto, corpo, [chamado.email])
+            notificar_email([chamado.email], assunto, corpo, referencia=f"chamado:{chamado.codigo}")
+            db.session.commit()
         except Exception as email_error:
             logger.warning(f"Erro ao enviar e-mail de atribuiç��o: {str(email_error)}")
 
         # Emitir evento Socket.IO para notificação em tempo real
         try:
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_atribuido', {
-                    'chamado_id': chamado.id,
-                    'codigo': chamado.codigo,
-                    'protocolo': chamado.protocolo,
-                    'solicitante': chamado.solicitante,
-                    'problema': chamado.problema,
-                    'prioridade': chamado.prioridade,
-                    'agente_id': agente.id,
-                    'agente_nome': f"{current_user.nome} {current_user.sobrenome}",
-                    'agente_email': current_user.email,
-                    'timestamp': get_brazil_time().isoformat()
-                })
+            emitir('chamado_atribuido', {
+                'chamado_id': chamado.id,
+                'codigo': chamado.codigo,
+                'protocolo': chamado.protocolo,
+                'solicitante': chamado.solicitante,
+                'problema': chamado.problema,
+                'prioridade': chamado.prioridade,
+                'agente_id': agente.id,
+                'agente_nome': f"{current_user.nome} {current_user.sobrenome}",
+                'agente_email': current_user.email,
+                'timestamp': get_brazil_time().isoformat()
+            }, salas_do_chamado(chamado, agentes=(agente.id,)) + [SALA_AGENTES])
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -1166,14 +1160,13 @@ def atualizar_chamado_agente(chamado_id):
 
         # Emitir evento Socket.IO
         try:
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_atualizado', {
-                    'chamado_id': chamado.id,
-                    'codigo': chamado.codigo,
-                    'status': chamado.status,
-                    'agente': f"{current_user.nome} {current_user.sobrenome}",
-                    'timestamp': get_brazil_time().isoformat()
-                })
+            emitir('chamado_atualizado', {
+                'chamado_id': chamado.id,
+                'codigo': chamado.codigo,
+                'status': chamado.status,
+                'agente': f"{current_user.nome} {current_user.sobrenome}",
+                'timestamp': get_brazil_time().isoformat()
+            }, salas_do_chamado(chamado, agentes=(agente_do_chamado(chamado.id),)))
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -1261,16 +1254,15 @@ def transferir_chamado_agente(chamado_id):
 
         # Emitir evento Socket.IO
         try:
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_transferido', {
-                    'chamado_id': chamado.id,
-                    'codigo': chamado.codigo,
-                    'agente_origem_nome': f"{current_user.nome} {current_user.sobrenome}",
-                    'agente_origem_email': current_user.email,
-                    'agente_destino_nome': f"{agente_destino.usuario.nome} {agente_destino.usuario.sobrenome}",
-                    'agente_destino_email': agente_destino.usuario.email,
-                    'timestamp': get_brazil_time().isoformat()
-                })
+            emitir('chamado_transferido', {
+                'chamado_id': chamado.id,
+                'codigo': chamado.codigo,
+                'agente_origem_nome': f"{current_user.nome} {current_user.sobrenome}",
+                'agente_origem_email': current_user.email,
+                'agente_destino_nome': f"{agente_destino.usuario.nome} {agente_destino.usuario.sobrenome}",
+                'agente_destino_email': agente_destino.usuario.email,
+                'timestamp': get_brazil_time().isoformat()
+            }, salas_do_chamado(chamado, agentes=(agente_atual.id, agente_destino.id)))
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -1315,16 +1307,13 @@ def enviar_ticket_chamado(chamado_id):
                     ok, msg, anexo_obj = save_uploaded_file(f, chamado_id, current_user.id)
                     if ok and anexo_obj:
                         anexos_salvos.append(anexo_obj)
-                        try:
-                            # Ler bytes do arquivo salvo para anexar ao e-mail
-                            with open(anexo_obj.caminho_arquivo, 'rb') as fh:
-                                anexos_payload.append({
-                                    'nome': anexo_obj.nome_original,
-                                    'content_type': anexo_obj.tipo_mime,
-                                    'dados': fh.read()
-                                })
-                        except Exception:
-                            continue
+                        # O e-mail lê o arquivo salvo em blocos no momento do envio
+                        anexos_payload.append({
+                            'nome': anexo_obj.nome_original,
+                            'content_type': anexo_obj.tipo_mime,
+                            'caminho': anexo_obj.caminho_arquivo,
+                            'tamanho': anexo_obj.tamanho_bytes
+                        })
                     else:
                         return error_response(msg or 'Falha ao salvar anexo', 400)
             prioridade_alta = form.get('prioridade', 'false').lower() == 'true'
@@ -1408,8 +1397,10 @@ Sistema de Gerenciamento de Chamados - Evoque Fitness
 
         # Tentar enviar o e-mail
         try:
-            from setores.ti.routes import enviar_email
-            sucesso_email = enviar_email(assunto_completo, corpo_mensagem, destinatarios, anexos=anexos_payload)
+            # Envio pedido pelo usuário: vai direto para a outbox, sem agrupamento
+            sucesso_email = enviar_email(assunto_completo, corpo_mensagem, destinatarios, anexos=anexos_payload or None,
+                                         referencia=f"chamado:{chamado.codigo}")
+            db.session.commit()
             if not sucesso_email:
                 logger.warning(f"Falha ao enviar e-mail do ticket para chamado {chamado.codigo}")
                 return error_response('Falha ao enviar e-mail. Verifique as configurações de e-mail.')
@@ -1446,16 +1437,15 @@ Sistema de Gerenciamento de Chamados - Evoque Fitness
 
         # Emitir evento Socket.IO para notificação em tempo real
         try:
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('ticket_enviado', {
-                    'chamado_id': chamado.id,
-                    'codigo': chamado.codigo,
-                    'assunto': assunto,
-                    'remetente': f"{current_user.nome} {current_user.sobrenome}",
-                    'destinatarios': destinatarios,
-                    'prioridade': prioridade_texto,
-                    'timestamp': get_brazil_time().isoformat()
-                })
+            emitir('ticket_enviado', {
+                'chamado_id': chamado.id,
+                'codigo': chamado.codigo,
+                'assunto': assunto,
+                'remetente': f"{current_user.nome} {current_user.sobrenome}",
+                'destinatarios': destinatarios,
+                'prioridade': prioridade_texto,
+                'timestamp': get_brazil_time().isoformat()
+            }, salas_do_chamado(chamado, agentes=(agente_do_chamado(chamado.id),)))
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -1479,6 +1469,7 @@ Sistema de Gerenciamento de Chamados - Evoque Fitness
 
 @painel_bp.route('/api/historico/chamados/completo', methods=['GET'])
 @api_login_required
+@conditional_response('chamados')
 def historico_chamados_completo():
     """Retorna histórico completo de chamados com timeline detalhado"""
     try:
@@ -1635,6 +1626,7 @@ def historico_chamados_completo():
             anexos_info = []
             try:
                 from database import ChamadoAnexo
+                from setores.ti.miniaturas import suporta as suporta_miniatura
                 anexos = ChamadoAnexo.query.filter_by(chamado_id=chamado.id, ativo=True).all()
                 for anexo in anexos:
                     anexos_info.append({
@@ -1662,7 +1654,10 @@ def historico_chamados_completo():
                         },
                         'anexo_id': anexo.id,
                         'is_image': (anexo.tipo_mime or '').startswith('image/'),
-                        'preview_url': url_for('ti.preview_anexo', anexo_id=anexo.id)
+                        'preview_url': url_for('ti.preview_anexo', anexo_id=anexo.id),
+                        # Miniatura reduzida para a timeline (imagens e PDFs)
+                        'thumbnail_url': url_for('ti.miniatura_anexo', anexo_id=anexo.id, tamanho='m')
+                        if (anexo.tipo_mime or '').startswith('image/') or suporta_miniatura(anexo.tipo_mime) else None
                     })
             except Exception as e:
                 logger.warning(f"Erro ao buscar anexos para chamado {chamado.id}: {str(e)}")
@@ -2204,6 +2199,7 @@ def auto_atribuir_chamado(chamado_id):
         try:
             from .email_service import email_service
             email_service.notificar_agente_atribuido(chamado, agente)
+            db.session.commit()
         except Exception as e:
             logger.warning(f"Erro ao enviar email: {str(e)}")
 
@@ -2564,6 +2560,7 @@ def remover_unidade(id):
 @painel_bp.route('/api/chamados', methods=['GET'])
 @login_required
 @setor_required('TI')
+@conditional_response('chamados')
 def listar_chamados():
     try:
         logger.debug("Iniciando consulta de chamados...")
@@ -2588,13 +2585,6 @@ def listar_chamados():
         chamados_list = []
         for c, chamado_agente, agente_suporte, usuario in resultados:
             try:
-                # Converter data de abertura para timezone do Brasil
-                data_abertura_brazil = c.get_data_abertura_brazil()
-                data_abertura_str = data_abertura_brazil.strftime('%d/%m/%Y %H:%M:%S') if data_abertura_brazil else None
-
-                # Converter data de visita se existir
-                data_visita_str = c.data_visita.strftime('%d/%m/%Y') if c.data_visita else None
-
                 # Agente atribuído (dos joins acima)
                 agente_info = None
                 if chamado_agente and agente_suporte and usuario:
@@ -2605,26 +2595,9 @@ def listar_chamados():
                         'nivel_experiencia': agente_suporte.nivel_experiencia
                     }
 
-                chamado_data = {
-                    'id': c.id,
-                    'codigo': c.codigo if hasattr(c, 'codigo') else None,
-                    'protocolo': c.protocolo if hasattr(c, 'protocolo') else None,
-                    'solicitante': c.solicitante if hasattr(c, 'solicitante') else None,
-                    'email': c.email if hasattr(c, 'email') else None,
-                    'cargo': c.cargo if hasattr(c, 'cargo') else None,
-                    'telefone': c.telefone if hasattr(c, 'telefone') else None,
-                    'unidade': c.unidade if hasattr(c, 'unidade') else None,
-                    'problema': c.problema if hasattr(c, 'problema') else None,
-                    'descricao': c.descricao if hasattr(c, 'descricao') else None,
-                    'internet_item': c.internet_item if hasattr(c, 'internet_item') else None,
-                    'data_visita': data_visita_str,
-                    'data_abertura': data_abertura_str,
-                    'status': c.status if hasattr(c, 'status') else 'Aberto',
-                    'prioridade': c.prioridade if hasattr(c, 'prioridade') else 'Normal',
-                    'visita_tecnica': c.visita_tecnica if hasattr(c, 'visita_tecnica') else False,
-                    'agente': agente_info,
-                    'agente_id': agente_info['id'] if agente_info else None
-                }
+                chamado_data = CHAMADO(c)
+                chamado_data['agente'] = agente_info
+                chamado_data['agente_id'] = agente_info['id'] if agente_info else None
                 chamados_list.append(chamado_data)
             except Exception as e:
                 logger.error(f"Erro ao formatar chamado {c.id}: {str(e)}")
@@ -2840,16 +2813,15 @@ def atualizar_status_chamado(id):
 
         # Emitir evento Socket.IO apenas se a conexão estiver disponível
         try:
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('status_atualizado', {
-                    'chamado_id': chamado.id,
-                    'codigo': chamado.codigo,
-                    'status_anterior': status_anterior,
-                    'novo_status': novo_status,
-                    'solicitante': chamado.solicitante,
-                    'agente': agente_info,
-                    'timestamp': agora_brazil.isoformat()
-                })
+            emitir('status_atualizado', {
+                'chamado_id': chamado.id,
+                'codigo': chamado.codigo,
+                'status_anterior': status_anterior,
+                'novo_status': novo_status,
+                'solicitante': chamado.solicitante,
+                'agente': agente_info,
+                'timestamp': agora_brazil.isoformat()
+            }, salas_do_chamado(chamado, agentes=(agente_info and agente_info['id'],)))
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -2874,6 +2846,8 @@ def deletar_chamado(id):
             return error_response('Chamado não encontrado.', 404)
 
         codigo_chamado = chamado.codigo
+        # Público do aviso calculado antes: depois do delete não há solicitante nem agente
+        salas = salas_do_chamado(chamado, agentes=(agente_do_chamado(id),), fila=chamado.status == 'Aberto')
 
         # Remover atribuições de agentes antes de deletar o chamado
         from database import ChamadoAgente
@@ -2887,12 +2861,11 @@ def deletar_chamado(id):
 
         # Emitir evento Socket.IO apenas se a conexão estiver disponível
         try:
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_deletado', {
-                    'id': id,
-                    'codigo': codigo_chamado,
-                    'timestamp': get_brazil_time().isoformat()
-                })
+            emitir('chamado_deletado', {
+                'id': id,
+                'codigo': codigo_chamado,
+                'timestamp': get_brazil_time().isoformat()
+            }, salas)
         except Exception as socket_error:
             logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
 
@@ -2939,20 +2912,7 @@ def listar_usuarios():
             page=page, per_page=per_page, error_out=False
         )
 
-        usuarios_list = []
-        for user in usuarios_pag.items:
-            usuarios_list.append({
-                'id': user.id,
-                'nome': user.nome,
-                'sobrenome': user.sobrenome,
-                'email': user.email,
-                'usuario': user.usuario,
-                'nivel_acesso': user.nivel_acesso,
-                'setor': user.setor,
-                'bloqueado': getattr(user, 'bloqueado', False),
-                'ativo': getattr(user, 'ativo', True),
-                'data_cadastro': user.data_criacao.strftime('%d/%m/%Y') if user.data_criacao else None
-            })
+        usuarios_list = USUARIO.muitos(usuarios_pag.items)
 
         return json_response({
             'usuarios': usuarios_list,
@@ -3535,8 +3495,9 @@ Atenciosamente,
 Suporte Evoque.
 """
         
-        enviado = enviar_email(assunto, corpo, [chamado.email])
-        
+        enviado = enviar_email(assunto, corpo, [chamado.email], referencia=f"chamado:{chamado.codigo}")
+        db.session.commit()
+
         if enviado:
             return json_response({'message': 'E-mail enviado com sucesso'})
         else:
@@ -3612,11 +3573,7 @@ Atenciosamente,
 Equipe de Suporte TI - Evoque Fitness
 """
 
-        sucesso = enviar_email(
-            assunto=assunto,
-            corpo=mensagem_formatada,
-            destinatarios=destinatarios
-        )
+        sucesso = enviar_email(assunto, mensagem_formatada, destinatarios, referencia=f"chamado:{chamado.codigo}")
 
         if sucesso:
             historico = HistoricoTicket(
@@ -3631,14 +3588,13 @@ Equipe de Suporte TI - Evoque Fitness
             
             # Emitir evento Socket.IO apenas se a conexão estiver disponível
             try:
-                if hasattr(current_app, 'socketio'):
-                    current_app.socketio.emit('ticket_enviado', {
-                        'chamado_id': chamado.id,
-                        'codigo': chamado.codigo,
-                        'assunto': assunto,
-                        'destinatarios': destinatarios,
-                        'timestamp': get_brazil_time().isoformat()
-                    })
+                emitir('ticket_enviado', {
+                    'chamado_id': chamado.id,
+                    'codigo': chamado.codigo,
+                    'assunto': assunto,
+                    'destinatarios': destinatarios,
+                    'timestamp': get_brazil_time().isoformat()
+                }, salas_do_chamado(chamado, agentes=(agente_do_chamado(chamado.id),)))
             except Exception as socket_error:
                 logger.warning(f"Erro ao emitir evento Socket.IO: {str(socket_error)}")
             
@@ -3747,6 +3703,7 @@ def obter_grafico_semanal():
 @painel_bp.route('/api/sla/chamados-detalhados', methods=['GET'])
 @login_required
 @setor_required('TI')
+@conditional_response('chamados', 'configuracoes', janela=60)
 def obter_chamados_detalhados_sla():
     """Retorna lista detalhada de chamados com informações de SLA"""
     try:
@@ -4727,6 +4684,7 @@ def atribuir_chamado(chamado_id):
         try:
             from .email_service import email_service
             email_enviado = email_service.notificar_agente_atribuido(chamado, agente)
+            db.session.commit()
             if email_enviado:
                 logger.info(f"Email de notificação enviado para {chamado.email}")
             else:
@@ -4751,6 +4709,7 @@ def atribuir_chamado(chamado_id):
 @painel_bp.route('/api/logs/acoes', methods=['GET'])
 @login_required
 @setor_required('Administrador')
+@conditional_response('logs_acoes')
 def listar_logs_acoes():
     """Lista logs de ações com filtros e paginação"""
     try:
@@ -4899,6 +4858,7 @@ def estatisticas_logs_acoes():
 @painel_bp.route('/api/logs/acesso', methods=['GET'])
 @login_required
 @setor_required('Administrador')
+@conditional_response('logs_acesso')
 def listar_logs_acesso():
     """Lista logs de acesso com filtros e paginação"""
     try:
@@ -0,0 +1,271 @@
+"""
+Conciliação entre a pasta de uploads e a tabela de anexos
+
+- O disco é lido com os.scandir, pasta a pasta (sem montar a lista inteira), e
+  do banco vêm só as colunas necessárias, em lotes
+- O relatório traz arquivos órfãos (no disco, sem registro), ausentes
+  (registro ativo sem arquivo) e tamanhos divergentes para mais e para menos
+- Órfãos não são apagados: vão para <UPLOAD_FOLDER>/quarentena/<data-hora>/
+  mantendo o caminho relativo (para restaurar basta mover de volta) e só são
+  apagados depois de ANEXOS_QUARENTENA_DIAS
+- Arquivos modificados há menos de ANEXOS_BLOBS_CARENCIA segundos nunca são
+  tratados como órfãos: podem ser uploads cujo registro ainda não foi gravado
+"""
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import select
+
+from database import db, BlobAnexo, ChamadoAnexo, get_brazil_time
+from performance.metrics import registro
+from setores.ti.anexos_utils import ANEXOS_CONFIG
+from setores.ti.blob_store import PASTA_BLOBS, PASTA_TEMPORARIOS, _remover_pastas_vazias, anexos_blobs_command
+
+logger = logging.getLogger(__name__)
+
+PASTA_QUARENTENA = 'quarentena'
+FORMATO_CARIMBO = '%Y%m%d-%H%M%S'
+TAMANHO_LOTE = 1000
+LIMITE_AMOSTRA = 100
+
+_AUSENTE = object()
+
+
+def pasta_quarentena(pasta_upload=None):
+    return os.path.join(pasta_upload or ANEXOS_CONFIG['UPLOAD_FOLDER'], PASTA_QUARENTENA)
+
+
+# ==================== BANCO ====================
+
+def _em_lotes(consulta, coluna_id, lote):
+    """Percorre uma consulta por faixas de id (sem OFFSET e sem carregar objetos ORM)"""
+    ultimo_id = 0
+    while True:
+        linhas = db.session.execute(
+            consulta.where(coluna_id > ultimo_id).order_by(coluna_id).limit(lote)
+        ).all()
+        if not linhas:
+            return
+        yield from linhas
+        ultimo_id = linhas[-1][0]
+
+
+def _carregar_esperados(lote):
+    """
+    Devolve (legados, blobs, hashes_conhecidos): nome -> tamanho dos arquivos
+    antigos, hash -> tamanho dos blobs em uso e todos os hashes com registro
+    (inclusive blobs sem referência, que são da coleta e não desta conciliação)
+    """
+    legados, blobs, hashes_conhecidos = {}, {}, set()
+    consulta = (select(ChamadoAnexo.id, ChamadoAnexo.nome_arquivo, ChamadoAnexo.hash_arquivo, ChamadoAnexo.tamanho_bytes)
+                .where(ChamadoAnexo.ativo.is_(True)))
+    for _, nome, hash_arquivo, tamanho in _em_lotes(consulta, ChamadoAnexo.id, lote):
+        if hash_arquivo and nome == hash_arquivo:
+            blobs[hash_arquivo] = tamanho
+            hashes_conhecidos.add(hash_arquivo)
+        else:
+            legados[os.path.basename(nome or '')] = tamanho
+    for _, hash_arquivo in _em_lotes(select(BlobAnexo.id, BlobAnexo.hash_arquivo), BlobAnexo.id, lote):
+        hashes_conhecidos.add(hash_arquivo)
+    return legados, blobs, hashes_conhecidos
+
+
+# ==================== DISCO ====================
+
+def _arquivos(pasta):
+    try:
+        with os.scandir(pasta) as entradas:
+            for entrada in entradas:
+                if entrada.is_file(follow_symlinks=False):
+                    yield entrada
+    except FileNotFoundError:
+        return
+
+
+def _subpastas(pasta):
+    try:
+        with os.scandir(pasta) as entradas:
+            for entrada in entradas:
+                if entrada.is_dir(follow_symlinks=False):
+                    yield entrada
+    except FileNotFoundError:
+        return
+
+
+def _varrer(pasta_upload):
+    """
+    Gera (tipo, chave, entrada) para cada arquivo da pasta de uploads:
+    'legado' (na raiz, chave = nome), 'blob' (blobs/aa/bb/<hash>) e 'derivado'
+    (miniaturas <hash>.<sufixo>, chave = hash). Temporários e a própria
+    quarentena ficam de fora.
+    """
+    for entrada in _arquivos(pasta_upload):
+        yield 'legado', entrada.name, entrada
+    for nivel1 in _subpastas(os.path.join(pasta_upload, PASTA_BLOBS)):
+        if nivel1.name == PASTA_TEMPORARIOS:
+            continue
+        for nivel2 in _subpastas(nivel1.path):
+            for entrada in _arquivos(nivel2.path):
+                hash_arquivo, separador, _ = entrada.name.partition('.')
+                yield ('derivado' if separador else 'blob'), hash_arquivo, entrada
+
+
+def _amostrar(lista, item):
+    if len(lista) < LIMITE_AMOSTRA:
+        lista.append(item)
+
+
+def _mover_para_quarentena(caminho, pasta_upload, destino_base):
+    relativo = os.path.relpath(caminho, pasta_upload)
+    destino = os.path.join(destino_base, relativo)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    os.replace(caminho, destino)
+    if os.path.dirname(relativo).startswith(PASTA_BLOBS + os.sep):
+        _remover_pastas_vazias(os.path.dirname(caminho))
+
+
+def reconciliar(carencia, quarentena=True, simular=False, lote=TAMANHO_LOTE, pasta_upload=None):
+    """
+    Compara disco e banco e devolve o relatório. Com quarentena=True (e fora
+    da simulação) os órfãos são movidos para a quarentena.
+    """
+    pasta_upload = pasta_upload or ANEXOS_CONFIG['UPLOAD_FOLDER']
+    legados, blobs, hashes_conhecidos = _carregar_esperados(lote)
+    mover = quarentena and not simular
+    destino_base = os.path.join(pasta_quarentena(pasta_upload), get_brazil_time().strftime(FORMATO_CARIMBO))
+    limite_recente = time.time() - carencia
+
+    resultado = {
+        'arquivos_verificados': 0, 'bytes_verificados': 0,
+        'orfaos': 0, 'bytes_orfaos': 0, 'recentes_ignorados': 0, 'movidos_quarentena': 0,
+        'ausentes': 0, 'maiores_no_disco': 0, 'menores_no_disco': 0,
+        'amostras': {'orfaos': [], 'ausentes': [], 'divergentes': []}
+    }
+    amostras = resultado['amostras']
+
+    for tipo, chave, entrada in _varrer(pasta_upload):
+        try:
+            info = entrada.stat(follow_symlinks=False)
+        except FileNotFoundError:
+            continue  # Removido durante a varredura (coleta, upload concorrente)
+        resultado['arquivos_verificados'] += 1
+        resultado['bytes_verificados'] += info.st_size
+
+        if tipo == 'legado':
+            esperado = legados.pop(chave, _AUSENTE)
+            orfao = esperado is _AUSENTE
+        elif tipo == 'blob':
+            esperado = blobs.pop(chave, _AUSENTE)
+            orfao = chave not in hashes_conhecidos
+        else:
+            esperado = _AUSENTE
+            orfao = chave not in hashes_conhecidos
+
+        if esperado is not _AUSENTE and esperado is not None and esperado != info.st_size:
+            resultado['maiores_no_disco' if info.st_size > esperado else 'menores_no_disco'] += 1
+            _amostrar(amostras['divergentes'], {
+                'arquivo': os.path.relpath(entrada.path, pasta_upload),
+                'tamanho_banco': esperado,
+                'tamanho_disco': info.st_size
+            })
+
+        if not orfao:
+            continue
+        if info.st_mtime > limite_recente:
+            resultado['recentes_ignorados'] += 1
+            continue
+        resultado['orfaos'] += 1
+        resultado['bytes_orfaos'] += info.st_size
+        _amostrar(amostras['orfaos'], os.path.relpath(entrada.path, pasta_upload))
+        if mover:
+            try:
+                _mover_para_quarentena(entrada.path, pasta_upload, destino_base)
+                resultado['movidos_quarentena'] += 1
+            except OSError as e:
+                logger.error(f"Erro ao mover {entrada.path} para a quarentena: {str(e)}")
+
+    # O que sobrou do banco não foi encontrado no disco
+    for nome in legados:
+        resultado['ausentes'] += 1
+        _amostrar(amostras['ausentes'], nome)
+    for hash_arquivo in blobs:
+        resultado['ausentes'] += 1
+        _amostrar(amostras['ausentes'], os.path.join(PASTA_BLOBS, hash_arquivo[:2], hash_arquivo[2:4], hash_arquivo))
+
+    if resultado['movidos_quarentena']:
+        registro.incrementar('anexos_quarentena_total', resultado['movidos_quarentena'],
+                             'Arquivos órfãos de anexos movidos para a quarentena')
+        logger.info(f"📦 {resultado['movidos_quarentena']} arquivo(s) órfão(s) movido(s) para {destino_base}")
+    if resultado['ausentes']:
+        logger.warning(f"⚠️  {resultado['ausentes']} anexo(s) ativo(s) sem arquivo no disco")
+    return resultado
+
+
+def purgar_quarentena(dias, simular=False, pasta_upload=None):
+    """Apaga as remessas da quarentena com mais de `dias` dias"""
+    limite = get_brazil_time().replace(tzinfo=None) - timedelta(days=dias)
+    resultado = {'remessas_removidas': 0, 'arquivos_removidos': 0, 'bytes_liberados': 0}
+
+    for remessa in _subpastas(pasta_quarentena(pasta_upload)):
+        try:
+            criada = datetime.strptime(remessa.name, FORMATO_CARIMBO)
+        except ValueError:
+            continue  # Pasta que não foi criada pela conciliação
+        if criada > limite:
+            continue
+        for pasta, _, arquivos in os.walk(remessa.path):
+            for nome in arquivos:
+                try:
+                    resultado['bytes_liberados'] += os.path.getsize(os.path.join(pasta, nome))
+                except OSError:
+                    pass
+                resultado['arquivos_removidos'] += 1
+        resultado['remessas_removidas'] += 1
+        if not simular:
+            shutil.rmtree(remessa.path, ignore_errors=True)
+
+    if resultado['arquivos_removidos'] and not simular:
+        logger.info(f"🧹 Quarentena: {resultado['arquivos_removidos']} arquivo(s) apagado(s) "
+                    f"({resultado['bytes_liberados'] / (1024 * 1024):.1f} MB)")
+    return resultado
+
+
+# ==================== CLI ====================
+
+@anexos_blobs_command.command('reconciliar')
+@click.option('--simular', is_flag=True, help='Só gera o relatório, sem mover nada')
+@click.option('--sem-quarentena', is_flag=True, help='Relata os órfãos mas os deixa no lugar')
+@click.option('--lote', type=int, default=TAMANHO_LOTE, show_default=True, help='Registros lidos por consulta')
+@click.option('--amostras', is_flag=True, help='Lista também as amostras de cada categoria')
+def reconciliar_command(simular, sem_quarentena, lote, amostras):
+    """Concilia a pasta de uploads com os anexos do banco"""
+    resultado = current_app.extensions['anexos_blobs'].reconciliar(
+        quarentena=not sem_quarentena, simular=simular, lote=lote
+    )
+    click.echo(f"🔎 {resultado['arquivos_verificados']} arquivo(s) verificado(s), "
+               f"{resultado['bytes_verificados'] / (1024 * 1024):.1f} MB")
+    click.echo(f"   Órfãos: {resultado['orfaos']} ({resultado['bytes_orfaos'] / (1024 * 1024):.1f} MB), "
+               f"{resultado['movidos_quarentena']} movido(s) para a quarentena, "
+               f"{resultado['recentes_ignorados']} recente(s) ignorado(s)")
+    click.echo(f"   Ausentes no disco: {resultado['ausentes']}")
+    click.echo(f"   Tamanho divergente: {resultado['maiores_no_disco']} maior(es) no disco, "
+               f"{resultado['menores_no_disco']} menor(es) no disco")
+    if amostras:
+        for categoria, itens in resultado['amostras'].items():
+            for item in itens:
+                click.echo(f"   [{categoria}] {item}")
+
+
+@anexos_blobs_command.command('purgar-quarentena')
+@click.option('--simular', is_flag=True, help='Só lista o que seria apagado')
+def purgar_quarentena_command(simular):
+    """Apaga da quarentena os órfãos que já passaram do prazo"""
+    resultado = current_app.extensions['anexos_blobs'].purgar_quarentena(simular=simular)
+    prefixo = '🔎 Seriam apagados' if simular else '🧹 Apagados'
+    click.echo(f"{prefixo}: {resultado['arquivos_removidos']} arquivo(s) em {resultado['remessas_removidas']} "
+               f"remessa(s), {resultado['bytes_liberados'] / (1024 * 1024):.1f} MB")
@@ -25,6 +25,8 @@ from database import (
     get_brazil_time, registrar_log_acao, criar_alerta_sistema,
     registrar_log_acesso, registrar_log_logout
 )
+from setores.ti.utils.serializacao import json_response, error_response as _error_response
+from performance.lazy import modulo_preguicoso
 
 # Configurar logging
 logging.basicConfig(level=logging.DEBUG)
@@ -33,27 +35,15 @@ logger = logging.getLogger(__name__)
 # Timezone do Brasil
 BRAZIL_TZ = pytz.timezone('America/Sao_Paulo')
 
+# Estatísticas do servidor (opcional, carregado só no status do sistema)
+psutil = modulo_preguicoso('psutil', opcional=True)
+
 # Criar blueprint
 rotas_bp = Blueprint('rotas', __name__, template_folder='templates')
 
-def json_response(data, status=200):
-    """Wrapper para garantir resposta JSON válida"""
-    try:
-        response = jsonify(data)
-        response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return response, status
-    except Exception as e:
-        logger.error(f"Erro ao criar resposta JSON: {str(e)}")
-        error_response = jsonify({'error': 'Erro interno de serialização'})
-        error_response.headers['Content-Type'] = 'application/json; charset=utf-8'
-        return error_response, 500
-
 def error_response(message, status=500, details=None):
-    """Wrapper para respostas de erro padronizadas"""
-    error_data = {'error': message}
-    if details:
-        error_data['details'] = details
-    return json_response(error_data, status)
+    """Wrapper para respostas de erro padronizadas (padrão 500 neste módulo)"""
+    return _error_response(message, status, details)
 
 def get_client_info(request):
     """Extrai informações do cliente da requisição"""
@@ -1441,14 +1431,22 @@ def status_sistema():
         debug_mode = ConfiguracaoAvancada.query.filter_by(chave='sistema.debug_mode').first()
         
         # Informações do sistema
-        import psutil
         import platform
         
-        # Uso de memória
-        memoria = psutil.virtual_memory()
-        
-        # Uso de disco
-        disco = psutil.disk_usage('/')
+        # Uso de memória e disco (psutil é opcional)
+        if psutil.disponivel:
+            memoria = psutil.virtual_memory()
+            disco = psutil.disk_usage('/')
+            recursos = {
+                'memoria_total_gb': round(memoria.total / (1024**3), 2),
+                'memoria_usada_gb': round(memoria.used / (1024**3), 2),
+                'memoria_percentual': memoria.percent,
+                'disco_total_gb': round(disco.total / (1024**3), 2),
+                'disco_usado_gb': round(disco.used / (1024**3), 2),
+                'disco_percentual': round((disco.used / disco.total) * 100, 2)
+            }
+        else:
+            recursos = None
         
         status_info = {
             'sistema_online': True,
@@ -1471,14 +1469,7 @@ def status_sistema():
                 'arquitetura': platform.machine(),
                 'python_versao': platform.python_version()
             },
-            'recursos': {
-                'memoria_total_gb': round(memoria.total / (1024**3), 2),
-                'memoria_usada_gb': round(memoria.used / (1024**3), 2),
-                'memoria_percentual': memoria.percent,
-                'disco_total_gb': round(disco.total / (1024**3), 2),
-                'disco_usado_gb': round(disco.used / (1024**3), 2),
-                'disco_percentual': round((disco.used / disco.total) * 100, 2)
-            },
+            'recursos': recursos,
             'timestamp': get_brazil_time().strftime('%d/%m/%Y %H:%M:%S')
         }
         
@@ -7,8 +7,11 @@ from flask import Blueprint, render_template, request, jsonify, current_app, fla
 from flask_login import LoginManager, login_required, current_user
 from auth.auth_helpers import setor_required
 from database import db, Chamado, User, Unidade, ProblemaReportado, ItemInternet, ChamadoAnexo, seed_unidades, get_brazil_time
-import requests
-from msal import ConfidentialClientApplication
+from performance.conditional import conditional_response
+from setores.ti.graph_auth import ProvedorTokenGraph, AUTHORITY_HOST_PADRAO
+from setores.ti.graph_client import ClienteGraph, CircuitoAberto, Disjuntor, ErroGraph, LimitadorTaxa
+from setores.ti.anexos_email import normalizar_anexos
+from setores.ti.salas_socketio import emitir, salas_do_chamado
 
 ti_bp = Blueprint('ti', __name__, template_folder='templates')
 
@@ -22,54 +25,46 @@ EMAIL_TI = os.getenv('EMAIL_TI', 'ti@academiaevoque.com.br')
 # Verificar se as variáveis de ambiente estão configuradas (não obrigatórias para desenvolvimento)
 EMAIL_ENABLED = all([CLIENT_ID, CLIENT_SECRET, TENANT_ID, USER_ID])
 
+# Base da API (permite apontar para um stand-in local em testes)
+GRAPH_BASE_URL = os.getenv('GRAPH_BASE_URL', 'https://graph.microsoft.com/v1.0').rstrip('/')
+
 if EMAIL_ENABLED:
     SCOPES = ["https://graph.microsoft.com/.default"]
-    ENDPOINT = f"https://graph.microsoft.com/v1.0/users/{USER_ID}/sendMail"
+    ENDPOINT = f"{GRAPH_BASE_URL}/users/{USER_ID}/sendMail"
     print("✅ Configurações de email Microsoft Graph carregadas")
 else:
     SCOPES = []
     ENDPOINT = None
     print("⚠️  Email desabilitado: Variáveis de ambiente do Microsoft Graph não configuradas")
 
+# Token compartilhado por todas as threads do processo
+provedor_token_graph = ProvedorTokenGraph(
+    CLIENT_ID, CLIENT_SECRET, TENANT_ID, SCOPES,
+    authority_host=os.getenv('GRAPH_AUTHORITY_HOST', AUTHORITY_HOST_PADRAO)
+)
+
+# Sessão HTTP com pool, timeouts, retentativas e disjuntor para o Graph
+cliente_graph = ClienteGraph(
+    GRAPH_BASE_URL, provedor_token_graph,
+    timeout_conexao=float(os.getenv('GRAPH_TIMEOUT_CONEXAO', 5)),
+    timeout_leitura=float(os.getenv('GRAPH_TIMEOUT_LEITURA', 30)),
+    max_tentativas=int(os.getenv('GRAPH_MAX_TENTATIVAS', 3)),
+    disjuntor=Disjuntor(
+        limite_falhas=int(os.getenv('GRAPH_DISJUNTOR_FALHAS', 5)),
+        tempo_aberto=int(os.getenv('GRAPH_DISJUNTOR_SEGUNDOS', 60))
+    )
+)
+
+# Envio em massa: lotes $batch em paralelo, limitados em requisições por segundo
+GRAPH_LOTE_CONCORRENCIA = int(os.getenv('GRAPH_LOTE_CONCORRENCIA', 4))
+limitador_lotes_graph = LimitadorTaxa(float(os.getenv('GRAPH_LOTE_TAXA', 4)))
+
 def get_access_token():
+    """Token do Graph a partir do provedor compartilhado (cache + renovação em segundo plano)"""
     if not EMAIL_ENABLED:
         current_app.logger.warning("⚠️  Tentativa de obter token com email desabilitado")
         return None
-
-    try:
-        current_app.logger.info(f"🔄 Configurando MSAL Client...")
-        current_app.logger.info(f"🔑 CLIENT_ID: {CLIENT_ID[:8]}...")
-        current_app.logger.info(f"🏢 TENANT_ID: {TENANT_ID}")
-        current_app.logger.info(f"🌐 Authority: https://login.microsoftonline.com/{TENANT_ID}")
-
-        app = ConfidentialClientApplication(
-            client_id=CLIENT_ID,
-            client_credential=CLIENT_SECRET,
-            authority=f"https://login.microsoftonline.com/{TENANT_ID}"
-        )
-
-        current_app.logger.info(f"📋 Scopes: {SCOPES}")
-        current_app.logger.info("🔄 Solicitando token...")
-
-        result = app.acquire_token_for_client(scopes=SCOPES)
-
-        current_app.logger.info(f"📥 Resultado recebido: {list(result.keys())}")
-
-        if "access_token" in result:
-            current_app.logger.info("✅ Token obtido com sucesso!")
-            return result["access_token"]
-        else:
-            current_app.logger.error(f"❌ Erro ao obter token:")
-            current_app.logger.error(f"   - Error: {result.get('error', 'N/A')}")
-            current_app.logger.error(f"   - Error Description: {result.get('error_description', 'N/A')}")
-            current_app.logger.error(f"   - Error Codes: {result.get('error_codes', 'N/A')}")
-            current_app.logger.error(f"   - Correlation ID: {result.get('correlation_id', 'N/A')}")
-            return None
-    except Exception as e:
-        current_app.logger.error(f"❌ Exceção ao obter token: {str(e)}")
-        import traceback
-        current_app.logger.error(f"🔍 Stack trace: {traceback.format_exc()}")
-        return None
+    return provedor_token_graph.obter_token()
 
 def testar_configuracao_email():
     """Função para testar se as configurações de e-mail estão funcionando"""
@@ -112,7 +107,32 @@ def testar_configuracao_email():
         current_app.logger.error(f"🔍 Stack trace: {traceback.format_exc()}")
         return False
 
-def enviar_email(assunto, corpo, destinatarios=None, anexos=None):
+def enviar_email(assunto, corpo, destinatarios=None, anexos=None, chave_idempotencia=None, referencia=None,
+                 corpo_html=None):
+    """
+    Enfileira o e-mail na outbox (sem commit; a mensagem é confirmada junto
+    com a transação de quem chamou); a entrega (Graph com fallback SMTP) é
+    feita pelos workers em segundo plano. corpo é o texto; corpo_html, se
+    informado, é a versão enviada em HTML. Retorna True se a mensagem foi aceita.
+    """
+    if destinatarios is None:
+        destinatarios = [EMAIL_TI]
+
+    if not current_app.config.get('EMAIL_OUTBOX_ENABLED', True):
+        return entregar_email(assunto, corpo, destinatarios, anexos, corpo_html=corpo_html)
+
+    # O item entra na transação atual: quem chama faz o commit
+    try:
+        from setores.ti.email_outbox import enfileirar_email
+        return enfileirar_email(assunto, corpo, destinatarios, anexos,
+                                chave_idempotencia=chave_idempotencia, referencia=referencia,
+                                corpo_html=corpo_html) is not None
+    except Exception as e:
+        current_app.logger.error(f"❌ Erro ao enfileirar e-mail: {str(e)}")
+        return False
+
+def entregar_email(assunto, corpo, destinatarios=None, anexos=None, corpo_html=None):
+    """Entrega imediata: Microsoft Graph e, em caso de falha, SMTP"""
     if destinatarios is None:
         destinatarios = [EMAIL_TI]
 
@@ -120,31 +140,18 @@ def enviar_email(assunto, corpo, destinatarios=None, anexos=None):
     current_app.logger.info(f"📧 Destinatários: {destinatarios}")
     current_app.logger.info(f"📋 Assunto: {assunto}")
     current_app.logger.info(f"📄 Tamanho do corpo: {len(corpo)} caracteres")
-    if anexos:
-        try:
-            nomes_anexos = [a.get('nome') for a in anexos if a.get('nome')]
-            tamanhos = [len(a.get('dados') or b'') for a in anexos]
-            current_app.logger.info(f"📎 Anexos: {nomes_anexos} (tamanhos: {tamanhos})")
-        except Exception:
-            current_app.logger.info("📎 Anexos presentes, detalhes indisponíveis para log")
+    anexos_email = normalizar_anexos(anexos)
+    if anexos_email:
+        current_app.logger.info(f"📎 Anexos: {[a.nome for a in anexos_email]} (tamanhos: {[a.tamanho for a in anexos_email]})")
 
     # Tentar via Microsoft Graph
-    token = get_access_token()
-    if token:
-        current_app.logger.info(f"🔑 Token obtido: {token[:20]}...")
-        current_app.logger.info(f"🌐 Endpoint: {ENDPOINT}")
-
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-
+    if EMAIL_ENABLED:
         email_data = {
             "message": {
                 "subject": assunto,
                 "body": {
-                    "contentType": "Text",
-                    "content": corpo
+                    "contentType": "HTML" if corpo_html else "Text",
+                    "content": corpo_html or corpo
                 },
                 "toRecipients": [
                     {"emailAddress": {"address": addr}} for addr in destinatarios
@@ -153,37 +160,20 @@ def enviar_email(assunto, corpo, destinatarios=None, anexos=None):
             "saveToSentItems": False
         }
 
-        # Incluir anexos se houver
-        if anexos:
-            import base64
-            attachments_payload = []
-            for anexo in anexos:
-                nome = anexo.get('nome')
-                tipo = anexo.get('content_type') or 'application/octet-stream'
-                dados = anexo.get('dados')
-                if not (nome and dados is not None):
-                    continue
-                content_b64 = base64.b64encode(dados).decode('utf-8')
-                attachments_payload.append({
-                    "@odata.type": "#microsoft.graph.fileAttachment",
-                    "name": nome,
-                    "contentType": tipo,
-                    "contentBytes": content_b64
-                })
-            if attachments_payload:
-                email_data["message"]["attachments"] = attachments_payload
-
         current_app.logger.info(f"📦 Email data preparado para: {[r['emailAddress']['address'] for r in email_data['message']['toRecipients']]}" )
 
         try:
-            response = requests.post(ENDPOINT, headers=headers, json=email_data)
-            if response.status_code == 202:
-                current_app.logger.info("✅ E-mail enviado com sucesso via Microsoft Graph!")
-                return True
+            if anexos_email:
+                # Anexos grandes sobem do disco por upload session
+                cliente_graph.enviar_email_com_anexos(USER_ID, email_data, anexos_email)
             else:
-                current_app.logger.error(f"❌ Falha no Graph. Status: {response.status_code} | Body: {response.text}")
+                cliente_graph.enviar_email(USER_ID, email_data)
+            current_app.logger.info("✅ E-mail enviado com sucesso via Microsoft Graph!")
+            return True
+        except CircuitoAberto:
+            current_app.logger.warning("⚡ Microsoft Graph indisponível (circuito aberto). Usando fallback SMTP...")
         except Exception as e:
-            current_app.logger.error(f"❌ Erro na requisição Graph: {str(e)}")
+            current_app.logger.error(f"❌ Falha no Graph: {str(e)}")
     else:
         current_app.logger.warning("⚠️ Microsoft Graph não configurado. Tentando fallback SMTP...")
 
@@ -192,7 +182,7 @@ def enviar_email(assunto, corpo, destinatarios=None, anexos=None):
         from setores.ti.email_service import email_service
         sucesso_smtp = True
         for dest in destinatarios:
-            if not email_service.enviar_email(dest, assunto, corpo.replace('\n', '<br>'), corpo, anexos=anexos):
+            if not email_service.enviar_email(dest, assunto, corpo_html or corpo.replace('\n', '<br>'), corpo, anexos=anexos):
                 sucesso_smtp = False
         if sucesso_smtp:
             current_app.logger.info("✅ E-mail enviado com sucesso via SMTP (fallback)")
@@ -203,6 +193,63 @@ def enviar_email(assunto, corpo, destinatarios=None, anexos=None):
         current_app.logger.error(f"❌ Erro no fallback SMTP: {str(smtp_err)}")
         return False
 
+def entregar_emails_em_massa(assunto, mensagens):
+    """
+    Entrega mensagens personalizadas (uma por destinatário) de uma vez.
+    mensagens: lista de (id, email, corpo_html). Usa $batch do Graph e, para o
+    que o Graph recusar, o SMTP. Itens de um $batch com resultado incerto
+    (timeout de leitura) não vão para o SMTP: voltam como falha e podem ser
+    reenviados depois. Devolve {id: erro ou None}.
+    """
+    resultados = {}
+    resultados_graph = {}
+    restantes = list(mensagens)
+
+    if EMAIL_ENABLED and restantes:
+        lote = [(item_id, {
+            "message": {
+                "subject": assunto,
+                "body": {"contentType": "HTML", "content": corpo_html},
+                "toRecipients": [{"emailAddress": {"address": email}}]
+            },
+            "saveToSentItems": False
+        }) for item_id, email, corpo_html in restantes]
+
+        inicio = datetime.now()
+        try:
+            resultados_graph = cliente_graph.enviar_emails_em_massa(
+                USER_ID, lote, concorrencia=GRAPH_LOTE_CONCORRENCIA, limitador=limitador_lotes_graph
+            )
+        except Exception as e:
+            current_app.logger.error(f"❌ Falha no envio em massa via Graph: {str(e)}")
+
+        enviados = [item for item in restantes if str(item[0]) in resultados_graph and resultados_graph[str(item[0])] is None]
+        for item_id, _, _ in enviados:
+            resultados[str(item_id)] = None
+        incertos = 0
+        for item_id, _, _ in restantes:
+            erro_graph = resultados_graph.get(str(item_id))
+            if isinstance(erro_graph, ErroGraph) and erro_graph.ambiguo:
+                # O Graph pode ter entregue: mandar pelo SMTP arriscaria duplicar
+                resultados[str(item_id)] = f"Graph: {erro_graph} (resultado incerto, não reenviado pelo SMTP)"
+                incertos += 1
+        restantes = [item for item in restantes if str(item[0]) not in resultados]
+        current_app.logger.info(
+            f"📨 Graph $batch: {len(enviados)} enviados, {incertos} incertos, {len(restantes)} para o SMTP "
+            f"em {(datetime.now() - inicio).total_seconds():.1f}s"
+        )
+
+    if restantes:
+        from setores.ti.email_service import email_service
+        for item_id, email, corpo_html in restantes:
+            if email_service.enviar_email(email, assunto, corpo_html):
+                resultados[str(item_id)] = None
+            else:
+                erro_graph = resultados_graph.get(str(item_id))
+                resultados[str(item_id)] = f"Graph: {erro_graph}; SMTP: falha no envio" if erro_graph else 'Erro no envio'
+
+    return resultados
+
 def gerar_codigo_chamado():
     ultimo_chamado = Chamado.query.order_by(Chamado.id.desc()).first()
     if ultimo_chamado and ultimo_chamado.codigo.startswith("EVQ-"):
@@ -251,7 +298,8 @@ Se você recebeu este e-mail, o sistema está funcionando corretamente!
 Sistema de Suporte TI - Evoque Fitness
 """
 
-            resultado = enviar_email(assunto, corpo, [current_user.email])
+            # Envio direto: o objetivo é validar a configuração agora
+            resultado = entregar_email(assunto, corpo, [current_user.email])
 
             if resultado:
                 return jsonify({
@@ -427,18 +475,18 @@ def abrir_chamado():
                 db.session.add(novo_chamado)
                 db.session.commit()
 
-                if hasattr(current_app, 'socketio'):
-                    current_app.socketio.emit('novo_chamado', {
-                        'id': novo_chamado.id,
-                        'codigo': codigo_gerado,
-                        'protocolo': protocolo_gerado,
-                        'solicitante': dados_chamado['nome_solicitante'],
-                        'problema': problema_nome,
-                        'unidade': unidade_nome_completo,
-                        'status': 'Aberto',
-                        'data_abertura': data_abertura_brazil.isoformat(),
-                        'prioridade': dados_chamado['prioridade']
-                    })
+                # Administradores, fila dos agentes e responsáveis pela unidade
+                emitir('novo_chamado', {
+                    'id': novo_chamado.id,
+                    'codigo': codigo_gerado,
+                    'protocolo': protocolo_gerado,
+                    'solicitante': dados_chamado['nome_solicitante'],
+                    'problema': problema_nome,
+                    'unidade': unidade_nome_completo,
+                    'status': 'Aberto',
+                    'data_abertura': data_abertura_brazil.isoformat(),
+                    'prioridade': dados_chamado['prioridade']
+                }, salas_do_chamado(novo_chamado, fila=True))
 
                 visita_tecnica_texto = (
                     f"Sim, agendada para {data_visita.strftime('%d/%m/%Y')}"
@@ -476,7 +524,8 @@ Por favor, não responda este e-mail, essa é uma mensagem automática!
                 destinatarios = [dados_chamado['email'], EMAIL_TI]
                 assunto_email = f"ACADEMIA EVOQUE - CHAMADO #{codigo_gerado}"
 
-                sucesso_email = enviar_email(assunto_email, corpo_email, destinatarios)
+                sucesso_email = enviar_email(assunto_email, corpo_email, destinatarios, referencia=f"chamado:{codigo_gerado}")
+                db.session.commit()
                 if not sucesso_email:
                     current_app.logger.warning(f"Falha ao enviar e-mail para o chamado {codigo_gerado}")
 
@@ -744,19 +793,18 @@ def abrir_chamado_com_anexos():
         db.session.commit()
 
         # Emitir notificação Socket.IO
-        if hasattr(current_app, 'socketio'):
-            current_app.socketio.emit('novo_chamado', {
-                'id': novo_chamado.id,
-                'codigo': codigo_gerado,
-                'protocolo': protocolo_gerado,
-                'solicitante': dados_chamado['nome_solicitante'],
-                'problema': problema_nome,
-                'unidade': unidade_nome_completo,
-                'status': 'Aberto',
-                'data_abertura': data_abertura_brazil.isoformat(),
-                'prioridade': dados_chamado['prioridade'],
-                'anexos': len(anexos_salvos)
-            })
+        emitir('novo_chamado', {
+            'id': novo_chamado.id,
+            'codigo': codigo_gerado,
+            'protocolo': protocolo_gerado,
+            'solicitante': dados_chamado['nome_solicitante'],
+            'problema': problema_nome,
+            'unidade': unidade_nome_completo,
+            'status': 'Aberto',
+            'data_abertura': data_abertura_brazil.isoformat(),
+            'prioridade': dados_chamado['prioridade'],
+            'anexos': len(anexos_salvos)
+        }, salas_do_chamado(novo_chamado, fila=True))
 
         # Preparar corpo do email
         visita_tecnica_texto = (
@@ -801,7 +849,8 @@ Por favor, não responda este e-mail, essa é uma mensagem automática!
         destinatarios = [dados_chamado['email'], EMAIL_TI]
         assunto_email = f"ACADEMIA EVOQUE - CHAMADO #{codigo_gerado}"
 
-        sucesso_email = enviar_email(assunto_email, corpo_email, destinatarios)
+        sucesso_email = enviar_email(assunto_email, corpo_email, destinatarios, referencia=f"chamado:{codigo_gerado}")
+        db.session.commit()
         if not sucesso_email:
             current_app.logger.warning(f"Falha ao enviar e-mail para o chamado {codigo_gerado}")
 
@@ -834,8 +883,7 @@ Por favor, não responda este e-mail, essa é uma mensagem automática!
 def download_anexo(anexo_id):
     """Rota para download de anexos"""
     from database import ChamadoAnexo
-    from flask import send_file
-    import os
+    from .entrega_anexos import servir_anexo
 
     try:
         anexo = ChamadoAnexo.query.get(anexo_id)
@@ -848,20 +896,11 @@ def download_anexo(anexo_id):
             not current_user.eh_agente_suporte_ativo()):
             return jsonify({'error': 'Sem permissão para acessar este anexo'}), 403
 
-        # Verificar se arquivo existe
-        if not os.path.exists(anexo.caminho_arquivo):
-            current_app.logger.error(f"Arquivo não encontrado: {anexo.caminho_arquivo}")
-            return jsonify({'error': 'Arquivo não encontrado no servidor'}), 404
-
         # Log do download
         current_app.logger.info(f"Download do anexo {anexo.nome_original} por usuário {current_user.id}")
 
-        return send_file(
-            anexo.caminho_arquivo,
-            as_attachment=True,
-            download_name=anexo.nome_original,
-            mimetype=anexo.tipo_mime
-        )
+        # ETag pelo hash, Range e entrega pelo proxy conforme ANEXOS_ENTREGA
+        return servir_anexo(anexo, as_attachment=True)
 
     except Exception as e:
         current_app.logger.error(f"Erro no download do anexo {anexo_id}: {str(e)}")
@@ -873,8 +912,7 @@ def download_anexo(anexo_id):
 def preview_anexo(anexo_id):
     """Rota para pré-visualização inline de anexos (sem forçar download)"""
     from database import ChamadoAnexo
-    from flask import send_file
-    import os
+    from .entrega_anexos import servir_anexo
 
     try:
         anexo = ChamadoAnexo.query.get(anexo_id)
@@ -886,24 +924,60 @@ def preview_anexo(anexo_id):
             not current_user.eh_agente_suporte_ativo()):
             return jsonify({'error': 'Sem permissão para acessar este anexo'}), 403
 
-        if not os.path.exists(anexo.caminho_arquivo):
-            current_app.logger.error(f"Arquivo não encontrado: {anexo.caminho_arquivo}")
-            return jsonify({'error': 'Arquivo não encontrado no servidor'}), 404
-
         current_app.logger.info(f"Preview do anexo {anexo.nome_original} por usuário {current_user.id}")
 
-        # Envia inline (browser decide se exibe, especialmente para imagens/pdf)
-        return send_file(
-            anexo.caminho_arquivo,
-            as_attachment=False,
-            download_name=anexo.nome_original,
-            mimetype=anexo.tipo_mime
-        )
+        # Envia inline (browser decide se exibe, especialmente para imagens/pdf);
+        # Range permite avançar em vídeos sem baixar o arquivo todo
+        return servir_anexo(anexo, as_attachment=False)
 
     except Exception as e:
         current_app.logger.error(f"Erro no preview do anexo {anexo_id}: {str(e)}")
         return jsonify({'error': 'Erro interno no servidor'}), 500
 
+@ti_bp.route('/miniatura-anexo/<int:anexo_id>/<tamanho>')
+@login_required
+@setor_required('ti')
+def miniatura_anexo(anexo_id, tamanho):
+    """Miniatura (JPEG) de imagem ou primeira página de PDF, com cache no navegador"""
+    from database import ChamadoAnexo
+    from .entrega_anexos import servir_arquivo
+    from .miniaturas import LARGURAS
+
+    try:
+        if tamanho not in LARGURAS:
+            return jsonify({'error': 'Tamanho de miniatura inválido'}), 400
+
+        anexo = ChamadoAnexo.query.get(anexo_id)
+        if not anexo or not anexo.ativo:
+            return jsonify({'error': 'Anexo não encontrado'}), 404
+
+        if (anexo.chamado.usuario_id != current_user.id and
+            not current_user.tem_permissao('Administrador') and
+            not current_user.eh_agente_suporte_ativo()):
+            return jsonify({'error': 'Sem permissão para acessar este anexo'}), 403
+
+        largura = LARGURAS[tamanho]
+        caminho = None
+        if anexo.hash_arquivo:
+            caminho = current_app.extensions['miniaturas'].obter(
+                anexo.hash_arquivo, anexo.caminho_arquivo, anexo.tipo_mime, largura
+            )
+        if caminho is None:
+            if (anexo.tipo_mime or '').startswith('image/'):
+                # Sem Pillow (ou imagem ilegível): o navegador reduz o original
+                return redirect(url_for('ti.preview_anexo', anexo_id=anexo.id))
+            return jsonify({'error': 'Miniatura indisponível para este anexo'}), 404
+
+        # O conteúdo do anexo nunca muda: a miniatura pode ficar no cache do navegador
+        return servir_arquivo(
+            caminho, f"{anexo.hash_arquivo}-{largura}", 'image/jpeg',
+            f"miniatura-{anexo.id}.jpg", max_age=current_app.config['ANEXOS_MINIATURAS_MAX_AGE']
+        )
+
+    except Exception as e:
+        current_app.logger.error(f"Erro na miniatura do anexo {anexo_id}: {str(e)}")
+        return jsonify({'error': 'Erro interno no servidor'}), 500
+
 @ti_bp.route('/anexos/<int:chamado_id>')
 @login_required
 @setor_required('ti')
@@ -945,6 +1019,7 @@ def listar_anexos(chamado_id):
             'anexos': anexos_data,
             'total': len(anexos_data),
             'tamanho_total': chamado.get_tamanho_total_anexos(),
+            'zip_url': url_for('ti.zip_anexos_chamado', chamado_id=chamado.id) if anexos_data else None,
             'tamanho_total_formatado': anexos[0].get_tamanho_formatado() if anexos else '0 B'
         })
 
@@ -952,6 +1027,201 @@ def listar_anexos(chamado_id):
         current_app.logger.error(f"Erro ao listar anexos do chamado {chamado_id}: {str(e)}")
         return jsonify({'error': 'Erro interno no servidor'}), 500
 
+@ti_bp.route('/anexos/<int:chamado_id>/zip')
+@login_required
+@setor_required('ti')
+def zip_anexos_chamado(chamado_id):
+    """Baixa todos os anexos ativos de um chamado num ZIP gerado sob demanda"""
+    from sqlalchemy import select
+    from .zip_anexos import contar_anexos, resposta_zip
+
+    try:
+        chamado = Chamado.query.get(chamado_id)
+        if not chamado:
+            return jsonify({'error': 'Chamado não encontrado'}), 404
+
+        if (chamado.usuario_id != current_user.id and
+            not current_user.tem_permissao('Administrador') and
+            not current_user.eh_agente_suporte_ativo()):
+            return jsonify({'error': 'Sem permissão para baixar anexos deste chamado'}), 403
+
+        chamados = select(Chamado.id).where(Chamado.id == chamado.id)
+        quantidade, _ = contar_anexos(chamados)
+        if not quantidade:
+            return jsonify({'error': 'Chamado sem anexos'}), 404
+
+        current_app.logger.info(f"ZIP dos anexos do chamado {chamado.codigo} por usuário {current_user.id}")
+        return resposta_zip(chamados, f"anexos-{chamado.codigo}.zip", por_pasta=False)
+
+    except Exception as e:
+        current_app.logger.error(f"Erro no ZIP dos anexos do chamado {chamado_id}: {str(e)}")
+        return jsonify({'error': 'Erro interno no servidor'}), 500
+
+@ti_bp.route('/anexos/zip')
+@login_required
+@setor_required('ti')
+def zip_anexos_filtro():
+    """ZIP dos anexos de vários chamados (ids=1,2,3 ou os filtros do histórico), uma pasta por chamado"""
+    from .zip_anexos import contar_anexos, filtrar_chamados, resposta_zip
+
+    try:
+        if not current_user.tem_permissao('Administrador') and not current_user.eh_agente_suporte_ativo():
+            return jsonify({'error': 'Sem permissão para baixar anexos em lote'}), 403
+
+        chamados = filtrar_chamados(request.args)
+        quantidade, _ = contar_anexos(chamados)
+        if not quantidade:
+            return jsonify({'error': 'Nenhum anexo para os filtros informados'}), 404
+
+        limite = current_app.config['ANEXOS_ZIP_MAX_ARQUIVOS']
+        if quantidade > limite:
+            return jsonify({'error': f'{quantidade} anexos encontrados; refine os filtros (máximo {limite})'}), 400
+
+        current_app.logger.info(f"ZIP de {quantidade} anexos por usuário {current_user.id}")
+        nome = f"anexos-{get_brazil_time().strftime('%Y%m%d-%H%M')}.zip"
+        return resposta_zip(chamados, nome, por_pasta=True)
+
+    except Exception as e:
+        current_app.logger.error(f"Erro no ZIP de anexos em lote: {str(e)}")
+        return jsonify({'error': 'Erro interno no servidor'}), 500
+
+@ti_bp.route('/anexos/estatisticas')
+@login_required
+@setor_required('ti')
+def estatisticas_anexos():
+    """Uso de espaço dos anexos por categoria, unidade e mês (planejamento de capacidade)"""
+    from .anexos_utils import get_attachment_statistics
+
+    if not current_user.tem_permissao('Administrador'):
+        return jsonify({'status': 'error', 'message': 'Sem permissão para visualizar estatísticas'}), 403
+
+    estatisticas = get_attachment_statistics()
+    if 'erro' in estatisticas:
+        current_app.logger.error(estatisticas['erro'])
+        return jsonify({'status': 'error', 'message': 'Erro interno no servidor'}), 500
+    return jsonify({'status': 'success', **estatisticas})
+
+def _erro_sessao_upload(e):
+    resposta = jsonify({'status': 'error', 'message': e.mensagem, **e.dados})
+    if 'offset' in e.dados:
+        resposta.headers['Upload-Offset'] = str(e.dados['offset'])
+    return resposta, e.status
+
+@ti_bp.route('/anexos/<int:chamado_id>/uploads', methods=['POST'])
+@login_required
+@setor_required('ti')
+def iniciar_upload_anexo(chamado_id):
+    """Inicia um upload retomável (vídeos grandes enviados em blocos)"""
+    from .uploads_retomaveis import ErroSessaoUpload, iniciar_sessao
+
+    try:
+        chamado = Chamado.query.get(chamado_id)
+        if not chamado:
+            return jsonify({'status': 'error', 'message': 'Chamado não encontrado'}), 404
+
+        if (chamado.usuario_id != current_user.id and
+            not current_user.tem_permissao('Administrador') and
+            not current_user.eh_agente_suporte_ativo()):
+            return jsonify({'status': 'error', 'message': 'Sem permissão para anexar arquivos a este chamado'}), 403
+
+        dados = request.get_json(silent=True) or {}
+        sessao = iniciar_sessao(
+            chamado.id, current_user.id, dados.get('nome', ''), dados.get('tipo_mime', ''),
+            dados.get('tamanho'), dados.get('sha256'), dados.get('descricao')
+        )
+        upload_url = url_for('ti.enviar_bloco_anexo', sessao_id=sessao.id)
+        resposta = jsonify({
+            'status': 'success',
+            'sessao_id': sessao.id,
+            'offset': 0,
+            'tamanho_bytes': sessao.tamanho_bytes,
+            'bloco_max': current_app.config['ANEXOS_UPLOAD_BLOCO_MAX'],
+            'upload_url': upload_url,
+            'concluir_url': url_for('ti.concluir_upload_anexo', sessao_id=sessao.id)
+        })
+        resposta.headers['Location'] = upload_url
+        return resposta, 201
+
+    except ErroSessaoUpload as e:
+        return _erro_sessao_upload(e)
+    except Exception as e:
+        current_app.logger.error(f"Erro ao iniciar upload para o chamado {chamado_id}: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Erro interno no servidor'}), 500
+
+@ti_bp.route('/anexos/uploads/<sessao_id>', methods=['GET', 'PUT', 'DELETE'])
+@login_required
+@setor_required('ti')
+def enviar_bloco_anexo(sessao_id):
+    """GET: offset para retomar; PUT: bloco no offset Upload-Offset; DELETE: cancela"""
+    from .uploads_retomaveis import ErroSessaoUpload, cancelar_sessao, gravar_bloco, obter_sessao, offset_atual
+
+    try:
+        sessao = obter_sessao(sessao_id, current_user.id)
+
+        if request.method == 'DELETE':
+            cancelar_sessao(sessao)
+            return jsonify({'status': 'success', 'message': 'Upload cancelado'})
+
+        if request.method == 'PUT':
+            try:
+                offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+            except ValueError:
+                return jsonify({'status': 'error', 'message': 'Header Upload-Offset obrigatório'}), 400
+            # Corpo cru (application/octet-stream), lido em blocos direto para o parcial
+            offset = gravar_bloco(sessao, offset, request.stream, request.content_length,
+                                  current_app.config['ANEXOS_UPLOAD_BLOCO_MAX'])
+        else:
+            offset = offset_atual(sessao)
+
+        resposta = jsonify({
+            'status': 'success',
+            'offset': offset,
+            'tamanho_bytes': sessao.tamanho_bytes,
+            'completo': offset == sessao.tamanho_bytes
+        })
+        resposta.headers['Upload-Offset'] = str(offset)
+        resposta.headers['Cache-Control'] = 'no-store'
+        return resposta
+
+    except ErroSessaoUpload as e:
+        return _erro_sessao_upload(e)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erro no upload retomável {sessao_id}: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Erro interno no servidor'}), 500
+
+@ti_bp.route('/anexos/uploads/<sessao_id>/concluir', methods=['POST'])
+@login_required
+@setor_required('ti')
+def concluir_upload_anexo(sessao_id):
+    """Confere o SHA-256 e registra o anexo enviado em blocos"""
+    from .uploads_retomaveis import ErroSessaoUpload, concluir_sessao, obter_sessao
+
+    try:
+        sessao = obter_sessao(sessao_id, current_user.id)
+        dados = request.get_json(silent=True) or {}
+        anexo = concluir_sessao(sessao, dados.get('sha256'))
+
+        current_app.logger.info(f"Anexo {anexo.nome_original} recebido em blocos para chamado {anexo.chamado_id}")
+        return jsonify({
+            'status': 'success',
+            'message': 'Arquivo enviado com sucesso',
+            'anexo': {
+                'id': anexo.id,
+                'nome_original': anexo.nome_original,
+                'tamanho_formatado': anexo.get_tamanho_formatado(),
+                'hash_arquivo': anexo.hash_arquivo,
+                'download_url': url_for('ti.download_anexo', anexo_id=anexo.id)
+            }
+        }), 201
+
+    except ErroSessaoUpload as e:
+        return _erro_sessao_upload(e)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erro ao concluir upload retomável {sessao_id}: {str(e)}")
+        return jsonify({'status': 'error', 'message': 'Erro interno no servidor'}), 500
+
 @ti_bp.route('/remover-anexo/<int:anexo_id>', methods=['DELETE'])
 @login_required
 @setor_required('ti')
@@ -1182,20 +1452,20 @@ def reabrir_chamado():
 
         if novo_chamado:
             # Notificar via Socket.IO
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_reaberto', {
-                    'novo_chamado': {
-                        'id': novo_chamado.id,
-                        'codigo': novo_chamado.codigo,
-                        'protocolo': novo_chamado.protocolo,
-                        'solicitante': novo_chamado.solicitante
-                    },
-                    'chamado_original': {
-                        'id': chamado_original.id,
-                        'codigo': chamado_original.codigo,
-                        'protocolo': chamado_original.protocolo
-                    }
-                })
+            # Volta para a fila; quem acompanhava o original também é avisado
+            emitir('chamado_reaberto', {
+                'novo_chamado': {
+                    'id': novo_chamado.id,
+                    'codigo': novo_chamado.codigo,
+                    'protocolo': novo_chamado.protocolo,
+                    'solicitante': novo_chamado.solicitante
+                },
+                'chamado_original': {
+                    'id': chamado_original.id,
+                    'codigo': chamado_original.codigo,
+                    'protocolo': chamado_original.protocolo
+                }
+            }, salas_do_chamado(novo_chamado, fila=True) + salas_do_chamado(chamado_original))
 
             # Log da ação
             from database import registrar_log_acao
@@ -1347,23 +1617,23 @@ def transferir_chamado(chamado_id):
 
         if transferencia:
             # Notificar via Socket.IO
-            if hasattr(current_app, 'socketio'):
-                current_app.socketio.emit('chamado_transferido', {
-                    'chamado': {
-                        'id': chamado.id,
-                        'codigo': chamado.codigo,
-                        'protocolo': chamado.protocolo
-                    },
-                    'agente_anterior': {
-                        'id': transferencia.agente_anterior.id if transferencia.agente_anterior else None,
-                        'nome': f"{transferencia.agente_anterior.usuario.nome} {transferencia.agente_anterior.usuario.sobrenome}" if transferencia.agente_anterior else 'Não atribuído'
-                    },
-                    'agente_novo': {
-                        'id': agente_destino.id,
-                        'nome': f"{agente_destino.usuario.nome} {agente_destino.usuario.sobrenome}"
-                    },
-                    'motivo': motivo
-                })
+            # Só os dois agentes envolvidos, administradores e quem acompanha o chamado
+            emitir('chamado_transferido', {
+                'chamado': {
+                    'id': chamado.id,
+                    'codigo': chamado.codigo,
+                    'protocolo': chamado.protocolo
+                },
+                'agente_anterior': {
+                    'id': transferencia.agente_anterior.id if transferencia.agente_anterior else None,
+                    'nome': f"{transferencia.agente_anterior.usuario.nome} {transferencia.agente_anterior.usuario.sobrenome}" if transferencia.agente_anterior else 'Não atribuído'
+                },
+                'agente_novo': {
+                    'id': agente_destino.id,
+                    'nome': f"{agente_destino.usuario.nome} {agente_destino.usuario.sobrenome}"
+                },
+                'motivo': motivo
+            }, salas_do_chamado(chamado, agentes=(transferencia.agente_anterior_id, agente_destino.id)))
 
             # Log da ação
             from database import registrar_log_acao
@@ -1532,6 +1802,7 @@ def obter_agentes_disponiveis():
 @ti_bp.route('/api/historico/chamados', methods=['GET'])
 @login_required
 @setor_required('ti')
+@conditional_response('chamados')
 def obter_historico_chamados():
     """Obtém histórico de chamados com filtros e paginação"""
     try:
@@ -1660,6 +1931,7 @@ def obter_historico_chamados():
 @ti_bp.route('/api/historico/transferencias', methods=['GET'])
 @login_required
 @setor_required('ti')
+@conditional_response('transferencias')
 def obter_historico_transferencias():
     """Obtém histórico de transferências com filtros e paginação"""
     try:
@@ -0,0 +1,107 @@
+"""
+Salas do Socket.IO: cada evento vai só para quem precisa dele
+
+- admin: administradores (nome já usado pelo agente_api)
+- agentes: todos os agentes de suporte ativos (fila de chamados abertos)
+- agente_<id>: um agente de suporte (AgenteSuporte.id)
+- unidade_<nome>: membros de grupos que cuidam da unidade (Chamado.unidade)
+- usuario_<id>: todas as abas de um usuário (ex.: o solicitante do chamado)
+- chamado_<id>: quem está acompanhando um chamado aberto na tela
+
+A sessão entra nas salas no connect autenticado (uma consulta para o agente
+e outra para as unidades); chamado_<id> é por pedido do cliente
+(acompanhar_chamado). emitir() manda para a união das salas: o python-socketio
+entrega uma vez só para quem está em mais de uma.
+"""
+import logging
+
+from flask import current_app
+from sqlalchemy import select
+
+from database import db, AgenteSuporte, ChamadoAgente, GrupoMembro, GrupoUnidade, GrupoUsuarios, Unidade
+from performance.metrics import registro
+
+logger = logging.getLogger(__name__)
+
+SALA_ADMINS = 'admin'
+SALA_AGENTES = 'agentes'
+
+
+def sala_agente(agente_id):
+    return f'agente_{agente_id}'
+
+
+def sala_unidade(unidade):
+    return f'unidade_{unidade}'
+
+
+def sala_usuario(usuario_id):
+    return f'usuario_{usuario_id}'
+
+
+def sala_chamado(chamado_id):
+    return f'chamado_{chamado_id}'
+
+
+def salas_do_usuario(usuario):
+    """Salas em que a sessão do usuário entra ao conectar"""
+    salas = [sala_usuario(usuario.id)]
+    if usuario.tem_permissao('Administrador'):
+        salas.append(SALA_ADMINS)
+
+    agente_id = db.session.execute(
+        select(AgenteSuporte.id).where(AgenteSuporte.usuario_id == usuario.id, AgenteSuporte.ativo.is_(True))
+    ).scalar()
+    if agente_id is not None:
+        salas += [SALA_AGENTES, sala_agente(agente_id)]
+
+    unidades = db.session.execute(
+        select(Unidade.nome).distinct()
+        .join(GrupoUnidade, GrupoUnidade.unidade_id == Unidade.id)
+        .join(GrupoUsuarios, GrupoUsuarios.id == GrupoUnidade.grupo_id)
+        .join(GrupoMembro, GrupoMembro.grupo_id == GrupoUsuarios.id)
+        .where(GrupoMembro.usuario_id == usuario.id, GrupoMembro.ativo.is_(True), GrupoUsuarios.ativo.is_(True))
+    ).scalars()
+    salas += [sala_unidade(nome) for nome in unidades]
+    return salas
+
+
+def pode_acompanhar(usuario, chamado):
+    """Solicitante, administradores e agentes podem acompanhar o chamado"""
+    return (chamado.usuario_id == usuario.id
+            or usuario.tem_permissao('Administrador')
+            or usuario.eh_agente_suporte_ativo())
+
+
+def agente_do_chamado(chamado_id):
+    """AgenteSuporte.id do atribuído ativo (None se não houver)"""
+    return db.session.execute(
+        select(ChamadoAgente.agente_id).where(ChamadoAgente.chamado_id == chamado_id, ChamadoAgente.ativo.is_(True))
+    ).scalar()
+
+
+def salas_do_chamado(chamado, agentes=(), fila=False):
+    """
+    Público de um evento do chamado: administradores, quem o acompanha, o
+    solicitante e os agentes informados. fila=True inclui todos os agentes e
+    a unidade (chamado novo ou reaberto, ainda sem responsável).
+    """
+    salas = [SALA_ADMINS, sala_chamado(chamado.id)]
+    if chamado.usuario_id:
+        salas.append(sala_usuario(chamado.usuario_id))
+    if fila:
+        salas.append(SALA_AGENTES)
+        if chamado.unidade:
+            salas.append(sala_unidade(chamado.unidade))
+    salas += [sala_agente(agente_id) for agente_id in agentes if agente_id]
+    return salas
+
+
+def emitir(evento, dados, salas):
+    """Emite o evento para a união das salas (cada sessão recebe uma vez)"""
+    socketio = getattr(current_app, 'socketio', None)
+    if socketio is None:
+        return
+    salas = list(dict.fromkeys(salas))
+    socketio.emit(evento, dados, to=salas)
+    registro.incrementar('socketio_eventos_total', 1, 'Eventos Socket.IO emitidos', evento=evento)
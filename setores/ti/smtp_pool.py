@@ -0,0 +1,195 @@
+"""
+Pool de conexões SMTP autenticadas
+
+Cada conexão faz EHLO/STARTTLS/login uma única vez e é reaproveitada para
+várias mensagens. Conexões são descartadas após max_mensagens envios, quando
+ficam ociosas por muito tempo sem responder ao NOOP, ou em qualquer erro de
+conexão; o envio é repetido uma vez em uma conexão nova.
+
+enviar_blocos() transmite a mensagem já em formato MIME bloco a bloco no
+DATA, sem montar a mensagem inteira em memória (anexos grandes).
+"""
+import logging
+import smtplib
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from performance.metrics import registro
+
+logger = logging.getLogger(__name__)
+
+# Erros que indicam conexão inutilizável. Não dá para usar OSError: as
+# SMTPException (destinatário recusado, DATA rejeitado...) herdam dele e não
+# devem ser repetidas em outra conexão.
+ERROS_CONEXAO = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                 ConnectionError, TimeoutError, socket.gaierror)
+
+
+class ConexaoSMTP:
+    __slots__ = ('smtp', 'mensagens', 'ultimo_uso')
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.mensagens = 0
+        self.ultimo_uso = time.monotonic()
+
+    def fechar(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class PoolSMTP:
+    def __init__(self, servidor, porta, usuario, senha, usar_starttls=True,
+                 tamanho=3, max_mensagens=100, ocioso_max=30, timeout=30):
+        self.servidor = servidor
+        self.porta = porta
+        self.usuario = usuario
+        self.senha = senha
+        self.usar_starttls = usar_starttls
+        self.tamanho = tamanho
+        self.max_mensagens = max_mensagens
+        self.ocioso_max = ocioso_max
+        self.timeout = timeout
+
+        self._ociosas = deque()
+        self._lock = threading.Lock()
+        self._vagas = threading.BoundedSemaphore(tamanho)
+
+    def _conectar(self):
+        inicio = time.perf_counter()
+        smtp = smtplib.SMTP(self.servidor, self.porta, timeout=self.timeout)
+        try:
+            if self.usar_starttls:
+                smtp.starttls()
+            smtp.login(self.usuario, self.senha)
+        except Exception:
+            smtp.close()
+            raise
+        registro.incrementar('smtp_connections_total', 1, 'Conexões SMTP abertas')
+        logger.debug(f"📡 Conexão SMTP aberta em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        return ConexaoSMTP(smtp)
+
+    def _obter_ociosa(self):
+        while True:
+            with self._lock:
+                if not self._ociosas:
+                    return None
+                conexao = self._ociosas.pop()
+            if time.monotonic() - conexao.ultimo_uso < self.ocioso_max:
+                return conexao
+            # Ociosa há muito tempo: o servidor pode ter encerrado a sessão
+            try:
+                if conexao.smtp.noop()[0] == 250:
+                    return conexao
+            except Exception:
+                pass
+            conexao.fechar()
+
+    @contextmanager
+    def conexao(self):
+        """Empresta uma conexão autenticada; descartada se o bloco falhar"""
+        if not self._vagas.acquire(timeout=self.timeout):
+            raise TimeoutError("Nenhuma conexão SMTP livre no pool")
+        conexao = None
+        try:
+            conexao = self._obter_ociosa() or self._conectar()
+            yield conexao
+        except BaseException:
+            if conexao is not None:
+                conexao.fechar()
+                conexao = None
+            raise
+        finally:
+            if conexao is not None:
+                conexao.ultimo_uso = time.monotonic()
+                if conexao.mensagens >= self.max_mensagens:
+                    conexao.fechar()
+                else:
+                    with self._lock:
+                        self._ociosas.append(conexao)
+            self._vagas.release()
+
+    def enviar(self, mensagem):
+        """Envia uma mensagem (email.message); repete uma vez se a conexão caiu"""
+        for tentativa in (1, 2):
+            try:
+                with self.conexao() as conexao:
+                    conexao.smtp.send_message(mensagem)
+                    conexao.mensagens += 1
+                registro.incrementar('smtp_messages_total', 1, 'Mensagens enviadas por SMTP')
+                return
+            except ERROS_CONEXAO as e:
+                if tentativa == 2:
+                    raise
+                logger.warning(f"🔌 Conexão SMTP perdida ({str(e)}), reconectando...")
+            except smtplib.SMTPException:
+                # Problema da mensagem: repetir não adianta
+                raise
+
+    def enviar_blocos(self, remetente, destinatarios, gerar_blocos):
+        """
+        Envia uma mensagem MIME pronta (CRLF, com pontos já duplicados)
+        escrevendo no socket bloco a bloco. gerar_blocos() é chamado a cada
+        tentativa e devolve um iterável de bytes.
+        """
+        for tentativa in (1, 2):
+            try:
+                with self.conexao() as conexao:
+                    self._transmitir(conexao.smtp, remetente, destinatarios, gerar_blocos())
+                    conexao.mensagens += 1
+                registro.incrementar('smtp_messages_total', 1, 'Mensagens enviadas por SMTP')
+                return
+            except ERROS_CONEXAO as e:
+                if tentativa == 2:
+                    raise
+                logger.warning(f"🔌 Conexão SMTP perdida ({str(e)}), reconectando...")
+            except smtplib.SMTPException:
+                # Problema da mensagem: repetir não adianta
+                raise
+
+    def _transmitir(self, smtp, remetente, destinatarios, blocos):
+        smtp.ehlo_or_helo_if_needed()
+        codigo, resposta = smtp.mail(remetente)
+        if codigo != 250:
+            smtp.rset()
+            raise smtplib.SMTPSenderRefused(codigo, resposta, remetente)
+
+        recusados = {}
+        for destinatario in destinatarios:
+            codigo, resposta = smtp.rcpt(destinatario)
+            if codigo not in (250, 251):
+                recusados[destinatario] = (codigo, resposta)
+        if len(recusados) == len(destinatarios):
+            smtp.rset()
+            raise smtplib.SMTPRecipientsRefused(recusados)
+
+        codigo, resposta = smtp.docmd('DATA')
+        if codigo != 354:
+            smtp.rset()
+            raise smtplib.SMTPDataError(codigo, resposta)
+
+        ultimo = b'\r\n'
+        for bloco in blocos:
+            if bloco:
+                smtp.send(bloco)
+                ultimo = bloco
+        smtp.send(b'.\r\n' if ultimo.endswith(b'\r\n') else b'\r\n.\r\n')
+
+        codigo, resposta = smtp.getreply()
+        if codigo != 250:
+            raise smtplib.SMTPDataError(codigo, resposta)
+
+    def fechar(self):
+        with self._lock:
+            conexoes = list(self._ociosas)
+            self._ociosas.clear()
+        for conexao in conexoes:
+            conexao.fechar()
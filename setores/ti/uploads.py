@@ -0,0 +1,229 @@
+"""
+Recebimento de anexos em uma única passagem
+
+- RequestAnexos troca o destino dos arquivos do multipart: em vez do
+  SpooledTemporaryFile do Werkzeug, cada arquivo vai para um temporário na
+  pasta dos blobs, com SHA-256, tamanho e primeiros bytes calculados enquanto
+  o corpo da requisição é lido (blocos de TAMANHO_BLOCO_UPLOAD)
+- Passou do limite da extensão (MAX_FILE_SIZE, MAX_VIDEO_SIZE), o restante do
+  arquivo é descartado sem ir para o disco e o upload é recusado
+- O tipo real é detectado pelos primeiros bytes e precisa bater com a extensão
+- save_uploaded_file só renomeia o temporário para o blob: nada é relido
+"""
+import hashlib
+import os
+import tempfile
+
+from flask import Request
+from werkzeug.formparser import FormDataParser, MultiPartParser
+
+from setores.ti.anexos_utils import get_max_file_size
+from setores.ti.blob_store import pasta_temporarios
+
+TAMANHO_BLOCO_UPLOAD = 1024 * 1024
+TAMANHO_CABECALHO = 512
+
+# Tipos detectados aceitos para cada extensão permitida
+TIPOS_POR_EXTENSAO = {
+    'jpg': {'image/jpeg'},
+    'jpeg': {'image/jpeg'},
+    'png': {'image/png'},
+    'gif': {'image/gif'},
+    'webp': {'image/webp'},
+    'bmp': {'image/bmp'},
+    'mp4': {'video/mp4', 'video/quicktime'},
+    'mov': {'video/quicktime', 'video/mp4'},
+    'avi': {'video/avi'},
+    'wmv': {'video/x-ms-wmv'},
+    'flv': {'video/x-flv'},
+    'webm': {'video/webm'},
+    'mkv': {'video/webm'},
+    'pdf': {'application/pdf'},
+    'doc': {'application/x-ole-storage'},
+    'xls': {'application/x-ole-storage'},
+    'ppt': {'application/x-ole-storage'},
+    'docx': {'application/zip'},
+    'xlsx': {'application/zip'},
+    'pptx': {'application/zip'},
+    'txt': {'text/plain'},
+}
+
+ATOMOS_QUICKTIME = (b'moov', b'mdat', b'wide', b'free', b'skip', b'pnot')
+
+# Tamanhos válidos do cabeçalho DIB (BITMAPCOREHEADER ... BITMAPV5HEADER)
+TAMANHOS_CABECALHO_BMP = {12, 16, 40, 52, 56, 64, 108, 124}
+
+# Controles que não aparecem em texto (tab, quebras de linha e form feed são aceitos)
+CONTROLES_BINARIOS = bytes(c for c in range(32) if c not in (9, 10, 12, 13)) + b'\x7f'
+
+
+def _eh_bmp(cabecalho):
+    """'BM' sozinho casa com texto comum: confere também o tamanho do cabeçalho DIB"""
+    return (cabecalho.startswith(b'BM') and len(cabecalho) >= 18
+            and int.from_bytes(cabecalho[14:18], 'little') in TAMANHOS_CABECALHO_BMP)
+
+
+def _eh_texto(cabecalho):
+    """UTF-8, UTF-16 com BOM ou Windows-1252 (arquivos salvos pelo Bloco de Notas)"""
+    if cabecalho.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return True
+    if any(c in CONTROLES_BINARIOS for c in cabecalho):
+        return False
+    try:
+        cabecalho.decode('utf-8')
+        return True
+    except UnicodeDecodeError as e:
+        # Caractere multibyte cortado no fim do cabeçalho
+        if e.start >= len(cabecalho) - 3 and e.reason == 'unexpected end of data':
+            return True
+    try:
+        cabecalho.decode('cp1252')
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detectar_mime(cabecalho):
+    """Tipo do arquivo pela assinatura dos primeiros bytes (None se desconhecido)"""
+    if cabecalho.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if cabecalho.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if cabecalho[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if cabecalho[:4] == b'RIFF' and cabecalho[8:12] == b'WEBP':
+        return 'image/webp'
+    if cabecalho[:4] == b'RIFF' and cabecalho[8:12] == b'AVI ':
+        return 'video/avi'
+    if _eh_bmp(cabecalho):
+        return 'image/bmp'
+    if cabecalho.startswith(b'%PDF-'):
+        return 'application/pdf'
+    if cabecalho.startswith(b'PK\x03\x04'):
+        return 'application/zip'
+    if cabecalho.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return 'application/x-ole-storage'
+    if cabecalho[4:8] == b'ftyp':
+        return 'video/quicktime' if cabecalho[8:12] == b'qt  ' else 'video/mp4'
+    if cabecalho[4:8] in ATOMOS_QUICKTIME:
+        return 'video/quicktime'
+    if cabecalho.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video/webm'
+    if cabecalho.startswith(b'FLV'):
+        return 'video/x-flv'
+    if cabecalho.startswith(b'\x30\x26\xb2\x75\x8e\x66\xcf\x11'):
+        return 'video/x-ms-wmv'
+    if _eh_texto(cabecalho):
+        return 'text/plain'
+    return None
+
+
+def validar_conteudo(cabecalho, extensao):
+    """Confere se os primeiros bytes correspondem à extensão do arquivo"""
+    esperados = TIPOS_POR_EXTENSAO.get(extensao)
+    if esperados is None:
+        return False, f"Extensão '{extensao}' não permitida"
+    detectado = detectar_mime(cabecalho)
+    if extensao == 'txt':
+        # Texto não tem assinatura: basta não ser um dos formatos binários conhecidos
+        if detectado not in (None, 'text/plain'):
+            return False, "Conteúdo do arquivo não corresponde à extensão '.txt'"
+        return True, "Conteúdo válido"
+    if detectado not in esperados:
+        return False, f"Conteúdo do arquivo não corresponde à extensão '.{extensao}'"
+    return True, "Conteúdo válido"
+
+
+class ArquivoRecebido:
+    """
+    Destino de um arquivo do multipart: grava em um temporário e calcula
+    hash, tamanho e cabeçalho a cada write. Acima do limite, descarta.
+    """
+
+    def __init__(self, pasta, limite=None):
+        os.makedirs(pasta, exist_ok=True)
+        fd, self.caminho = tempfile.mkstemp(dir=pasta, prefix='upload-')
+        self._arquivo = os.fdopen(fd, 'w+b')
+        self._sha256 = hashlib.sha256()
+        self.limite = limite
+        self.tamanho = 0
+        self.excedido = False
+        self.cabecalho = b''
+
+    @classmethod
+    def de_arquivo(cls, caminho):
+        """Adota um arquivo já gravado (upload retomável): calcula hash e cabeçalho lendo-o uma vez"""
+        recebido = cls.__new__(cls)
+        recebido.caminho = caminho
+        recebido._arquivo = open(caminho, 'r+b')
+        recebido._sha256 = hashlib.sha256()
+        recebido.limite = None
+        recebido.tamanho = 0
+        recebido.excedido = False
+        recebido.cabecalho = b''
+        for bloco in iter(lambda: recebido._arquivo.read(TAMANHO_BLOCO_UPLOAD), b''):
+            recebido.tamanho += len(bloco)
+            if len(recebido.cabecalho) < TAMANHO_CABECALHO:
+                recebido.cabecalho += bloco[:TAMANHO_CABECALHO - len(recebido.cabecalho)]
+            recebido._sha256.update(bloco)
+        recebido._arquivo.seek(0)
+        return recebido
+
+    def write(self, dados):
+        self.tamanho += len(dados)
+        if self.excedido:
+            return len(dados)
+        if self.limite is not None and self.tamanho > self.limite:
+            # O restante do arquivo só é contado, não vai para o disco
+            self.excedido = True
+            self._arquivo.seek(0)
+            self._arquivo.truncate()
+            return len(dados)
+        if len(self.cabecalho) < TAMANHO_CABECALHO:
+            self.cabecalho += dados[:TAMANHO_CABECALHO - len(self.cabecalho)]
+        self._sha256.update(dados)
+        return self._arquivo.write(dados)
+
+    @property
+    def hash_arquivo(self):
+        return self._sha256.hexdigest()
+
+    def __getattr__(self, nome):
+        # read, readline, seek, tell, flush... vão direto para o temporário
+        return getattr(self._arquivo, nome)
+
+    def __iter__(self):
+        return iter(self._arquivo)
+
+    def close(self):
+        self._arquivo.close()
+        # Se foi publicado como blob o temporário já não existe
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+
+class ParserAnexos(FormDataParser):
+    """FormDataParser que lê o corpo do multipart em blocos maiores"""
+
+    def _parse_multipart(self, stream, mimetype, content_length, options):
+        parser = MultiPartParser(
+            stream_factory=self.stream_factory,
+            charset=self.charset if self.charset != 'utf-8' else None,
+            errors=self.errors if self.errors != 'replace' else None,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.cls,
+            buffer_size=TAMANHO_BLOCO_UPLOAD
+        )
+        boundary = options.get('boundary', '').encode('ascii')
+        if not boundary:
+            raise ValueError('Missing boundary')
+        form, files = parser.parse(stream, boundary, content_length)
+        return stream, form, files
+
+
+class RequestAnexos(Request):
+    form_data_parser_class = ParserAnexos
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return ArquivoRecebido(pasta_temporarios(), limite=get_max_file_size(filename))
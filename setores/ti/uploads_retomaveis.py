@@ -0,0 +1,226 @@
+"""
+Upload retomável de anexos (vídeos grandes em conexões instáveis)
+
+Protocolo:
+1. POST /ti/anexos/<chamado_id>/uploads {nome, tipo_mime, tamanho, sha256?}
+   valida extensão, tipo, tamanho e a cota do chamado antes de qualquer byte
+2. PUT /ti/anexos/uploads/<id> com o header Upload-Offset e o bloco no corpo
+   (application/octet-stream, até ANEXOS_UPLOAD_BLOCO_MAX). O offset precisa
+   ser exatamente o que o servidor já tem; se não for, a resposta é 409 com o
+   offset certo. GET na mesma URL informa o offset para retomar
+3. POST /ti/anexos/uploads/<id>/concluir {sha256?}: confere o hash do
+   arquivo inteiro e passa pelo save_uploaded_file (mesmas validações de
+   conteúdo e cota do upload comum, publicação no armazenamento por hash)
+
+O arquivo parcial fica em blobs/tmp/sessoes/<id>.parte (mesmo disco dos
+blobs: concluir é um rename). O tamanho do parcial é a fonte da verdade do
+offset, então um bloco interrompido no meio não se perde. Sessões sem
+atividade há ANEXOS_UPLOAD_SESSAO_EXPIRA segundos são apagadas na coleta.
+"""
+import logging
+import os
+import re
+import time
+import uuid
+from datetime import timedelta
+
+from werkzeug.datastructures import FileStorage
+
+from database import db, SessaoUploadAnexo, get_brazil_time
+from performance.metrics import registro
+from setores.ti.anexos_utils import is_allowed_file, save_uploaded_file, validate_file_size
+from setores.ti.blob_store import pasta_temporarios
+from setores.ti.uploads import TAMANHO_BLOCO_UPLOAD, ArquivoRecebido
+
+logger = logging.getLogger(__name__)
+
+PASTA_SESSOES = 'sessoes'
+EXTENSAO_PARCIAL = '.parte'
+MAX_SESSOES_POR_USUARIO = 5
+PADRAO_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ErroSessaoUpload(Exception):
+    def __init__(self, mensagem, status=400, **dados):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.status = status
+        self.dados = dados
+
+
+def _agora():
+    return get_brazil_time().replace(tzinfo=None)
+
+
+def pasta_sessoes():
+    return os.path.join(pasta_temporarios(), PASTA_SESSOES)
+
+
+def caminho_parcial(sessao_id):
+    return os.path.join(pasta_sessoes(), f"{sessao_id}{EXTENSAO_PARCIAL}")
+
+
+def _normalizar_hash(valor):
+    if not valor:
+        return None
+    valor = valor.strip().lower()
+    if not PADRAO_SHA256.match(valor):
+        raise ErroSessaoUpload('sha256 deve ter 64 caracteres hexadecimais')
+    return valor
+
+
+def _remover_parcial(sessao_id):
+    try:
+        os.remove(caminho_parcial(sessao_id))
+    except FileNotFoundError:
+        pass
+
+
+def iniciar_sessao(chamado_id, usuario_id, nome, tipo_mime, tamanho, hash_esperado=None, descricao=None):
+    """Valida o arquivo anunciado e cria a sessão com o parcial vazio"""
+    is_valid, message = is_allowed_file(nome, tipo_mime)
+    if not is_valid:
+        raise ErroSessaoUpload(message)
+    try:
+        tamanho = int(tamanho)
+    except (TypeError, ValueError):
+        raise ErroSessaoUpload('Tamanho do arquivo inválido')
+    if tamanho <= 0:
+        raise ErroSessaoUpload('Tamanho do arquivo inválido')
+    # Cota do chamado conferida já no início (e de novo ao concluir)
+    is_valid, message = validate_file_size(tamanho, chamado_id, nome)
+    if not is_valid:
+        raise ErroSessaoUpload(message, status=413)
+
+    abertas = SessaoUploadAnexo.query.filter_by(usuario_id=usuario_id).count()
+    if abertas >= MAX_SESSOES_POR_USUARIO:
+        raise ErroSessaoUpload('Muitos uploads em andamento; conclua ou cancele algum', status=429)
+
+    sessao = SessaoUploadAnexo(
+        id=uuid.uuid4().hex,
+        chamado_id=chamado_id,
+        usuario_id=usuario_id,
+        nome_original=nome,
+        tipo_mime=tipo_mime,
+        tamanho_bytes=tamanho,
+        hash_esperado=_normalizar_hash(hash_esperado),
+        descricao=descricao
+    )
+    os.makedirs(pasta_sessoes(), exist_ok=True)
+    open(caminho_parcial(sessao.id), 'xb').close()
+    try:
+        db.session.add(sessao)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        _remover_parcial(sessao.id)
+        raise
+
+    registro.incrementar('anexos_uploads_retomaveis_total', 1, 'Uploads retomáveis por etapa', etapa='iniciado')
+    return sessao
+
+
+def obter_sessao(sessao_id, usuario_id):
+    sessao = SessaoUploadAnexo.query.get(sessao_id)
+    if sessao is None or sessao.usuario_id != usuario_id:
+        raise ErroSessaoUpload('Sessão de upload não encontrada', status=404)
+    return sessao
+
+
+def offset_atual(sessao):
+    try:
+        return os.path.getsize(caminho_parcial(sessao.id))
+    except FileNotFoundError:
+        raise ErroSessaoUpload('Sessão de upload expirada; inicie o envio novamente', status=410)
+
+
+def gravar_bloco(sessao, offset, stream, tamanho_bloco, bloco_max):
+    """Acrescenta um bloco no offset informado; devolve o novo offset"""
+    atual = offset_atual(sessao)
+    if offset != atual:
+        raise ErroSessaoUpload('Offset não corresponde ao recebido', status=409, offset=atual)
+    if tamanho_bloco is None:
+        raise ErroSessaoUpload('Content-Length obrigatório', status=411)
+    if tamanho_bloco > bloco_max:
+        raise ErroSessaoUpload(f'Bloco maior que {bloco_max} bytes', status=413)
+    if offset + tamanho_bloco > sessao.tamanho_bytes:
+        raise ErroSessaoUpload('Bloco ultrapassa o tamanho anunciado do arquivo', status=413, offset=atual)
+
+    restante = tamanho_bloco
+    with open(caminho_parcial(sessao.id), 'r+b') as parcial:
+        parcial.seek(offset)
+        while restante:
+            dados = stream.read(min(TAMANHO_BLOCO_UPLOAD, restante))
+            if not dados:
+                break  # Conexão caiu: o que chegou fica e o cliente retoma dali
+            parcial.write(dados)
+            restante -= len(dados)
+
+    sessao.data_atualizacao = _agora()
+    db.session.commit()
+    return offset + tamanho_bloco - restante
+
+
+def concluir_sessao(sessao, hash_informado=None):
+    """Confere o hash e registra o anexo; a sessão é encerrada em qualquer caso que não seja de offset"""
+    atual = offset_atual(sessao)
+    if atual != sessao.tamanho_bytes:
+        raise ErroSessaoUpload('Upload incompleto', status=409, offset=atual)
+
+    esperado = _normalizar_hash(hash_informado) or sessao.hash_esperado
+    arquivo = ArquivoRecebido.de_arquivo(caminho_parcial(sessao.id))
+    try:
+        if esperado and arquivo.hash_arquivo != esperado:
+            registro.incrementar('anexos_uploads_retomaveis_total', 1, 'Uploads retomáveis por etapa',
+                                 etapa='hash_divergente')
+            raise ErroSessaoUpload('SHA-256 do arquivo recebido não confere; envie o arquivo novamente', status=422)
+
+        # Mesmo caminho do upload comum: extensão, conteúdo real, cota e blob
+        success, message, anexo = save_uploaded_file(
+            FileStorage(stream=arquivo, filename=sessao.nome_original, content_type=sessao.tipo_mime),
+            sessao.chamado_id, sessao.usuario_id, sessao.descricao
+        )
+        if not success:
+            raise ErroSessaoUpload(message)
+    finally:
+        # Publicado vira blob (rename); recusado, o parcial é apagado aqui
+        arquivo.close()
+        db.session.delete(sessao)
+        db.session.commit()
+
+    registro.incrementar('anexos_uploads_retomaveis_total', 1, 'Uploads retomáveis por etapa', etapa='concluido')
+    return anexo
+
+
+def cancelar_sessao(sessao):
+    _remover_parcial(sessao.id)
+    db.session.delete(sessao)
+    db.session.commit()
+
+
+def coletar_sessoes(expira, simular=False):
+    """Apaga sessões sem atividade há mais de `expira` segundos e parciais sem sessão"""
+    limite = _agora() - timedelta(seconds=expira)
+    removidas = 0
+    for sessao in SessaoUploadAnexo.query.filter(SessaoUploadAnexo.data_atualizacao < limite).all():
+        removidas += 1
+        if not simular:
+            _remover_parcial(sessao.id)
+            db.session.delete(sessao)
+    if not simular:
+        db.session.commit()
+
+    pasta = pasta_sessoes()
+    if os.path.isdir(pasta):
+        limite_mtime = time.time() - expira
+        for entrada in os.scandir(pasta):
+            if not entrada.name.endswith(EXTENSAO_PARCIAL) or entrada.stat().st_mtime > limite_mtime:
+                continue
+            if SessaoUploadAnexo.query.get(entrada.name[:-len(EXTENSAO_PARCIAL)]) is None:
+                removidas += 1
+                if not simular:
+                    os.remove(entrada.path)
+
+    if removidas and not simular:
+        logger.info(f"🧹 {removidas} sessão(ões) de upload abandonada(s) removida(s)")
+    return removidas
@@ -0,0 +1,222 @@
+"""
+Serialização JSON centralizada para as APIs do TI
+
+- Usa orjson quando disponível e cai para o json da biblioteca padrão
+- Mesma saída do jsonify padrão do Flask: chaves ordenadas, datas em
+  RFC 822 (http_date), Decimal e UUID como texto; set e objetos com
+  to_dict() também são aceitos
+- Serializadores declarativos por modelo (Chamado, ChamadoAnexo, User)
+"""
+import dataclasses
+import json
+import logging
+import uuid
+from datetime import date, time
+from decimal import Decimal
+from operator import attrgetter
+
+from flask import current_app, jsonify
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Datas passam pelo _converter (o orjson geraria ISO 8601) e as chaves saem ordenadas, como no Flask
+ORJSON_OPCOES = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                 | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+
+def _converter(obj):
+    """Converte tipos que não são nativos do JSON (mesmas regras do provider padrão do Flask)"""
+    if isinstance(obj, date):
+        return http_date(obj)
+    if isinstance(obj, time):
+        return obj.isoformat()
+    if isinstance(obj, (Decimal, uuid.UUID)):
+        return str(obj)
+    if dataclasses.is_dataclass(obj):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if hasattr(obj, '__html__'):
+        return str(obj.__html__())
+    raise TypeError(f"Objeto do tipo {type(obj).__name__} não é serializável em JSON")
+
+
+def dumps(obj):
+    """Serializa para bytes UTF-8"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_converter, option=ORJSON_OPCOES)
+    return json.dumps(obj, default=_converter, ensure_ascii=False, sort_keys=True,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def loads(dados):
+    """Desserializa bytes ou str"""
+    if orjson is not None:
+        return orjson.loads(dados)
+    return json.loads(dados)
+
+
+class JSONProviderRapido(DefaultJSONProvider):
+    """Provider do Flask que faz jsonify() passar pela mesma serialização"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Chamadas com opções explícitas (indent, sort_keys...) mantêm o comportamento padrão
+            kwargs.setdefault('default', _converter)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return json.loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b'\n', mimetype=self.mimetype)
+
+
+def json_response(data, status=200):
+    """Retorna resposta JSON padronizada"""
+    try:
+        response = current_app.response_class(dumps(data), mimetype='application/json')
+    except TypeError as e:
+        logger.error(f"Erro ao criar resposta JSON: {str(e)}")
+        response = jsonify({'error': 'Erro interno de serialização'})
+        status = 500
+    response.status_code = status
+    return response
+
+
+def error_response(message, status=400, details=None):
+    """Retorna erro JSON padronizado"""
+    data = {'error': message}
+    if details:
+        data['details'] = details
+    return json_response(data, status)
+
+
+# ==================== SERIALIZADORES DECLARATIVOS ====================
+
+def data(atributo, formato='%d/%m/%Y %H:%M:%S'):
+    """Campo de data formatado com strftime (None quando vazio)"""
+    obter = attrgetter(atributo)
+
+    def formatar(obj):
+        valor = obter(obj)
+        return valor.strftime(formato) if valor else None
+    return formatar
+
+
+def nome_completo(atributo=None, padrao=None):
+    """Campo 'nome sobrenome' de um usuário (ou do relacionamento informado)"""
+    obter = attrgetter(atributo) if atributo else (lambda obj: obj)
+
+    def formatar(obj):
+        usuario = obter(obj)
+        return f"{usuario.nome} {usuario.sobrenome}" if usuario else padrao
+    return formatar
+
+
+def metodo(nome):
+    """Campo calculado por um método do modelo"""
+    return lambda obj: getattr(obj, nome)()
+
+
+class Serializador:
+    """
+    Serializador declarativo: {chave: origem}, onde origem é o nome do atributo
+    (aceita caminho com pontos) ou uma função que recebe o objeto.
+    """
+
+    def __init__(self, campos):
+        self.campos = dict(campos)
+        # Atributos simples são lidos de uma vez com um único attrgetter
+        self._chaves_simples = tuple(c for c, o in self.campos.items() if isinstance(o, str))
+        origens = [self.campos[c] for c in self._chaves_simples]
+        if len(origens) > 1:
+            self._obter_simples = attrgetter(*origens)
+        elif origens:
+            obter = attrgetter(origens[0])
+            self._obter_simples = lambda obj: (obter(obj),)
+        else:
+            self._obter_simples = lambda obj: ()
+        self._calculados = tuple((c, o) for c, o in self.campos.items() if not isinstance(o, str))
+
+    def __call__(self, obj):
+        resultado = dict(zip(self._chaves_simples, self._obter_simples(obj)))
+        for chave, obter in self._calculados:
+            resultado[chave] = obter(obj)
+        return resultado
+
+    def muitos(self, objs):
+        return [self(obj) for obj in objs]
+
+    def estender(self, **campos):
+        novos = dict(self.campos)
+        novos.update(campos)
+        return Serializador(novos)
+
+    def somente(self, *chaves):
+        return Serializador({chave: self.campos[chave] for chave in chaves})
+
+
+CHAMADO = Serializador({
+    'id': 'id',
+    'codigo': 'codigo',
+    'protocolo': 'protocolo',
+    'solicitante': 'solicitante',
+    'email': 'email',
+    'cargo': 'cargo',
+    'telefone': 'telefone',
+    'unidade': 'unidade',
+    'problema': 'problema',
+    'descricao': 'descricao',
+    'internet_item': 'internet_item',
+    'data_visita': data('data_visita', '%d/%m/%Y'),
+    'data_abertura': data('data_abertura'),
+    'status': 'status',
+    'prioridade': 'prioridade',
+    'visita_tecnica': lambda c: getattr(c, 'visita_tecnica', False),
+})
+
+ANEXO = Serializador({
+    'id': 'id',
+    'chamado_id': 'chamado_id',
+    'nome_original': 'nome_original',
+    'nome_arquivo': 'nome_arquivo',
+    'tamanho_bytes': 'tamanho_bytes',
+    'tamanho_formatado': metodo('get_tamanho_formatado'),
+    'tipo_mime': 'tipo_mime',
+    'extensao': 'extensao',
+    'data_upload': data('data_upload'),
+    'usuario_upload': nome_completo('usuario_upload'),
+    'descricao': 'descricao',
+    'tipo_arquivo': metodo('get_tipo_arquivo'),
+    'icone': metodo('get_icone_arquivo'),
+    'is_image': metodo('is_image'),
+    'is_video': metodo('is_video'),
+    'is_document': metodo('is_document'),
+})
+
+USUARIO = Serializador({
+    'id': 'id',
+    'nome': 'nome',
+    'sobrenome': 'sobrenome',
+    'email': 'email',
+    'usuario': 'usuario',
+    'nivel_acesso': 'nivel_acesso',
+    'setor': 'setor',
+    'bloqueado': lambda u: getattr(u, 'bloqueado', False),
+    'ativo': lambda u: getattr(u, 'ativo', True),
+    'data_cadastro': data('data_criacao', '%d/%m/%Y'),
+})
@@ -0,0 +1,113 @@
+"""
+Registro de templates de e-mail
+
+- Todos os templates de setores/ti/templates/emails são compilados uma única
+  vez, no primeiro uso, em um Environment compartilhado (thread-safe)
+- Bytecode em cache no disco (EMAIL_TEMPLATES_CACHE_DIR ou diretório
+  temporário), então novos workers não recompilam o Jinja
+- preparar() renderiza as partes comuns uma vez e devolve fragmentos
+  estáticos; por destinatário só os campos variáveis são escapados e unidos
+"""
+import logging
+import os
+import re
+import threading
+import time
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from markupsafe import Markup, escape
+
+logger = logging.getLogger(__name__)
+
+PASTA_TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+PREFIXO = 'emails/'
+
+_MARCADOR = '\x1e{}\x1e'
+_RE_MARCADOR = re.compile('\x1e(\\w+)\x1e')
+
+
+class TemplatePreparado:
+    """Template com o contexto comum já aplicado; só os campos variáveis mudam"""
+
+    __slots__ = ('nome', 'variaveis', '_partes', '_template', '_contexto')
+
+    def __init__(self, template, variaveis, contexto):
+        self.nome = template.name
+        self.variaveis = tuple(variaveis)
+        self._template = template
+        self._contexto = contexto
+
+        marcadores = {campo: Markup(_MARCADOR.format(campo)) for campo in self.variaveis}
+        html = template.render(**contexto, **marcadores)
+        partes = _RE_MARCADOR.split(html)
+        encontrados = set(partes[1::2])
+
+        if encontrados == set(self.variaveis):
+            self._partes = partes
+        else:
+            # Campo variável passou por filtro ou condição: renderização completa por chamada
+            logger.debug(f"Template {self.nome}: campos {set(self.variaveis) - encontrados} sem fragmento fixo")
+            self._partes = None
+
+    def render(self, **valores):
+        if self._partes is None:
+            return self._template.render(**self._contexto, **valores)
+        partes = self._partes[:]
+        for i in range(1, len(partes), 2):
+            partes[i] = escape(valores[partes[i]])
+        return ''.join(partes)
+
+
+class RegistroTemplatesEmail:
+    def __init__(self, pasta=PASTA_TEMPLATES, pasta_cache=None):
+        self.pasta = pasta
+        self.pasta_cache = pasta_cache
+        self._ambiente = None
+        self._lock = threading.Lock()
+
+    @property
+    def ambiente(self):
+        if self._ambiente is None:
+            with self._lock:
+                if self._ambiente is None:
+                    self._ambiente = self._criar_ambiente()
+        return self._ambiente
+
+    def _criar_ambiente(self):
+        inicio = time.perf_counter()
+        pasta_cache = self.pasta_cache or os.getenv('EMAIL_TEMPLATES_CACHE_DIR')
+        if pasta_cache:
+            os.makedirs(pasta_cache, exist_ok=True)
+
+        ambiente = Environment(
+            loader=FileSystemLoader(self.pasta),
+            autoescape=select_autoescape(['html']),
+            bytecode_cache=FileSystemBytecodeCache(pasta_cache),
+            auto_reload=False,
+            cache_size=-1
+        )
+
+        # Compila todos os templates de e-mail de uma vez
+        nomes = ambiente.list_templates(filter_func=lambda nome: nome.startswith(PREFIXO))
+        for nome in nomes:
+            ambiente.get_template(nome)
+
+        logger.info(f"📧 {len(nomes)} templates de e-mail compilados em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        return ambiente
+
+    def obter(self, nome):
+        return self.ambiente.get_template(PREFIXO + nome)
+
+    def renderizar(self, nome, **contexto):
+        return self.obter(nome).render(**contexto)
+
+    def preparar(self, nome, variaveis, **contexto):
+        """
+        Pré-renderiza o template com o contexto comum. Os campos listados em
+        variaveis devem ser escritos diretamente no template ({{ campo }}).
+        """
+        return TemplatePreparado(self.obter(nome), variaveis, contexto)
+
+
+# Instância global compartilhada pelos serviços de e-mail
+templates_email = RegistroTemplatesEmail()
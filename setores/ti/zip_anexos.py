@@ -0,0 +1,205 @@
+"""
+Download em lote dos anexos (ZIP gerado durante a transferência)
+
+- O ZIP é escrito num buffer pequeno que é esvaziado a cada bloco: nada vai
+  para o disco e a memória não cresce com o tamanho do arquivo final
+  (zipfile usa data descriptors quando a saída não aceita seek)
+- Mídia e formatos que já são compactados (jpeg, png, vídeos, pdf, docx...)
+  entram sem compressão (ZIP_STORED); o resto usa deflate
+- Os anexos são lidos do banco em lotes por id, só com as colunas usadas
+- Um chamado: arquivos na raiz do ZIP; vários chamados: uma pasta por código
+"""
+import logging
+import os
+import zipfile
+from datetime import datetime, timedelta
+
+from flask import current_app, stream_with_context
+from sqlalchemy import select
+
+from database import db, Chamado, ChamadoAnexo, get_brazil_time
+from performance.metrics import registro
+
+logger = logging.getLogger(__name__)
+
+TAMANHO_BLOCO = 64 * 1024
+TAMANHO_LOTE = 200
+
+# Conteúdo que não diminui com deflate: só gastaria CPU
+TIPOS_JA_COMPACTADOS = {
+    'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp',
+    'application/pdf', 'application/zip',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+
+def metodo_compressao(tipo_mime):
+    tipo_mime = (tipo_mime or '').lower()
+    if tipo_mime.startswith('video/') or tipo_mime in TIPOS_JA_COMPACTADOS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+class _SaidaZip:
+    """Destino do zipfile sem seek: acumula os bytes até o gerador recolhê-los"""
+
+    def __init__(self):
+        self._partes = []
+        self.tamanho = 0
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        self.tamanho += len(dados)
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def recolher(self):
+        dados = b''.join(self._partes)
+        self._partes = []
+        self.tamanho = 0
+        return dados
+
+
+def filtrar_chamados(args):
+    """Consulta de ids de chamados com os mesmos filtros do histórico"""
+    consulta = select(Chamado.id)
+
+    ids = [int(i) for i in args.get('ids', '').split(',') if i.strip().isdigit()]
+    if ids:
+        consulta = consulta.where(Chamado.id.in_(ids))
+
+    solicitante = args.get('solicitante', '').strip()
+    problema = args.get('problema', '').strip()
+    status = args.get('status', '').strip()
+    prioridade = args.get('prioridade', '').strip()
+    unidade = args.get('unidade', '').strip()
+    if solicitante:
+        consulta = consulta.where(Chamado.solicitante.contains(solicitante))
+    if problema:
+        consulta = consulta.where(Chamado.problema.contains(problema))
+    if status:
+        consulta = consulta.where(Chamado.status == status)
+    if prioridade:
+        consulta = consulta.where(Chamado.prioridade == prioridade)
+    if unidade:
+        consulta = consulta.where(Chamado.unidade.contains(unidade))
+
+    data_inicio = args.get('data_inicio', '').strip()
+    data_fim = args.get('data_fim', '').strip()
+    if data_inicio:
+        try:
+            consulta = consulta.where(Chamado.data_abertura >= datetime.strptime(data_inicio, '%Y-%m-%d'))
+        except ValueError:
+            pass
+    if data_fim:
+        try:
+            consulta = consulta.where(
+                Chamado.data_abertura < datetime.strptime(data_fim, '%Y-%m-%d') + timedelta(days=1)
+            )
+        except ValueError:
+            pass
+    return consulta
+
+
+def contar_anexos(chamados):
+    """Quantidade e bytes dos anexos ativos dos chamados (select de ids)"""
+    quantidade, total = db.session.execute(
+        select(db.func.count(ChamadoAnexo.id), db.func.coalesce(db.func.sum(ChamadoAnexo.tamanho_bytes), 0))
+        .where(ChamadoAnexo.ativo.is_(True), ChamadoAnexo.chamado_id.in_(chamados))
+    ).one()
+    return quantidade, total
+
+
+def _anexos(chamados):
+    consulta = (
+        select(ChamadoAnexo.id, Chamado.codigo, ChamadoAnexo.nome_original, ChamadoAnexo.caminho_arquivo,
+               ChamadoAnexo.tipo_mime, ChamadoAnexo.data_upload)
+        .join(Chamado, Chamado.id == ChamadoAnexo.chamado_id)
+        .where(ChamadoAnexo.ativo.is_(True), ChamadoAnexo.chamado_id.in_(chamados))
+    )
+    ultimo_id = 0
+    while True:
+        linhas = db.session.execute(
+            consulta.where(ChamadoAnexo.id > ultimo_id).order_by(ChamadoAnexo.id).limit(TAMANHO_LOTE)
+        ).all()
+        if not linhas:
+            return
+        yield from linhas
+        ultimo_id = linhas[-1].id
+
+
+def _nome_unico(nome, usados):
+    """Dois anexos com o mesmo nome no mesmo chamado viram 'arquivo (2).ext'"""
+    candidato, contador = nome, 1
+    base, extensao = os.path.splitext(nome)
+    while candidato.lower() in usados:
+        contador += 1
+        candidato = f"{base} ({contador}){extensao}"
+    usados.add(candidato.lower())
+    return candidato
+
+
+def _data_zip(data):
+    data = data or get_brazil_time().replace(tzinfo=None)
+    return max(data, datetime(1980, 1, 1)).timetuple()[:6]
+
+
+def gerar_zip(chamados, por_pasta):
+    """Gera os bytes do ZIP em blocos; `chamados` é um select de ids"""
+    saida = _SaidaZip()
+    usados = set()
+    faltando = []
+    arquivos = 0
+
+    with zipfile.ZipFile(saida, 'w', allowZip64=True) as zf:
+        for anexo in _anexos(chamados):
+            nome = (anexo.nome_original or f"anexo-{anexo.id}").replace('/', '_').replace('\\', '_')
+            if por_pasta:
+                nome = f"{anexo.codigo}/{nome}"
+            nome = _nome_unico(nome, usados)
+            try:
+                origem = open(anexo.caminho_arquivo, 'rb')
+            except OSError:
+                faltando.append(nome)
+                continue
+
+            with origem:
+                info = zipfile.ZipInfo(nome, date_time=_data_zip(anexo.data_upload))
+                info.compress_type = metodo_compressao(anexo.tipo_mime)
+                # Tamanho conhecido de antemão: zipfile decide sozinho se precisa de ZIP64
+                info.file_size = os.fstat(origem.fileno()).st_size
+                with zf.open(info, 'w') as destino:
+                    for bloco in iter(lambda: origem.read(TAMANHO_BLOCO), b''):
+                        destino.write(bloco)
+                        if saida.tamanho >= TAMANHO_BLOCO:
+                            yield saida.recolher()
+            arquivos += 1
+            if saida.tamanho:
+                yield saida.recolher()
+
+        if faltando:
+            logger.warning(f"ZIP de anexos sem {len(faltando)} arquivo(s) não encontrado(s) no disco")
+            zf.writestr(
+                _nome_unico('ARQUIVOS-NAO-ENCONTRADOS.txt', usados),
+                'Arquivos não encontrados no servidor:\n' + '\n'.join(faltando) + '\n'
+            )
+    # Diretório central, escrito ao fechar o ZipFile
+    yield saida.recolher()
+    registro.incrementar('anexos_zip_arquivos_total', arquivos, 'Anexos enviados em downloads ZIP')
+
+
+def resposta_zip(chamados, nome_download, por_pasta):
+    """Resposta em streaming (chunked, sem Content-Length) com o ZIP dos anexos"""
+    registro.incrementar('anexos_zip_total', 1, 'Downloads ZIP de anexos')
+    resposta = current_app.response_class(
+        stream_with_context(gerar_zip(chamados, por_pasta)), mimetype='application/zip'
+    )
+    resposta.headers.set('Content-Disposition', 'attachment', filename=nome_download)
+    resposta.headers['Cache-Control'] = 'private, no-store'
+    # Sem isso o nginx junta a resposta inteira antes de começar a enviar
+    resposta.headers['X-Accel-Buffering'] = 'no'
+    return resposta
@@ -471,9 +471,11 @@ class HistoricoCompletoManager {
                                 <i class="fas fa-download me-1"></i> Baixar
                             </a>
                         </div>
-                        ${evento.is_image ? `
+                        ${evento.thumbnail_url ? `
                             <div class="mt-2">
-                                <img src="${evento.preview_url}" alt="${(evento.detalhes && evento.detalhes.arquivo) || 'Anexo'}" style="max-width: 100%; height: auto; border-radius: 6px; border: 1px solid #495057;" />
+                                <a href="${evento.preview_url}" target="_blank">
+                                    <img src="${evento.thumbnail_url}" loading="lazy" alt="${(evento.detalhes && evento.detalhes.arquivo) || 'Anexo'}" style="max-width: 100%; height: auto; border-radius: 6px; border: 1px solid #495057;" onerror="this.closest('div').remove()" />
+                                </a>
                             </div>
                         ` : ''}
                     ` : ''}
@@ -612,6 +614,11 @@ class HistoricoCompletoManager {
                         </div>
                     </div>
                     <div class="modal-footer border-secondary">
+                        ${chamado.anexos?.length > 1 ? `
+                            <a href="/ti/anexos/${chamado.id}/zip" class="btn btn-outline-success">
+                                <i class="fas fa-file-archive me-1"></i>Baixar todos (ZIP)
+                            </a>
+                        ` : ''}
                         <button type="button" class="btn btn-secondary" data-bs-dismiss="modal">
                             <i class="fas fa-times me-1"></i>Fechar
                         </button>
@@ -1192,13 +1192,36 @@ function openModal(chamado) {
     modalStatusSelect.value = chamado.status;
 
     modal.classList.add('active');
+    acompanharChamado(chamado.id);
 }
 
 function closeModal() {
     modal.classList.remove('active');
+    deixarChamado();
     currentModalChamadoId = null;
 }
 
+// Sala do chamado aberto no modal (acompanhar_chamado/deixar_chamado no servidor)
+let chamadoAcompanhado = null;
+
+function acompanharChamado(chamadoId) {
+    if (chamadoAcompanhado && chamadoAcompanhado !== chamadoId) {
+        deixarChamado();
+    }
+    chamadoAcompanhado = chamadoId;
+    if (socket && socket.connected) {
+        socket.emit('acompanhar_chamado', { chamado_id: chamadoId });
+    }
+}
+
+function deixarChamado() {
+    if (!chamadoAcompanhado) return;
+    if (socket && socket.connected) {
+        socket.emit('deixar_chamado', { chamado_id: chamadoAcompanhado });
+    }
+    chamadoAcompanhado = null;
+}
+
 // Event Listeners do Modal de Chamados
 modalCloseBtn.addEventListener('click', closeModal);
 modalCancelBtn.addEventListener('click', closeModal);
@@ -2844,6 +2867,11 @@ function initializeSocketIO() {
         socket.on('connect', function() {
             console.log('Socket.IO conectado com sucesso!');
             updateSocketStatus('Conectado', 'success');
+
+            // Reconexão gera uma sessão nova, sem as salas anteriores
+            if (chamadoAcompanhado) {
+                socket.emit('acompanhar_chamado', { chamado_id: chamadoAcompanhado });
+            }
             
             // Enviar ping para manter conexão ativa
             setInterval(() => {
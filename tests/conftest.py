@@ -0,0 +1,75 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app  # noqa: E402
+from config import TestingConfig  # noqa: E402
+from database import db  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    # Arquivo em vez de :memory: para os workers em thread enxergarem o mesmo banco
+    class Config(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'teste.db'}"
+
+    app = create_app(Config)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def servidor_email():
+    """Stand-in local do Graph e do SMTP (tests/servidor_email_falso.py)"""
+    from servidor_email_falso import iniciar_servidores
+
+    servidor = iniciar_servidores()
+    yield servidor
+    servidor.parar()
+
+
+@pytest.fixture
+def pasta_upload(tmp_path, monkeypatch):
+    """UPLOAD_FOLDER isolado por teste"""
+    from setores.ti.anexos_utils import ANEXOS_CONFIG
+
+    pasta = tmp_path / 'uploads'
+    monkeypatch.setitem(ANEXOS_CONFIG, 'UPLOAD_FOLDER', str(pasta))
+    return pasta
+
+
+@pytest.fixture
+def chamado(app):
+    from database import Chamado, User
+
+    usuario = User(nome='Ana', sobrenome='Lima', usuario='ana', email='ana@evoque.com', nivel_acesso='Usuário')
+    usuario.set_password('senha-teste')
+    usuario.setores = ['TI']
+    db.session.add(usuario)
+    db.session.flush()
+    chamado = Chamado(codigo='TI-0001', protocolo='P-0001', solicitante='Ana Lima', cargo='Recepção',
+                      email='ana@evoque.com', telefone='11999990000', unidade='Centro', problema='Impressora',
+                      usuario_id=usuario.id)
+    db.session.add(chamado)
+    db.session.commit()
+    return chamado
+
+
+@pytest.fixture
+def entrar(app):
+    """Autentica o cliente de teste como `usuario` (sessão do Flask-Login)"""
+    def entrar(cliente, usuario):
+        usuario.ultimo_acesso = datetime.utcnow()
+        db.session.commit()
+        with cliente.session_transaction() as sessao:
+            sessao['_user_id'] = str(usuario.id)
+            sessao['_fresh'] = True
+        return cliente
+    return entrar
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Stand-in local do Microsoft Graph e de um servidor SMTP para testes de e-mail.
+
+Graph (HTTP):
+  POST /<tenant>/oauth2/v2.0/token      token falso (client credentials)
+  POST /v1.0/users/<id>/sendMail        aceita a mensagem (202)
+  POST /v1.0/$batch                     até 20 sendMail por chamada, resultado por item
+  POST /v1.0/users/<id>/messages        cria rascunho (anexos grandes)
+  POST .../messages/<mid>/attachments   anexo pequeno no rascunho
+  POST .../attachments/createUploadSession  devolve uploadUrl; PUT em fatias com Content-Range
+  POST .../messages/<mid>/send          envia o rascunho (202)
+  GET  /_mensagens                      mensagens recebidas (Graph e SMTP)
+  DELETE /_mensagens                    limpa as mensagens
+
+SMTP: EHLO/HELO, AUTH PLAIN/LOGIN (aceita qualquer credencial), MAIL, RCPT,
+DATA, RSET, NOOP e QUIT; sem STARTTLS.
+
+Falhas podem ser injetadas para exercitar retries e fallback:
+  --falhas-graph N      as N primeiras chamadas ao Graph (ou itens de um $batch)
+                        respondem --status-falha
+  --latencia-ms M       atraso em cada resposta do Graph
+  derrubar_conexoes_smtp()  (importado) encerra as sessões SMTP abertas
+
+Para apontar a aplicação para o stand-in:
+  GRAPH_BASE_URL=http://127.0.0.1:8025/v1.0
+  MICROSOFT_GRAPH_SMTP_SERVER=127.0.0.1 MICROSOFT_GRAPH_SMTP_PORT=8026
+  MICROSOFT_GRAPH_SMTP_STARTTLS=false
+  MICROSOFT_GRAPH_USERNAME=ti@teste.local MICROSOFT_GRAPH_PASSWORD=x
+
+Uso: python tests/servidor_email_falso.py [--porta-graph 8025] [--porta-smtp 8026]
+Também pode ser importado: iniciar_servidores() devolve um ServidorEmailFalso.
+"""
+import argparse
+import hashlib
+import json
+import re
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class EstadoFalso:
+    def __init__(self, falhas_graph=0, status_falha=503, retry_after=1, latencia_ms=0):
+        self.lock = threading.Lock()
+        self.mensagens = []
+        self.tokens_emitidos = 0
+        self.chamadas_graph = 0
+        self.chamadas_batch = 0
+        self.rascunhos = {}
+        self.uploads = {}
+        self.conexoes_smtp = 0
+        self.sockets_smtp = set()
+        self.falhas_graph = falhas_graph
+        self.status_falha = status_falha
+        self.retry_after = retry_after
+        self.latencia = latencia_ms / 1000.0
+
+    def registrar(self, canal, **dados):
+        with self.lock:
+            self.mensagens.append(dict(canal=canal, recebido_em=time.time(), **dados))
+
+    def deve_falhar(self):
+        with self.lock:
+            self.chamadas_graph += 1
+            if self.falhas_graph > 0:
+                self.falhas_graph -= 1
+                return True
+            return False
+
+
+# ==================== GRAPH ====================
+
+class GraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    estado = None
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, status, corpo=None, cabecalhos=None):
+        dados = json.dumps(corpo).encode('utf-8') if corpo is not None else b''
+        self.send_response(status)
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, str(valor))
+        if corpo is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        try:
+            self.end_headers()
+            self.wfile.write(dados)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # o cliente desistiu (ex.: timeout de leitura)
+
+    def _ler_corpo(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(tamanho) if tamanho else b''
+
+    def do_GET(self):
+        if self.path == '/_mensagens':
+            with self.estado.lock:
+                return self._responder(200, list(self.estado.mensagens))
+        self._responder(404, {'error': {'code': 'NotFound'}})
+
+    def do_DELETE(self):
+        if self.path == '/_mensagens':
+            with self.estado.lock:
+                self.estado.mensagens.clear()
+            return self._responder(204)
+        rascunho = re.fullmatch(r'/v1\.0/users/[^/]+/messages/([^/]+)', self.path)
+        if rascunho and self.estado.rascunhos.pop(rascunho.group(1), None) is not None:
+            return self._responder(204)
+        self._responder(404, {'error': {'code': 'NotFound'}})
+
+    def do_PUT(self):
+        upload = re.fullmatch(r'/_upload/([^/]+)', self.path)
+        sessao = self.estado.uploads.get(upload.group(1)) if upload else None
+        if sessao is None:
+            return self._responder(404, {'error': {'code': 'NotFound'}})
+
+        faixa = re.fullmatch(r'bytes (\d+)-(\d+)/(\d+)', self.headers.get('Content-Range', ''))
+        corpo = self._ler_corpo()
+        if not faixa or int(faixa.group(1)) != sessao['recebido'] or len(corpo) != int(faixa.group(2)) - int(faixa.group(1)) + 1:
+            return self._responder(416, {'error': {'code': 'InvalidRange'}})
+        if len(corpo) > 4 * 1024 * 1024 or (len(corpo) % (320 * 1024) and int(faixa.group(2)) + 1 != sessao['tamanho']):
+            return self._responder(400, {'error': {'code': 'InvalidChunkSize'}})
+
+        sessao['recebido'] += len(corpo)
+        sessao['hash'].update(corpo)
+        if sessao['recebido'] < sessao['tamanho']:
+            return self._responder(200, {'nextExpectedRanges': [f"{sessao['recebido']}-"]})
+        self.estado.rascunhos[sessao['rascunho']]['anexos'].append(
+            {'nome': sessao['nome'], 'tamanho': sessao['tamanho'], 'sha256': sessao['hash'].hexdigest()}
+        )
+        del self.estado.uploads[upload.group(1)]
+        self._responder(201)
+
+    def do_POST(self):
+        corpo = self._ler_corpo()
+        if self.estado.latencia:
+            time.sleep(self.estado.latencia)
+
+        if re.fullmatch(r'/[^/]+/oauth2/v2\.0/token', self.path):
+            with self.estado.lock:
+                self.estado.tokens_emitidos += 1
+            return self._responder(200, {
+                'token_type': 'Bearer',
+                'expires_in': 3599,
+                'access_token': f"falso-{uuid.uuid4().hex}"
+            })
+
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self._responder(401, {'error': {'code': 'InvalidAuthenticationToken'}})
+
+        if self.path == '/v1.0/$batch':
+            return self._batch(json.loads(corpo))
+
+        if self.estado.deve_falhar():
+            return self._responder(self.estado.status_falha, {'error': {'code': 'ServiceUnavailable'}},
+                                   {'Retry-After': self.estado.retry_after})
+
+        envio = re.fullmatch(r'/v1\.0/users/([^/]+)/sendMail', self.path)
+        if envio:
+            self._registrar_envio(envio.group(1), json.loads(corpo)['message'], len(corpo))
+            return self._responder(202)
+
+        rascunho = re.fullmatch(r'/v1\.0/users/([^/]+)/messages(?:/([^/]+)(/.*)?)?', self.path)
+        if rascunho:
+            return self._rascunho(rascunho.group(1), rascunho.group(2), rascunho.group(3) or '', corpo)
+
+        self._responder(404, {'error': {'code': 'NotFound'}})
+
+    def _rascunho(self, remetente, mensagem_id, acao, corpo):
+        if mensagem_id is None:
+            mensagem_id = uuid.uuid4().hex
+            self.estado.rascunhos[mensagem_id] = {'remetente': remetente, 'mensagem': json.loads(corpo), 'anexos': []}
+            return self._responder(201, {'id': mensagem_id})
+
+        rascunho = self.estado.rascunhos.get(mensagem_id)
+        if rascunho is None:
+            return self._responder(404, {'error': {'code': 'ErrorItemNotFound'}})
+
+        if acao == '/attachments':
+            anexo = json.loads(corpo)
+            rascunho['anexos'].append({'nome': anexo.get('name'), 'tamanho': len(anexo.get('contentBytes', '')) * 3 // 4})
+            return self._responder(201, {'id': uuid.uuid4().hex})
+
+        if acao == '/attachments/createUploadSession':
+            item = json.loads(corpo)['AttachmentItem']
+            sessao_id = uuid.uuid4().hex
+            self.estado.uploads[sessao_id] = {
+                'rascunho': mensagem_id, 'nome': item['name'], 'tamanho': int(item['size']),
+                'recebido': 0, 'hash': hashlib.sha256()
+            }
+            host, porta = self.server.server_address[:2]
+            return self._responder(201, {'uploadUrl': f"http://{host}:{porta}/_upload/{sessao_id}"})
+
+        if acao == '/send':
+            del self.estado.rascunhos[mensagem_id]
+            mensagem = rascunho['mensagem']
+            self.estado.registrar(
+                'graph',
+                remetente=remetente,
+                assunto=mensagem.get('subject'),
+                destinatarios=[r['emailAddress']['address'] for r in mensagem.get('toRecipients', [])],
+                anexos=[a['nome'] for a in rascunho['anexos']],
+                detalhes_anexos=rascunho['anexos'],
+                tamanho=sum(a['tamanho'] for a in rascunho['anexos'])
+            )
+            return self._responder(202)
+
+        self._responder(404, {'error': {'code': 'NotFound'}})
+
+    def _registrar_envio(self, remetente, mensagem, tamanho, canal='graph'):
+        self.estado.registrar(
+            canal,
+            remetente=remetente,
+            assunto=mensagem.get('subject'),
+            destinatarios=[r['emailAddress']['address'] for r in mensagem.get('toRecipients', [])],
+            anexos=[a.get('name') for a in mensagem.get('attachments', [])],
+            tamanho=tamanho
+        )
+
+    def _batch(self, pedido):
+        requisicoes = pedido.get('requests', [])
+        if len(requisicoes) > 20:
+            return self._responder(400, {'error': {'code': 'BadRequest', 'message': 'Limite de 20 requisições'}})
+        with self.estado.lock:
+            self.estado.chamadas_batch += 1
+
+        respostas = []
+        for requisicao in requisicoes:
+            resposta = {'id': requisicao['id']}
+            envio = re.fullmatch(r'/users/([^/]+)/sendMail', requisicao.get('url', ''))
+            if self.estado.deve_falhar():
+                resposta.update(status=self.estado.status_falha,
+                                headers={'Retry-After': str(self.estado.retry_after)},
+                                body={'error': {'code': 'ServiceUnavailable', 'message': 'Falha injetada'}})
+            elif envio and requisicao.get('method') == 'POST':
+                mensagem = requisicao['body']['message']
+                self._registrar_envio(envio.group(1), mensagem, len(json.dumps(requisicao['body'])), canal='graph_batch')
+                resposta.update(status=202, headers={}, body=None)
+            else:
+                resposta.update(status=404, body={'error': {'code': 'NotFound', 'message': requisicao.get('url')}})
+            respostas.append(resposta)
+        self._responder(200, {'responses': respostas})
+
+
+# ==================== SMTP ====================
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    estado = None
+
+    def _enviar(self, linha):
+        self.wfile.write((linha + '\r\n').encode('utf-8'))
+
+    def handle(self):
+        with self.estado.lock:
+            self.estado.conexoes_smtp += 1
+            self.estado.sockets_smtp.add(self.connection)
+        try:
+            self._sessao()
+        finally:
+            with self.estado.lock:
+                self.estado.sockets_smtp.discard(self.connection)
+
+    def _sessao(self):
+        self._enviar('220 stand-in SMTP pronto')
+        remetente, destinatarios = None, []
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode('utf-8', 'replace').strip()
+            verbo = comando.split(' ', 1)[0].upper()
+
+            if verbo in ('EHLO', 'HELO'):
+                self.wfile.write(b'250-stand-in\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+            elif verbo == 'AUTH':
+                partes = comando.split()
+                if partes[1].upper() == 'LOGIN':
+                    self._enviar('334 VXNlcm5hbWU6')
+                    self.rfile.readline()
+                    self._enviar('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                elif len(partes) == 2:
+                    self._enviar('334 ')
+                    self.rfile.readline()
+                self._enviar('235 Autenticado')
+            elif verbo == 'MAIL':
+                remetente, destinatarios = comando[10:].strip('<> '), []
+                self._enviar('250 OK')
+            elif verbo == 'RCPT':
+                destinatarios.append(comando[8:].strip('<> '))
+                self._enviar('250 OK')
+            elif verbo == 'DATA':
+                self._enviar('354 Termine com <CRLF>.<CRLF>')
+                linhas = []
+                while True:
+                    dado = self.rfile.readline()
+                    if dado in (b'.\r\n', b'.\n', b''):
+                        break
+                    linhas.append(dado[1:] if dado.startswith(b'..') else dado)
+                bruto = b''.join(linhas)
+                mensagem = message_from_bytes(bruto)
+                self.estado.registrar(
+                    'smtp',
+                    remetente=remetente,
+                    assunto=str(mensagem.get('Subject')),
+                    destinatarios=destinatarios,
+                    anexos=[p.get_filename() for p in mensagem.walk() if p.get_filename()],
+                    tamanho=len(bruto)
+                )
+                self._enviar('250 Mensagem aceita')
+            elif verbo == 'RSET':
+                remetente, destinatarios = None, []
+                self._enviar('250 OK')
+            elif verbo == 'NOOP':
+                self._enviar('250 OK')
+            elif verbo == 'QUIT':
+                self._enviar('221 Até logo')
+                return
+            else:
+                self._enviar('502 Comando não implementado')
+
+
+class _SMTPServidor(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class ServidorEmailFalso:
+    def __init__(self, estado, http, smtp):
+        self.estado = estado
+        self.http = http
+        self.smtp = smtp
+
+    @property
+    def url_graph(self):
+        return f"http://127.0.0.1:{self.http.server_address[1]}/v1.0"
+
+    @property
+    def porta_smtp(self):
+        return self.smtp.server_address[1]
+
+    @property
+    def mensagens(self):
+        with self.estado.lock:
+            return list(self.estado.mensagens)
+
+    def derrubar_conexoes_smtp(self):
+        """Encerra do lado do servidor as sessões SMTP abertas (queda de conexão)"""
+        with self.estado.lock:
+            sockets = list(self.estado.sockets_smtp)
+        for conexao in sockets:
+            try:
+                conexao.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def parar(self):
+        self.http.shutdown()
+        self.smtp.shutdown()
+        self.http.server_close()
+        self.smtp.server_close()
+
+
+def iniciar_servidores(porta_graph=0, porta_smtp=0, **opcoes):
+    """Sobe os dois servidores em threads; porta 0 escolhe uma porta livre"""
+    estado = EstadoFalso(**opcoes)
+    http = ThreadingHTTPServer(('127.0.0.1', porta_graph), type('Graph', (GraphHandler,), {'estado': estado}))
+    smtp = _SMTPServidor(('127.0.0.1', porta_smtp), type('SMTP', (SMTPHandler,), {'estado': estado}))
+    for servidor in (http, smtp):
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return ServidorEmailFalso(estado, http, smtp)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stand-in local do Graph e SMTP')
+    parser.add_argument('--porta-graph', type=int, default=8025)
+    parser.add_argument('--porta-smtp', type=int, default=8026)
+    parser.add_argument('--falhas-graph', type=int, default=0)
+    parser.add_argument('--status-falha', type=int, default=503)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--latencia-ms', type=int, default=0)
+    args = parser.parse_args()
+
+    servidor = iniciar_servidores(
+        args.porta_graph, args.porta_smtp,
+        falhas_graph=args.falhas_graph, status_falha=args.status_falha,
+        retry_after=args.retry_after, latencia_ms=args.latencia_ms
+    )
+    print(f"📨 Graph falso em {servidor.url_graph} | SMTP falso em 127.0.0.1:{servidor.porta_smtp}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        servidor.parar()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import tracemalloc
+
+from setores.ti.anexos_email import AnexoEmail, gerar_mime
+from setores.ti.smtp_pool import ConexaoSMTP, PoolSMTP
+
+TAMANHO_ANEXO = 16 * 1024 * 1024
+
+
+class SMTPContador:
+    """Aceita a transação e só conta o que foi escrito no socket"""
+
+    def __init__(self):
+        self.enviados = 0
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def mail(self, remetente):
+        return 250, b'OK'
+
+    def rcpt(self, destinatario):
+        return 250, b'OK'
+
+    def docmd(self, comando):
+        return 354, b'Go ahead'
+
+    def send(self, dados):
+        self.enviados += len(dados)
+
+    def getreply(self):
+        return 250, b'Queued'
+
+    def quit(self):
+        pass
+
+
+def test_anexo_grande_e_transmitido_sem_ficar_em_memoria(tmp_path):
+    caminho = tmp_path / 'backup.bin'
+    bloco = bytes(range(256)) * 4096
+    with open(caminho, 'wb') as arquivo:
+        for _ in range(TAMANHO_ANEXO // len(bloco)):
+            arquivo.write(bloco)
+
+    smtp = SMTPContador()
+    pool = PoolSMTP('smtp.exemplo', 587, 'usuario', 'senha')
+    pool._conectar = lambda: ConexaoSMTP(smtp)
+    anexo = AnexoEmail('backup.bin', caminho=str(caminho))
+
+    tracemalloc.start()
+    try:
+        pool.enviar_blocos('ti@exemplo', ['a@exemplo'], lambda: gerar_mime(
+            'ti@exemplo', 'a@exemplo', 'Backup', '<p>Segue o backup</p>', 'Segue o backup', [anexo]))
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # base64 aumenta o anexo em ~4/3; só os blocos e o cabeçalho ficam em memória
+    assert smtp.enviados > TAMANHO_ANEXO * 4 // 3
+    assert pico < TAMANHO_ANEXO // 4
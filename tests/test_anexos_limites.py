@@ -0,0 +1,23 @@
+from setores.ti.anexos_utils import ANEXOS_CONFIG, get_max_file_size, validate_file_size
+from setores.ti.uploads import RequestAnexos
+
+
+def test_limite_vem_da_extensao_e_nao_do_content_type():
+    assert get_max_file_size('treino.MP4') == ANEXOS_CONFIG['MAX_VIDEO_SIZE']
+    assert get_max_file_size('relatorio.pdf') == ANEXOS_CONFIG['MAX_FILE_SIZE']
+    assert get_max_file_size(None) == ANEXOS_CONFIG['MAX_FILE_SIZE']
+
+    vinte_mb = 20 * 1024 * 1024
+    assert validate_file_size(vinte_mb, filename='treino.mp4')[0]
+    assert not validate_file_size(vinte_mb, filename='relatorio.pdf')[0]
+
+
+def test_stream_do_multipart_ignora_content_type_de_video(app):
+    with app.test_request_context():
+        recebido = RequestAnexos.__new__(RequestAnexos)._get_file_stream(
+            None, 'video/mp4', filename='relatorio.pdf'
+        )
+    try:
+        assert recebido.limite == ANEXOS_CONFIG['MAX_FILE_SIZE']
+    finally:
+        recebido.close()
@@ -0,0 +1,88 @@
+import io
+import os
+import time
+from datetime import timedelta
+
+from werkzeug.datastructures import FileStorage
+
+from database import db, BlobAnexo
+from setores.ti.anexos_utils import delete_attachment, save_uploaded_file
+from setores.ti.blob_store import _agora, coletar_lixo, gravar_stream
+
+CONTEUDO = b'%PDF-1.7\n' + b'relatorio de manutencao\n' * 64
+CARENCIA = 3600
+
+
+def _enviar(chamado, conteudo=CONTEUDO, nome='relatorio.pdf'):
+    arquivo = FileStorage(io.BytesIO(conteudo), filename=nome, content_type='application/pdf')
+    sucesso, mensagem, anexo = save_uploaded_file(arquivo, chamado.id, chamado.usuario_id)
+    assert sucesso, mensagem
+    return anexo
+
+
+def _blob(anexo):
+    db.session.expire_all()
+    return BlobAnexo.query.filter_by(hash_arquivo=anexo.hash_arquivo).one()
+
+
+def _envelhecer(blob):
+    """Sem referência e sem uso desde antes da carência"""
+    blob.data_sem_referencia = _agora() - timedelta(seconds=CARENCIA + 60)
+    db.session.commit()
+    antigo = time.time() - CARENCIA - 60
+    os.utime(blob.caminho_arquivo, (antigo, antigo))
+
+
+def test_upload_deduplicado_soma_e_soft_delete_libera(chamado, pasta_upload):
+    primeiro = _enviar(chamado)
+    segundo = _enviar(chamado, nome='copia.pdf')
+
+    assert primeiro.caminho_arquivo == segundo.caminho_arquivo
+    assert _blob(primeiro).referencias == 2
+
+    assert delete_attachment(primeiro.id, chamado.usuario_id)[0]
+    assert _blob(primeiro).referencias == 1
+    assert _blob(primeiro).data_sem_referencia is None
+
+    assert delete_attachment(segundo.id, chamado.usuario_id)[0]
+    # Apagar de novo o mesmo anexo não tira outra referência
+    assert delete_attachment(segundo.id, chamado.usuario_id)[0]
+    blob = _blob(segundo)
+    assert blob.referencias == 0
+    assert blob.data_sem_referencia is not None
+
+
+def test_coleta_mantem_blob_referenciado_ou_na_carencia(chamado, pasta_upload):
+    em_uso = _enviar(chamado)
+    recente = _enviar(chamado, CONTEUDO + b'v2')
+    assert delete_attachment(recente.id, chamado.usuario_id)[0]
+
+    assert coletar_lixo(CARENCIA)['blobs_removidos'] == 0
+    assert os.path.exists(em_uso.caminho_arquivo)
+    assert os.path.exists(recente.caminho_arquivo)
+
+    # Contador defasado: o anexo ativo ainda usa o blob e o contador é corrigido
+    blob = _blob(em_uso)
+    blob.referencias = 0
+    _envelhecer(blob)
+    assert coletar_lixo(CARENCIA)['blobs_removidos'] == 0
+    assert os.path.exists(em_uso.caminho_arquivo)
+    assert _blob(em_uso).referencias == 1
+
+    _envelhecer(_blob(recente))
+    assert coletar_lixo(CARENCIA)['blobs_removidos'] == 1
+    assert not os.path.exists(recente.caminho_arquivo)
+    assert BlobAnexo.query.filter_by(hash_arquivo=recente.hash_arquivo).count() == 0
+
+
+def test_reenvio_durante_a_coleta_renova_o_arquivo(chamado, pasta_upload):
+    anexo = _enviar(chamado)
+    assert delete_attachment(anexo.id, chamado.usuario_id)[0]
+    _envelhecer(_blob(anexo))
+
+    # Upload do mesmo conteúdo publicado, mas ainda não registrado no banco
+    hash_arquivo, caminho, _, novo = gravar_stream(io.BytesIO(CONTEUDO))
+    assert (hash_arquivo, caminho, novo) == (anexo.hash_arquivo, anexo.caminho_arquivo, False)
+
+    assert coletar_lixo(CARENCIA)['blobs_removidos'] == 0
+    assert os.path.exists(caminho)
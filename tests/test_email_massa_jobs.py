@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import timedelta
+
+from database import db, EmailMassa, EmailMassaDestinatario, ExecucaoEmailMassa, User
+from setores.ti.email_massa_jobs import ExecutorEmailMassa, _agora
+
+
+class Entregador:
+    def __init__(self, bloquear=None):
+        self.enviados = []
+        self.bloquear = bloquear
+        self.em_bloco = threading.Event()
+
+    def __call__(self, assunto, mensagens):
+        self.em_bloco.set()
+        if self.bloquear:
+            self.bloquear.wait(5)
+        self.enviados.extend(email for _, email, _ in mensagens)
+        return {str(item_id): None for item_id, _, _ in mensagens}
+
+
+def _criar_envio(destinatarios=4):
+    usuario = User(nome='Ana', sobrenome='Lima', usuario='ana', email='ana@evoque.com', nivel_acesso='Administrador')
+    usuario.set_password('senha-teste')
+    db.session.add(usuario)
+    db.session.flush()
+    envio = EmailMassa(assunto='Aviso', conteudo='Manutenção', tipo='atualizacao', criado_por=usuario.id,
+                       destinatarios_count=destinatarios, status='na_fila')
+    db.session.add(envio)
+    db.session.flush()
+    db.session.add_all(
+        EmailMassaDestinatario(email_massa_id=envio.id, email_destinatario=f'd{i}@evoque.com')
+        for i in range(destinatarios)
+    )
+    db.session.commit()
+    return envio.id
+
+
+def _executor(app, entregador, **config):
+    app.config.update(config)
+    return ExecutorEmailMassa(app, entregador=entregador)
+
+
+def test_trabalho_com_lease_de_outro_processo_nao_e_enviado(app):
+    envio_id = _criar_envio()
+    a = _executor(app, Entregador())
+    b_entregador = Entregador()
+    b = _executor(app, b_entregador)
+
+    assert a._tomar_lease(envio_id)
+    assert b.executar(envio_id) is None
+    assert b_entregador.enviados == []
+    assert not b._tomar_lease(envio_id)
+
+
+def test_lease_vencido_pode_ser_assumido(app):
+    envio_id = _criar_envio()
+    a = _executor(app, Entregador())
+    entregador = Entregador()
+    b = _executor(app, entregador)
+
+    assert a._tomar_lease(envio_id)
+    db.session.get(ExecucaoEmailMassa, envio_id).bloqueado_ate = _agora() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert b.executar(envio_id) == 'concluido'
+    assert len(entregador.enviados) == 4
+    # Ao terminar o lease fica livre
+    assert db.session.get(ExecucaoEmailMassa, envio_id).dono is None
+
+
+def test_pausar_e_retomar_durante_um_bloco_nao_deixa_o_trabalho_parado(app):
+    envio_id = _criar_envio(destinatarios=6)
+    liberar = threading.Event()
+    entregador = Entregador(bloquear=liberar)
+    executor = _executor(app, entregador, EMAIL_MASSA_LOTE=3)
+
+    executor._submeter(envio_id)
+    assert entregador.em_bloco.wait(5)
+    assert executor.pausar(envio_id)
+    assert executor.retomar(envio_id)
+    liberar.set()
+
+    limite = time.time() + 5
+    while time.time() < limite:
+        db.session.expire_all()
+        if db.session.get(EmailMassa, envio_id).status == 'concluido':
+            break
+        time.sleep(0.05)
+    executor.parar()
+
+    assert db.session.get(EmailMassa, envio_id).status == 'concluido'
+    assert sorted(entregador.enviados) == sorted(f'd{i}@evoque.com' for i in range(6))
+
+
+def test_progresso_vai_so_para_admins_e_para_quem_criou(app, monkeypatch):
+    eventos = []
+
+    class SocketIO:
+        def emit(self, evento, dados, to=None):
+            eventos.append((evento, to))
+
+    monkeypatch.setattr(app, 'socketio', SocketIO(), raising=False)
+    envio_id = _criar_envio()
+    criador = db.session.get(EmailMassa, envio_id).criado_por
+
+    assert _executor(app, Entregador()).executar(envio_id) == 'concluido'
+    assert eventos
+    assert all(to == ['admin', f'usuario_{criador}'] for evento, to in eventos)
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from database import db, BlobAnexo, EmailOutbox, Unidade
+from setores.ti import routes
+from setores.ti.anexos_utils import ANEXOS_CONFIG
+from setores.ti.blob_store import caminho_blob, recontar_referencias
+from setores.ti.email_outbox import OutboxEmail, _agora, enfileirar_email
+from setores.ti.email_service import email_service
+from setores.ti.graph_auth import ProvedorTokenGraph
+from setores.ti.graph_client import ClienteGraph
+
+
+class Entregador:
+    def __init__(self, bloquear=None):
+        self.enviados = []
+        self.bloquear = bloquear
+
+    def __call__(self, assunto, corpo, destinatarios, anexos, corpo_html=None):
+        if self.bloquear:
+            self.bloquear.wait(5)
+        self.enviados.append(assunto)
+        return True
+
+
+def _outbox(app, entregador, **config):
+    app.config.update(config)
+    return OutboxEmail(app, entregador=entregador)
+
+
+def test_enfileirar_nao_faz_commit_da_transacao_do_chamador(app):
+    db.session.add(Unidade(nome='Unidade pendente'))
+    enfileirar_email('Assunto', 'Corpo', ['a@b.com'])
+    db.session.rollback()
+
+    assert EmailOutbox.query.count() == 0
+    assert Unidade.query.filter_by(nome='Unidade pendente').count() == 0
+
+
+def test_enfileirar_so_deduplica_com_chave_explicita(app):
+    primeiro = enfileirar_email('Assunto', 'Corpo', ['a@b.com'])
+    repetido = enfileirar_email('Assunto', 'Corpo', ['a@b.com'])
+    com_chave = enfileirar_email('Assunto', 'Corpo', ['a@b.com'], chave_idempotencia='lote-1')
+    mesma_chave = enfileirar_email('Outro', 'Corpo', ['a@b.com'], chave_idempotencia='lote-1')
+    db.session.commit()
+
+    assert primeiro.id != repetido.id
+    assert com_chave.id == mesma_chave.id
+    assert EmailOutbox.query.count() == 3
+
+
+def test_item_reservado_nao_e_reservado_por_outro_processo(app):
+    a = _outbox(app, Entregador())
+    b = _outbox(app, Entregador())
+    enfileirar_email('Assunto', 'Corpo', ['a@b.com'])
+    db.session.commit()
+
+    assert len(a._reservar(10)) == 1
+    assert b._reservar(10) == []
+
+
+def test_lease_vencido_passa_para_outro_processo_e_o_antigo_nao_envia(app):
+    entregador_a, entregador_b = Entregador(), Entregador()
+    a = _outbox(app, entregador_a)
+    b = _outbox(app, entregador_b)
+    enfileirar_email('Assunto', 'Corpo', ['a@b.com'])
+    db.session.commit()
+
+    [(item_id, lease_a)] = a._reservar(10)
+    # O worker de A ficou parado além do lease
+    db.session.get(EmailOutbox, item_id).bloqueado_ate = _agora() - timedelta(seconds=1)
+    db.session.commit()
+
+    [(_, lease_b)] = b._reservar(10)
+    a.processar(item_id, lease_a)
+    assert entregador_a.enviados == []
+
+    assert b.processar(item_id, lease_b) == 'enviado'
+    assert entregador_b.enviados == ['Assunto']
+
+
+def test_despachante_reserva_apenas_o_que_os_workers_conseguem_atender(app):
+    liberar = threading.Event()
+    entregador = Entregador(bloquear=liberar)
+    outbox = _outbox(app, entregador, EMAIL_OUTBOX_WORKERS=2, EMAIL_OUTBOX_LOTE=20, EMAIL_OUTBOX_INTERVALO=0.05)
+    for i in range(6):
+        enfileirar_email(f'Assunto {i}', 'Corpo', ['a@b.com'])
+    db.session.commit()
+
+    outbox.iniciar()
+    try:
+        time.sleep(0.5)
+        db.session.expire_all()
+        assert EmailOutbox.query.filter_by(status='enviando').count() == 2
+        liberar.set()
+        limite = time.time() + 5
+        while EmailOutbox.query.filter_by(status='enviado').count() < 6 and time.time() < limite:
+            time.sleep(0.05)
+            db.session.expire_all()
+    finally:
+        liberar.set()
+        outbox.parar()
+
+    assert sorted(entregador.enviados) == [f'Assunto {i}' for i in range(6)]
+
+
+def test_anexo_em_blob_fica_referenciado_ate_o_envio(app, tmp_path, monkeypatch):
+    monkeypatch.setitem(ANEXOS_CONFIG, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    conteudo = b'%PDF-1.7 relatorio'
+    hash_arquivo = hashlib.sha256(conteudo).hexdigest()
+    caminho = caminho_blob(hash_arquivo)
+    os.makedirs(os.path.dirname(caminho))
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(conteudo)
+
+    enfileirar_email('Assunto', 'Corpo', ['a@b.com'], anexos=[
+        {'nome': 'relatorio.pdf', 'content_type': 'application/pdf', 'caminho': caminho, 'tamanho': len(conteudo)}
+    ])
+    db.session.commit()
+    blob = BlobAnexo.query.filter_by(hash_arquivo=hash_arquivo).one()
+    assert blob.referencias == 1
+
+    # A recontagem considera os e-mails ainda na fila
+    recontar_referencias()
+    assert db.session.get(BlobAnexo, blob.id).referencias == 1
+
+    outbox = _outbox(app, Entregador())
+    assert outbox.processar_pendentes() == 1
+    db.session.expire_all()
+    blob = db.session.get(BlobAnexo, blob.id)
+    assert blob.referencias == 0
+    assert blob.data_sem_referencia is not None
+
+
+def _apontar_para(servidor, monkeypatch, com_graph):
+    """Entrega real (routes.entregar_email) contra o stand-in do Graph/SMTP"""
+    provedor = ProvedorTokenGraph('cliente', 'segredo', 'tenant', ['https://graph.microsoft.com/.default'],
+                                  buscar_token=lambda provedor: {'access_token': 'token-teste', 'expires_in': 3599})
+    monkeypatch.setattr(routes, 'EMAIL_ENABLED', com_graph)
+    monkeypatch.setattr(routes, 'USER_ID', 'ti@teste.local')
+    monkeypatch.setattr(routes, 'cliente_graph', ClienteGraph(servidor.url_graph, provedor, max_tentativas=1))
+    for atributo, valor in {'smtp_server': '127.0.0.1', 'smtp_port': servidor.porta_smtp, 'usar_starttls': False,
+                            'email_username': 'ti@teste.local', 'email_password': 'x',
+                            'from_email': 'ti@teste.local', '_pool': None}.items():
+        monkeypatch.setattr(email_service, atributo, valor)
+
+
+@pytest.mark.parametrize('com_graph, canal', [(True, 'graph'), (False, 'smtp')])
+def test_entrega_real_pelo_stand_in(app, tmp_path, monkeypatch, servidor_email, com_graph, canal):
+    _apontar_para(servidor_email, monkeypatch, com_graph)
+    # Acima do limite do JSON do sendMail: no Graph vai por upload session
+    caminho = tmp_path / 'backup.bin'
+    caminho.write_bytes(os.urandom(4 * 1024 * 1024))
+
+    enfileirar_email('Backup mensal', 'Segue o backup', ['a@b.com'], corpo_html='<p>Segue o backup</p>',
+                     anexos=[{'nome': 'backup.bin', 'caminho': str(caminho)}])
+    db.session.commit()
+
+    try:
+        assert _outbox(app, None).processar_pendentes() == 1
+    finally:
+        if email_service._pool is not None:
+            email_service._pool.fechar()
+
+    assert EmailOutbox.query.one().status == 'enviado'
+    [mensagem] = servidor_email.mensagens
+    assert mensagem['canal'] == canal
+    assert mensagem['assunto'] == 'Backup mensal'
+    assert mensagem['destinatarios'] == ['a@b.com']
+    assert mensagem['anexos'] == ['backup.bin']
+    assert mensagem['tamanho'] >= 4 * 1024 * 1024
@@ -0,0 +1,43 @@
+import io
+
+from werkzeug.datastructures import FileStorage
+
+from database import db, Chamado, EstatisticaAnexos
+from setores.ti.anexos_utils import delete_attachment, save_uploaded_file
+from setores.ti.estatisticas_anexos import obter_estatisticas, recalcular
+
+
+def _enviar(chamado, nome, content_type, conteudo):
+    arquivo = FileStorage(io.BytesIO(conteudo), filename=nome, content_type=content_type)
+    sucesso, mensagem, anexo = save_uploaded_file(arquivo, chamado.id, chamado.usuario_id)
+    assert sucesso, mensagem
+    return anexo
+
+
+def _agregados():
+    db.session.expire_all()
+    return sorted(
+        (linha.categoria, linha.unidade, linha.ano, linha.mes, linha.quantidade, linha.tamanho_bytes)
+        for linha in EstatisticaAnexos.query.all() if linha.quantidade
+    )
+
+
+def test_agregados_do_upload_e_da_remocao_batem_com_o_recalculo(chamado, pasta_upload):
+    outra_unidade = Chamado(codigo='TI-0002', protocolo='P-0002', solicitante='Ana Lima', cargo='Recepção',
+                            email='ana@evoque.com', telefone='11999990000', unidade='Zona Sul',
+                            problema='Rede', usuario_id=chamado.usuario_id)
+    db.session.add(outra_unidade)
+    db.session.commit()
+
+    _enviar(chamado, 'laudo.pdf', 'application/pdf', b'%PDF-1.7 laudo')
+    removido = _enviar(chamado, 'orcamento.pdf', 'application/pdf', b'%PDF-1.7 orcamento da troca')
+    _enviar(chamado, 'log.txt', 'text/plain', b'erro de conexao as 10h')
+    _enviar(outra_unidade, 'laudo.pdf', 'application/pdf', b'%PDF-1.7 laudo')
+    assert delete_attachment(removido.id, chamado.usuario_id)[0]
+
+    incrementais = _agregados()
+    assert sum(linha[4] for linha in incrementais) == 3
+    assert obter_estatisticas()['total_anexos'] == 3
+
+    recalcular()
+    assert _agregados() == incrementais
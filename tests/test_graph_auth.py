@@ -0,0 +1,22 @@
+import pytest
+
+from setores.ti.graph_auth import ProvedorTokenGraph
+
+
+def test_authority_sem_https_e_recusada():
+    with pytest.raises(ValueError):
+        ProvedorTokenGraph('cliente', 'segredo', 'tenant', ['escopo'], authority_host='http://127.0.0.1:8080')
+
+
+def test_buscar_token_injetado_substitui_o_msal():
+    chamadas = []
+
+    def buscar(provedor):
+        chamadas.append(provedor.authority)
+        return {'access_token': 'token-teste', 'expires_in': 3599}
+
+    provedor = ProvedorTokenGraph('cliente', 'segredo', 'tenant', ['escopo'], buscar_token=buscar)
+
+    assert provedor.obter_token() == 'token-teste'
+    assert provedor.obter_token() == 'token-teste'
+    assert chamadas == ['https://login.microsoftonline.com/tenant']
@@ -0,0 +1,136 @@
+import pytest
+import requests
+
+from setores.ti.graph_client import CircuitoAberto, ClienteGraph, Disjuntor, ErroGraph
+
+
+class Resposta:
+    def __init__(self, status_code, text=''):
+        self.status_code = status_code
+        self.text = text
+        self.headers = {}
+
+
+class Sessao:
+    """Devolve (ou levanta) os itens de `roteiro` em ordem"""
+
+    def __init__(self, *roteiro):
+        self.roteiro = list(roteiro)
+        self.chamadas = 0
+
+    def request(self, metodo, url, **kwargs):
+        self.chamadas += 1
+        item = self.roteiro.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+class Provedor:
+    def __init__(self, erro=None):
+        self.erro = erro
+        self.invalidacoes = 0
+
+    def obter_token(self):
+        if self.erro:
+            raise self.erro
+        return 'token'
+
+    def invalidar(self):
+        self.invalidacoes += 1
+
+
+def _cliente(sessao, provedor=None, **kwargs):
+    kwargs.setdefault('backoff_base', 0)
+    cliente = ClienteGraph('https://graph.teste/v1.0', provedor or Provedor(), **kwargs)
+    cliente._sessao = sessao
+    return cliente
+
+
+def _disjuntor_meio_aberto():
+    disjuntor = Disjuntor(limite_falhas=1, tempo_aberto=0)
+    disjuntor.falha()
+    assert disjuntor.estado == 'meio_aberto'
+    return disjuntor
+
+
+@pytest.mark.parametrize('erro', [requests.exceptions.ChunkedEncodingError('cortado'),
+                                  requests.exceptions.ContentDecodingError('gzip')])
+def test_erro_ao_ler_resposta_registra_falha_e_libera_o_teste_do_meio_aberto(erro):
+    disjuntor = _disjuntor_meio_aberto()
+    cliente = _cliente(Sessao(erro), disjuntor=disjuntor)
+
+    with pytest.raises(ErroGraph):
+        cliente.requisitar('POST', 'users/x/sendMail', json={})
+
+    # POST não é repetido e a próxima chamada de teste é permitida
+    assert cliente.sessao.chamadas == 1
+    assert disjuntor.permitir()
+
+
+def test_erro_do_provedor_de_token_registra_falha_no_disjuntor():
+    disjuntor = _disjuntor_meio_aberto()
+    cliente = _cliente(Sessao(), Provedor(erro=RuntimeError('MSAL indisponível')), disjuntor=disjuntor)
+
+    with pytest.raises(RuntimeError):
+        cliente.requisitar('GET', 'users/x')
+    assert disjuntor.permitir()
+
+
+def test_renovacao_do_token_apos_401_nao_gasta_tentativa():
+    provedor = Provedor()
+    cliente = _cliente(Sessao(Resposta(401), Resposta(202)), provedor, max_tentativas=1)
+
+    assert cliente.requisitar('POST', 'users/x/sendMail', json={}).status_code == 202
+    assert provedor.invalidacoes == 1
+
+
+def test_401_repetido_levanta_erro_do_graph():
+    cliente = _cliente(Sessao(Resposta(401), Resposta(401)), max_tentativas=1)
+
+    with pytest.raises(ErroGraph) as erro:
+        cliente.requisitar('GET', 'users/x')
+    assert erro.value.status == 401
+    # O Graph respondeu: não conta como indisponibilidade
+    assert cliente.disjuntor.estado == 'fechado'
+
+
+def test_circuito_aberto_nao_chama_o_graph():
+    disjuntor = Disjuntor(limite_falhas=1, tempo_aberto=60)
+    disjuntor.falha()
+    sessao = Sessao()
+    with pytest.raises(CircuitoAberto):
+        _cliente(sessao, disjuntor=disjuntor).requisitar('GET', 'users/x')
+    assert sessao.chamadas == 0
+
+
+def test_timeout_de_leitura_no_batch_marca_o_lote_como_incerto():
+    cliente = _cliente(Sessao(requests.exceptions.ReadTimeout('lento')))
+
+    resultados = cliente.enviar_emails_em_massa('x', [(1, {}), (2, {})])
+
+    assert cliente.sessao.chamadas == 1
+    assert all(isinstance(erro, ErroGraph) and erro.ambiguo for erro in resultados.values())
+
+
+def test_batch_incerto_nao_cai_no_smtp(app, monkeypatch):
+    from setores.ti import routes
+    from setores.ti.email_service import email_service
+
+    enviados_smtp = []
+    monkeypatch.setattr(routes, 'EMAIL_ENABLED', True)
+    monkeypatch.setattr(routes.cliente_graph, 'enviar_emails_em_massa', lambda *a, **k: {
+        '1': ErroGraph('Timeout de leitura no Graph', ambiguo=True),
+        '2': ErroGraph('Graph respondeu 400', status=400),
+        '3': None,
+    })
+    monkeypatch.setattr(email_service, 'enviar_email', lambda email, *a, **k: enviados_smtp.append(email) or True)
+
+    with app.test_request_context():
+        resultados = routes.entregar_emails_em_massa('Assunto', [
+            (1, 'a@b.com', '<p>1</p>'), (2, 'c@d.com', '<p>2</p>'), (3, 'e@f.com', '<p>3</p>')
+        ])
+
+    assert enviados_smtp == ['c@d.com']
+    assert 'resultado incerto' in resultados['1']
+    assert resultados['2'] is None and resultados['3'] is None
@@ -0,0 +1,63 @@
+from database import db, EmailOutbox, NotificacaoEmail, Unidade
+from setores.ti.notificacoes_email import notificar_email, notificacoes_email
+
+HTML = '<html><head><title>x</title></head><body><h1>Agente atribuído</h1></body></html>'
+
+
+def test_modo_padrao_envia_sem_espera(app):
+    assert app.config['NOTIFICACOES_MODO'] == 'imediato'
+    assert notificar_email(['a@b.com'], 'Assunto', 'Texto', referencia='chamado:1', corpo_html=HTML)
+    db.session.commit()
+
+    item = EmailOutbox.query.one()
+    assert item.corpo == 'Texto'
+    assert item.corpo_html == HTML
+    assert NotificacaoEmail.query.count() == 0
+
+
+def test_agrupado_nao_faz_commit_da_transacao_do_chamador(app):
+    app.config['NOTIFICACOES_MODO'] = 'agrupado'
+    db.session.add(Unidade(nome='Unidade pendente'))
+    assert notificar_email(['a@b.com'], 'Assunto', 'Texto', referencia='chamado:1')
+    db.session.rollback()
+
+    assert NotificacaoEmail.query.count() == 0
+    assert Unidade.query.filter_by(nome='Unidade pendente').count() == 0
+
+
+def test_agrupado_mantem_o_html_do_template(app):
+    app.config['NOTIFICACOES_MODO'] = 'agrupado'
+    notificar_email(['a@b.com'], 'Status', 'Status alterado', referencia='chamado:1')
+    notificar_email(['a@b.com'], 'Agente', 'Agente atribuído', referencia='chamado:1', corpo_html=HTML)
+    notificar_email(['c@d.com'], 'Agente', 'Agente atribuído', referencia='chamado:1', corpo_html=HTML)
+    db.session.commit()
+
+    assert notificacoes_email.descarregar(todas=True) == 2
+    db.session.commit()
+
+    agrupado = EmailOutbox.query.filter(EmailOutbox.destinatarios.contains('a@b.com')).one()
+    assert 'Status alterado' in agrupado.corpo and 'Agente atribuído' in agrupado.corpo
+    assert '<h1>Agente atribuído</h1>' in agrupado.corpo_html
+    assert 'Status alterado' in agrupado.corpo_html
+    assert agrupado.corpo_html.count('<body>') == 1
+
+    unico = EmailOutbox.query.filter(EmailOutbox.destinatarios.contains('c@d.com')).one()
+    assert unico.corpo_html == HTML
+
+
+def test_agente_atribuido_no_modo_imediato_vai_pela_outbox(app, monkeypatch):
+    from types import SimpleNamespace
+    from setores.ti import email_service as modulo
+
+    monkeypatch.setattr(modulo.templates_email, 'renderizar', lambda *args, **kwargs: HTML)
+    monkeypatch.setattr(modulo.email_service, 'enviar_email', None)
+    chamado = SimpleNamespace(email='a@b.com', solicitante='Ana', codigo='TI-1', protocolo='P1',
+                              problema='Impressora', prioridade='Normal')
+    agente = SimpleNamespace(nome='Bruno', nivel_experiencia='senior', especialidades_list=[])
+
+    assert modulo.email_service.notificar_agente_atribuido(chamado, agente)
+    db.session.commit()
+
+    item = EmailOutbox.query.one()
+    assert item.referencia == 'chamado:TI-1'
+    assert item.corpo_html == HTML
@@ -0,0 +1,27 @@
+import pytest
+
+from database import db, Unidade
+from performance import NPlusOneError
+
+
+@pytest.fixture
+def app_n_mais_1(app):
+    @app.route('/_teste/n-mais-1')
+    def n_mais_1():
+        for unidade_id in range(1, 8):
+            db.session.get(Unidade, unidade_id)
+        return 'ok'
+    return app
+
+
+def test_strict_levanta_em_testes(app_n_mais_1):
+    with pytest.raises(NPlusOneError):
+        app_n_mais_1.test_client().get('/_teste/n-mais-1')
+
+
+def test_strict_fora_dos_testes_so_marca_a_resposta(app_n_mais_1):
+    app_n_mais_1.testing = False
+    resposta = app_n_mais_1.test_client().get('/_teste/n-mais-1')
+
+    assert resposta.status_code == 200
+    assert resposta.headers['X-Query-N-Plus-One'] == '1'
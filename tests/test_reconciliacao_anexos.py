@@ -0,0 +1,104 @@
+import io
+import os
+import time
+from datetime import timedelta
+
+from werkzeug.datastructures import FileStorage
+
+from database import db, ChamadoAnexo, get_brazil_time
+from setores.ti.anexos_utils import save_uploaded_file
+from setores.ti.blob_store import caminho_blob
+from setores.ti.reconciliacao_anexos import FORMATO_CARIMBO, pasta_quarentena, reconciliar
+
+CARENCIA = 3600
+
+
+def _enviar(chamado, conteudo):
+    arquivo = FileStorage(io.BytesIO(conteudo), filename='relatorio.pdf', content_type='application/pdf')
+    sucesso, mensagem, anexo = save_uploaded_file(arquivo, chamado.id, chamado.usuario_id)
+    assert sucesso, mensagem
+    return anexo
+
+
+def _gravar(caminho, conteudo=b'conteudo', antigo=True):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with open(caminho, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    if antigo:
+        instante = time.time() - CARENCIA - 60
+        os.utime(caminho, (instante, instante))
+    return caminho
+
+
+def _quarentenados(pasta_upload):
+    raiz = pasta_quarentena(str(pasta_upload))
+    return sorted(os.path.relpath(os.path.join(pasta, nome), raiz).split(os.sep, 1)[1]
+                  for pasta, _, nomes in os.walk(raiz) for nome in nomes)
+
+
+def test_orfaos_antigos_vao_para_a_quarentena_e_recentes_ficam(chamado, pasta_upload):
+    anexo = _enviar(chamado, b'%PDF-1.7 em uso')
+    _gravar(str(pasta_upload / 'legado_sem_registro.pdf'))
+    orfao_blob = _gravar(caminho_blob('ab' * 32))
+    recente = _gravar(str(pasta_upload / 'upload_em_andamento.pdf'), antigo=False)
+
+    resultado = reconciliar(CARENCIA)
+
+    assert resultado['orfaos'] == 2
+    assert resultado['movidos_quarentena'] == 2
+    assert resultado['recentes_ignorados'] == 1
+    assert os.path.exists(recente)
+    assert os.path.exists(anexo.caminho_arquivo)
+    assert not os.path.exists(orfao_blob)
+    # O caminho relativo é mantido para poder restaurar
+    assert _quarentenados(pasta_upload) == sorted([
+        'legado_sem_registro.pdf', os.path.relpath(orfao_blob, str(pasta_upload))
+    ])
+
+
+def test_simulacao_so_relata(chamado, pasta_upload):
+    orfao = _gravar(str(pasta_upload / 'legado_sem_registro.pdf'))
+
+    resultado = reconciliar(CARENCIA, simular=True)
+
+    assert resultado['orfaos'] == 1
+    assert resultado['movidos_quarentena'] == 0
+    assert os.path.exists(orfao)
+
+
+def test_ausentes_e_tamanhos_divergentes(chamado, pasta_upload):
+    sem_arquivo = _enviar(chamado, b'%PDF-1.7 removido do disco')
+    os.remove(sem_arquivo.caminho_arquivo)
+    maior = _enviar(chamado, b'%PDF-1.7 maior no disco')
+    menor = _enviar(chamado, b'%PDF-1.7 menor no disco')
+    maior.tamanho_bytes -= 1
+    menor.tamanho_bytes += 1
+    db.session.add(ChamadoAnexo(chamado_id=chamado.id, nome_original='antigo.pdf', nome_arquivo='antigo.pdf',
+                                caminho_arquivo=str(pasta_upload / 'antigo.pdf'), tamanho_bytes=10,
+                                tipo_mime='application/pdf', extensao='pdf', usuario_upload_id=chamado.usuario_id))
+    db.session.commit()
+
+    resultado = reconciliar(CARENCIA)
+
+    assert resultado['ausentes'] == 2
+    assert 'antigo.pdf' in resultado['amostras']['ausentes']
+    assert resultado['maiores_no_disco'] == 1
+    assert resultado['menores_no_disco'] == 1
+    assert resultado['orfaos'] == 0
+
+
+def test_purga_respeita_os_dias_de_quarentena(app, pasta_upload):
+    app.config['ANEXOS_QUARENTENA_DIAS'] = 7
+    agora = get_brazil_time().replace(tzinfo=None)
+    raiz = pasta_quarentena(str(pasta_upload))
+    vencida = _gravar(os.path.join(raiz, (agora - timedelta(days=8)).strftime(FORMATO_CARIMBO), 'a.pdf'))
+    no_prazo = _gravar(os.path.join(raiz, (agora - timedelta(days=2)).strftime(FORMATO_CARIMBO), 'b.pdf'))
+    manual = _gravar(os.path.join(raiz, 'copia-manual', 'c.pdf'))
+
+    resultado = app.extensions['anexos_blobs'].purgar_quarentena()
+
+    assert resultado['remessas_removidas'] == 1
+    assert resultado['arquivos_removidos'] == 1
+    assert not os.path.exists(vencida)
+    assert os.path.exists(no_prazo)
+    assert os.path.exists(manual)
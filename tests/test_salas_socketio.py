@@ -0,0 +1,75 @@
+from app import socketio
+from database import db, AgenteSuporte, ChamadoAgente, User
+from setores.ti.salas_socketio import agente_do_chamado, emitir, salas_do_chamado
+
+
+def _usuario(login, nivel_acesso='Usuário', agente=False):
+    usuario = User(nome=login.title(), sobrenome='Teste', usuario=login, email=f'{login}@evoque.com',
+                   nivel_acesso=nivel_acesso)
+    usuario.set_password('senha-teste')
+    db.session.add(usuario)
+    db.session.flush()
+    if agente:
+        db.session.add(AgenteSuporte(usuario_id=usuario.id))
+    db.session.commit()
+    return usuario
+
+
+def _conectar(app, entrar, usuario):
+    flask_cliente = entrar(app.test_client(), usuario)
+    # Contexto próprio por evento, como no servidor: o usuário do Flask-Login fica em g
+    with app.app_context():
+        cliente = socketio.test_client(app, flask_test_client=flask_cliente)
+    assert cliente.is_connected()
+    cliente.get_received()
+    return cliente
+
+
+def _pedir(app, cliente, evento, chamado_id):
+    with app.app_context():
+        cliente.emit(evento, {'chamado_id': chamado_id})
+    return cliente.get_received()
+
+
+def _eventos(cliente):
+    return [evento['name'] for evento in cliente.get_received()]
+
+
+def test_conexao_anonima_e_recusada(app):
+    assert not socketio.test_client(app).is_connected()
+
+
+def test_evento_do_chamado_so_chega_a_quem_participa(app, chamado, entrar):
+    atribuido = _usuario('bruno', agente=True)
+    agente = AgenteSuporte.query.filter_by(usuario_id=atribuido.id).one()
+    db.session.add(ChamadoAgente(chamado_id=chamado.id, agente_id=agente.id))
+    db.session.commit()
+
+    clientes = {
+        'admin': _conectar(app, entrar, _usuario('carla', nivel_acesso='Administrador')),
+        'solicitante': _conectar(app, entrar, db.session.get(User, chamado.usuario_id)),
+        'atribuido': _conectar(app, entrar, atribuido),
+        'acompanhando': _conectar(app, entrar, _usuario('diego', agente=True)),
+        'sem_relacao': _conectar(app, entrar, _usuario('elisa')),
+    }
+    assert _pedir(app, clientes['acompanhando'], 'acompanhar_chamado', chamado.id)[0]['args'][0]['status'] == 'success'
+    # Quem não pode acompanhar o chamado não entra na sala
+    assert _pedir(app, clientes['sem_relacao'], 'acompanhar_chamado', chamado.id)[0]['args'][0]['status'] == 'error'
+
+    emitir('chamado_atualizado', {'chamado_id': chamado.id},
+           salas_do_chamado(chamado, agentes=(agente_do_chamado(chamado.id),)))
+
+    recebidos = {nome: _eventos(cliente) for nome, cliente in clientes.items()}
+    assert recebidos == {
+        'admin': ['chamado_atualizado'],
+        'solicitante': ['chamado_atualizado'],
+        'atribuido': ['chamado_atualizado'],
+        'acompanhando': ['chamado_atualizado'],
+        'sem_relacao': [],
+    }
+
+    _pedir(app, clientes['acompanhando'], 'deixar_chamado', chamado.id)
+    emitir('chamado_atualizado', {'chamado_id': chamado.id}, salas_do_chamado(chamado))
+    assert _eventos(clientes['acompanhando']) == []
+    for cliente in clientes.values():
+        cliente.disconnect()
@@ -0,0 +1,33 @@
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+
+from setores.ti.utils import serializacao
+
+DADOS = {
+    'data_abertura': datetime(2026, 3, 9, 14, 30, 5),
+    'data_visita': date(2026, 3, 10),
+    'valor': Decimal('10.50'),
+    'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+    'zeta': 1,
+    'alfa': {'b': 2, 'a': 1},
+}
+
+
+@pytest.mark.parametrize('com_orjson', [True, False])
+def test_jsonify_mantem_o_formato_padrao_do_flask(app, monkeypatch, com_orjson):
+    if not com_orjson:
+        monkeypatch.setattr(serializacao, 'orjson', None)
+
+    with app.test_request_context():
+        corpo = jsonify(DADOS).get_data(as_text=True)
+    esperado = DefaultJSONProvider(app).dumps(DADOS)
+
+    assert json.loads(corpo) == json.loads(esperado)
+    assert list(json.loads(corpo)) == sorted(DADOS)
+    assert json.loads(corpo)['data_abertura'] == 'Mon, 09 Mar 2026 14:30:05 GMT'
@@ -0,0 +1,103 @@
+import smtplib
+import socket
+from email.message import EmailMessage
+
+import pytest
+
+from setores.ti.smtp_pool import ConexaoSMTP, PoolSMTP
+
+
+class SMTPFalso:
+    """Levanta (ou aceita) os itens de `roteiro` a cada send_message"""
+
+    def __init__(self, roteiro):
+        self.roteiro = roteiro
+
+    def send_message(self, mensagem):
+        item = self.roteiro.pop(0)
+        if item is not None:
+            raise item
+
+    def quit(self):
+        pass
+
+
+def _pool(roteiro):
+    pool = PoolSMTP('smtp.exemplo', 587, 'usuario', 'senha')
+    pool.conexoes = 0
+
+    def conectar():
+        pool.conexoes += 1
+        return ConexaoSMTP(SMTPFalso(roteiro))
+
+    pool._conectar = conectar
+    return pool
+
+
+def _mensagem():
+    mensagem = EmailMessage()
+    mensagem['From'] = 'ti@teste.local'
+    mensagem['To'] = 'a@exemplo'
+    mensagem['Subject'] = 'Teste'
+    mensagem.set_content('corpo')
+    return mensagem
+
+
+@pytest.mark.parametrize('erro', [
+    smtplib.SMTPRecipientsRefused({'x@exemplo': (550, b'nao existe')}),
+    smtplib.SMTPDataError(554, b'rejeitada'),
+    smtplib.SMTPSenderRefused(553, b'remetente', 'y@exemplo'),
+])
+def test_erro_da_mensagem_nao_repete(erro):
+    roteiro = [erro, None]
+    pool = _pool(roteiro)
+
+    with pytest.raises(type(erro)):
+        pool.enviar(_mensagem())
+
+    assert pool.conexoes == 1
+    assert roteiro == [None]
+
+
+@pytest.mark.parametrize('erro', [
+    smtplib.SMTPServerDisconnected('caiu'),
+    ConnectionResetError('reset'),
+    socket.timeout('timeout'),
+])
+def test_erro_de_conexao_repete_em_conexao_nova(erro):
+    roteiro = [erro, None]
+    pool = _pool(roteiro)
+
+    pool.enviar(_mensagem())
+
+    assert pool.conexoes == 2
+    assert roteiro == []
+
+
+def _pool_real(servidor, **opcoes):
+    return PoolSMTP('127.0.0.1', servidor.porta_smtp, 'ti@teste.local', 'x', usar_starttls=False, timeout=5, **opcoes)
+
+
+def test_conexao_e_renovada_apos_max_mensagens(servidor_email):
+    pool = _pool_real(servidor_email, max_mensagens=2)
+    try:
+        for _ in range(5):
+            pool.enviar(_mensagem())
+    finally:
+        pool.fechar()
+
+    assert len(servidor_email.mensagens) == 5
+    assert servidor_email.estado.conexoes_smtp == 3
+
+
+def test_queda_da_conexao_reconecta_e_envia(servidor_email):
+    pool = _pool_real(servidor_email)
+    try:
+        pool.enviar(_mensagem())
+        servidor_email.derrubar_conexoes_smtp()
+        pool.enviar_blocos('ti@teste.local', ['a@exemplo'], lambda: [_mensagem().as_bytes().replace(b'\n', b'\r\n')])
+    finally:
+        pool.fechar()
+
+    assert len(servidor_email.mensagens) == 2
+    assert servidor_email.estado.conexoes_smtp == 2
@@ -0,0 +1,28 @@
+import pytest
+
+from setores.ti.uploads import detectar_mime, validar_conteudo
+
+
+@pytest.mark.parametrize('conteudo', [
+    'Relatório de manutenção\r\nAção: troca do cabo'.encode('utf-8'),
+    'Relatório de manutenção\r\nAção: troca do cabo'.encode('cp1252'),
+    'Relatório de manutenção'.encode('utf-16'),
+    b'\xfe\xff' + 'Relatório de manutenção'.encode('utf-16-be'),
+    b'BMW 320i - placa ABC1234\nRevisao em dia',
+    'ação'.encode('utf-8')[:-1],
+])
+def test_texto_aceito(conteudo):
+    assert detectar_mime(conteudo) == 'text/plain'
+    assert validar_conteudo(conteudo, 'txt')[0]
+
+
+def test_txt_com_conteudo_binario_conhecido_recusado():
+    assert not validar_conteudo(b'%PDF-1.7\n...', 'txt')[0]
+    assert not validar_conteudo(b'PK\x03\x04\x14\x00', 'txt')[0]
+
+
+def test_bmp_exige_cabecalho_dib():
+    bmp = b'BM' + (70).to_bytes(4, 'little') + b'\x00' * 4 + (54).to_bytes(4, 'little') + (40).to_bytes(4, 'little')
+    assert detectar_mime(bmp + b'\x00' * 32) == 'image/bmp'
+    assert validar_conteudo(bmp + b'\x00' * 32, 'bmp')[0]
+    assert not validar_conteudo(b'BMW 320i - placa ABC1234', 'bmp')[0]
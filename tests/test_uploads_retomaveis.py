@@ -0,0 +1,84 @@
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from database import db, ChamadoAnexo, SessaoUploadAnexo, User
+from setores.ti.uploads_retomaveis import _agora, caminho_parcial, coletar_sessoes, iniciar_sessao
+
+CONTEUDO = b'%PDF-1.7\n' + os.urandom(200 * 1024)
+EXPIRA = 3600
+
+
+def _iniciar(cliente, chamado, sha256=None):
+    resposta = cliente.post(f'/ti/anexos/{chamado.id}/uploads', json={
+        'nome': 'laudo.pdf', 'tipo_mime': 'application/pdf', 'tamanho': len(CONTEUDO),
+        'sha256': sha256 or hashlib.sha256(CONTEUDO).hexdigest()
+    })
+    assert resposta.status_code == 201, resposta.get_json()
+    return resposta.get_json()
+
+
+def _put(cliente, url, offset, dados):
+    return cliente.put(url, data=dados, headers={'Upload-Offset': str(offset)},
+                       content_type='application/octet-stream')
+
+
+def test_upload_em_blocos_com_retomada(app, chamado, pasta_upload, entrar):
+    cliente = entrar(app.test_client(), db.session.get(User, chamado.usuario_id))
+    sessao = _iniciar(cliente, chamado)
+    url, meio = sessao['upload_url'], len(CONTEUDO) // 2
+
+    resposta = _put(cliente, url, 0, CONTEUDO[:meio])
+    assert resposta.status_code == 200
+    assert resposta.headers['Upload-Offset'] == str(meio)
+
+    # Bloco repetido (cliente não viu a resposta): 409 com o offset certo
+    resposta = _put(cliente, url, 0, CONTEUDO[:meio])
+    assert resposta.status_code == 409
+    assert resposta.headers['Upload-Offset'] == str(meio)
+    assert cliente.get(url).get_json()['offset'] == meio
+
+    resposta = _put(cliente, url, meio, CONTEUDO[meio:])
+    assert resposta.get_json()['completo']
+
+    resposta = cliente.post(sessao['concluir_url'], json={})
+    assert resposta.status_code == 201, resposta.get_json()
+    anexo = db.session.get(ChamadoAnexo, resposta.get_json()['anexo']['id'])
+    assert anexo.hash_arquivo == hashlib.sha256(CONTEUDO).hexdigest()
+    with open(anexo.caminho_arquivo, 'rb') as arquivo:
+        assert arquivo.read() == CONTEUDO
+    assert SessaoUploadAnexo.query.count() == 0
+    assert not os.path.exists(caminho_parcial(sessao['sessao_id']))
+
+
+def test_hash_divergente_recusa_e_encerra_a_sessao(app, chamado, pasta_upload, entrar):
+    cliente = entrar(app.test_client(), db.session.get(User, chamado.usuario_id))
+    sessao = _iniciar(cliente, chamado, sha256='0' * 64)
+    assert _put(cliente, sessao['upload_url'], 0, CONTEUDO).status_code == 200
+
+    resposta = cliente.post(sessao['concluir_url'], json={})
+
+    assert resposta.status_code == 422
+    assert ChamadoAnexo.query.count() == 0
+    assert SessaoUploadAnexo.query.count() == 0
+    assert not os.path.exists(caminho_parcial(sessao['sessao_id']))
+
+
+def test_coleta_remove_sessoes_paradas_e_parciais_sem_sessao(chamado, pasta_upload):
+    parada = iniciar_sessao(chamado.id, chamado.usuario_id, 'a.pdf', 'application/pdf', 100)
+    ativa = iniciar_sessao(chamado.id, chamado.usuario_id, 'b.pdf', 'application/pdf', 100)
+    parada.data_atualizacao = _agora() - timedelta(seconds=EXPIRA + 60)
+    db.session.commit()
+    sem_sessao = caminho_parcial('f' * 32)
+    open(sem_sessao, 'wb').close()
+    antigo = time.time() - EXPIRA - 60
+    os.utime(sem_sessao, (antigo, antigo))
+    parada_id, ativa_id = parada.id, ativa.id
+
+    assert coletar_sessoes(EXPIRA) == 2
+
+    assert [s.id for s in SessaoUploadAnexo.query.all()] == [ativa_id]
+    assert not os.path.exists(caminho_parcial(parada_id))
+    assert not os.path.exists(sem_sessao)
+    assert os.path.exists(caminho_parcial(ativa_id))
@@ -0,0 +1,64 @@
+from datetime import date
+
+from database import db, Feriado, VersaoRecurso
+
+
+def _versao(recurso):
+    linha = db.session.get(VersaoRecurso, recurso)
+    return linha.versao if linha else 0
+
+
+def test_versao_incrementa_so_depois_do_commit(app):
+    antes = _versao('configuracoes')
+    db.session.add(Feriado(nome='Natal', data=date(2026, 12, 25)))
+    db.session.flush()
+
+    # Durante a transação o contador não é tocado (nem bloqueado)
+    assert _versao('configuracoes') == antes
+    db.session.commit()
+
+    assert _versao('configuracoes') == antes + 1
+
+
+def test_rollback_nao_incrementa_e_savepoint_desfeito_nao_descarta(app):
+    antes = _versao('configuracoes')
+    db.session.add(Feriado(nome='Natal', data=date(2026, 12, 25)))
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert _versao('configuracoes') == antes
+
+    db.session.add(Feriado(nome='Ano Novo', data=date(2027, 1, 1)))
+    db.session.flush()
+    with db.session.begin_nested() as savepoint:
+        savepoint.rollback()
+    db.session.commit()
+    assert _versao('configuracoes') == antes + 1
+
+
+def test_savepoint_confirmado_so_incrementa_no_commit_externo(app):
+    antes = _versao('configuracoes')
+    db.session.add(Feriado(nome='Natal', data=date(2026, 12, 25)))
+    db.session.flush()
+    with db.session.begin_nested():
+        db.session.add(Feriado(nome='Ano Novo', data=date(2027, 1, 1)))
+
+    assert _versao('configuracoes') == antes
+    db.session.commit()
+    assert _versao('configuracoes') == antes + 1
+
+    with db.session.begin_nested():
+        db.session.add(Feriado(nome='Carnaval', data=date(2027, 2, 9)))
+    db.session.rollback()
+    assert _versao('configuracoes') == antes + 1
+
+
+def test_atualizacao_em_massa_incrementa_apos_commit(app):
+    db.session.add(Feriado(nome='Natal', data=date(2026, 12, 25)))
+    db.session.commit()
+    antes = _versao('configuracoes')
+
+    Feriado.query.update({'ativo': False})
+    db.session.commit()
+
+    assert _versao('configuracoes') == antes + 1